@@ -0,0 +1,265 @@
+# estado da conversa de uma sessão de EDA (perguntas de acompanhamento)
+# Cada pergunta chegava ao modelo sozinha: "e agora por Class?" não tinha a que se referir e
+# um resultado já calculado era recalculado. Aqui ficam, por sessão e por dataset:
+#   - um resumo compacto do schema (montado uma vez por dataset);
+#   - os turnos anteriores (pergunta + chamadas + início do texto de cada resultado, com uma
+#     referência "r1", "r2", ...), renderizados numa mensagem de contexto que respeita um
+#     orçamento de tokens: turnos recentes completos, os mais antigos condensados e, por fim,
+#     descartados;
+#   - os resultados completos das ferramentas, para reaproveitamento: a mesma chamada (mesma
+#     ferramenta e argumentos) não é recomputada e o modelo pode reapresentar uma tabela
+#     anterior pela referência (ferramenta reuse_result).
+import json
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.tools import chunked, sqlsource
+from app.tools.columns import fold
+
+# orçamento (tokens estimados) da mensagem de contexto enviada a cada pergunta
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))
+# resultados completos guardados para reaproveitamento (LRU por quantidade)
+CONVERSATION_MAX_RESULTS = int(os.getenv("CONVERSATION_MAX_RESULTS", "50"))
+# parcela do orçamento reservada ao schema; o restante vai para os turnos
+SCHEMA_BUDGET_SHARE = 0.4
+RESULT_SNIPPET_CHARS = 240
+PROMPT_SNIPPET_CHARS = 160
+
+try:  # contagem exata quando o tokenizador está instalado; senão ~4 caracteres por token
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# perguntas que só fazem sentido com o contexto anterior ("e por Class?", "agora só fraudes")
+_FOLLOW_UP = re.compile(
+    r"^\s*(e|e se|e agora|agora|entao|tambem|mesmo|mesma|o mesmo|a mesma|isso|disso|dessa?s?|desse?s?|"
+    r"compare|compara|repita|refaca|de novo|novamente|anterior|ultim[oa])\b"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def call_key(name: str, args: Dict[str, Any]) -> str:
+    """Forma canônica de uma chamada (ferramenta + argumentos em JSON ordenado)."""
+    return name + json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _one_line(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _args_text(args: Dict[str, Any]) -> str:
+    # parâmetros de apresentação não ajudam o modelo a referir o resultado
+    shown = {k: v for k, v in args.items() if k not in ("client_chart", "plot") and v not in (None, False)}
+    return ", ".join(f"{k}={json.dumps(v, ensure_ascii=False, default=str)}" for k, v in shown.items())
+
+
+@dataclass
+class StoredResult:
+    ref: str
+    tool: str
+    args: Dict[str, Any]
+    out: Dict[str, Any]
+
+    def line(self) -> str:
+        parts = [f"[{self.ref}] {self.tool}({_args_text(self.args)})"]
+        tables = [t for t in self.out.get("tables", []) if hasattr(t, "shape")]
+        if tables:
+            shapes = ", ".join(f"{r}x{c}" for r, c in (t.shape for t in tables))
+            parts.append(f"tabela {shapes}")
+        if self.out.get("images") or self.out.get("charts"):
+            parts.append("gráfico")
+        if self.out.get("text"):
+            parts.append(_one_line(self.out["text"], RESULT_SNIPPET_CHARS))
+        return " — ".join(parts)
+
+
+@dataclass
+class Turn:
+    prompt: str
+    results: List[StoredResult] = field(default_factory=list)
+    reused: List[str] = field(default_factory=list)  # referências reapresentadas neste turno
+
+    def detailed(self) -> str:
+        lines = [f"P: {_one_line(self.prompt, PROMPT_SNIPPET_CHARS)}"]
+        lines += [f"  {r.line()}" for r in self.results]
+        if self.reused:
+            lines.append(f"  (reaproveitou {', '.join(self.reused)})")
+        return "\n".join(lines)
+
+    def condensed(self) -> str:
+        refs = [f"{r.ref}={r.tool}" for r in self.results] + self.reused
+        return f"P: {_one_line(self.prompt, 60)} -> {', '.join(refs) or 'sem ferramentas'}"
+
+
+def schema_summary(df) -> str:
+    if chunked.is_out_of_core(df):
+        head = f"Dataset out-of-core com {len(df.columns)} colunas."
+    elif sqlsource.is_sql_source(df):
+        head = f"Dataset: {df.describe()}."
+    else:
+        head = f"Dataset com {len(df):,} linhas e {df.shape[1]} colunas.".replace(",", ".")
+    dtypes = df.dtypes
+    cols = [f"{c} ({dtypes[c]})" for c in df.columns]
+    return head + " Colunas: " + ", ".join(cols) + "."
+
+
+class Conversation:
+    """Estado multi-turno de uma sessão (um objeto por sessão da UI; troca de dataset zera)."""
+
+    def __init__(self, token_budget: int = CONVERSATION_TOKEN_BUDGET,
+                 max_results: int = CONVERSATION_MAX_RESULTS):
+        self.token_budget = token_budget
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._dataset: Optional[weakref.ref] = None  # o objeto do dataset (identidade, não conteúdo)
+        self._schema = ""
+        self.turns: List[Turn] = []
+        self._results: "OrderedDict[str, StoredResult]" = OrderedDict()  # ref -> resultado
+        self._by_call: Dict[str, str] = {}  # call_key -> ref
+        self._next_ref = 1
+
+    # ------------------------------------------------------------------
+    def bind(self, df) -> bool:
+        """Associa a conversa ao dataset; se ele mudou, descarta turnos e resultados.
+        Devolve True quando houve troca. A comparação é por identidade do objeto: um CSV
+        reenviado (mesmo que idêntico nas linhas amostradas pelo fingerprint) é outro dataset."""
+        if df is None:
+            return False
+        with self._lock:
+            if self._dataset is not None and self._dataset() is df:
+                return False
+            self._clear()
+            self._dataset = weakref.ref(df)
+            self._schema = self._fit_schema(schema_summary(df))
+            return True
+
+    def reset(self):
+        """Descarta turnos e resultados (a UI chama ao trocar o dataset da sessão)."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._dataset = None
+        self._schema = ""
+        self.turns.clear()
+        self._results.clear()
+        self._by_call.clear()
+        self._next_ref = 1
+
+    def _fit_schema(self, text: str) -> str:
+        limit = int(self.token_budget * SCHEMA_BUDGET_SHARE)
+        if estimate_tokens(text) <= limit:
+            return text
+        # muitas colunas: corta a lista e informa quantas ficaram de fora
+        head, _, cols = text.partition(" Colunas: ")
+        names = cols.rstrip(".").split(", ")
+        room = limit - estimate_tokens(head) - 12  # "Colunas:" e o aviso final
+        kept: List[str] = []
+        for name in names:
+            room -= estimate_tokens(name) + 1
+            if room < 0:
+                break
+            kept.append(name)
+        return head + " Colunas: " + ", ".join(kept) + f", … (+{len(names) - len(kept)} colunas)."
+
+    def is_follow_up(self, prompt: str) -> bool:
+        """Pergunta curta que depende da anterior (o roteamento local não deve tratá-la sozinha)."""
+        return bool(self.turns) and bool(_FOLLOW_UP.match(fold(prompt)))
+
+    # ------------------------------------------------------------------
+    # resultados
+    # ------------------------------------------------------------------
+    def lookup(self, name: str, args: Dict[str, Any]) -> Optional[StoredResult]:
+        with self._lock:
+            ref = self._by_call.get(call_key(name, args))
+            if ref is None:
+                return None
+            self._results.move_to_end(ref)
+            return self._results[ref]
+
+    def get(self, ref: str) -> Optional[StoredResult]:
+        ref = str(ref).strip().strip("[]").lower()
+        if ref.isdigit():
+            ref = "r" + ref
+        with self._lock:
+            return self._results.get(ref)
+
+    def refs(self) -> List[str]:
+        with self._lock:
+            return list(self._results)
+
+    def record_turn(self, prompt: str, calls: List[Tuple[str, Dict[str, Any]]],
+                    outs: List[Dict[str, Any]], reused: Optional[Dict[int, StoredResult]] = None,
+                    dedupe: Optional[List[bool]] = None):
+        """Registra um turno. reused: índice -> resultado anterior servido sem recomputar;
+        dedupe: quais chamadas, repetidas, podem ser servidas deste resultado (padrão: todas).
+        Saídas que estouraram o tempo não são guardadas."""
+        reused = reused or {}
+        turn = Turn(prompt)
+        with self._lock:
+            for i, ((name, args), out) in enumerate(zip(calls, outs)):
+                if i in reused:
+                    turn.reused.append(reused[i].ref)
+                    continue
+                if out is not None and out.get("reused_ref"):  # reuse_result: não vira nova referência
+                    turn.reused.append(out["reused_ref"])
+                    continue
+                if out is None or out.get("timeout"):
+                    continue
+                stored = StoredResult(f"r{self._next_ref}", name, dict(args), out)
+                self._next_ref += 1
+                self._results[stored.ref] = stored
+                if dedupe is None or dedupe[i]:
+                    self._by_call[call_key(name, args)] = stored.ref
+                turn.results.append(stored)
+            while len(self._results) > self.max_results:
+                ref, old = self._results.popitem(last=False)
+                if self._by_call.get(call_key(old.tool, old.args)) == ref:
+                    del self._by_call[call_key(old.tool, old.args)]
+            self.turns.append(turn)
+
+    # ------------------------------------------------------------------
+    # contexto para o modelo
+    # ------------------------------------------------------------------
+    def context_message(self) -> Optional[str]:
+        """Mensagem de sistema com schema + turnos anteriores dentro do orçamento de tokens."""
+        with self._lock:
+            if not self._schema:
+                return None
+            header = ("Contexto da sessão. Resultados anteriores podem ser reapresentados com "
+                      "reuse_result(ref) sem recomputar; não repita cálculos já feitos.\n" + self._schema)
+            used = estimate_tokens(header)
+            lines: List[str] = []
+            dropped = 0
+            for turn in reversed(self.turns):  # do mais recente para o mais antigo
+                if dropped:
+                    dropped += 1
+                    continue
+                for text in (turn.detailed(), turn.condensed()):
+                    cost = estimate_tokens(text) + 1
+                    if used + cost <= self.token_budget:
+                        lines.append(text)
+                        used += cost
+                        break
+                else:
+                    dropped = 1
+            if not lines:
+                return header
+            lines.reverse()
+            if dropped:
+                lines.insert(0, f"({dropped} turnos mais antigos omitidos)")
+            return header + "\nTurnos anteriores:\n" + "\n".join(lines)
@@ -1,48 +1,92 @@
 
+import hashlib
 import io
 import json
+import os
 import re
 import sqlite3
+import unicodedata
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-from PIL import Image
-from pdf2image import convert_from_bytes
-import pytesseract
-from openai import OpenAI
+from .llm_client import get_llm
 
-client = OpenAI()
+if TYPE_CHECKING:
+    from PIL import Image
+
+# PIL / pdf2image / pytesseract são importados só quando há um arquivo para processar
+
+# resolução do OCR da página inteira e da releitura das regiões com baixa confiança
+OCR_BASE_DPI = int(os.getenv("OCR_BASE_DPI", "200"))
+OCR_REOCR_DPI = int(os.getenv("OCR_REOCR_DPI", "400"))
+# confiança do Tesseract (0–100) abaixo da qual um campo é relido
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "60"))
+# margem (px na resolução base) em volta das palavras do campo ao recortar a região
+OCR_REGION_PAD = int(os.getenv("OCR_REGION_PAD", "12"))
 
 
 # ============================================================
 # 1. Ingestão & Pré-processamento + OCR
 # ============================================================
 
-def file_to_images(file_bytes: bytes, file_type: str) -> List[Image.Image]:
+def file_to_images(file_bytes: bytes, file_type: str, dpi: int = OCR_BASE_DPI) -> List["Image.Image"]:
     """
     Converte um arquivo PDF ou imagem em uma lista de imagens PIL.
     file_type: extensão do arquivo, ex: "pdf", "jpg", "png".
     """
     ft = file_type.lower()
     if ft == "pdf":
-        images = convert_from_bytes(file_bytes)
+        from pdf2image import convert_from_bytes
+        images = convert_from_bytes(file_bytes, dpi=dpi)
         return [img.convert("RGB") for img in images]
     elif ft in {"jpg", "jpeg", "png"}:
+        from PIL import Image
         img = Image.open(io.BytesIO(file_bytes))
         return [img.convert("RGB")]
     else:
         raise ValueError(f"Tipo de arquivo não suportado para OCR: {file_type}")
 
 
-def run_ocr(images: List[Image.Image], lang: str = "por") -> str:
+def run_ocr_data(images: List["Image.Image"], lang: str = "por") -> Dict[str, Any]:
+    """
+    OCR com detalhes por palavra (image_to_data): devolve
+      - "text": texto reconstruído (linhas e parágrafos como no image_to_string)
+      - "words": [{"text", "conf", "page", "line", "box": (left, top, width, height)}]
+      - "pages": [(largura, altura)] das imagens lidas (coordenadas das caixas)
+    """
+    import pytesseract
+    words: List[Dict[str, Any]] = []
+    page_texts: List[str] = []
+    for page, img in enumerate(images):
+        data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+        lines: Dict[Tuple[int, int, int], List[str]] = {}
+        for i, text in enumerate(data["text"]):
+            text = (text or "").strip()
+            conf = float(data["conf"][i])
+            if not text or conf < 0:
+                continue
+            line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(line, []).append(text)
+            words.append({
+                "text": text, "conf": conf, "page": page, "line": line,
+                "box": (data["left"][i], data["top"][i], data["width"][i], data["height"][i]),
+            })
+        out, last_par = [], None
+        for (block, par, _), line_words in lines.items():
+            if last_par is not None and (block, par) != last_par:
+                out.append("")
+            out.append(" ".join(line_words))
+            last_par = (block, par)
+        page_texts.append("\n".join(out))
+    return {"text": "\n\n".join(page_texts), "words": words, "pages": [img.size for img in images]}
+
+
+def run_ocr(images: List["Image.Image"], lang: str = "por") -> str:
     """
     Roda OCR em uma lista de imagens e concatena o texto.
     """
-    texts: List[str] = []
-    for img in images:
-        text = pytesseract.image_to_string(img, lang=lang)
-        texts.append(text)
-    return "\n\n".join(texts)
+    return run_ocr_data(images, lang=lang)["text"]
 
 
 # ============================================================
@@ -80,13 +124,18 @@ TEXTO OCR:
 """
 
 
-def extract_invoice_fields(text_ocr: str, model: str = "gpt-4.1") -> Dict[str, Any]:
+def extract_invoice_fields(text_ocr: str, model: str = "gpt-4.1", document: str = None,
+                           session: str = None) -> Dict[str, Any]:
     """
     Usa GPT-4 para transformar texto OCR em JSON com campos fiscais.
+    document/session: identificadores do documento e da sessão para a contabilidade de tokens
+    (e para o orçamento de tokens da sessão).
     """
     prompt = INVOICE_EXTRACTION_PROMPT.format(texto_ocr=text_ocr[:6000])
 
-    response = client.chat.completions.create(
+    response = get_llm().chat(
+        session=session,
+        document=document,
         model=model,
         messages=[
             {
@@ -152,11 +201,16 @@ def _validate_valor(valor_str: str) -> bool:
         return False
 
 
-def validate_invoice_fields(fields: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+def validate_invoice_fields(
+    fields: Dict[str, Any],
+    ocr_confidence: Optional[Dict[str, Optional[float]]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Valida os campos extraídos e devolve:
       - fields_normalized: campos possivelmente normalizados
       - report: dicionário com flags, score e mensagens
+    ocr_confidence: confiança do OCR (0–100) das palavras de onde cada campo veio
+    (ver field_confidence); campos abaixo de OCR_MIN_CONFIDENCE também ficam suspeitos.
     """
     fields = dict(fields or {})
 
@@ -180,6 +234,17 @@ def validate_invoice_fields(fields: Dict[str, Any]) -> Tuple[Dict[str, Any], Dic
         if not ok:
             report["campos_suspeitos"].append(key)
 
+    if ocr_confidence is not None:
+        report["confianca_ocr"] = {
+            k: None if v is None else round(v, 1) for k, v in ocr_confidence.items()
+        }
+        report["campos_baixa_confianca_ocr"] = [
+            k for k, v in ocr_confidence.items() if v is not None and v < OCR_MIN_CONFIDENCE
+        ]
+        for key in report["campos_baixa_confianca_ocr"]:
+            if key not in report["campos_suspeitos"]:
+                report["campos_suspeitos"].append(key)
+
     n_sus = len(report["campos_suspeitos"])
     if n_sus == 0:
         report["score_confianca"] = 1.0
@@ -192,7 +257,192 @@ def validate_invoice_fields(fields: Dict[str, Any]) -> Tuple[Dict[str, Any], Dic
 
 
 # ============================================================
-# 4. Persistência em SQLite
+# 4. Confiança do OCR por campo e re-OCR seletivo
+# ============================================================
+
+# campos conferidos pela validação (relidos quando vêm de palavras com baixa confiança)
+REQUIRED_FIELDS = ("chave_acesso", "cnpj_emitente", "cnpj_destinatario", "data_emissao", "valor_total")
+
+_CNPJ_RE = r"\d{2}\.?\d{3}\.?\d{3}\s*/?\s*\d{4}\s*-?\s*\d{2}"
+_FIELD_PATTERNS = {
+    "chave_acesso": r"(?:\d[\s.]*){43}\d",
+    "cnpj_emitente": _CNPJ_RE,
+    "cnpj_destinatario": _CNPJ_RE,
+    "data_emissao": r"\d{2}/\d{2}/\d{4}",
+    "valor_total": r"\d{1,3}(?:\.?\d{3})*,\d{2}|\d+\.\d{2}",
+}
+_FIELD_VALIDATORS = {
+    "chave_acesso": _validate_chave,
+    "cnpj_emitente": _validate_cnpj,
+    "cnpj_destinatario": _validate_cnpj,
+    "data_emissao": _validate_date,
+    "valor_total": _validate_valor,
+}
+
+
+def _fold_token(text: str, digits: bool) -> str:
+    """Forma comparável de um texto: só dígitos (CNPJ, chave, data, valor) ou
+    alfanuméricos em minúsculas sem acento (razão social etc.)."""
+    if digits:
+        return _only_digits(text)
+    folded = unicodedata.normalize("NFKD", str(text).casefold())
+    return "".join(ch for ch in folded if ch.isalnum())
+
+
+def _locate(value: str, words: List[Dict[str, Any]], digits: bool) -> Optional[List[Dict[str, Any]]]:
+    """Palavras do OCR que formam `value`: procura na mesma linha e, se não achar,
+    na página inteira (valores quebrados entre linhas)."""
+    target = _fold_token(value, digits)
+    if len(target) < 2:
+        return None
+    lines: Dict[Any, List[Dict[str, Any]]] = {}
+    pages: Dict[Any, List[Dict[str, Any]]] = {}
+    for w in words:
+        lines.setdefault((w.get("page", 0), w.get("line")), []).append(w)
+        pages.setdefault(w.get("page", 0), []).append(w)
+    for seq in list(lines.values()) + list(pages.values()):
+        owner: List[int] = []
+        starts, ends = set(), set()  # limites de palavra no texto concatenado
+        for j, w in enumerate(seq):
+            token = _fold_token(w["text"], digits)
+            if token:
+                starts.add(len(owner))
+                owner.extend([j] * len(token))
+                ends.add(len(owner))
+        joined = "".join(_fold_token(w["text"], digits) for w in seq)
+        pos = joined.find(target)
+        while pos >= 0:
+            # só casamentos que começam e terminam em limite de palavra ("123456" não casa
+            # dentro de um CNPJ)
+            if pos in starts and pos + len(target) in ends:
+                return [seq[j] for j in sorted(set(owner[pos:pos + len(target)]))]
+            pos = joined.find(target, pos + 1)
+    return None
+
+
+def field_confidence(fields: Dict[str, Any], ocr: Dict[str, Any]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Para cada campo extraído, as palavras do OCR de onde ele veio:
+    {"conf": menor confiança entre as palavras, "page", "box": (x0, y0, x1, y1), "words"}.
+    None quando o valor não foi encontrado no OCR (ex.: campo reformatado pelo modelo).
+    A menor confiança (e não a média) porque um único dígito ruim invalida um CNPJ.
+    """
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for key, value in (fields or {}).items():
+        if key == "tipo_documento" or not isinstance(value, (str, int, float)) or value in ("", None):
+            continue
+        found = _locate(str(value), ocr.get("words", []), digits=key in REQUIRED_FIELDS)
+        if not found:
+            out[key] = None
+            continue
+        x0 = min(w["box"][0] for w in found)
+        y0 = min(w["box"][1] for w in found)
+        x1 = max(w["box"][0] + w["box"][2] for w in found)
+        y1 = max(w["box"][1] + w["box"][3] for w in found)
+        out[key] = {
+            "conf": min(w["conf"] for w in found),
+            "page": found[0].get("page", 0),
+            "box": (x0, y0, x1, y1),
+            "words": len(found),
+        }
+    return out
+
+
+def _region_image(file_bytes: bytes, file_type: str, page: int, box: Tuple[int, int, int, int],
+                  page_size: Tuple[int, int], cache: Dict[int, Any]) -> "Image.Image":
+    """Recorte da região em alta resolução. PDF: a página é rasterizada de novo em
+    OCR_REOCR_DPI (uma vez por página) e recortada; imagem: o recorte é ampliado."""
+    scale = OCR_REOCR_DPI / OCR_BASE_DPI
+    width, height = page_size
+    x0, y0, x1, y1 = box
+    x0, y0 = max(x0 - OCR_REGION_PAD, 0), max(y0 - OCR_REGION_PAD, 0)
+    x1, y1 = min(x1 + OCR_REGION_PAD, width), min(y1 + OCR_REGION_PAD, height)
+    if file_type.lower() == "pdf":
+        if page not in cache:
+            from pdf2image import convert_from_bytes
+            cache[page] = convert_from_bytes(
+                file_bytes, dpi=OCR_REOCR_DPI, first_page=page + 1, last_page=page + 1
+            )[0].convert("L")
+        img = cache[page]
+        sx, sy = img.size[0] / width, img.size[1] / height  # escala real da nova rasterização
+        return img.crop((int(x0 * sx), int(y0 * sy), int(x1 * sx), int(y1 * sy)))
+    from PIL import Image
+    if page not in cache:
+        cache[page] = file_to_images(file_bytes, file_type)[page].convert("L")
+    crop = cache[page].crop((x0, y0, x1, y1))
+    return crop.resize((max(int(crop.size[0] * scale), 1), max(int(crop.size[1] * scale), 1)),
+                       Image.LANCZOS)
+
+
+def _best_candidate(key: str, text: str, previous: Any) -> Optional[str]:
+    """Valor válido do campo no texto relido; entre vários, o mais parecido com o anterior."""
+    best, best_ratio = None, -1.0
+    prev = _only_digits(str(previous or ""))
+    for match in re.finditer(rf"(?<!\d)(?:{_FIELD_PATTERNS[key]})(?!\d)", text):
+        value = re.sub(r"\s+", "", match.group(0))
+        if key == "chave_acesso":
+            value = _only_digits(value)
+        elif key == "valor_total" and "," in value:
+            value = value.replace(".", "").replace(",", ".")
+        if not _FIELD_VALIDATORS[key](value):
+            continue
+        ratio = SequenceMatcher(None, prev, _only_digits(value)).ratio()
+        if ratio > best_ratio:
+            best, best_ratio = value, ratio
+    return best
+
+
+def reocr_low_confidence_fields(
+    file_bytes: bytes,
+    file_type: str,
+    ocr: Dict[str, Any],
+    fields: Dict[str, Any],
+    located: Dict[str, Optional[Dict[str, Any]]],
+    lang: str = "por",
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Relê em alta resolução só as regiões dos campos obrigatórios que vieram de palavras
+    com confiança < OCR_MIN_CONFIDENCE (em vez de refazer o documento inteiro em alta DPI).
+    O campo só é trocado se a releitura der um valor válido com confiança maior.
+    Devolve (campos, detalhes por campo relido); `located` é atualizado com a nova confiança.
+    """
+    targets = [k for k in REQUIRED_FIELDS
+               if located.get(k) and located[k]["conf"] < OCR_MIN_CONFIDENCE]
+    if not targets:
+        return fields, {}
+    import pytesseract
+    fields = dict(fields)
+    pages: Dict[int, Any] = {}
+    details: Dict[str, Any] = {}
+    for key in targets:
+        loc = located[key]
+        region = _region_image(file_bytes, file_type, loc["page"], loc["box"],
+                               ocr["pages"][loc["page"]], pages)
+        data = pytesseract.image_to_data(region, lang=lang, config="--psm 6",
+                                         output_type=pytesseract.Output.DICT)
+        words = [
+            {"text": t.strip(), "conf": float(c), "page": 0, "line": (b, p, ln), "box": (0, 0, 0, 0)}
+            for t, c, b, p, ln in zip(data["text"], data["conf"], data["block_num"],
+                                      data["par_num"], data["line_num"])
+            if (t or "").strip() and float(c) >= 0
+        ]
+        text = " ".join(w["text"] for w in words)
+        entry: Dict[str, Any] = {"antes": fields.get(key), "conf_antes": round(loc["conf"], 1),
+                                 "texto_relido": text}
+        candidate = _best_candidate(key, text, fields.get(key))
+        if candidate is not None:
+            used = _locate(candidate, words, digits=True) or words
+            conf = min(w["conf"] for w in used)
+            if conf > loc["conf"]:
+                fields[key] = candidate
+                located[key] = {**loc, "conf": conf}
+                entry.update({"depois": candidate, "conf_depois": round(conf, 1)})
+        details[key] = entry
+    return fields, details
+
+
+# ============================================================
+# 5. Persistência em SQLite
 # ============================================================
 
 def _get_db_connection(db_path: str = "invoices.db") -> sqlite3.Connection:
@@ -238,7 +488,7 @@ def save_invoice_to_db(
 
 
 # ============================================================
-# 5. Definição das tools (run_ocr, extract, validate, save)
+# 6. Definição das tools (run_ocr, extract, validate, save)
 # ============================================================
 
 TOOLS_DOCS = [
@@ -289,7 +539,8 @@ TOOLS_DOCS = [
             "name": "validate_invoice_fields",
             "description": (
                 "Valida e normaliza os campos extraídos de um documento fiscal, "
-                "retornando um relatório de validação com score de confiança e campos suspeitos."
+                "retornando um relatório de validação com score de confiança e campos suspeitos. "
+                "Campos lidos pelo OCR com baixa confiança são relidos em alta resolução."
             ),
             "parameters": {
                 "type": "object",
@@ -334,7 +585,7 @@ TOOLS_DOCS = [
 
 
 # ============================================================
-# 6. System prompt enriquecido e agente tool-based
+# 7. System prompt enriquecido e agente tool-based
 # ============================================================
 
 SYSTEM_PROMPT_DOCS = """
@@ -371,7 +622,7 @@ Estilo de resposta:
 """
 
 
-def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict[str, Any]:
+def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str, session: str = None) -> Dict[str, Any]:
     """
     Executa uma interação com o agente de documentos fiscais (GPT-4 + tools).
 
@@ -379,14 +630,19 @@ def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict
     - file_bytes: conteúdo bruto do arquivo enviado (PDF/imagem).
     - file_type: extensão do arquivo, ex: "pdf", "jpg", "png".
     - user_message: pergunta ou instrução do usuário.
+    - session: identificador da sessão para a contabilidade de tokens (opcional).
 
     Retorna um dicionário com:
       - "assistant_message": texto final de resposta do modelo
       - "text_ocr": texto OCR (se gerado)
       - "fields": campos extraídos/normalizados (se gerados)
-      - "validation_report": relatório de validação (se gerado)
+      - "validation_report": relatório de validação (se gerado), com a confiança do OCR por
+        campo e, em "reocr", os campos relidos em alta resolução
       - "save_result": resultado da persistência (se chamada)
+      - "usage": tokens/chamadas gastos com este documento (acumulado)
     """
+    # identificador do documento para a contabilidade de tokens (mesmo arquivo = mesma conta)
+    document = hashlib.sha1(file_bytes).hexdigest()[:16]
     messages: List[Dict[str, Any]] = [
         {"role": "system", "content": SYSTEM_PROMPT_DOCS},
         {
@@ -401,29 +657,41 @@ def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict
     ]
 
     text_ocr: str = ""
+    ocr_data: Optional[Dict[str, Any]] = None  # palavras, confianças e caixas do último OCR
+    ocr_lang = "por"
     fields_result: Dict[str, Any] = {}
     validation_result: Dict[str, Any] = {}
     save_result: Dict[str, Any] = {}
 
     def _call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-        nonlocal text_ocr, fields_result, validation_result, save_result
+        nonlocal text_ocr, ocr_data, ocr_lang, fields_result, validation_result, save_result
 
         if name == "run_ocr":
-            lang = arguments.get("lang", "por")
+            ocr_lang = arguments.get("lang", "por")
             images = file_to_images(file_bytes, file_type)
-            text = run_ocr(images, lang=lang)
-            text_ocr = text
-            return {"text_ocr": text}
+            ocr_data = run_ocr_data(images, lang=ocr_lang)
+            text_ocr = ocr_data["text"]
+            return {"text_ocr": text_ocr}
 
         elif name == "extract_invoice_fields":
             txt = arguments.get("text_ocr") or text_ocr
-            data = extract_invoice_fields(txt)
+            data = extract_invoice_fields(txt, document=document, session=session)
             fields_result = data
             return data
 
         elif name == "validate_invoice_fields":
             fields_arg = arguments.get("fields") or fields_result
-            fields_norm, report = validate_invoice_fields(fields_arg)
+            ocr_confidence, reocr = None, {}
+            if ocr_data is not None:
+                # campos obrigatórios lidos com baixa confiança: relê só a região deles
+                located = field_confidence(fields_arg, ocr_data)
+                fields_arg, reocr = reocr_low_confidence_fields(
+                    file_bytes, file_type, ocr_data, fields_arg, located, lang=ocr_lang
+                )
+                ocr_confidence = {k: v["conf"] if v else None for k, v in located.items()}
+            fields_norm, report = validate_invoice_fields(fields_arg, ocr_confidence=ocr_confidence)
+            if reocr:
+                report["reocr"] = reocr
             fields_result = fields_norm
             validation_result = report
             return {
@@ -443,7 +711,9 @@ def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict
 
     # Loop simples para permitir múltiplas chamadas de tools
     for _ in range(6):
-        response = client.chat.completions.create(
+        response = get_llm().chat(
+            session=session,
+            document=document,
             model="gpt-4.1",
             messages=messages,
             tools=TOOLS_DOCS,
@@ -463,6 +733,7 @@ def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict
                 "fields": fields_result,
                 "validation_report": validation_result,
                 "save_result": save_result,
+                "usage": get_llm().usage(document=document),
             }
 
         # Executa as tools solicitadas
@@ -497,4 +768,5 @@ def ask_docs_agent(file_bytes: bytes, file_type: str, user_message: str) -> Dict
         "fields": fields_result,
         "validation_report": validation_result,
         "save_result": save_result,
+        "usage": get_llm().usage(document=document),
     }
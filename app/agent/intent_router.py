@@ -0,0 +1,395 @@
+# roteamento local de intenções: perguntas comuns ("histograma de Amount", "balanceamento
+# da coluna Class") viram chamadas de ferramenta sem ida ao LLM.
+# Classificador TF-IDF (n-gramas de caracteres) + regressão logística, treinado com frases
+# geradas a partir dos schemas de TOOLS (nomes, descrições, enums); as colunas citadas são
+# mascaradas antes da classificação e resolvidas por um casamento com os nomes do dataset.
+# Só responde quando a confiança é alta, os argumentos obrigatórios foram resolvidos e a
+# pergunta não diz mais do que a ferramenta consegue expressar (colunas a mais, "por X",
+# palavras fora do vocabulário da ferramenta, como "nas fraudes"); caso contrário a pergunta
+# segue para o LLM. A concordância com o LLM pode ser registrada em JSONL (INTENT_LOG=1).
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.tools.columns import ColumnIndex, column_index, fold as _fold
+
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.6"))
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.2"))
+# fração das perguntas roteadas localmente que também vão ao LLM (em segundo plano) para
+# medir a concordância
+INTENT_AUDIT_RATE = float(os.getenv("INTENT_AUDIT_RATE", "0.1"))
+# log das decisões (com o texto das perguntas): desligado por padrão; fora do diretório do app
+# e rotacionado ao passar de INTENT_LOG_MAX_MB (um arquivo anterior, .1, é mantido)
+INTENT_LOG = os.getenv("INTENT_LOG", "0") == "1"
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH",
+                            os.path.join(os.path.expanduser("~"), ".cache", "ia2a_agents", "intent_router.jsonl"))
+INTENT_LOG_MAX_MB = float(os.getenv("INTENT_LOG_MAX_MB", "5"))
+
+OTHER = "__llm__"  # rótulo "não sei": deixa a pergunta para o LLM
+COLUMN_TOKEN = "COLUNA"
+
+# frases-modelo por ferramenta ({col} = coluna citada); completadas com as descrições e
+# os enums dos schemas em TOOLS
+_TEMPLATES: Dict[str, List[str]] = {
+    "describe_data": [
+        "resumo do dataset", "faça um describe dos dados", "overview dos dados", "sumário do dataset",
+        "qual o shape do dataset", "estatísticas descritivas", "describe", "descreva os dados",
+        "quantas linhas e colunas tem o dataset", "summary of the data", "dataset overview",
+    ],
+    "schema_info": [
+        "quais são os tipos de dados", "quais colunas são numéricas", "quais colunas são categóricas",
+        "tipos das colunas", "liste as colunas", "quais colunas existem", "numérico vs categórico",
+        "schema do dataset", "dtypes", "what are the column types", "list the columns",
+    ],
+    "value_counts": [
+        "value counts de {col}", "contagem de valores de {col}", "frequência dos valores de {col}",
+        "quais os valores mais comuns de {col}", "distribuição das categorias de {col}",
+        "top 10 valores de {col}", "quantas vezes aparece cada valor de {col}", "valores únicos de {col}",
+        "most common values of {col}", "count of each {col}",
+    ],
+    "histogram": [
+        "histograma de {col}", "faça um histograma de {col}", "plote o histograma da coluna {col}",
+        "distribuição de {col}", "mostre a distribuição da coluna {col}", "histograma de {col} em escala log",
+        "histograma de {col} com 50 bins", "gráfico da distribuição de {col}", "plot histogram of {col}",
+        "distribution of {col}",
+    ],
+    "corr_matrix": [
+        "matriz de correlação", "correlação entre as variáveis", "heatmap de correlação",
+        "quais variáveis são mais correlacionadas", "correlações mais fortes", "top pares de correlação",
+        "correlação de spearman", "correlação de pearson", "mostre as correlações", "correlation matrix",
+        "strongest correlations",
+    ],
+    "compute_stat": [
+        "média de {col}", "qual a média da coluna {col}", "mediana de {col}", "desvio padrão de {col}",
+        "valor mínimo de {col}", "valor máximo de {col}", "qual o maior valor de {col}",
+        "qual o menor valor de {col}", "quantos valores não nulos tem {col}", "mean of {col}",
+        "median of {col}", "std of {col}", "max of {col}", "min of {col}",
+    ],
+    "class_balance": [
+        "balanceamento da coluna {col}", "qual o balanceamento de {col}", "proporção de cada classe",
+        "o dataset é desbalanceado", "quantas fraudes existem", "proporção de fraudes",
+        "distribuição das classes de {col}", "class balance", "class imbalance", "classe minoritária",
+    ],
+    "get_conclusions": [
+        "quais conclusões foram salvas", "mostre as conclusões", "o que já concluímos",
+        "recupere as conclusões", "conclusões até agora", "show saved conclusions",
+    ],
+    OTHER: [
+        "média de {col} por {col}", "agrupe por {col} e calcule a soma de {col}",
+        "compare {col} entre as classes", "por que {col} é importante",
+        "treine um modelo para prever {col}", "quais outliers existem em {col}",
+        "salve a conclusão de que o dataset é desbalanceado", "escreva um código que filtre {col} > 100",
+        "existe relação entre {col} e {col} para fraudes", "faça um scatter de {col} vs {col}",
+        "qual a tendência de {col} ao longo do tempo", "explique o resultado anterior",
+        "o que você recomenda como próximos passos", "olá", "obrigado", "quem é você",
+        "calcule a média e o desvio de {col} e depois o histograma de {col}",
+        "group by {col} and sum {col}", "rode um código python",
+        # séries temporais (time_series): período, janela móvel e acumulado ficam com o LLM
+        "média móvel de {col}", "média móvel de 7 dias de {col}", "soma de {col} por hora",
+        "média de {col} por dia", "contagem por mês", "total de {col} por semana", "série temporal de {col}",
+        "evolução de {col} ao longo do tempo", "média acumulada de {col}", "máximo diário de {col}",
+        "rolling mean of {col}", "{col} per hour", "daily sum of {col}",
+    ],
+}
+
+# palavras -> valores de argumentos
+_STAT_WORDS = [
+    ("desvio", "std"), ("std", "std"), ("mediana", "median"), ("median", "median"),
+    ("media", "mean"), ("mean", "mean"), ("average", "mean"),
+    ("minimo", "min"), ("menor", "min"), ("min", "min"),
+    ("maximo", "max"), ("maior", "max"), ("max", "max"),
+    ("contagem", "count"), ("quantos", "count"), ("count", "count"),
+]
+
+
+def _tool_schemas() -> Dict[str, Dict[str, Any]]:
+    from .tools_spec import TOOLS  # tardio: os schemas vêm do registro de ferramentas do router
+    return {t["function"]["name"]: t["function"] for t in TOOLS}
+
+
+# -----------------------------------------------------------------------------
+# Colunas citadas
+# -----------------------------------------------------------------------------
+
+def match_columns(prompt: str, columns) -> List[Tuple[int, int, str]]:
+    """Colunas citadas no prompt como (início, fim, coluna), na ordem em que aparecem
+    (ver ColumnIndex.scan; com um DataFrame use column_index(df), que fica em cache)."""
+    return ColumnIndex(columns).scan(prompt)
+
+
+# condição sobre as linhas ("onde Class == 1", "só fraudes", "Amount > 100"): o roteador
+# local não monta filtros (parâmetro "where"), então a pergunta segue para o LLM
+_ROW_CONDITION = re.compile(
+    r"\b(onde|where|quando|somente|apenas|so (?:as|os|para|nas|nos)|exceto|excluindo|filtr\w*)\b"
+    r"|[<>]=?|[!=]="
+)
+
+
+# palavras que não mudam o sentido em nenhuma ferramenta; as demais precisam aparecer nas
+# frases-modelo (ou enums) da ferramenta escolhida. "por" fica de fora: "por X" agrupa.
+_NEUTRAL_WORDS = set("""
+qual quais que como me mostre mostra mostrar exiba exibir veja ver calcule calcula calcular faca
+fazer gere gerar plote plotar desenhe quero queria gostaria pode poderia voce favor ai aqui agora
+dataset dados base tabela coluna colunas variavel variaveis campo the what which show give please
+""".split())
+_POLITE = re.compile(r"\bpor favor\b")
+
+
+def _vocabulary() -> Dict[str, set]:
+    """Palavras das frases-modelo e dos enums de cada ferramenta (ver _training_set)."""
+    vocab: Dict[str, set] = {}
+    for text, label in zip(*_training_set(include_descriptions=False)):
+        vocab.setdefault(label, set()).update(re.findall(r"[a-z]+", text))
+    return vocab
+
+
+def _unexpressed(tool: str, prompt: str, matches, cols: List[str], args: Dict[str, Any],
+                 vocab: Dict[str, set]) -> Optional[str]:
+    """Motivo para não rotear localmente quando a pergunta pede algo que os argumentos da
+    ferramenta não expressam; None se tudo o que foi dito cabe neles."""
+    used = {v for v in args.values() if isinstance(v, str)}
+    if any(c not in used for c in cols):
+        return "colunas além dos argumentos"
+    text = _POLITE.sub(" ", _mask_columns(prompt, matches))
+    if re.search(r"\b(por|per|by|cada|each)\b", text):
+        return "agrupamento"
+    known = vocab.get(tool, set()) | _NEUTRAL_WORDS | {COLUMN_TOKEN.lower()}
+    if any(len(w) > 2 and w not in known for w in re.findall(r"[a-z]+", text)):
+        return "termos fora do escopo local"
+    return None
+
+
+def _mask_columns(prompt: str, matches) -> str:
+    text = _fold(prompt)
+    for start, end, _ in sorted(matches, reverse=True):
+        text = text[:start] + COLUMN_TOKEN.lower() + text[end:]
+    return text
+
+
+# -----------------------------------------------------------------------------
+# Classificador
+# -----------------------------------------------------------------------------
+
+def _training_set(include_descriptions: bool = True) -> Tuple[List[str], List[str]]:
+    schemas = _tool_schemas()
+    texts, labels = [], []
+
+    def add(label, text):
+        texts.append(_fold(text.replace("{col}", COLUMN_TOKEN)))
+        labels.append(label)
+
+    for label, templates in _TEMPLATES.items():
+        for tpl in templates:
+            add(label, tpl)
+        if label in schemas:
+            if include_descriptions:
+                add(label, schemas[label]["description"])
+            add(label, label.replace("_", " "))
+    # enums dos schemas: uma frase por valor (ex.: "std de COLUNA", "correlação spearman")
+    for stat in schemas["compute_stat"]["parameters"]["properties"]["stat"]["enum"]:
+        add("compute_stat", f"{stat} de {{col}}")
+    for method in schemas["corr_matrix"]["parameters"]["properties"]["method"]["enum"]:
+        add("corr_matrix", f"correlação {method}")
+    return texts, labels
+
+
+class IntentClassifier:
+    """TF-IDF de n-gramas de caracteres + regressão logística (treino em milissegundos)."""
+
+    def __init__(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        texts, labels = _training_set()
+        self.model = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True),
+            LogisticRegression(C=20.0, max_iter=2000),
+        )
+        self.model.fit(texts, labels)
+        self.vocabulary = _vocabulary()
+
+    def predict(self, masked_prompt: str) -> List[Tuple[str, float]]:
+        """Rótulos ordenados por probabilidade."""
+        proba = self.model.predict_proba([masked_prompt])[0]
+        order = proba.argsort()[::-1]
+        return [(self.model.classes_[i], float(proba[i])) for i in order]
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> IntentClassifier:
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier()
+        return _classifier
+
+
+# -----------------------------------------------------------------------------
+# Argumentos
+# -----------------------------------------------------------------------------
+
+def _numeric_columns(df) -> List[str]:
+    if hasattr(df, "numeric_columns"):  # ChunkedCSV, SQLSource
+        return list(df.numeric_columns())
+    return list(df.select_dtypes(include=["number"]).columns)
+
+
+def _int_after(pattern: str, text: str) -> Optional[int]:
+    m = re.search(pattern, text)
+    return int(m.group(1)) if m else None
+
+
+def _extract_args(tool: str, prompt: str, cols: List[str], df) -> Optional[Dict[str, Any]]:
+    """Argumentos da ferramenta a partir do prompt; None se faltar algo obrigatório."""
+    text = _fold(prompt)
+    numeric = [c for c in cols if c in set(_numeric_columns(df))]
+    if tool == "histogram":
+        if not numeric:
+            return None
+        args: Dict[str, Any] = {"column": numeric[0]}
+        bins = _int_after(r"(\d+)\s*(?:bins|faixas|intervalos|barras)", text)
+        if bins:
+            args["bins"] = bins
+        if re.search(r"\blog", text):
+            args["log_scale"] = True
+        return args
+    if tool == "value_counts":
+        if not cols:
+            return None
+        args = {"column": cols[0]}
+        top = _int_after(r"top\s*(\d+)", text) or _int_after(r"(\d+)\s*(?:valores|categorias)", text)
+        if top:
+            args["top"] = top
+        return args
+    if tool == "compute_stat":
+        stat = next((s for word, s in _STAT_WORDS if re.search(rf"\b{word}", text)), None)
+        if stat is None or not numeric:
+            return None
+        return {"column": numeric[0], "stat": stat}
+    if tool == "corr_matrix":
+        args = {}
+        if "spearman" in text:
+            args["method"] = "spearman"
+        if re.search(r"pares|mais fortes|mais correlacionad|strongest|top", text):
+            args["top_pairs"] = _int_after(r"top\s*(\d+)", text) or _int_after(r"(\d+)\s*pares", text) or 10
+        return args
+    if tool == "class_balance":
+        if cols:
+            return {"target": cols[0]}
+        index = column_index(df)
+        target = next((c for c in map(index.resolve, ("class", "classe", "target", "label")) if c is not None),
+                      None)
+        return {"target": target} if target is not None else None
+    return {}
+
+
+# -----------------------------------------------------------------------------
+# Roteamento
+# -----------------------------------------------------------------------------
+
+class Route:
+    """Decisão do roteador local (tool=None: deixar para o LLM)."""
+
+    def __init__(self, tool: Optional[str], args: Dict[str, Any], confidence: float, guess: Optional[str],
+                 reason: str = ""):
+        self.tool = tool
+        self.args = args
+        self.confidence = confidence
+        self.guess = guess  # melhor palpite, mesmo quando não confiante (para medir concordância)
+        self.reason = reason
+
+    @property
+    def confident(self) -> bool:
+        return self.tool is not None
+
+
+def route_prompt(prompt: str, df, min_confidence: float = INTENT_MIN_CONFIDENCE,
+                 min_margin: float = INTENT_MIN_MARGIN) -> Route:
+    """Ferramenta + argumentos para o prompt, ou Route(tool=None) quando não há confiança."""
+    if df is None or not prompt or not prompt.strip():
+        return Route(None, {}, 0.0, None, "sem dataset")
+    if _ROW_CONDITION.search(_fold(prompt)):
+        return Route(None, {}, 0.0, None, "filtro de linhas")
+    matches = column_index(df).scan(prompt)
+    cols = list(dict.fromkeys(col for _, _, col in matches))
+    ranked = get_classifier().predict(_mask_columns(prompt, matches))
+    (label, p1), p2 = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+    guess = None if label == OTHER else label
+    if label == OTHER:
+        return Route(None, {}, p1, None, "fora do escopo local")
+    if p1 < min_confidence or p1 - p2 < min_margin:
+        return Route(None, {}, p1, guess, "baixa confiança")
+    args = _extract_args(label, prompt, cols, df)
+    if args is None:
+        return Route(None, {}, p1, guess, "argumentos não resolvidos")
+    reason = _unexpressed(label, prompt, matches, cols, args, get_classifier().vocabulary)
+    if reason is not None:
+        return Route(None, {}, p1, guess, reason)
+    return Route(label, args, p1, guess)
+
+
+# -----------------------------------------------------------------------------
+# Concordância com o LLM
+# -----------------------------------------------------------------------------
+
+_stats = {"local": 0, "llm": 0, "compared": 0, "tool_agree": 0, "args_agree": 0}
+_stats_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def _append_log(entry: Dict[str, Any]):
+    line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+    with _log_lock:
+        try:
+            os.makedirs(os.path.dirname(INTENT_LOG_PATH) or ".", exist_ok=True)
+            if os.path.exists(INTENT_LOG_PATH) and os.path.getsize(INTENT_LOG_PATH) > INTENT_LOG_MAX_MB * 1024 * 1024:
+                os.replace(INTENT_LOG_PATH, INTENT_LOG_PATH + ".1")
+            with open(INTENT_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass
+
+
+def record_decision(prompt: str, route: Route, llm_calls: Optional[List[Tuple[str, Dict[str, Any]]]] = None,
+                    audit: bool = False):
+    """Registra a decisão e, quando há chamadas do LLM para comparar, a concordância de
+    ferramenta e de argumentos com o palpite local.
+    audit=True: comparação feita em segundo plano para uma pergunta já roteada localmente
+    (não conta como nova pergunta). Sem chamadas do LLM (llm_calls=[]) não há o que comparar."""
+    entry: Dict[str, Any] = {
+        "ts": time.time(), "prompt": prompt, "local": route.confident, "guess": route.guess,
+        "args": route.args, "confidence": round(route.confidence, 4), "reason": route.reason,
+    }
+    with _stats_lock:
+        if not audit:
+            _stats["local" if route.confident else "llm"] += 1
+        if llm_calls:
+            llm_tool, llm_args = llm_calls[0] if len(llm_calls) == 1 else (None, {})
+            tool_ok = route.guess is not None and route.guess == llm_tool
+            args_ok = tool_ok and route.confident and all(
+                _fold(llm_args[k]) == _fold(v) for k, v in route.args.items() if k in llm_args
+            )
+            _stats["compared"] += 1
+            _stats["tool_agree"] += tool_ok
+            _stats["args_agree"] += args_ok
+            entry.update({"audit": audit, "llm_calls": [name for name, _ in llm_calls],
+                          "tool_agree": tool_ok, "args_agree": args_ok})
+    if INTENT_LOG and INTENT_LOG_PATH:
+        _append_log(entry)
+
+
+def stats() -> Dict[str, Any]:
+    """Contadores do processo: perguntas resolvidas localmente, idas ao LLM e concordância."""
+    with _stats_lock:
+        out = dict(_stats)
+    total = out["local"] + out["llm"]
+    out["local_rate"] = out["local"] / total if total else 0.0
+    out["tool_agreement"] = out["tool_agree"] / out["compared"] if out["compared"] else None
+    return out
@@ -0,0 +1,353 @@
+# exportação incremental das notas salvas em invoices.db (ex.: sincronização noturna do ERP)
+# Lê a tabela `invoices` em páginas por keyset (created_at, id) a partir de uma marca d'água,
+# achata o fields_json/validation_report_json em colunas tipadas e grava CSV ou Parquet uma
+# página por vez (memória constante). Cada arquivo é escrito como .part, renomeado ao fechar
+# e só então a marca d'água avança: uma exportação interrompida recomeça do último arquivo
+# completo, e o arquivo refeito tem o mesmo nome (derivado do 1º id), sem linhas duplicadas.
+#
+#   python -m app.agent.invoice_export --out exports/ --format parquet
+#   python -m app.agent.invoice_export --status
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from .docs_agent import _get_db_connection, _only_digits
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+EXPORT_ROWS_PER_FILE = int(os.getenv("EXPORT_ROWS_PER_FILE", "200000"))
+FORMATS = ("csv", "parquet")
+
+# colunas exportadas (ordem e tipos fixos: todas as páginas e arquivos têm o mesmo schema)
+COLUMNS: List[Tuple[str, str]] = [
+    ("id", "int64"),
+    ("created_at", "datetime64[us]"),
+    ("tipo_documento", "string"),
+    ("chave_acesso", "string"),
+    ("cnpj_emitente", "string"),
+    ("razao_social_emitente", "string"),
+    ("cnpj_destinatario", "string"),
+    ("razao_social_destinatario", "string"),
+    ("data_emissao", "datetime64[us]"),
+    ("valor_total", "Float64"),
+    ("score_confianca", "Float64"),
+    ("campos_suspeitos", "string"),
+    ("campos_extras", "string"),
+]
+_DIGIT_FIELDS = ("chave_acesso", "cnpj_emitente", "cnpj_destinatario")
+_TEXT_FIELDS = ("tipo_documento", "razao_social_emitente", "razao_social_destinatario")
+_KNOWN_FIELDS = set(_DIGIT_FIELDS) | set(_TEXT_FIELDS) | {"data_emissao", "valor_total"}
+
+
+# ============================================================
+# 1. Campos JSON -> colunas tipadas
+# ============================================================
+
+def _parse_valor(value: Any) -> Optional[float]:
+    """'1.234,56', '1234,56', '1,234.56', '1234.56', 'R$ 1.234' e números -> float. Só 'R$' e
+    espaços são descartados: qualquer outro texto ('USD 100', '100 reais') dá None, nunca um
+    número parcial. invoice_source._valor aplica as mesmas regras em SQL."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("R$", "").replace(" ", "")
+    if not re.fullmatch(r"[-+]?[\d.,]*", text) or not re.search(r"\d", text):
+        return None
+    if "," in text and "." in text:
+        # o separador que aparece por último é o decimal
+        thousands = "." if text.rfind(",") > text.rfind(".") else ","
+        text = text.replace(thousands, "").replace(",", ".")
+    elif "," in text:
+        text = text.replace(",", ".") if text.count(",") == 1 else text.replace(",", "")
+    elif text.count(".") > 1 or re.search(r"\.\d{3}$", text):
+        text = text.replace(".", "")  # 1.234.567 / 1.234: pontos de milhar
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def flatten_invoice(row: Tuple[int, str, str, str]) -> Dict[str, Any]:
+    """(id, created_at, fields_json, validation_report_json) -> dicionário com as COLUMNS.
+    CNPJs e chave só com dígitos; campos fora do schema vão, em JSON, para campos_extras."""
+    invoice_id, created_at, fields_json, report_json = row
+    try:
+        fields = json.loads(fields_json or "{}")
+    except ValueError:
+        fields = {"raw_fields_json": fields_json}
+    try:
+        report = json.loads(report_json or "{}")
+    except ValueError:
+        report = {}
+    if not isinstance(fields, dict):
+        fields = {"raw_fields_json": fields}
+    out: Dict[str, Any] = {"id": invoice_id, "created_at": created_at}
+    for key in _DIGIT_FIELDS:
+        digits = _only_digits(str(fields.get(key) or ""))
+        out[key] = digits or None
+    for key in _TEXT_FIELDS:
+        value = fields.get(key)
+        out[key] = None if value in (None, "") else str(value)
+    out["data_emissao"] = _parse_date(fields.get("data_emissao"))
+    out["valor_total"] = _parse_valor(fields.get("valor_total"))
+    score = report.get("score_confianca") if isinstance(report, dict) else None
+    out["score_confianca"] = float(score) if isinstance(score, (int, float)) else None
+    suspects = report.get("campos_suspeitos") if isinstance(report, dict) else None
+    out["campos_suspeitos"] = ";".join(map(str, suspects)) if suspects else None
+    extras = {k: v for k, v in fields.items() if k not in _KNOWN_FIELDS}
+    out["campos_extras"] = json.dumps(extras, ensure_ascii=False) if extras else None
+    return out
+
+
+def _page_frame(rows: List[Tuple[int, str, str, str]]) -> pd.DataFrame:
+    frame = pd.DataFrame([flatten_invoice(r) for r in rows], columns=[c for c, _ in COLUMNS])
+    frame["created_at"] = pd.to_datetime(frame["created_at"], errors="coerce", format="ISO8601")
+    frame["data_emissao"] = pd.to_datetime(frame["data_emissao"], errors="coerce")
+    return frame.astype(dict(COLUMNS))
+
+
+# ============================================================
+# 2. Leitura por keyset
+# ============================================================
+
+def _prepare(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_created_id ON invoices (created_at, id)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS export_watermarks (
+            name TEXT PRIMARY KEY,
+            last_created_at TEXT NOT NULL,
+            last_id INTEGER NOT NULL,
+            rows_exported INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.commit()
+
+
+def iter_invoice_batches(
+    db_path: str = "invoices.db",
+    after: Optional[Tuple[str, int]] = None,
+    until: Optional[Tuple[str, int]] = None,
+    batch_size: int = EXPORT_BATCH_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """Páginas (DataFrames com as COLUMNS) das notas com (created_at, id) > after e <= until,
+    em ordem. Cada página é uma consulta curta pelo índice (created_at, id): nada de OFFSET
+    nem cursor aberto durante a exportação inteira."""
+    conn = _get_db_connection(db_path)
+    try:
+        _prepare(conn)
+        last = after or ("", 0)
+        bound, params = "", []
+        if until is not None:
+            bound, params = " AND (created_at, id) <= (?, ?)", list(until)
+        while True:
+            rows = conn.execute(
+                "SELECT id, created_at, fields_json, validation_report_json FROM invoices "
+                f"WHERE (created_at, id) > (?, ?){bound} ORDER BY created_at, id LIMIT ?",
+                [last[0], last[1], *params, int(batch_size)],
+            ).fetchall()
+            if not rows:
+                return
+            last = (rows[-1][1], rows[-1][0])
+            page = _page_frame(rows)
+            page.attrs["last_key"] = last  # (created_at, id) como gravados: próxima marca d'água
+            yield page
+            if len(rows) < batch_size:
+                return
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 3. Marca d'água
+# ============================================================
+
+def get_watermark(name: str, db_path: str = "invoices.db") -> Optional[Dict[str, Any]]:
+    conn = _get_db_connection(db_path)
+    try:
+        _prepare(conn)
+        row = conn.execute(
+            "SELECT last_created_at, last_id, rows_exported, updated_at FROM export_watermarks WHERE name = ?",
+            (name,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"name": name, "last_created_at": row[0], "last_id": row[1], "rows_exported": row[2],
+            "updated_at": row[3]}
+
+
+def list_watermarks(db_path: str = "invoices.db") -> List[Dict[str, Any]]:
+    conn = _get_db_connection(db_path)
+    try:
+        _prepare(conn)
+        names = [r[0] for r in conn.execute("SELECT name FROM export_watermarks ORDER BY name")]
+    finally:
+        conn.close()
+    return [get_watermark(n, db_path) for n in names]
+
+
+def _save_watermark(conn: sqlite3.Connection, name: str, last: Tuple[str, int], rows: int):
+    conn.execute(
+        """
+        INSERT INTO export_watermarks (name, last_created_at, last_id, rows_exported, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            last_created_at = excluded.last_created_at,
+            last_id = excluded.last_id,
+            rows_exported = export_watermarks.rows_exported + ?,
+            updated_at = excluded.updated_at
+        """,
+        (name, last[0], last[1], rows, datetime.utcnow().isoformat(), rows),
+    )
+    conn.commit()
+
+
+def reset_watermark(name: str, db_path: str = "invoices.db"):
+    conn = _get_db_connection(db_path)
+    try:
+        _prepare(conn)
+        conn.execute("DELETE FROM export_watermarks WHERE name = ?", (name,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 4. Escrita (CSV / Parquet), um arquivo por até EXPORT_ROWS_PER_FILE linhas
+# ============================================================
+
+class _Writer:
+    def __init__(self, path: str, fmt: str):
+        self.path, self.fmt, self.rows = path, fmt, 0
+        if fmt == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise RuntimeError("Exportação em Parquet requer o pacote pyarrow.") from e
+            self._pa = pa
+            self._schema = pa.Schema.from_pandas(_page_frame([]), preserve_index=False)
+            self._file = pq.ParquetWriter(path, self._schema, compression="zstd")
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+
+    def write(self, page: pd.DataFrame):
+        if self.fmt == "parquet":
+            # uma página = um row group
+            self._file.write_table(self._pa.Table.from_pandas(page, schema=self._schema, preserve_index=False))
+        else:
+            # textos entre aspas (chave/CNPJ não viram número no ERP), números sem
+            page.to_csv(self._file, header=self.rows == 0, index=False, quoting=csv.QUOTE_NONNUMERIC,
+                        date_format="%Y-%m-%dT%H:%M:%S.%f")
+        self.rows += len(page)
+
+    def close(self):
+        if self.fmt != "parquet":
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def export_invoices(
+    out_dir: str,
+    db_path: str = "invoices.db",
+    fmt: str = "csv",
+    name: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_ROWS,
+    rows_per_file: int = EXPORT_ROWS_PER_FILE,
+    full: bool = False,
+) -> Dict[str, Any]:
+    """Exporta as notas novas desde a marca d'água `name` (padrão: formato + diretório) para
+    arquivos em `out_dir`. full=True ignora a marca d'água e exporta tudo de novo. As linhas
+    que chegarem durante a exportação ficam para a próxima (o fim é fixado no início)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato desconhecido: {fmt}. Use um de {', '.join(FORMATS)}.")
+    name = name or f"{fmt}:{os.path.abspath(out_dir)}"
+    os.makedirs(out_dir, exist_ok=True)
+    if full:
+        reset_watermark(name, db_path)
+    mark = get_watermark(name, db_path)
+    after = (mark["last_created_at"], mark["last_id"]) if mark else None
+
+    conn = _get_db_connection(db_path)
+    try:
+        _prepare(conn)
+        end = conn.execute("SELECT created_at, id FROM invoices ORDER BY created_at DESC, id DESC LIMIT 1").fetchone()
+        files: List[str] = []
+        total = 0
+        writer: Optional[_Writer] = None
+        last: Optional[Tuple[str, int]] = None
+
+        def finish():
+            nonlocal writer, total
+            writer.close()
+            final = writer.path[: -len(".part")]
+            os.replace(writer.path, final)
+            _save_watermark(conn, name, last, writer.rows)
+            files.append(final)
+            total += writer.rows
+            writer = None
+
+        if end is not None:
+            for page in iter_invoice_batches(db_path, after=after, until=tuple(end), batch_size=batch_size):
+                if writer is None:
+                    first_id = int(page["id"].iloc[0])
+                    writer = _Writer(os.path.join(out_dir, f"invoices_{first_id:010d}.{fmt}.part"), fmt)
+                writer.write(page)
+                last = page.attrs["last_key"]
+                if writer.rows >= rows_per_file:
+                    finish()
+            if writer is not None:
+                finish()
+    finally:
+        conn.close()
+    return {"status": "ok", "rows": total, "files": files, "watermark": get_watermark(name, db_path)}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Exportação incremental das notas de invoices.db.")
+    parser.add_argument("--db", default="invoices.db")
+    parser.add_argument("--out", help="diretório de destino")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--name", help="nome da marca d'água (padrão: formato + diretório)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_ROWS)
+    parser.add_argument("--rows-per-file", type=int, default=EXPORT_ROWS_PER_FILE)
+    parser.add_argument("--full", action="store_true", help="ignora a marca d'água e exporta tudo")
+    parser.add_argument("--status", action="store_true", help="só mostra as marcas d'água")
+    args = parser.parse_args(argv)
+    if args.status:
+        print(json.dumps(list_watermarks(args.db), ensure_ascii=False, indent=2))
+        return 0
+    if not args.out:
+        parser.error("--out é obrigatório para exportar")
+    result = export_invoices(args.out, db_path=args.db, fmt=args.format, name=args.name,
+                             batch_size=args.batch_size, rows_per_file=args.rows_per_file, full=args.full)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# as notas fiscais de invoices.db como fonte de dados do agente de EDA
+# Cada nota é uma linha; os campos de fields_json/validation_report_json viram colunas por
+# expressões SQL com as mesmas normalizações da exportação (invoice_export.py): CNPJs e chave
+# só com dígitos, data_emissao em AAAA-MM-DD, valor_total numérico. As colunas usadas como
+# chave de grupo e filtro ganham índices de expressão (criados uma vez) que cobrem também as
+# medidas (valor_total, score_confianca): "total por CNPJ emitente" percorre só o índice.
+# As ferramentas recebem um SQLSource (app/tools/sqlsource.py) e agregam dentro do SQLite.
+import os
+from typing import List
+
+from app.tools.sqlsource import SQLColumn, SQLSource
+
+from .docs_agent import _get_db_connection
+
+INVOICES_DB = os.getenv("INVOICES_DB", "invoices.db")
+
+
+def _json(document: str, key: str) -> str:
+    # JSON malformado vira NULL em vez de abortar a consulta (ou um INSERT, por causa do índice)
+    return f"json_extract(CASE WHEN json_valid({document}) THEN {document} END, '$.{key}')"
+
+
+def _text(value: str) -> str:
+    # texto vazio conta como ausente, como na exportação
+    return f"NULLIF(CAST({value} AS TEXT), '')"
+
+
+def _digits(value: str) -> str:
+    return _text(f"replace(replace(replace(replace({value}, '.', ''), '/', ''), '-', ''), ' ', '')")
+
+
+def _date(value: str) -> str:
+    # DD/MM/AAAA (formato pedido na extração) ou AAAA-MM-DD -> AAAA-MM-DD
+    return (f"CASE WHEN {value} GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' "
+            f"THEN substr({value}, 7, 4) || '-' || substr({value}, 4, 2) || '-' || substr({value}, 1, 2) "
+            f"WHEN {value} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' THEN substr({value}, 1, 10) END")
+
+
+def _valor(value: str) -> str:
+    # mesmas regras de invoice_export._parse_valor: '1.234,56', '1234,56', '1,234.56', '1234.56',
+    # '1.234'; sem 'R$' e espaços, só dígitos, '.', ',' e um sinal no início (senão NULL: um
+    # CAST de 'USD 100' daria 0.0 e entraria nas somas). O separador decimal é o que aparece
+    # por último; ld/lc são as posições do último '.'/','.
+    t = f"replace(replace(CAST({value} AS TEXT), 'R$', ''), ' ', '')"
+    body = f"CASE WHEN substr({t}, 1, 1) IN ('-', '+') THEN substr({t}, 2) ELSE {t} END"
+    nc, nd = f"(length({t}) - length(replace({t}, ',', '')))", f"(length({t}) - length(replace({t}, '.', '')))"
+    lc, ld = f"length(rtrim({t}, '0123456789.+-'))", f"length(rtrim({t}, '0123456789,+-'))"
+    return (f"CASE WHEN typeof({value}) IN ('integer', 'real') THEN {value} "
+            f"WHEN NOT ({t} GLOB '*[0-9]*') OR ({body}) GLOB '*[^0-9.,]*' THEN NULL "
+            f"WHEN {nc} > 0 AND {nd} > 0 AND {lc} > {ld} "
+            f"THEN CASE WHEN {nc} > 1 THEN NULL ELSE CAST(replace(replace({t}, '.', ''), ',', '.') AS REAL) END "
+            f"WHEN {nc} > 0 AND {nd} > 0 THEN CASE WHEN {nd} > 1 THEN NULL ELSE CAST(replace({t}, ',', '') AS REAL) END "
+            f"WHEN {nc} = 1 THEN CAST(replace({t}, ',', '.') AS REAL) "
+            f"WHEN {nc} > 1 THEN CAST(replace({t}, ',', '') AS REAL) "
+            f"WHEN {nd} > 1 OR {t} GLOB '*.[0-9][0-9][0-9]' THEN CAST(replace({t}, '.', '') AS REAL) "
+            f"ELSE CAST({t} AS REAL) END")
+
+
+# true/false do JSON viram 1/0 no json_extract; na exportação, booleanos não são valores
+_VALOR = (f"CASE WHEN json_type(CASE WHEN json_valid(fields_json) THEN fields_json END, '$.valor_total') "
+          f"IN ('true', 'false') THEN NULL ELSE {_valor(_json('fields_json', 'valor_total'))} END")
+_SCORE = _json("validation_report_json", "score_confianca")
+_REPORT = "CASE WHEN json_valid(validation_report_json) THEN validation_report_json END"
+
+COLUMNS: List[SQLColumn] = [
+    SQLColumn("id", "id", "int64"),
+    SQLColumn("created_at", "created_at", "datetime64[us]", "datetime"),
+    SQLColumn("tipo_documento", _text(_json("fields_json", "tipo_documento")), "string"),
+    SQLColumn("chave_acesso", _digits(_json("fields_json", "chave_acesso")), "string", "digits"),
+    SQLColumn("cnpj_emitente", _digits(_json("fields_json", "cnpj_emitente")), "string", "digits"),
+    SQLColumn("razao_social_emitente", _text(_json("fields_json", "razao_social_emitente")), "string"),
+    SQLColumn("cnpj_destinatario", _digits(_json("fields_json", "cnpj_destinatario")), "string", "digits"),
+    SQLColumn("razao_social_destinatario", _text(_json("fields_json", "razao_social_destinatario")), "string"),
+    SQLColumn("data_emissao", _date(_json("fields_json", "data_emissao")), "datetime64[us]", "date"),
+    SQLColumn("valor_total", _VALOR, "Float64"),
+    SQLColumn("score_confianca", _SCORE, "Float64"),
+    SQLColumn("campos_suspeitos", _json("validation_report_json", "campos_suspeitos"), "string", "list",
+              each=f"json_each({_REPORT}, '$.campos_suspeitos')"),
+    SQLColumn("n_campos_suspeitos", f"json_array_length({_REPORT}, '$.campos_suspeitos')", "Float64"),
+]
+_BY_NAME = {c.name: c for c in COLUMNS}
+
+# (nome, colunas) dos índices de expressão: chave de grupo/filtro + medidas (índice de cobertura)
+INDEXES = [
+    ("idx_invoices_cnpj_emitente", ("cnpj_emitente", "valor_total", "score_confianca")),
+    ("idx_invoices_cnpj_destinatario", ("cnpj_destinatario", "valor_total", "score_confianca")),
+    ("idx_invoices_tipo_documento", ("tipo_documento", "valor_total", "score_confianca")),
+    ("idx_invoices_data_emissao", ("data_emissao", "valor_total", "score_confianca")),
+    ("idx_invoices_valor_total", ("valor_total",)),
+    ("idx_invoices_score", ("score_confianca", "n_campos_suspeitos")),
+    ("idx_invoices_n_suspeitos", ("n_campos_suspeitos",)),
+]
+
+
+def prepare(db_path: str = INVOICES_DB):
+    """Cria a tabela (se preciso) e os índices de expressão; idempotente. Um índice criado com
+    uma expressão antiga (o planejador só usa índices com a expressão idêntica) é recriado."""
+    conn = _get_db_connection(db_path)
+    try:
+        existing = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'invoices'"))
+        for name, cols in INDEXES:
+            sql = f"CREATE INDEX {name} ON invoices ({', '.join(_BY_NAME[c].expr for c in cols)})"
+            if existing.get(name) == sql:
+                continue
+            if name in existing:
+                conn.execute(f"DROP INDEX {name}")
+            conn.execute(sql)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_created_id ON invoices (created_at, id)")
+        conn.execute("PRAGMA optimize")  # estatísticas do planejador, só quando faltam/estão velhas
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def invoice_source(db_path: str = INVOICES_DB) -> SQLSource:
+    """A tabela de notas como dataset das ferramentas de EDA (consultas somente leitura)."""
+    prepare(db_path)
+    return SQLSource(db_path, "invoices", COLUMNS, label="Notas fiscais")
@@ -0,0 +1,230 @@
+# cliente LLM compartilhado pelos agentes (EDA e documentos fiscais)
+# Um único cliente OpenAI com pool de conexões keep-alive, retentativas com backoff
+# exponencial + jitter (respeitando Retry-After), timeout por chamada, limite de
+# chamadas simultâneas e contabilidade de tokens por sessão e por documento.
+# OPENAI_BASE_URL aponta o cliente para outro servidor (ex.: um stub local nos testes).
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "30"))
+# orçamento de tokens por sessão (0 = sem limite)
+LLM_SESSION_BUDGET = int(os.getenv("LLM_SESSION_BUDGET", "0"))
+# contabilidade de sessões/documentos sem chamadas há mais que isso é descartada
+LLM_USAGE_IDLE_S = float(os.getenv("LLM_USAGE_IDLE_S", str(24 * 3600)))
+_EVICT_EVERY_S = 60.0
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMBudgetExceeded(RuntimeError):
+    """A sessão já consumiu o orçamento de tokens configurado."""
+
+
+def _new_usage() -> Dict[str, int]:
+    return {"calls": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+
+def _retry_after(exc) -> Optional[float]:
+    """Espera sugerida pelo servidor (Retry-After / retry-after-ms), em segundos."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):  # Retry-After em formato de data: cai no backoff normal
+        pass
+    return None
+
+
+def _is_retryable(exc) -> bool:
+    import openai
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in _RETRY_STATUS
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Backoff exponencial com jitter completo; Retry-After do servidor tem precedência."""
+    if retry_after is not None:
+        return min(max(retry_after, 0.0), LLM_BACKOFF_MAX_S)
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt))
+
+
+class _TrackedStream:
+    """Iterador sobre os chunks de um stream. Guarda o uso de tokens (último chunk) e chama
+    on_close(usage) uma única vez: quando o stream termina, falha, é fechado (close) ou é
+    descartado sem ser consumido até o fim."""
+
+    def __init__(self, stream, on_close: Callable[[Any], None]):
+        self._stream = stream
+        self._chunks = iter(stream)
+        self._on_close = on_close
+        self._usage = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+        if getattr(chunk, "usage", None) is not None:
+            self._usage = chunk.usage
+        return chunk
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close(self._usage)
+
+    def __del__(self):
+        self.close()
+
+
+class LLMClient:
+    """Fachada fina sobre openai.OpenAI: chat(**kwargs) aceita os mesmos argumentos de
+    client.chat.completions.create, mais session/document (contabilidade) e timeout."""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: float = LLM_TIMEOUT_S, max_retries: int = LLM_MAX_RETRIES,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, session_budget: int = LLM_SESSION_BUDGET):
+        import openai
+        limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_S,
+        )
+        self._sdk = openai.OpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,  # as retentativas são nossas (jitter + Retry-After + contabilidade)
+            timeout=openai.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT_S),
+            http_client=openai.DefaultHttpxClient(limits=limits),
+        )
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session_budget = session_budget
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, int]] = defaultdict(_new_usage)
+        self._documents: Dict[str, Dict[str, int]] = defaultdict(_new_usage)
+        self._last_used: Dict[tuple, float] = {}  # (livro, chave) -> última chamada
+        self._evicted_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # contabilidade
+    # ------------------------------------------------------------------
+    def _record(self, session: Optional[str], document: Optional[str], usage=None, retries: int = 0,
+                calls: int = 1):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            for name, book, key in (("session", self._sessions, session), ("document", self._documents, document)):
+                if key is None:
+                    continue
+                self._last_used[(name, key)] = now
+                entry = book[key]
+                entry["calls"] += calls
+                entry["retries"] += retries
+                if usage is not None:
+                    entry["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                    entry["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+                    entry["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+    def _evict_idle(self, now: float):
+        """(com self._lock) descarta sessões/documentos sem chamadas há mais de LLM_USAGE_IDLE_S;
+        varre no máximo uma vez por minuto."""
+        if now - self._evicted_at < _EVICT_EVERY_S:
+            return
+        self._evicted_at = now
+        books = {"session": self._sessions, "document": self._documents}
+        for name, key in [k for k, t in self._last_used.items() if now - t > LLM_USAGE_IDLE_S]:
+            del self._last_used[(name, key)]
+            books[name].pop(key, None)
+
+    def usage(self, session: Optional[str] = None, document: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            if document is not None:
+                return dict(self._documents.get(document) or _new_usage())
+            return dict(self._sessions.get(session) or _new_usage())
+
+    def _check_budget(self, session: Optional[str]):
+        if not self.session_budget or session is None:
+            return
+        used = self.usage(session=session)["total_tokens"]
+        if used >= self.session_budget:
+            raise LLMBudgetExceeded(
+                f"Orçamento de tokens da sessão esgotado ({used} de {self.session_budget})."
+            )
+
+    # ------------------------------------------------------------------
+    # chamadas
+    # ------------------------------------------------------------------
+    def chat(self, session: Optional[str] = None, document: Optional[str] = None,
+             timeout: Optional[float] = None, **kwargs):
+        """chat.completions.create com retentativas. Com stream=True devolve um iterador
+        de chunks; a vaga de concorrência fica ocupada até o stream ser consumido (ou fechado)
+        e o uso de tokens é registrado nesse momento."""
+        self._check_budget(session)
+        stream = bool(kwargs.get("stream"))
+        if stream:
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        retries = 0
+        while True:
+            self._slots.acquire()
+            try:
+                response = self._sdk.chat.completions.create(timeout=timeout or self.timeout, **kwargs)
+            except BaseException as e:
+                self._slots.release()
+                if not isinstance(e, Exception) or retries >= self.max_retries or not _is_retryable(e):
+                    self._record(session, document, retries=retries)
+                    raise
+                time.sleep(backoff_delay(retries, _retry_after(e)))
+                retries += 1
+                continue
+            break
+        if stream:
+            def finish(usage):
+                self._slots.release()
+                self._record(session, document, usage, retries)
+            return _TrackedStream(response, finish)
+        self._slots.release()
+        self._record(session, document, getattr(response, "usage", None), retries)
+        return response
+
+
+_llm: Optional[LLMClient] = None
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> LLMClient:
+    """Cliente compartilhado (criado na primeira chamada)."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = LLMClient()
+        return _llm
@@ -0,0 +1,271 @@
+# registro de ferramentas do agente de EDA
+# Cada ferramenta declara schema (JSON Schema do tool calling) e implementação no mesmo
+# lugar, com o decorator @tool; o dispatch é uma busca em dicionário. Toda chamada é
+# medida (tempo de parede, tempo de CPU, pico de alocação e tamanho da saída) e
+# os números ficam disponíveis em metrics() para a UI e, opcionalmente, num log JSONL.
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# TOOL_TRACE_MEMORY=1 mede o pico de alocação com tracemalloc, ligado só enquanto há ferramentas
+# rodando (deixa toda alocação Python do processo várias vezes mais lenta nesse intervalo)
+TOOL_TRACE_MEMORY = os.getenv("TOOL_TRACE_MEMORY", "0") == "1"
+# arquivo JSONL com uma linha por chamada ("" = desligado)
+TOOL_METRICS_LOG = os.getenv("TOOL_METRICS_LOG", "")
+# chamadas recentes guardadas por ferramenta (para mediana/p95)
+TOOL_METRICS_WINDOW = int(os.getenv("TOOL_METRICS_WINDOW", "200"))
+
+APPROXIMATE_PARAM = {
+    "type": "boolean",
+    "description": "Usa amostra estratificada em cache (rápido em datasets grandes; reporta tamanho da "
+                   "amostra e IC95%). Omita para seguir o modo escolhido pelo usuário.",
+}
+
+WHERE_PARAM = {
+    "type": "string",
+    "description": "Filtro de linhas (opcional), aplicado antes da análise. Sintaxe de expressão Python: "
+                   "==, !=, <, <=, >, >=, in [...], not in [...], and/or/not, parênteses, "
+                   "isna(col), notna(col), contains(col, 'texto'), between(col, a, b); nomes com espaços "
+                   "entre crases. Ex.: \"Class == 1 and Amount > 100\", \"`Merchant Type` in ['A', 'B']\".",
+}
+
+
+@dataclass
+class ToolSpec:
+    """Uma ferramenta: schema exposto ao modelo + como chamá-la.
+    inject: argumentos da função preenchidos pelo contexto da pergunta
+            ({"df": "df", "__prompt": "prompt"} = parâmetro -> chave do contexto).
+    approximate: aceita o modo aproximado (o schema ganha o parâmetro "approximate").
+    where: aceita filtro de linhas (o schema ganha o parâmetro "where"; aplicado pelo router).
+    chart: pode devolver spec Vega-Lite em vez de PNG (recebe client_chart).
+    sequential: roda depois das demais, na ordem do modelo (ex.: memória).
+    reusable: a saída depende só do dataset e dos argumentos (a conversa pode reaproveitá-la).
+    sql: funciona sobre uma fonte SQL (SQLSource), agregando dentro do banco.
+    timeout: limite próprio em segundos (None = padrão do router).
+    enabled: função que diz se a ferramenta pode ser oferecida agora (None = sempre)."""
+    name: str
+    description: str
+    fn: Callable[..., Dict[str, Any]]
+    properties: Dict[str, Any] = field(default_factory=dict)
+    required: List[str] = field(default_factory=list)
+    inject: Dict[str, str] = field(default_factory=lambda: {"df": "df"})
+    approximate: bool = False
+    where: bool = False
+    chart: bool = False
+    sequential: bool = False
+    reusable: bool = True
+    sql: bool = False
+    timeout: Optional[float] = None
+    enabled: Optional[Callable[[], bool]] = None
+
+    def is_enabled(self) -> bool:
+        return self.enabled is None or bool(self.enabled())
+
+    def schema(self) -> Dict[str, Any]:
+        properties = dict(self.properties)
+        if self.approximate:
+            properties["approximate"] = APPROXIMATE_PARAM
+        if self.where:
+            properties["where"] = WHERE_PARAM
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {"type": "object", "properties": properties, "required": list(self.required)},
+            },
+        }
+
+
+def output_size(out: Any) -> int:
+    """Tamanho aproximado (bytes) do que a ferramenta devolve para a UI."""
+    if isinstance(out, (bytes, bytearray)):
+        return len(out)
+    if isinstance(out, str):
+        return len(out.encode("utf-8"))
+    if isinstance(out, dict):
+        return sum(output_size(v) for v in out.values())
+    if isinstance(out, (list, tuple)):
+        return sum(output_size(v) for v in out)
+    if isinstance(out, pd.DataFrame):
+        return int(out.memory_usage(deep=True).sum())
+    if isinstance(out, np.ndarray):
+        return out.nbytes
+    if hasattr(out, "arrays"):  # TableResult
+        return sum(output_size(a) for a in out.arrays)
+    return 0
+
+
+class _Probe:
+    """Medidas que só existem para o processo inteiro: tempo de CPU (inclui threads auxiliares,
+    como a de renderização, e BLAS) e pico de alocação via tracemalloc. Com chamadas
+    simultâneas os números de uma incluem as outras: o registro sai marcado como "concurrent".
+    O tracemalloc (TOOL_TRACE_MEMORY) é ligado na primeira chamada ativa e desligado quando a
+    última termina, a menos que já estivesse ligado por outro motivo (python -X tracemalloc)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._overlap = 0  # chamadas iniciadas enquanto outra estava ativa
+        self._owns_trace = False
+
+    def start(self):
+        with self._lock:
+            if self._active == 0:
+                if TOOL_TRACE_MEMORY and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._owns_trace = True
+                if TOOL_TRACE_MEMORY:
+                    tracemalloc.reset_peak()
+                self._overlap = 0
+            else:
+                self._overlap += 1
+            self._active += 1
+            base = tracemalloc.get_traced_memory()[0] if TOOL_TRACE_MEMORY else None
+        return base, time.perf_counter(), time.process_time()
+
+    def stop(self, started) -> Dict[str, Any]:
+        base, wall0, cpu0 = started
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        with self._lock:
+            peak = max(tracemalloc.get_traced_memory()[1] - base, 0) if base is not None else None
+            concurrent = self._active > 1 or self._overlap > 0
+            self._active -= 1
+            if self._active == 0 and self._owns_trace:
+                tracemalloc.stop()
+                self._owns_trace = False
+        return {"wall_ms": wall * 1000, "cpu_ms": cpu * 1000,
+                "peak_kb": None if peak is None else peak / 1024, "concurrent": concurrent}
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._sinks: List[Callable[[Dict[str, Any]], None]] = []
+        self._probe = _Probe()
+
+    # ------------------------------------------------------------------
+    # registro
+    # ------------------------------------------------------------------
+    def tool(self, name: str, description: str, properties: Optional[Dict[str, Any]] = None,
+             required: Optional[List[str]] = None, inject: Optional[Dict[str, str]] = None, **options):
+        """Decorator: registra a função como a ferramenta `name` (ver ToolSpec)."""
+        def decorator(fn):
+            if name in self._tools:
+                raise ValueError(f"Ferramenta já registrada: {name}")
+            self._tools[name] = ToolSpec(
+                name=name, description=description, fn=fn, properties=properties or {},
+                required=required or [], inject={"df": "df"} if inject is None else inject, **options,
+            )
+            return fn
+        return decorator
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def schemas(self, enabled_only: bool = True) -> List[Dict[str, Any]]:
+        """Lista no formato de `tools=` do chat.completions (o antigo tools_spec.TOOLS);
+        ferramentas desligadas (enabled) ficam de fora, salvo enabled_only=False."""
+        return [spec.schema() for spec in self._tools.values() if not enabled_only or spec.is_enabled()]
+
+    def add_sink(self, sink: Callable[[Dict[str, Any]], None]):
+        """Recebe cada registro de chamada (ex.: enviar para um coletor de logs)."""
+        self._sinks.append(sink)
+
+    # ------------------------------------------------------------------
+    # chamada
+    # ------------------------------------------------------------------
+    def dispatch(self, name: str, args: Dict[str, Any], **context) -> Dict[str, Any]:
+        spec = self._tools.get(name)
+        if spec is None:
+            return {"text": f"Ferramenta desconhecida: {name}"}
+        if not spec.is_enabled():
+            return {"text": f"Ferramenta indisponível neste servidor: {name}"}
+        kwargs = dict(args)
+        for param, key in spec.inject.items():
+            kwargs[param] = context.get(key)
+        started = self._probe.start()
+        out, error = None, None
+        try:
+            out = spec.fn(**kwargs)
+            return out
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._record({
+                "ts": time.time(), "tool": name, **self._probe.stop(started),
+                "output_bytes": output_size(out) if out is not None else 0, "error": error,
+            })
+
+    # ------------------------------------------------------------------
+    # métricas
+    # ------------------------------------------------------------------
+    def _record(self, entry: Dict[str, Any]):
+        name = entry["tool"]
+        with self._lock:
+            samples = self._samples.setdefault(name, deque(maxlen=TOOL_METRICS_WINDOW))
+            samples.append(entry)
+            totals = self._totals.setdefault(name, {"calls": 0, "errors": 0, "wall_ms": 0.0, "cpu_ms": 0.0})
+            totals["calls"] += 1
+            totals["errors"] += entry["error"] is not None
+            totals["wall_ms"] += entry["wall_ms"]
+            totals["cpu_ms"] += entry["cpu_ms"]
+        for sink in list(self._sinks):
+            try:
+                sink(entry)
+            except Exception:
+                pass
+        if TOOL_METRICS_LOG:
+            try:
+                with open(TOOL_METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Resumo por ferramenta: totais desde o início e mediana/p95/máximo das últimas
+        TOOL_METRICS_WINDOW chamadas."""
+        with self._lock:
+            snapshot = {name: (dict(self._totals[name]), list(samples)) for name, samples in self._samples.items()}
+        out = {}
+        for name, (totals, samples) in snapshot.items():
+            wall = np.array([s["wall_ms"] for s in samples])
+            peaks = [s["peak_kb"] for s in samples if s["peak_kb"] is not None]
+            out[name] = {
+                "calls": int(totals["calls"]),
+                "errors": int(totals["errors"]),
+                "wall_ms_total": totals["wall_ms"],
+                "cpu_ms_total": totals["cpu_ms"],
+                "wall_ms_p50": float(np.percentile(wall, 50)),
+                "wall_ms_p95": float(np.percentile(wall, 95)),
+                "wall_ms_max": float(wall.max()),
+                "cpu_ms_p50": float(np.median([s["cpu_ms"] for s in samples])),
+                "peak_kb_max": max(peaks) if peaks else None,
+                "output_bytes_p50": float(np.median([s["output_bytes"] for s in samples])),
+                "last": samples[-1],
+            }
+        return out
+
+    def reset_metrics(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+
+registry = ToolRegistry()
+tool = registry.tool
@@ -1,25 +1,75 @@
 # app/agent/router.py
 # Integração com OpenAI (tool calling) + execução das ferramentas.
-# Versão com: schema_info, compute_stat, class_balance, groupby robusto e narrativa opcional.
+# Versão com: schema_info, compute_stat, class_balance, groupby robusto, narrativa opcional
+# modo aproximado (amostra estratificada + IC95%) para datasets grandes
+# caminho out-of-core (ChunkedCSV) para CSVs maiores que a memória
+# e fonte SQL (SQLSource: notas fiscais de invoices.db), agregando dentro do banco.
 
 import os
 import json
-from typing import Dict, Any
+import random
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from openai import OpenAI
 
-from .tools_spec import TOOLS
-from app.tools.tables import stylize
-from app.tools.plots import plot_histogram, plot_corr_heatmap
+from .intent_router import INTENT_AUDIT_RATE, record_decision, route_prompt, stats as intent_stats
+from .llm_client import get_llm
+from .registry import registry, tool
+from app.tools.tables import to_table
+from app.tools.runtime import iter_with_deadlines
+from app.tools.sandbox import SANDBOX_QUEUE_S, SANDBOX_WALL_S, run_code, sandbox_available
+from app.tools import chunked, incremental, sqlsource
+from app.tools.anomaly import detect_anomalies
+from app.tools.columns import column_index
+from app.tools.filters import FilterError, apply_filter
+from app.tools.groupby import groupby_aggregate as fast_groupby
+from app.tools.timeseries import MODES as TIME_SERIES_MODES, STATS as TIME_SERIES_STATS, time_series
+from app.tools.correlation import MAX_HEATMAP_COLUMNS, corr_matrix, top_pairs as strongest_pairs
+from app.tools.plots import (
+    bin_column, plot_binned_histogram, histogram_spec, plot_corr_matrix, corr_heatmap_spec,
+    plot_timeseries, timeseries_spec,
+)
+from app.tools.sampling import (
+    Z95, get_sample, should_approximate, estimate_stat, format_estimate, approx_groupby, corr_ci_halfwidth,
+)
 
 # -----------------------------------------------------------------------------
 # Implementações das ferramentas
 # -----------------------------------------------------------------------------
 
+def _column(df, name, label: str = "Coluna"):
+    """(coluna do dataset, None) ou (None, saída de erro com sugestões). Aceita diferenças
+    de caixa/acentos/separadores e pequenos erros de digitação (app/tools/columns.py)."""
+    index = column_index(df)
+    col = index.resolve(name)
+    if col is None:
+        return None, {"text": index.not_found(name, label)}
+    return col, None
+
+
+@tool("describe_data",
+      "Descreve o dataset carregado: shape, dtypes, nulls e estatísticas numéricas básicas.",
+      sql=True, timeout=60.0)
 def _tool_describe_data(df: pd.DataFrame) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
+    if chunked.is_out_of_core(df):
+        desc = chunked.describe(df)
+        dtypes = df.dtypes.astype(str).to_dict()
+        return {
+            "text": f"Shape: {df.n_rows} linhas x {len(df.columns)} colunas (out-of-core)\n\nTipos: {dtypes}",
+            "tables": [to_table(desc)]
+        }
+    if sqlsource.is_sql_source(df):
+        desc = df.summary()
+        dtypes = df.dtypes.astype(str).to_dict()
+        return {
+            "text": f"Shape: {df.n_rows} linhas x {len(df.columns)} colunas (consulta SQL em {df.label})"
+                    f"\n\nTipos: {dtypes}",
+            "tables": [to_table(desc)]
+        }
     shape = df.shape
     dtypes = df.dtypes.astype(str).to_dict()
     nulls = df.isna().sum().to_dict()
@@ -30,14 +80,23 @@ def _tool_describe_data(df: pd.DataFrame) -> Dict[str, Any]:
         desc = df.describe(include="all").transpose()
     return {
         "text": f"Shape: {shape[0]} linhas x {shape[1]} colunas\n\nTipos: {dtypes}\n\nNulls: {nulls}",
-        "tables": [stylize(desc)]
+        "tables": [to_table(desc)]
     }
 
 
+@tool("schema_info",
+      "Lista colunas numéricas e categóricas do dataset (apenas tipos, sem estatísticas).",
+      {"show_examples": {"type": "boolean", "default": False}}, sql=True)
 def _tool_schema_info(df: pd.DataFrame, show_examples: bool = False) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
-    num_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    if chunked.is_out_of_core(df):
+        num_cols = df.numeric_columns()
+        df = df._head  # exemplos e tipos vêm do primeiro bloco lido
+    elif sqlsource.is_sql_source(df):
+        num_cols = df.numeric_columns()
+    else:
+        num_cols = df.select_dtypes(include=["number"]).columns.tolist()
     cat_cols = [c for c in df.columns if c not in num_cols]
     out = pd.DataFrame({
         "column": num_cols + cat_cols,
@@ -47,44 +106,171 @@ def _tool_schema_info(df: pd.DataFrame, show_examples: bool = False) -> Dict[str
     if show_examples and len(cat_cols) > 0:
         ex = {}
         for c in cat_cols[:10]:
-            ex[c] = list(map(lambda x: str(x), pd.Series(df[c]).dropna().unique()[:5]))
+            if sqlsource.is_sql_source(df):  # os valores mais frequentes, sem ler a tabela
+                values = df.value_counts(c, top=6)[0].index.dropna()[:5]
+            else:
+                values = pd.Series(df[c]).dropna().unique()[:5]
+            ex[c] = list(map(lambda x: str(x), values))
         extra = f"\nExemplos (categorias – até 5 por coluna): {ex}"
-    return {"tables": [stylize(out)], "text": extra.strip()}
+    return {"tables": [to_table(out)], "text": extra.strip()}
 
 
+@tool("value_counts",
+      "Retorna value counts de uma coluna e opcionalmente desenha um barplot.",
+      {
+          "column": {"type": "string"},
+          "top": {"type": "integer", "default": 20, "minimum": 1},
+          "plot": {"type": "boolean", "default": True},
+      },
+      required=["column"], where=True, sql=True)
 def _tool_value_counts(df: pd.DataFrame, column: str, top: int = 20, plot: bool = True) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
-    if column not in df.columns:
-        return {"text": f"Coluna '{column}' não encontrada."}
-    vc = df[column].value_counts(dropna=False).head(top)
+    column, missing = _column(df, column)
+    if missing:
+        return missing
+    note = ""
+    if sqlsource.is_sql_source(df):
+        vc, distinct = df.value_counts(column, top)
+        note = f" (de {distinct} valores distintos; consulta SQL em {df.label})"
+    elif chunked.is_out_of_core(df):
+        counter = chunked.value_counts(df, column)
+        vc = counter.counts.head(top)
+        if counter.truncated:
+            note = " (contagens aproximadas: muitos valores distintos)"
+    else:
+        vc = incremental.value_counts(df, column).head(top)
     result = {
-        "text": f"Top {min(top, len(vc))} valores em '{column}'.",
-        "tables": [stylize(vc.to_frame(name="count"))],
+        "text": f"Top {min(top, len(vc))} valores em '{column}'{note}.",
+        "tables": [to_table(vc.to_frame(name="count"))],
     }
     return result
 
 
-def _tool_histogram(df: pd.DataFrame, column: str, bins: int = 30, log_scale: bool = False) -> Dict[str, Any]:
+def _chart(counts_or_corr, kind: str, client_chart: bool, **kwargs) -> Dict[str, Any]:
+    """PNG renderizado no servidor ("images") ou spec Vega-Lite para o cliente ("charts")."""
+    if kind == "histogram":
+        counts, edges = counts_or_corr
+        if client_chart:
+            return {"charts": [histogram_spec(counts, edges, **kwargs)]}
+        return {"images": [plot_binned_histogram(counts, edges, **kwargs)]}
+    if kind == "timeseries":
+        if client_chart:
+            return {"charts": [timeseries_spec(counts_or_corr, **kwargs)]}
+        return {"images": [plot_timeseries(counts_or_corr, **kwargs)]}
+    if client_chart:
+        return {"charts": [corr_heatmap_spec(counts_or_corr, **kwargs)]}
+    return {"images": [plot_corr_matrix(counts_or_corr, **kwargs)]}
+
+
+@tool("histogram",
+      "Plota histograma de uma coluna numérica.",
+      {
+          "column": {"type": "string"},
+          "bins": {"type": "integer", "default": 30, "minimum": 1},
+          "log_scale": {"type": "boolean", "default": False},
+      },
+      required=["column"], approximate=True, chart=True, where=True, sql=True)
+def _tool_histogram(df: pd.DataFrame, column: str, bins: int = 30, log_scale: bool = False,
+                    approximate: Optional[bool] = None, client_chart: bool = False) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
+    column, missing = _column(df, column)
+    if missing:
+        return missing
     try:
-        img = plot_histogram(df, column=column, bins=bins, log_scale=log_scale)
-        return {"images": [img], "text": f"Histograma de '{column}' (bins={bins}, log={log_scale})."}
+        if chunked.is_out_of_core(df):
+            counts, edges = chunked.histogram(df, column, bins=bins)
+            out = _chart((counts, edges), "histogram", client_chart, column=column, log_scale=log_scale)
+            out["text"] = f"Histograma de '{column}' (bins={bins}, log={log_scale}; out-of-core)."
+            return out
+        if sqlsource.is_sql_source(df):
+            counts, edges = df.histogram(column, bins=bins)
+            out = _chart((counts, edges), "histogram", client_chart, column=column, log_scale=log_scale)
+            out["text"] = f"Histograma de '{column}' (bins={bins}, log={log_scale}; consulta SQL em {df.label})."
+            return out
+        if should_approximate(df, approximate):
+            sample = get_sample(df)
+            counts, edges = bin_column(sample.df, column, bins=bins, weights=sample.weights)
+            # IC95% das contagens por bin: ± z * sqrt(soma dos pesos² no bin)
+            var, _ = bin_column(sample.df, column, bins=edges, weights=sample.weights ** 2)
+            top = int(np.argmax(counts)) if len(counts) else 0
+            rel = Z95 * np.sqrt(var[top]) / counts[top] if len(counts) and counts[top] > 0 else float("nan")
+            out = _chart((counts, edges), "histogram", client_chart, column=column, log_scale=log_scale)
+            out["text"] = (
+                f"Histograma aproximado de '{column}' (bins={bins}, log={log_scale}) — {sample.describe()}. "
+                f"Contagens estimadas; IC95% do bin mais alto ≈ ±{rel:.1%}."
+            )
+            out["approximate"] = {"sample_size": sample.size, "population": sample.population}
+            return out
+        counts, edges = incremental.histogram(df, column, bins=bins)
+        out = _chart((counts, edges), "histogram", client_chart, column=column, log_scale=log_scale)
+        out["text"] = f"Histograma de '{column}' (bins={bins}, log={log_scale})."
+        return out
     except Exception as e:
         return {"text": f"Erro ao plotar histograma: {e}"}
 
 
-def _tool_corr_matrix(df: pd.DataFrame, method: str = "pearson") -> Dict[str, Any]:
+@tool("corr_matrix",
+      "Calcula matriz de correlação, desenha um heatmap (limitado às colunas mais correlacionadas) e lista "
+      "os pares com maior |r|. Use top_pairs para perguntas sobre 'correlações mais fortes'.",
+      {
+          "method": {"type": "string", "enum": ["pearson", "spearman"], "default": "pearson"},
+          "top_pairs": {"type": "integer", "default": 0, "minimum": 0,
+                        "description": "Se > 0, devolve tabela com os N pares de maior |r|."},
+          "max_columns": {"type": "integer", "default": 40, "minimum": 2,
+                          "description": "Máximo de colunas exibidas no heatmap."},
+      },
+      approximate=True, chart=True, where=True, timeout=60.0)
+def _tool_corr_matrix(df: pd.DataFrame, method: str = "pearson", top_pairs: int = 0,
+                     max_columns: int = MAX_HEATMAP_COLUMNS, approximate: Optional[bool] = None,
+                     client_chart: bool = False) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
     try:
-        img = plot_corr_heatmap(df, method=method)
-        return {"images": [img], "text": f"Matriz de correlação ({method})."}
+        out: Dict[str, Any] = {}
+        note = ""
+        if chunked.is_out_of_core(df):
+            if method != "pearson":
+                return {"text": "No modo out-of-core apenas a correlação de Pearson é suportada."}
+            corr = chunked.corr_matrix(df)
+            note = "; out-of-core"
+        elif should_approximate(df, approximate):
+            sample = get_sample(df)
+            corr = corr_matrix(sample.df, method=method, weights=sample.weights)
+            lo, hi = corr_ci_halfwidth(sample, 0.0)
+            note = (f"; aproximada — {sample.describe()}. "
+                    f"IC95% para r≈0: {lo:+.3f} a {hi:+.3f} (mais estreito para |r| maiores)")
+            out["approximate"] = {"sample_size": sample.size, "population": sample.population}
+        else:
+            corr = corr_matrix(df, method=method)
+
+        pairs = strongest_pairs(corr, k=max(int(top_pairs or 0), 5))
+        strongest = "; ".join(f"{a}–{b}: {r:+.3f}" for a, b, r in pairs.head(5).itertuples(index=False))
+        out.update(_chart(corr, "corr", client_chart, method=method, max_columns=max_columns))
+        out["text"] = f"Matriz de correlação ({method}{note}). Pares mais fortes: {strongest}."
+        if top_pairs:
+            out["tables"] = [to_table(pairs.head(int(top_pairs)))]
+        return out
     except Exception as e:
         return {"text": f"Erro ao calcular correlação: {e}"}
 
 
+@tool("groupby_aggregate",
+      "Agrupa por colunas e aplica agregações. Pode receber 'aggregations' diretamente OU 'columns' + 'stats' "
+      "(ex.: columns=['Amount'], stats=['mean','std']). Se 'by' não for passado, aplica agregações no dataset "
+      "inteiro (sem groupby).",
+      {
+          "by": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+          "aggregations": {"type": "object", "additionalProperties": {"type": "string"}},
+          "columns": {"type": "array", "items": {"type": "string"}},
+          "stats": {"type": "array",
+                    "items": {"type": "string", "enum": ["mean", "std", "sum", "count", "min", "max", "median"]}},
+          "sort_by": {"type": "string"},
+          "ascending": {"type": "boolean", "default": True},
+          "limit": {"type": "integer", "default": 50, "minimum": 1},
+      },
+      inject={"df": "df", "__prompt": "prompt"}, approximate=True, where=True, sql=True, timeout=60.0)
 def _tool_groupby_aggregate(
     df: pd.DataFrame,
     by=None,
@@ -94,23 +280,44 @@ def _tool_groupby_aggregate(
     sort_by=None,
     ascending=True,
     limit=50,
+    approximate: Optional[bool] = None,
     __prompt: str = ""
 ) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
     try:
+        index = column_index(df)
+        # nomes vindos do modelo -> colunas do dataset (caixa, acentos, erros de digitação)
+        if by is not None and not (isinstance(by, list) and len(by) == 0):
+            keys = []
+            for b in (by if isinstance(by, list) else [by]):
+                col, missing = _column(df, b)
+                if missing:
+                    return missing
+                keys.append(col)
+            by = keys
+        if aggregations:
+            resolved = {}
+            for name, sts in aggregations.items():
+                col, missing = _column(df, name)
+                if missing:
+                    return missing
+                resolved[col] = sts
+            aggregations = resolved
+
         # montar aggregations se veio columns+stats
         if not aggregations:
             aggregations = {}
             if columns and stats:
-                for col in columns:
-                    if col in df.columns:
+                for name in columns:
+                    col = index.resolve(name)
+                    if col is not None:
                         aggregations[col] = stats if len(stats) > 1 else stats[0]
 
         # fallback a partir do prompt se ainda vazio
         if not aggregations:
             pl = (__prompt or "").lower()
-            mentioned_cols = [c for c in df.columns if c.lower() in pl]
+            mentioned_cols = index.mentioned(__prompt or "")
             want_mean = ("mean" in pl) or ("média" in pl) or ("media" in pl)
             want_std  = ("std" in pl) or ("desvio" in pl)
             want_med  = ("median" in pl) or ("mediana" in pl)
@@ -128,121 +335,563 @@ def _tool_groupby_aggregate(
             if want_max:  metrics.append("max")
             if mentioned_cols and metrics:
                 for col in mentioned_cols:
-                    if col in df.columns and df[col].dtype.kind in "ifb":
+                    if df.dtypes[col].kind in "ifb":
                         aggregations[col] = metrics if len(metrics) > 1 else metrics[0]
 
         # fallback final
         if not aggregations:
-            num_cols = df.select_dtypes(include=["number"]).columns.tolist()
+            num_cols = (df.numeric_columns() if chunked.is_out_of_core(df) or sqlsource.is_sql_source(df)
+                        else df.select_dtypes(include=["number"]).columns.tolist())
             if not num_cols:
                 return {"text": "Não há colunas numéricas para agregação."}
             aggregations = {num_cols[0]: "mean"}
 
+        if chunked.is_out_of_core(df):
+            if by is None or (isinstance(by, list) and len(by) == 0):
+                rows = {}
+                for col, sts in aggregations.items():
+                    for st in ([sts] if isinstance(sts, str) else sts):
+                        rows.setdefault(st, {})[col] = chunked.compute_stat(df, col, st)
+                return {"tables": [to_table(pd.DataFrame(rows).T)]}
+            grouped = chunked.groupby_aggregate(df, by if isinstance(by, list) else [by], aggregations)
+            if sort_by is not None:
+                try:
+                    grouped = grouped.sort_values(by=sort_by, ascending=ascending)
+                except Exception:
+                    pass
+            if isinstance(limit, int) and limit > 0:
+                grouped = grouped.head(limit)
+            return {"text": "Agregação out-of-core (median aproximada por sketch).", "tables": [to_table(grouped)]}
+
+        if sqlsource.is_sql_source(df):
+            note = f"Consulta SQL em {df.label}."
+            if by is None or (isinstance(by, list) and len(by) == 0):
+                rows = {}
+                for col, sts in aggregations.items():
+                    for st in ([sts] if isinstance(sts, str) else sts):
+                        rows.setdefault(st, {})[col] = df.compute_stat(col, st)
+                return {"text": note, "tables": [to_table(pd.DataFrame(rows).T)]}
+            grouped, n_groups = df.groupby_aggregate(by if isinstance(by, list) else [by], aggregations,
+                                                     sort_by=sort_by, ascending=ascending, limit=limit)
+            if len(grouped) < n_groups:
+                order = f", ordenados por {sort_by}" if sort_by is not None else ""
+                note = f"{len(grouped)} de {n_groups} grupos{order}. " + note
+            return {"text": note, "tables": [to_table(grouped)]}
+
+        if should_approximate(df, approximate):
+            sample = get_sample(df)
+            if by is None or (isinstance(by, list) and len(by) == 0):
+                rows = []
+                for col, sts in aggregations.items():
+                    for st in ([sts] if isinstance(sts, str) else sts):
+                        est = estimate_stat(sample.df[col], sample.weights, st, sample.population)
+                        ci = est["ci"] or (np.nan, np.nan)
+                        rows.append({"column": col, "stat": st, "estimate": est["value"],
+                                     "ic_low": ci[0], "ic_high": ci[1], "n_amostra": est["n"]})
+                table = pd.DataFrame(rows).set_index(["column", "stat"])
+            else:
+                table = approx_groupby(sample, by if isinstance(by, list) else [by], aggregations)
+                if isinstance(limit, int) and limit > 0:
+                    table = table.head(limit)
+            return {
+                "text": f"Agregação aproximada — {sample.describe()}; colunas *_ic_* trazem o IC95% "
+                        "(min/max são os extremos observados na amostra, sem IC).",
+                "tables": [to_table(table)],
+                "approximate": {"sample_size": sample.size, "population": sample.population},
+            }
+
         # SEM groupby: agrega no dataset inteiro
         if by is None or (isinstance(by, list) and len(by) == 0):
             aggregated = df.agg(aggregations)
             if isinstance(aggregated, pd.Series):
                 aggregated = aggregated.to_frame().T
-            return {"tables": [stylize(aggregated)]}
-
-        # COM groupby
-        grouped = df.groupby(by).agg(aggregations)
-        # sort opcional (melhor esforço)
-        if sort_by is not None:
-            try:
-                grouped = grouped.sort_values(by=sort_by, ascending=ascending)
-            except Exception:
-                pass
-        if isinstance(limit, int) and limit > 0:
-            grouped = grouped.head(limit)
-        return {"tables": [stylize(grouped)]}
+            return {"tables": [to_table(aggregated)]}
+
+        # COM groupby: códigos de grupo em cache + top-k parcial (app/tools/groupby.py)
+        grouped, n_groups = fast_groupby(df, by if isinstance(by, list) else [by], aggregations,
+                                         sort_by=sort_by, ascending=ascending, limit=limit)
+        out: Dict[str, Any] = {"tables": [to_table(grouped)]}
+        if len(grouped) < n_groups:
+            order = f", ordenados por {sort_by}" if sort_by is not None else ""
+            out["text"] = f"{len(grouped)} de {n_groups} grupos{order}."
+        return out
     except Exception as e:
         return {"text": f"Erro no groupby: {e}"}
 
 
+@tool("run_python",
+      "Executa código Python/pandas numa sandbox isolada (sem internet, com limites de CPU, memória e tempo) "
+      "para perguntas que as outras ferramentas não cobrem. Variáveis disponíveis: df (somente leitura; use "
+      "df.copy() para modificar), pd, np, plt. Use print() para texto, matplotlib para figuras e atribua um "
+      "DataFrame/Series a `result` para devolver uma tabela.",
+      {"code": {"type": "string"}},
+      required=["code"], reusable=False,  # o código pode ter efeitos aleatórios
+      enabled=sandbox_available,  # só com isolamento do sistema operacional (sandbox.py)
+      # a sandbox aplica os próprios limites (fila + execução) e recicla o worker
+      timeout=SANDBOX_QUEUE_S + SANDBOX_WALL_S + 5.0)
+def _tool_run_python(df: pd.DataFrame, code: str) -> Dict[str, Any]:
+    if df is None:
+        return {"text": "Nenhum CSV carregado."}
+    if chunked.is_out_of_core(df):
+        return {"text": "Execução de código não está disponível no modo out-of-core."}
+    out = run_code(df, code)
+    if out.get("timeout"):
+        return {"text": f"⏱️ {out['error']}", "timeout": True}
+    parts = []
+    if out.get("stdout", "").strip():
+        parts.append("```\n" + out["stdout"].strip() + "\n```")
+    if out.get("error"):
+        parts.append(f"Erro na execução:\n```\n{out['error'].strip()}\n```")
+    result: Dict[str, Any] = {"text": "\n\n".join(parts) or "Código executado (sem saída).",
+                              "images": out.get("images", [])}
+    if out.get("table") is not None:
+        result["tables"] = [to_table(out["table"])]
+    return result
+
+
+@tool("store_conclusions",
+      "Armazena uma conclusão textual relevante sobre o dataset.",
+      {"text": {"type": "string"}},
+      required=["text"], inject={"mem": "mem"}, sequential=True, reusable=False)
 def _tool_store_conclusions(mem, text: str) -> Dict[str, Any]:
     try:
-        mem.add(text)
+        if mem.add(text) is False:  # SQLiteMemory: conclusão (quase) repetida
+            return {"text": "Conclusão já registrada."}
         return {"text": "Conclusão armazenada."}
     except Exception as e:
         return {"text": f"Falha ao armazenar conclusão: {e}"}
 
 
-def _tool_get_conclusions(mem) -> Dict[str, Any]:
-    return {"text": mem.get_all_as_markdown()}
+CONCLUSIONS_TOP_K = 10
+
+
+@tool("get_conclusions",
+      "Recupera as conclusões salvas mais relevantes (top-k por relevância; sem 'query', usa a pergunta do usuário).",
+      {
+          "query": {"type": "string", "description": "Termos de busca nas conclusões salvas."},
+          "k": {"type": "integer", "default": 10, "minimum": 1, "maximum": 50},
+      },
+      inject={"mem": "mem", "prompt": "prompt"}, sequential=True, reusable=False)
+def _tool_get_conclusions(mem, query: Optional[str] = None, k: int = CONCLUSIONS_TOP_K,
+                          prompt: str = "") -> Dict[str, Any]:
+    """Conclusões mais relevantes para a pergunta (top-k), sem devolver a memória inteira."""
+    if not hasattr(mem, "search"):  # Memory JSONL legado
+        return {"text": mem.get_all_as_markdown()}
+    items = mem.search(query or prompt, k=max(1, min(int(k), 50)))
+    if not items:
+        return {"text": "_Sem conclusões salvas ainda._"}
+    return {"text": "\n".join(f"- {t}" for t in items)}
+
+
+@tool("reuse_result",
+      "Reapresenta um resultado já calculado nesta conversa (texto, tabelas e gráficos) pela referência "
+      "listada no contexto da sessão (ex.: 'r3'), sem recomputar.",
+      {"ref": {"type": "string", "description": "Referência do resultado anterior (ex.: 'r3')."}},
+      required=["ref"], inject={"conversation": "conversation"}, reusable=False)
+def _tool_reuse_result(conversation, ref: str) -> Dict[str, Any]:
+    if conversation is None:
+        return {"text": "Não há resultados anteriores nesta sessão."}
+    stored = conversation.get(ref)
+    if stored is None:
+        available = ", ".join(conversation.refs()[-10:]) or "nenhum"
+        return {"text": f"Resultado '{ref}' não encontrado (disponíveis: {available})."}
+    out = dict(stored.out, reused_ref=stored.ref)
+    out["text"] = f"Resultado {stored.ref} ({stored.tool}), reaproveitado." + (
+        "\n\n" + out["text"] if out.get("text") else "")
+    return out
 
 
-def _tool_compute_stat(df: pd.DataFrame, column: str, stat: str) -> Dict[str, Any]:
+@tool("compute_stat",
+      "Calcula uma estatística simples (mean, median, std, min, max, count) para uma coluna.",
+      {
+          "column": {"type": "string"},
+          "stat": {"type": "string", "enum": ["mean", "median", "std", "min", "max", "count"]},
+      },
+      required=["column", "stat"], approximate=True, where=True, sql=True)
+def _tool_compute_stat(df: pd.DataFrame, column: str, stat: str, approximate: Optional[bool] = None) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
-    if column not in df.columns:
-        return {"text": f"Coluna '{column}' não encontrada."}
-    s = pd.to_numeric(df[column], errors="coerce").dropna()
-    value = getattr(s, stat)() if stat != "count" else s.count()
+    column, missing = _column(df, column)
+    if missing:
+        return missing
+    if chunked.is_out_of_core(df):
+        value = chunked.compute_stat(df, column, stat)
+        note = " (aproximada por sketch de quantis)" if stat == "median" else ""
+        return {"text": f"{stat}({column}) = {value:.6g}{note}"}
+    if sqlsource.is_sql_source(df):
+        try:
+            value = df.compute_stat(column, stat)
+        except ValueError as e:
+            return {"text": f"Erro ao calcular {stat}({column}): {e}"}
+        return {"text": f"{stat}({column}) = {value:.6g} (consulta SQL em {df.label})"}
+    if should_approximate(df, approximate):
+        sample = get_sample(df)
+        est = estimate_stat(sample.df[column], sample.weights, stat, sample.population)
+        return {
+            "text": format_estimate(f"{stat}({column})", est, sample),
+            "approximate": {"sample_size": sample.size, "population": sample.population},
+        }
+    if stat == "median":
+        value = pd.to_numeric(df[column], errors="coerce").median()
+    else:  # momentos em cache, atualizados sem releitura quando o dataset ganha linhas
+        mom = incremental.column_moments(df, column)
+        value = mom.n if stat == "count" else getattr(mom, stat)
     return {"text": f"{stat}({column}) = {value:.6g}"}
 
 
+@tool("class_balance",
+      "Mostra o balanceamento de uma coluna alvo (contagem e proporção de cada classe; ex.: fraudes em Class).",
+      {
+          "target": {"type": "string", "default": "Class"},
+          "normalize": {"type": "boolean", "default": True},
+          "top": {"type": "integer", "default": 20, "minimum": 1},
+      },
+      where=True, sql=True)
 def _tool_class_balance(df: pd.DataFrame, target: str = "Class", normalize: bool = True, top: int = 20) -> Dict[str, Any]:
     if df is None:
         return {"text": "Nenhum CSV carregado."}
-    if target not in df.columns:
-        return {"text": f"Coluna alvo '{target}' não encontrada."}
-    counts = df[target].value_counts(dropna=False)
-    props = df[target].value_counts(dropna=False, normalize=True)
+    target, missing = _column(df, target, "Coluna alvo")
+    if missing:
+        return missing
+    if sqlsource.is_sql_source(df):
+        counts = df.value_counts(target)[0]
+    elif chunked.is_out_of_core(df):
+        counts = chunked.value_counts(df, target).counts
+    else:
+        counts = incremental.value_counts(df, target)
+    props = counts / counts.sum()
     out = pd.DataFrame({"count": counts, "proportion": props}).head(top)
     txt = f"Balanceamento de '{target}': {len(counts)} classes. Classe minoritária ≈ {props.min():.4f}."
-    return {"text": txt, "tables": [stylize(out)]}
+    return {"text": txt, "tables": [to_table(out)]}
+
+@tool("time_series",
+      "Série temporal: agrega por período (ex.: volume de transações por hora, soma ou média de uma coluna "
+      "por dia), média móvel (mode='rolling') ou acumulado (mode='expanding'), com gráfico de linha. A coluna "
+      "de tempo (datas ou segundos decorridos, como Time) é detectada se time_column não for passada.",
+      {
+          "column": {"type": "string",
+                     "description": "Coluna numérica agregada; omita para contar linhas por período."},
+          "time_column": {"type": "string"},
+          "freq": {"type": "string",
+                   "description": "Período: 's', 'min', '15min', 'h', 'D', 'W', 'MS' (mês), 'QS', 'YS'. "
+                                  "Omita para escolher pelo intervalo dos dados."},
+          "stat": {"type": "string", "enum": list(TIME_SERIES_STATS),
+                   "description": "Padrão: count sem column, mean com column."},
+          "mode": {"type": "string", "enum": list(TIME_SERIES_MODES), "default": "resample"},
+          "window": {"type": "string",
+                     "description": "Janela de mode='rolling': nº de períodos (ex.: '7') ou duração (ex.: '7D')."},
+      },
+      chart=True, where=True, sql=True, timeout=60.0)
+def _tool_time_series(df: pd.DataFrame, column: Optional[str] = None, time_column: Optional[str] = None,
+                      freq: Optional[str] = None, stat: Optional[str] = None, mode: str = "resample",
+                      window=None, client_chart: bool = False) -> Dict[str, Any]:
+    if df is None:
+        return {"text": "Nenhum CSV carregado."}
+    if column is not None:
+        column, missing = _column(df, column)
+        if missing:
+            return missing
+    if time_column is not None:
+        time_column, missing = _column(df, time_column, "Coluna de tempo")
+        if missing:
+            return missing
+    try:
+        ts = time_series(df, column=column, time_column=time_column, freq=freq, stat=stat, mode=mode, window=window)
+    except ValueError as e:
+        return {"text": f"Erro na série temporal: {e}"}
+    s = ts.series.dropna()
+    shown = ts.plot_series()
+    freq_note = f"{ts.freq} (escolhida pelo intervalo dos dados)" if ts.auto_freq else ts.freq
+    if ts.requested_freq:
+        freq_note = f"{ts.freq} ({ts.requested_freq} daria períodos demais para o intervalo dos dados)"
+    txt = f"Série de {ts.label} por período de {freq_note}, tempo em '{ts.time_column}': {len(ts.series)} períodos"
+    if len(s):
+        table = ts.table()
+        peak = table.index[int(np.nanargmax(ts.series.to_numpy(dtype=np.float64)))]
+        txt += f" de {table.index[0]} a {table.index[-1]}; máximo {s.max():.6g} em {peak}"
+    txt += "."
+    if len(shown) < len(s):
+        txt += f" Gráfico com {len(shown)} de {len(s)} pontos (mínimo e máximo de cada faixa)."
+    if sqlsource.is_sql_source(df):
+        txt += f" Consulta SQL em {df.label}."
+    elif chunked.is_out_of_core(df):
+        txt += " Out-of-core."
+    out = _chart(shown, "timeseries", client_chart, title=ts.label, ylabel=ts.stat if ts.column else "linhas")
+    out["text"] = txt
+    out["tables"] = [to_table(ts.table())]
+    return out
+
+
+@tool("detect_anomalies",
+      "Detecta anomalias/outliers (IsolationForest, z-score robusto ou IQR) ajustando na amostra estratificada e "
+      "pontuando o dataset inteiro; devolve as linhas mais anômalas, histograma dos scores e a concordância "
+      "com a coluna alvo (ex.: fraudes em Class).",
+      {
+          "method": {"type": "string", "enum": ["isolation_forest", "robust_z", "iqr"],
+                     "default": "isolation_forest"},
+          "columns": {"type": "array", "items": {"type": "string"},
+                      "description": "Colunas usadas (padrão: todas as numéricas, exceto o alvo)."},
+          "target": {"type": "string", "default": "Class",
+                     "description": "Coluna alvo para medir a concordância (não entra no modelo)."},
+          "top": {"type": "integer", "default": 20, "minimum": 1},
+          "contamination": {"type": "number", "exclusiveMinimum": 0, "maximum": 0.5,
+                            "description": "Fração esperada de anomalias (define o limiar); omita para o padrão."},
+      },
+      approximate=True, chart=True, where=True, timeout=120.0)
+def _tool_detect_anomalies(df: pd.DataFrame, method: str = "isolation_forest", columns=None,
+                           target: Optional[str] = "Class", top: int = 20, contamination: Optional[float] = None,
+                           approximate: Optional[bool] = None, client_chart: bool = False) -> Dict[str, Any]:
+    if df is None:
+        return {"text": "Nenhum CSV carregado."}
+    features = None
+    if columns:
+        features = []
+        for name in columns:
+            col, missing = _column(df, name)
+            if missing:
+                return missing
+            features.append(col)
+    if target:
+        target = column_index(df).resolve(target)  # sem alvo no dataset: só não há concordância
+    try:
+        rep = detect_anomalies(df, method=method, columns=features, target=target, top=top,
+                               contamination=contamination, approximate=should_approximate(df, approximate))
+    except ValueError as e:
+        return {"text": f"Erro na detecção de anomalias: {e}"}
+    def fmt(n):
+        return f"{n:,.0f}".replace(",", ".")
+
+    share = rep.flagged / rep.n_rows if rep.n_rows else 0.0
+    txt = (f"Anomalias ({rep.method}, {len(rep.features)} colunas, modelo ajustado em {fmt(rep.fit_rows)} linhas): "
+           f"{fmt(rep.flagged)} de {fmt(rep.n_rows)} linhas ({share:.2%}) com score > {rep.threshold:.3g}.")
+    if rep.approximate:
+        txt += f" Aproximado — {rep.sample.describe()}; contagens estimadas e top-k só da amostra."
+    ag = rep.agreement
+    if ag is not None:
+        lift = ag["precision"] / ag["base_rate"] if ag["base_rate"] else float("nan")
+        txt += (f"\n\nConcordância com '{rep.target}' (classe {ag['positive']}, {ag['base_rate']:.2%} das linhas): "
+                f"precisão {ag['precision']:.1%} (lift {lift:.1f}x), recall {ag['recall']:.1%}, "
+                f"AUC ≈ {ag['auc']:.3f}.")
+    out = _chart((rep.counts, rep.edges), "histogram", client_chart, column="score de anomalia", log_scale=True)
+    out["text"] = txt
+    out["tables"] = [to_table(rep.top)]
+    if rep.approximate:
+        out["approximate"] = {"sample_size": rep.sample.size, "population": rep.sample.population}
+    return out
 
 # -----------------------------------------------------------------------------
 # Chamada do modelo
 # -----------------------------------------------------------------------------
 
-_client = None
+def _dispatch_tool(name: str, args: Dict[str, Any], df: pd.DataFrame, mem, prompt: str,
+                   conversation=None) -> Dict[str, Any]:
+    spec = registry.get(name)
+    if sqlsource.is_sql_source(df) and spec is not None and "df" in spec.inject.values() and not spec.sql:
+        return {"text": f"'{name}' não está disponível para {df.label} (fonte SQL); use value_counts, "
+                        "compute_stat, groupby_aggregate, histogram, class_balance ou time_series."}
+    where = None
+    if spec is not None and spec.where and "where" in args:
+        args = dict(args)
+        where = args.pop("where")
+    if not where or df is None:
+        return registry.dispatch(name, args, df=df, mem=mem, prompt=prompt, conversation=conversation)
+    # o filtro vira um subconjunto em cache (app/tools/filters.py): ferramentas da mesma
+    # pergunta e perguntas seguintes com o mesmo filtro recebem o mesmo objeto
+    try:
+        subset, predicate = apply_filter(df, where)
+    except FilterError as e:
+        return {"text": f"Filtro inválido: {e}"}
+    if chunked.is_out_of_core(subset):
+        note = f"Filtro: {predicate.text} (aplicado a cada chunk)."
+    elif sqlsource.is_sql_source(subset):
+        note = f"Filtro: {predicate.text} (WHERE na consulta)."
+    else:
+        if len(subset) == 0:
+            return {"text": f"Nenhuma linha satisfaz o filtro {predicate.text}."}
+        kept, total = (f"{n:,}".replace(",", ".") for n in (len(subset), len(df)))
+        note = f"Filtro: {predicate.text} ({kept} de {total} linhas)."
+    out = dict(registry.dispatch(name, args, df=subset, mem=mem, prompt=prompt, conversation=conversation))
+    out["text"] = note + ("\n\n" + out["text"] if out.get("text") else "")
+    return out
 
-def _get_client():
-    global _client
-    if _client is None:
-        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    return _client
 
+# limites de tempo (s) por ferramenta (ToolSpec.timeout, senão TOOL_TIMEOUT_S) e por pergunta;
+# ferramentas de memória rodam em sequência (a ordem store/get importa), as de dados em paralelo.
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "30"))
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "90"))
+LOCAL_ROUTING = os.getenv("INTENT_ROUTING", "1") != "0"
 
-def ask_agent(prompt: str, df: pd.DataFrame, mem, concise: bool = True) -> Dict[str, Any]:
-    """
-    2 fases:
-      1) modelo decide tools e obtem números/figuras;
-      2) narrativa qualitativa (insights/limitações/próximos passos) SEM tools (apenas se houver material).
-    """
-    system = (
-        "Você é um agente de EDA. SEMPRE use ferramentas para obter números e figuras; "
-        "só depois escreva a análise qualitativa. Em cada resposta, siga esta ordem:\n"
-        "1) Resultados objetivos (provenientes das ferramentas);\n"
-        "2) Insights: interpretação do que os números sugerem;\n"
-        "3) Limitações/cautelas (ex.: amostragem, outliers, correlação≠causalidade, data leakage);\n"
-        "4) Próximos passos (2–3 sugestões práticas de análise/modelagem);\n"
-        "Quando detectar achado importante (ex.: classe minoritária < 1%, correlações fortes, forte assimetria), "
-        "inclua no FINAL da resposta uma linha exatamente no formato: Conclusão salva: \"<texto conciso>\".\n"
-        "NÃO chame 'describe_data' a menos que o usuário peça explicitamente por 'resumo/describe/overview/sumário/shape/estatísticas'. "
-        "Se a pergunta for sobre tipos (numérico vs categórico), use 'schema_info'."
+
+def _iter_tool_calls(calls, df: pd.DataFrame, mem, prompt: str, timeout: Optional[float] = None,
+                     conversation=None):
+    """Executa as chamadas e produz (índice, saída) à medida que cada uma termina.
+    Chamadas que estouram o tempo voltam como {"text": "⏱️ ...", "timeout": True}."""
+    deadline = timeout if timeout is not None else REQUEST_TIMEOUT_S
+    specs = [registry.get(name) for name, _ in calls]
+    parallel = [i for i, spec in enumerate(specs) if spec is None or not spec.sequential]
+
+    def job(name, args):
+        try:
+            return _dispatch_tool(name, args, df, mem, prompt, conversation)
+        except TypeError as e:  # argumento inesperado vindo do modelo
+            return {"text": f"Argumentos inválidos para '{name}': {e}"}
+
+    runs = iter_with_deadlines(
+        [lambda n=calls[i][0], a=calls[i][1]: job(n, a) for i in parallel],
+        [(specs[i] and specs[i].timeout) or TOOL_TIMEOUT_S for i in parallel],
+        deadline=deadline,
     )
+    for j, run in runs:
+        i = parallel[j]
+        name = calls[i][0]
+        if run["ok"]:
+            yield i, run["value"]
+        elif run.get("timeout"):
+            yield i, {"text": f"⏱️ '{name}' excedeu o tempo limite e foi abandonada (resultado parcial).",
+                      "timeout": True}
+        else:
+            yield i, {"text": f"Erro em '{name}': {run['error']}"}
+    for i, (name, args) in enumerate(calls):
+        if i not in parallel:
+            yield i, job(name, args)
+
+
+SYSTEM_PROMPT = (
+    "Você é um agente de EDA. SEMPRE use ferramentas para obter números e figuras; "
+    "só depois escreva a análise qualitativa. Em cada resposta, siga esta ordem:\n"
+    "1) Resultados objetivos (provenientes das ferramentas);\n"
+    "2) Insights: interpretação do que os números sugerem;\n"
+    "3) Limitações/cautelas (ex.: amostragem, outliers, correlação≠causalidade, data leakage);\n"
+    "4) Próximos passos (2–3 sugestões práticas de análise/modelagem);\n"
+    "Quando detectar achado importante (ex.: classe minoritária < 1%, correlações fortes, forte assimetria), "
+    "inclua no FINAL da resposta uma linha exatamente no formato: Conclusão salva: \"<texto conciso>\".\n"
+    "NÃO chame 'describe_data' a menos que o usuário peça explicitamente por 'resumo/describe/overview/sumário/shape/estatísticas'. "
+    "Se a pergunta for sobre tipos (numérico vs categórico), use 'schema_info'."
+)
+
+
+def _tool_events(index: int, name: str, out: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Eventos de UI para a saída de uma ferramenta (texto, tabelas, imagens, gráficos)."""
+    base = {"index": index, "tool": name}
+    if out.get("text"):
+        yield {"type": "text", **base, "text": out["text"]}
+    for table in out.get("tables", []):
+        yield {"type": "table", **base, "table": table}
+    for image in out.get("images", []):
+        yield {"type": "image", **base, "image": image}
+    for chart in out.get("charts", []):
+        yield {"type": "chart", **base, "chart": chart}
+    yield {"type": "tool_done", **base, "timeout": bool(out.get("timeout"))}
 
-    client = _get_client()
 
-    # 1ª chamada: o modelo decide quais ferramentas usar
-    msg = client.chat.completions.create(
+def _save_suggested_conclusion(mem, txt: str):
+    """Auto-salvar se houver sugestão explícita ("Conclusão salva: ...")."""
+    if "Conclusão salva:" in txt:
+        try:
+            start = txt.index('Conclusão salva:') + len('Conclusão salva:')
+            snippet = txt[start:].strip()
+            # tira aspas se vierem "..."
+            if snippet.startswith('"') and '"' in snippet[1:]:
+                snippet = snippet[1:snippet.index('"', 1)]
+            if snippet:
+                _ = _tool_store_conclusions(mem, text=snippet)
+        except Exception:
+            pass
+
+
+def _first_messages(prompt: str, conversation=None) -> list:
+    """Mensagens da 1ª fase: instruções, contexto da sessão (se houver) e a pergunta.
+    A 2ª fase (narrativa) continua esta mesma lista, sem reenviar nada."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    context = conversation.context_message() if conversation is not None else None
+    if context:
+        messages.append({"role": "system", "content": context})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _llm_tool_calls(prompt: str, session: Optional[str] = None, messages: Optional[list] = None):
+    """1ª chamada ao modelo: lista de (ferramenta, argumentos) escolhidos por ele."""
+    msg = get_llm().chat(
+        session=session,
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt}
-        ],
-        tools=TOOLS,
+        messages=messages or _first_messages(prompt),
+        tools=registry.schemas(),
         tool_choice="auto",
         temperature=0.2,
     )
+    calls = []
+    for tc in msg.choices[0].message.tool_calls or []:
+        try:
+            args = json.loads(tc.function.arguments or "{}")
+        except Exception:
+            args = {}
+        calls.append((tc.function.name, args))
+    return calls
+
+
+def _audit_route(prompt: str, route):
+    """Pergunta ao LLM, em segundo plano, o que ele teria chamado (mede a concordância).
+    Sem sessão: a auditoria é do app, não consome o orçamento de tokens do usuário."""
+    def job():
+        try:
+            record_decision(prompt, route, _llm_tool_calls(prompt), audit=True)
+        except Exception:
+            pass
+    threading.Thread(target=job, name="intent-audit", daemon=True).start()
+
+
+def ask_agent_stream(prompt: str, df: pd.DataFrame, mem, concise: bool = True,
+                     approximate: bool = False, exact: bool = False, client_charts: bool = False,
+                     timeout: Optional[float] = None, session: Optional[str] = None,
+                     local_routing: Optional[bool] = None, conversation=None,
+                     replay: Optional[List[Tuple[str, Dict[str, Any]]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Versão em streaming de ask_agent: produz eventos à medida que o trabalho avança, para a
+    UI mostrar cada resultado assim que ele fica pronto (mesmos parâmetros de ask_agent).
+
+    Eventos (dicts com "type"):
+      tool_started {index, tool, args}  — uma por chamada, na ordem do modelo, antes de executar;
+      text/table/image/chart {index, tool, ...} e tool_done {index, tool, timeout}
+                                        — na ordem em que as ferramentas TERMINAM;
+      narrative_token {text}            — pedaços da narrativa (2ª fase) conforme chegam;
+      done {result}                     — o resultado final, igual ao de ask_agent.
+    """
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    result: Dict[str, Any] = {"text": "", "tables": [], "images": [], "charts": [], "approximate": [], "timeouts": [],
+                              "calls": []}
+
+    if conversation is not None:
+        conversation.bind(df)
+    messages = _first_messages(prompt, conversation)
+
+    # 0) roteamento local: perguntas comuns viram chamada de ferramenta sem ida ao LLM
+    #    (perguntas de acompanhamento, como "e por Class?", dependem do contexto: vão ao LLM)
+    if local_routing is None:
+        local_routing = LOCAL_ROUTING
+    route = None
+    if local_routing and replay is None and not (conversation is not None and conversation.is_follow_up(prompt)):
+        try:
+            route = route_prompt(prompt, df)
+        except Exception:  # sem scikit-learn ou dataset sem colunas: segue pelo LLM
+            route = None
 
-    result: Dict[str, Any] = {"text": "", "tables": [], "images": []}
+    if replay is not None:
+        # mesmas chamadas de uma resposta anterior (ex.: reexecutar exato): sem roteamento nem LLM
+        raw_calls = [(name, dict(args)) for name, args in replay]
+    elif route is not None and route.confident:
+        raw_calls = [(route.tool, dict(route.args))]
+        result["local_route"] = route.tool
+        record_decision(prompt, route)
+        if random.random() < INTENT_AUDIT_RATE:
+            _audit_route(prompt, route)
+    else:
+        # 1ª chamada: o modelo decide quais ferramentas usar
+        raw_calls = _llm_tool_calls(prompt, session, messages)
+        if route is not None:
+            record_decision(prompt, route, raw_calls)
 
-    tool_calls = msg.choices[0].message.tool_calls or []
-    if not tool_calls:
+    if not raw_calls:
         # Nenhuma ferramenta chamada: oriente o usuário a ser mais específico
         result["text"] = (
             "O agente não chamou ferramentas. Especifique a coluna/ação, por exemplo: "
@@ -250,77 +899,134 @@ def ask_agent(prompt: str, df: pd.DataFrame, mem, concise: bool = True) -> Dict[
             "'Qual é o balanceamento da coluna Class?' (class_balance), "
             "ou 'Faça um histograma de Amount' (histogram)."
         )
-        return result
+        yield {"type": "text", "index": None, "tool": None, "text": result["text"]}
+        yield {"type": "done", "result": result}
+        return
 
-    for tc in tool_calls:
-        name = tc.function.name
-        try:
-            args = json.loads(tc.function.arguments or "{}")
-        except Exception:
-            args = {}
+    calls = []
+    for name, raw_args in raw_calls:
+        args = dict(raw_args)
+        spec = registry.get(name)
+        if spec is not None and spec.approximate:  # amostra estratificada + IC95%
+            if exact:
+                args["approximate"] = False
+            else:
+                args.setdefault("approximate", approximate)
+        if spec is not None and spec.chart:  # spec Vega-Lite em vez de PNG
+            args["client_chart"] = client_charts
+        calls.append((name, args))
+    result["calls"] = [(name, dict(args)) for name, args in calls]
 
-        if name == "describe_data":
-            out = _tool_describe_data(df)
-        elif name == "schema_info":
-            out = _tool_schema_info(df, **args)
-        elif name == "value_counts":
-            out = _tool_value_counts(df, **args)
-        elif name == "histogram":
-            out = _tool_histogram(df, **args)
-        elif name == "corr_matrix":
-            out = _tool_corr_matrix(df, **args)
-        elif name == "groupby_aggregate":
-            out = _tool_groupby_aggregate(df, __prompt=prompt, **args)
-        elif name == "store_conclusions":
-            out = _tool_store_conclusions(mem, **args)
-        elif name == "get_conclusions":
-            out = _tool_get_conclusions(mem)
-        elif name == "compute_stat":
-            out = _tool_compute_stat(df, **args)
-        elif name == "class_balance":
-            out = _tool_class_balance(df, **args)
-        else:
-            out = {"text": f"Ferramenta desconhecida: {name}"}
+    for i, (name, args) in enumerate(calls):
+        yield {"type": "tool_started", "index": i, "tool": name, "args": args}
+    outs: list = [None] * len(calls)
+    # chamadas idênticas a uma anterior da conversa são servidas do resultado guardado
+    reused: Dict[int, Any] = {}
+    reusable = [bool(registry.get(name) and registry.get(name).reusable) for name, _ in calls]
+    if conversation is not None:
+        for i, (name, args) in enumerate(calls):
+            hit = conversation.lookup(name, args) if reusable[i] else None
+            if hit is not None:
+                reused[i] = hit
+                outs[i] = dict(hit.out, text=f"(reaproveitado de {hit.ref}) " + hit.out.get("text", ""))
+                yield from _tool_events(i, name, outs[i])
+    pending = [i for i in range(len(calls)) if i not in reused]
+    for j, out in _iter_tool_calls([calls[i] for i in pending], df, mem, prompt, timeout, conversation):
+        i = pending[j]
+        outs[i] = out
+        yield from _tool_events(i, calls[i][0], out)
+    if conversation is not None:
+        conversation.record_turn(prompt, calls, outs, reused, dedupe=reusable)
 
+    # o resultado final segue a ordem do modelo, não a de término
+    for (name, _), out in zip(calls, outs):
+        if out.get("timeout"):
+            result["timeouts"].append(name)
         if out.get("text"):
             result["text"] += out["text"] + "\n\n"
         result["tables"] += out.get("tables", [])
         result["images"] += out.get("images", [])
+        result["charts"] += out.get("charts", [])
+        if out.get("approximate"):
+            result["approximate"].append({"tool": name, **out["approximate"]})
 
-    # 2ª chamada: narrativa qualitativa (sem tools).
+    # 2ª chamada: narrativa qualitativa (sem tools), em streaming.
     # Só fazemos se houve algum texto factual (para não "sujar" respostas que são só tabelas/figuras).
     tool_summary = result.get("text", "").strip()
     if concise or not tool_summary:
-        return result
+        yield {"type": "done", "result": result}
+        return
 
+    # a narrativa continua a conversa da 1ª fase (mesmo prefixo de mensagens e de tools, que o
+    # provedor reaproveita do cache de prompt): só as chamadas e seus resultados são acrescentados
+    ids = [f"call_{i}" for i in range(len(calls))]
+    messages = messages + [
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": ids[i], "type": "function",
+             "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False, default=str)}}
+            for i, (name, args) in enumerate(calls)
+        ]},
+        *({"role": "tool", "tool_call_id": ids[i], "content": out.get("text") or "(sem texto: tabela/figura)"}
+          for i, out in enumerate(outs)),
+        {"role": "system", "content": "Escreva a análise a partir dos resultados acima "
+                                      "(resumo factual, não invente números)."},
+    ]
     try:
-        msg_final = client.chat.completions.create(
-            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": "Resultados das ferramentas (resumo factual, não invente números):\n" + tool_summary}
-            ],
+        stream = get_llm().chat(
+            session=session,
+            model=model,
+            messages=messages,
+            tools=registry.schemas(),
+            tool_choice="none",
             temperature=0.2,
+            stream=True,
         )
-        narrative = msg_final.choices[0].message.content or ""
+        pieces = []
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                pieces.append(delta)
+                yield {"type": "narrative_token", "text": delta}
+        narrative = "".join(pieces)
         if narrative:
             result["text"] = (tool_summary + "\n\n" + narrative).strip()
     except Exception:
         pass
 
-    # Auto-salvar se houver sugestão explícita
-    txt = result.get("text", "")
-    if "Conclusão salva:" in txt:
-        try:
-            start = txt.index('Conclusão salva:') + len('Conclusão salva:')
-            snippet = txt[start:].strip()
-            # tira aspas se vierem "..."
-            if snippet.startswith('"') and '"' in snippet[1:]:
-                snippet = snippet[1:snippet.index('"', 1)]
-            if snippet:
-                _ = _tool_store_conclusions(mem, text=snippet)
-        except Exception:
-            pass
+    _save_suggested_conclusion(mem, result.get("text", ""))
+    yield {"type": "done", "result": result}
+
+
+def ask_agent(prompt: str, df: pd.DataFrame, mem, concise: bool = True,
+              approximate: bool = False, exact: bool = False, client_charts: bool = False,
+              timeout: Optional[float] = None, session: Optional[str] = None,
+              local_routing: Optional[bool] = None, conversation=None,
+              replay: Optional[List[Tuple[str, Dict[str, Any]]]] = None) -> Dict[str, Any]:
+    """
+    2 fases:
+      1) modelo decide tools e obtem números/figuras;
+      2) narrativa qualitativa (insights/limitações/próximos passos) SEM tools (apenas se houver material).
 
-    return result
\ No newline at end of file
+    approximate: padrão do modo aproximado (toggle da sidebar); o modelo pode sobrescrever por chamada.
+    exact: força a execução exata (botão "reexecutar exato"), ignorando o que o modelo pedir.
+    client_charts: gráficos voltam como spec Vega-Lite ("charts") em vez de PNG ("images").
+    timeout: prazo total (s) das ferramentas desta pergunta (padrão REQUEST_TIMEOUT_S); cada
+      ferramenta tem também seu próprio limite (ToolSpec.timeout no registro). As chamadas rodam em paralelo.
+    session: identificador para a contabilidade de tokens (llm_client).
+    local_routing: tenta antes o roteador local (intent_router), que dispensa a 1ª chamada ao
+      LLM em perguntas comuns; padrão LOCAL_ROUTING (variável INTENT_ROUTING).
+    conversation: estado multi-turno da sessão (app/agent/conversation.Conversation): o modelo
+      recebe o schema e os resultados anteriores (dentro de CONVERSATION_TOKEN_BUDGET) e chamadas
+      repetidas são servidas do resultado guardado, sem recomputar.
+    replay: chamadas já feitas (result["calls"] de uma resposta anterior), executadas de novo
+      sem roteamento nem 1ª chamada ao LLM; com exact=True, é o "reexecutar exato".
+
+    Consome ask_agent_stream e devolve só o resultado final.
+    """
+    result: Dict[str, Any] = {}
+    for event in ask_agent_stream(prompt, df, mem, concise=concise, approximate=approximate, exact=exact,
+                                  client_charts=client_charts, timeout=timeout, session=session,
+                                  local_routing=local_routing, conversation=conversation, replay=replay):
+        if event["type"] == "done":
+            result = event["result"]
+    return result
@@ -1,7 +1,21 @@
 # SQLite/JSON p/ conclusões
+# Memory: JSONL simples (legado). SQLiteMemory: mesmo contrato sobre SQLite, com índice FTS5,
+# deduplicação de conclusões quase idênticas, namespaces por dataset e busca top-k.
+# Cada sessão só enxerga as próprias conclusões (mais as compartilhadas, importadas do JSONL
+# legado); o banco é seguro entre processos (WAL + transações BEGIN IMMEDIATE) e uma thread de
+# compactação remove sessões encerradas/expiradas.
 import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import weakref
+from difflib import SequenceMatcher
 from pathlib import Path
-from typing import List
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 
 
 class Memory:
@@ -35,4 +49,418 @@ class Memory:
     
     def clear(self):
         """Apaga toda a memória desta sessão (trunca o arquivo)."""
-        self.path.write_text("")
\ No newline at end of file
+        self.path.write_text("")
+
+
+# -----------------------------------------------------------------------------
+# SQLite + FTS5
+# -----------------------------------------------------------------------------
+
+NEAR_DUP_RATIO = 0.9
+DEFAULT_NAMESPACE = "default"
+# conclusões importadas do JSONL legado: fora de qualquer sessão, visíveis em todas e em todos
+# os datasets (o JSONL não diz de qual dataset elas vieram); a compactação nunca as remove
+SHARED_SESSION = ""
+MEMORY_BUSY_TIMEOUT_MS = int(os.getenv("MEMORY_BUSY_TIMEOUT_MS", "5000"))
+# sessões sem atividade por mais que isso são removidas pela compactação
+MEMORY_SESSION_TTL_S = float(os.getenv("MEMORY_SESSION_TTL_S", str(7 * 24 * 3600)))
+MEMORY_COMPACT_INTERVAL_S = float(os.getenv("MEMORY_COMPACT_INTERVAL_S", "3600"))
+_TOUCH_EVERY_S = 60.0
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conclusions (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL DEFAULT '',
+    namespace TEXT NOT NULL,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (session, namespace, norm)
+);
+CREATE INDEX IF NOT EXISTS conclusions_ns ON conclusions (session, namespace, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    closed_at REAL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS conclusions_fts USING fts5(
+    text, content='conclusions', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS conclusions_ai AFTER INSERT ON conclusions BEGIN
+    INSERT INTO conclusions_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS conclusions_ad AFTER DELETE ON conclusions BEGIN
+    INSERT INTO conclusions_fts(conclusions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS conclusions_au AFTER UPDATE OF text ON conclusions BEGIN
+    INSERT INTO conclusions_fts(conclusions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO conclusions_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# v1 (conclusões sem sessão, únicas por namespace) -> v2; os ids são mantidos, então o
+# índice FTS (conteúdo externo, por rowid) continua válido
+_MIGRATE_V1 = """
+ALTER TABLE conclusions RENAME TO conclusions_v1;
+DROP TRIGGER IF EXISTS conclusions_ai;
+DROP TRIGGER IF EXISTS conclusions_ad;
+DROP TRIGGER IF EXISTS conclusions_au;
+DROP INDEX IF EXISTS conclusions_ns;
+"""
+
+
+def _normalize(text: str) -> str:
+    """minúsculas, sem acentos/pontuação e com espaços colapsados (chave de deduplicação)."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"\w+(?:[.,]\d+)?", text))
+
+
+# palavras sem conteúdo (e pedidos genéricos) ignoradas na busca
+_STOPWORDS = set("""
+a o as os de do da dos das e em no na nos nas um uma uns umas que se por para com sem sobre
+ao aos ou mais menos muito como qual quais quando onde ja ate entre foi sao ser esta estao
+me mostre mostra liste listar quero ver diga o que sabemos conclusao conclusoes salvas salva
+the of and to in is are on for with what show
+""".split())
+
+
+def _fts_query(text: str) -> str:
+    """Consulta FTS5 segura: termos entre aspas unidos por OR (ranqueados por bm25)."""
+    terms = dict.fromkeys(
+        t for t in re.findall(r"\w+", _normalize(text)) if len(t) > 1 and t not in _STOPWORDS
+    )
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Conexão em autocommit (transações explícitas), WAL e espera em vez de 'database is locked'."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                           timeout=MEMORY_BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {MEMORY_BUSY_TIMEOUT_MS}")
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.OperationalError:  # sistema de arquivos sem suporte a WAL: fica no rollback journal
+        pass
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+@contextmanager
+def _write_txn(conn: sqlite3.Connection):
+    """BEGIN IMMEDIATE: pega o lock de escrita já no início, então a leitura de deduplicação
+    e a inserção são atômicas mesmo com vários processos escrevendo."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _statements(script: str) -> List[str]:
+    """Divide um script SQL em comandos (inclusive triggers com BEGIN ... END;)."""
+    out, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            out.append(buf.strip())
+            buf = ""
+    return out
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> bool:
+    """Cria/migra o schema numa única transação; devolve se o FTS5 está disponível."""
+    with _write_txn(conn):
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(conclusions)")]
+        migrate = bool(cols) and "session" not in cols
+        for stmt in _statements((_MIGRATE_V1 if migrate else "") + _SCHEMA):
+            conn.execute(stmt)
+        if migrate:
+            conn.execute(
+                "INSERT INTO conclusions (id, session, namespace, text, norm, created_at, updated_at, hits) "
+                "SELECT id, '', namespace, text, norm, created_at, updated_at, hits FROM conclusions_v1"
+            )
+            conn.execute("DROP TABLE conclusions_v1")
+        try:
+            conn.execute("SAVEPOINT fts")
+            for stmt in _statements(_FTS_SCHEMA):
+                conn.execute(stmt)
+            conn.execute("RELEASE fts")
+            fts = True
+        except sqlite3.OperationalError:  # SQLite sem FTS5: busca cai para LIKE
+            conn.execute("ROLLBACK TO fts")
+            conn.execute("RELEASE fts")
+            fts = False
+        if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+    return fts
+
+
+class SQLiteMemory:
+    """Conclusões em SQLite (mem.db). Mesma interface de Memory (add/get_all/
+    get_all_as_markdown/clear) + search(query, k) para recuperação por relevância.
+
+    session: isola as conclusões por sessão/usuário (clear() de uma sessão não afeta as outras).
+    namespace: separa as conclusões por dataset (use(fingerprint) ao trocar de CSV).
+    import_jsonl: arquivo JSONL legado importado uma única vez como conclusões compartilhadas
+      (SHARED_SESSION, namespace padrão), que aparecem junto com as da sessão em qualquer dataset.
+    A conexão é fechada por close() (ou ao sair do bloco with, ou quando o objeto é coletado).
+    """
+
+    def __init__(self, path: str = "mem.db", namespace: str = DEFAULT_NAMESPACE,
+                 import_jsonl: Optional[str] = "mem.jsonl", session: str = SHARED_SESSION,
+                 compact: bool = True):
+        self.path = str(path)
+        self.namespace = namespace
+        self.session = session
+        self._lock = threading.Lock()  # ferramentas rodam em threads do pool
+        self._conn = _connect(self.path)
+        self._finalizer = weakref.finalize(self, self._conn.close)
+        self.fts = _ensure_schema(self._conn)
+        self._touched = 0.0
+        if import_jsonl:
+            self._import_jsonl(Path(import_jsonl))
+        if session != SHARED_SESSION:
+            self._touch(force=True)
+        if compact:
+            start_compactor(self.path)
+
+    def _import_jsonl(self, path: Path):
+        key = f"imported:{path.resolve()}"
+        with self._lock, _write_txn(self._conn):
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return
+            for text in self._read_jsonl(path):
+                self._insert(text, SHARED_SESSION, DEFAULT_NAMESPACE)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(time.time())))
+
+    @staticmethod
+    def _read_jsonl(path: Path) -> List[str]:
+        if not path.exists():
+            return []
+        out = []
+        for ln in path.read_text(encoding="utf-8").splitlines():
+            try:
+                out.append(json.loads(ln).get("text", ""))
+            except Exception:
+                continue
+        return [x for x in out if x]
+
+    def _touch(self, force: bool = False):
+        """Marca a sessão como ativa (no máximo uma escrita por minuto)."""
+        now = time.time()
+        if not force and now - self._touched < _TOUCH_EVERY_S:
+            return
+        self._touched = now
+        with _write_txn(self._conn):
+            self._conn.execute(
+                "INSERT INTO sessions (session, created_at, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(session) DO UPDATE SET last_seen = excluded.last_seen, closed_at = NULL",
+                (self.session, now, now),
+            )
+
+    def use(self, namespace: str):
+        """Troca o namespace (ex.: fingerprint do dataset carregado)."""
+        self.namespace = namespace
+
+    def _visible(self, alias: str = "") -> tuple:
+        """Filtro SQL (e parâmetros) das conclusões que esta sessão lê no namespace atual:
+        as próprias e as compartilhadas (legado)."""
+        a = alias + "." if alias else ""
+        return (f"(({a}session = ? AND {a}namespace = ?) OR ({a}session = ? AND {a}namespace IN (?, ?)))",
+                (self.session, self.namespace, SHARED_SESSION, self.namespace, DEFAULT_NAMESPACE))
+
+    def _near_duplicate(self, norm: str, session: str, namespace: str) -> Optional[int]:
+        row = self._conn.execute(
+            "SELECT id FROM conclusions WHERE session = ? AND namespace = ? AND norm = ?",
+            (session, namespace, norm),
+        ).fetchone()
+        if row:
+            return row[0]
+        if not self.fts:
+            return None
+        query = _fts_query(norm)
+        if not query:
+            return None
+        candidates = self._conn.execute(
+            "SELECT c.id, c.norm FROM conclusions_fts f JOIN conclusions c ON c.id = f.rowid "
+            "WHERE conclusions_fts MATCH ? AND c.session = ? AND c.namespace = ? "
+            "ORDER BY bm25(conclusions_fts) LIMIT 20",
+            (query, session, namespace),
+        ).fetchall()
+        for cid, other in candidates:
+            if SequenceMatcher(None, norm, other).ratio() >= NEAR_DUP_RATIO:
+                return cid
+        return None
+
+    def _insert(self, text: str, session: str, namespace: str) -> bool:
+        """(dentro de uma transação de escrita) insere ou marca a repetição."""
+        text = text.strip()
+        norm = _normalize(text)
+        if not norm:
+            return False
+        now = time.time()
+        dup = self._near_duplicate(norm, session, namespace)
+        if dup is not None:
+            self._conn.execute("UPDATE conclusions SET hits = hits + 1, updated_at = ? WHERE id = ?", (now, dup))
+            return False
+        self._conn.execute(
+            "INSERT INTO conclusions (session, namespace, text, norm, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session, namespace, text, norm, now, now),
+        )
+        return True
+
+    def add(self, text: str, namespace: Optional[str] = None) -> bool:
+        """Guarda a conclusão; devolve False se ela repete (quase) uma já salva."""
+        with self._lock:
+            if self.session != SHARED_SESSION:
+                self._touch()
+            with _write_txn(self._conn):
+                return self._insert(text, self.session, namespace or self.namespace)
+
+    def count(self) -> int:
+        where, params = self._visible()
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM conclusions WHERE {where}", params).fetchone()[0]
+
+    def get_all(self, limit: Optional[int] = None) -> List[str]:
+        """Conclusões do namespace em ordem de criação (as `limit` mais recentes, se dado)."""
+        where, params = self._visible()
+        with self._lock:
+            if limit is None:
+                rows = self._conn.execute(f"SELECT text FROM conclusions WHERE {where} ORDER BY id", params).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT text FROM (SELECT id, text FROM conclusions WHERE {where} "
+                    "ORDER BY id DESC LIMIT ?) ORDER BY id", (*params, limit),
+                ).fetchall()
+        return [r[0] for r in rows]
+
+    def search(self, query: str, k: int = 5) -> List[str]:
+        """As k conclusões mais relevantes para `query` (bm25); sem termos, as k mais recentes."""
+        q = _fts_query(query or "")
+        if not q:
+            return self.get_all(limit=k)
+        with self._lock:
+            if self.fts:
+                where, params = self._visible("c")
+                rows = self._conn.execute(
+                    "SELECT c.text FROM conclusions_fts f JOIN conclusions c ON c.id = f.rowid "
+                    f"WHERE conclusions_fts MATCH ? AND {where} "
+                    "ORDER BY bm25(conclusions_fts) LIMIT ?",
+                    (q, *params, k),
+                ).fetchall()
+            else:
+                where, params = self._visible()
+                terms = [t.strip('"') for t in q.split(" OR ")]
+                like = " OR ".join("norm LIKE ?" for _ in terms)
+                rows = self._conn.execute(
+                    f"SELECT text FROM conclusions WHERE {where} AND ({like}) "
+                    "ORDER BY id DESC LIMIT ?",
+                    (*params, *[f"%{t}%" for t in terms], k),
+                ).fetchall()
+        return [r[0] for r in rows] or self.get_all(limit=k)
+
+    def get_all_as_markdown(self, limit: Optional[int] = None) -> str:
+        items = self.get_all(limit=limit)
+        if not items:
+            return "_Sem conclusões salvas ainda._"
+        md = "\n".join([f"- {t}" for t in items])
+        total = self.count() if limit is not None else len(items)
+        if total > len(items):
+            md += f"\n\n_(mostrando as {len(items)} mais recentes de {total})_"
+        return md
+
+    def clear(self):
+        """Apaga as conclusões desta sessão no namespace atual (as outras sessões e as
+        compartilhadas não são afetadas)."""
+        with self._lock, _write_txn(self._conn):
+            self._conn.execute(
+                "DELETE FROM conclusions WHERE session = ? AND namespace = ?", (self.session, self.namespace)
+            )
+
+    def close_session(self):
+        """Encerra a sessão: as conclusões dela são removidas na próxima compactação."""
+        if self.session == SHARED_SESSION:
+            return
+        with self._lock, _write_txn(self._conn):
+            self._conn.execute("UPDATE sessions SET closed_at = ? WHERE session = ?", (time.time(), self.session))
+
+    def close(self):
+        """Fecha a conexão com o banco (a sessão continua valendo; ver close_session)."""
+        with self._lock:
+            self._finalizer()
+
+    def __enter__(self) -> "SQLiteMemory":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -----------------------------------------------------------------------------
+# Compactação
+# -----------------------------------------------------------------------------
+
+def compact(path: str = "mem.db", ttl_s: float = MEMORY_SESSION_TTL_S) -> Dict[str, int]:
+    """Remove sessões encerradas ou inativas há mais de ttl_s (e suas conclusões), otimiza o
+    índice FTS e trunca o WAL. Pode rodar com o app no ar (transações curtas)."""
+    conn = _connect(path)
+    try:
+        fts = _ensure_schema(conn)
+        cutoff = time.time() - ttl_s
+        with _write_txn(conn):
+            dead = [r[0] for r in conn.execute(
+                "SELECT session FROM sessions WHERE closed_at IS NOT NULL OR last_seen < ?", (cutoff,)
+            )]
+            removed = 0
+            for session in dead:
+                removed += conn.execute("DELETE FROM conclusions WHERE session = ?", (session,)).rowcount
+                conn.execute("DELETE FROM sessions WHERE session = ?", (session,))
+        if fts and removed:
+            with _write_txn(conn):
+                conn.execute("INSERT INTO conclusions_fts(conclusions_fts) VALUES ('optimize')")
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError:
+            pass
+        return {"sessions": len(dead), "conclusions": removed}
+    finally:
+        conn.close()
+
+
+_compactors: Dict[str, threading.Thread] = {}
+_compactors_lock = threading.Lock()
+
+
+def start_compactor(path: str = "mem.db", interval_s: float = MEMORY_COMPACT_INTERVAL_S):
+    """Thread daemon (uma por arquivo, por processo) que chama compact() periodicamente."""
+    if interval_s <= 0:
+        return
+    key = os.path.abspath(path)
+    with _compactors_lock:
+        if key in _compactors:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    compact(path)
+                except sqlite3.Error:  # banco ocupado/indisponível: tenta no próximo ciclo
+                    pass
+
+        thread = threading.Thread(target=loop, name="memory-compactor", daemon=True)
+        _compactors[key] = thread
+        thread.start()
@@ -0,0 +1,336 @@
+# detecção de anomalias para datasets de transações (alvo raro, ex.: Class)
+# Três métodos: IsolationForest, z-score robusto (mediana/MAD) e IQR (cercas de Tukey).
+# O ajuste usa a amostra estratificada em cache (sampling.get_sample; out-of-core, uma
+# amostra estratificada lida em uma passada) e o modelo fica em cache pelo fingerprint do
+# dataset. A pontuação do dataset inteiro é feita em blocos de linhas em paralelo (threads
+# do joblib: a travessia das árvores e as operações do numpy liberam o GIL) e resumida num
+# acumulador "mergeável" (top-k, histograma, concordância com o alvo): o mesmo código
+# atende DataFrames e CSVs out-of-core sem materializar mais que um chunk por vez.
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+from .cache import dataset_cache, dataset_fingerprint
+from .chunked import ChunkedCSV, is_out_of_core
+from .sampling import Sample, _resolve_target, _weighted_quantile, get_sample
+
+# n_jobs da pontuação em blocos (-1 = todos os núcleos)
+ANOMALY_JOBS = int(os.getenv("ANOMALY_JOBS", "-1"))
+ANOMALY_BLOCK_ROWS = int(os.getenv("ANOMALY_BLOCK_ROWS", "250000"))
+# modelos ajustados guardados (LRU por fingerprint/método/colunas)
+ANOMALY_MODEL_CACHE = int(os.getenv("ANOMALY_MODEL_CACHE", "8"))
+ANOMALY_TREES = 100
+# linhas usadas no ajuste do IsolationForest (cada árvore usa só 256)
+ANOMALY_FIT_ROWS = 100_000
+# out-of-core: linhas guardadas por classe do alvo na amostra de ajuste
+OOC_ROWS_PER_STRATUM = 100_000
+
+METHODS = ("isolation_forest", "robust_z", "iqr")
+# limiares sem `contamination`: IF segue o offset "auto" do sklearn (score > 0.5);
+# z robusto > 3.5 (Iglewicz & Hoaglin); IQR: 1.5 IQR além dos quartis (Tukey)
+DEFAULT_THRESHOLDS = {"isolation_forest": 0.5, "robust_z": 3.5, "iqr": 1.5}
+HIST_BINS = 40
+AUC_BINS = 4096
+MAX_STRATA = 50
+
+
+def _fingerprint(df) -> str:
+    if is_out_of_core(df):
+        st = os.stat(df.path)
+        pred = getattr(df, "predicate", None)
+        return f"csv:{os.path.abspath(df.path)}:{st.st_size}:{st.st_mtime_ns}:{pred.text if pred else ''}"
+    return dataset_fingerprint(df)
+
+
+# -----------------------------------------------------------------------------
+# Modelo
+# -----------------------------------------------------------------------------
+
+class Detector:
+    """Detector ajustado. score(frame): quanto maior, mais anômala a linha.
+    isolation_forest: -score_samples do sklearn (0 a 1); robust_z: maior |x - mediana| /
+    (1.4826·MAD) entre as colunas; iqr: maior distância além dos quartis, em IQRs."""
+
+    def __init__(self, method: str, features: List[str], fill: np.ndarray, sample: Sample,
+                 model: Any = None, center: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None):
+        self.method = method
+        self.features = features
+        self.fill = fill
+        self.model = model
+        self.center = center
+        self.scale = scale
+        self.sample_size = sample.size
+        self.sample_scores = np.empty(0)
+        self.threshold = DEFAULT_THRESHOLDS[method]
+        self.target: Optional[str] = None
+        self.positive: Any = None  # classe minoritária do alvo (ex.: fraude = 1)
+        self.key: Tuple = ()
+
+    def _matrix(self, frame: pd.DataFrame) -> np.ndarray:
+        x = frame[self.features].to_numpy(dtype=np.float64, na_value=np.nan)
+        nan = np.isnan(x)
+        if nan.any():
+            x[nan] = np.take(self.fill, np.nonzero(nan)[1])
+        return x
+
+    def _deviations(self, x: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.method == "robust_z":
+                d = np.abs(x - self.center) / self.scale
+            else:  # iqr: center = (Q1, Q3)
+                q1, q3 = self.center
+                d = np.maximum(np.maximum(q1 - x, x - q3), 0.0) / self.scale
+        return np.nan_to_num(d, nan=0.0, posinf=0.0)
+
+    def score(self, frame: pd.DataFrame) -> np.ndarray:
+        x = self._matrix(frame)
+        if self.method == "isolation_forest":
+            return -self.model.score_samples(x)
+        return self._deviations(x).max(axis=1) if x.shape[1] else np.zeros(len(x))
+
+    def explain(self, frame: pd.DataFrame) -> List[str]:
+        """Coluna que mais se afasta do centro, por linha (z robusto e IQR)."""
+        if self.method == "isolation_forest" or not self.features:
+            return [""] * len(frame)
+        idx = self._deviations(self._matrix(frame)).argmax(axis=1)
+        return [self.features[i] for i in idx]
+
+
+def _ooc_sample(src: ChunkedCSV, features: List[str], target: Optional[str], seed: int = 0) -> Sample:
+    """Amostra estratificada em uma passada: por classe do alvo, as OOC_ROWS_PER_STRATUM
+    linhas de menor chave aleatória (bottom-k), com peso N_h/n_h."""
+    rng = np.random.default_rng(seed)
+    cols = list(dict.fromkeys(features + ([target] if target else [])))
+    kept: Dict[Any, pd.DataFrame] = {}
+    counts: Dict[Any, int] = {}
+    for chunk in src.iter_chunks(usecols=cols):
+        chunk = chunk.assign(__key=rng.random(len(chunk)))
+        groups = chunk.groupby(chunk[target].fillna("__na__"), sort=False) if target else [(None, chunk)]
+        for h, part in groups:
+            counts[h] = counts.get(h, 0) + len(part)
+            merged = part if h not in kept else pd.concat([kept[h], part])
+            kept[h] = merged.nsmallest(OOC_ROWS_PER_STRATUM, "__key")
+            if len(counts) > MAX_STRATA:
+                raise ValueError(f"'{target}' tem classes demais para estratificar.")
+    frames = [kept[h].drop(columns="__key") for h in kept]
+    weights = np.concatenate([np.full(len(kept[h]), counts[h] / max(len(kept[h]), 1)) for h in kept])
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+    return Sample(df, weights, int(sum(counts.values())), target)
+
+
+def _positive_class(sample: Sample, target: Optional[str]) -> Any:
+    """Classe minoritária do alvo (ex.: fraude = 1), pelos pesos da amostra."""
+    if not target or target not in sample.df.columns:
+        return None
+    labels = sample.df[target]
+    totals = pd.Series(sample.weights, index=labels.index).groupby(labels).sum()
+    if len(totals) < 2:
+        return None
+    return totals.idxmin()
+
+
+def _fit(df, method: str, features: List[str], target: Optional[str], contamination: Optional[float],
+         seed: int) -> Detector:
+    sample = _ooc_sample(df, features, target, seed) if is_out_of_core(df) else get_sample(df, target=target)
+    x = sample.df[features].to_numpy(dtype=np.float64, na_value=np.nan)
+    w = sample.weights
+    fill = np.array([_weighted_quantile(c[~np.isnan(c)], w[~np.isnan(c)], 0.5) if (~np.isnan(c)).any() else 0.0
+                     for c in x.T])
+    x = np.where(np.isnan(x), fill, x)
+    if method == "isolation_forest":
+        from sklearn.ensemble import IsolationForest
+
+        # a amostra estratificada super-representa classes raras; o IF depende da raridade,
+        # então o ajuste usa uma reamostra com reposição proporcional aos pesos (≈ amostra
+        # uniforme da população)
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(x), size=min(len(x), ANOMALY_FIT_ROWS), replace=True, p=w / w.sum())
+        model = IsolationForest(n_estimators=ANOMALY_TREES, random_state=seed, n_jobs=ANOMALY_JOBS)
+        model.fit(x[rows])
+        det = Detector(method, features, fill, sample, model=model)
+    elif method == "robust_z":
+        mad = np.array([_weighted_quantile(np.abs(c - f), w, 0.5) for c, f in zip(x.T, fill)])
+        # MAD nulo (coluna quase constante): desvio médio absoluto, como no z modificado
+        mean_ad = np.array([np.average(np.abs(c - f), weights=w) for c, f in zip(x.T, fill)])
+        scale = np.where(mad > 0, 1.4826 * mad, 1.2533 * mean_ad)
+        det = Detector(method, features, fill, sample, center=fill, scale=np.where(scale > 0, scale, np.inf))
+    else:
+        q = np.array([_weighted_quantile(c, w, [0.25, 0.75]) for c in x.T]).reshape(-1, 2)
+        iqr = q[:, 1] - q[:, 0]
+        det = Detector(method, features, fill, sample, center=(q[:, 0], q[:, 1]),
+                       scale=np.where(iqr > 0, iqr, np.inf))
+    det.sample_scores = det.score(sample.df)
+    det.target = target
+    det.positive = _positive_class(sample, target)
+    if contamination:
+        det.threshold = float(_weighted_quantile(det.sample_scores, w, 1 - float(contamination)))
+    return det
+
+
+_MODELS: "OrderedDict[Tuple, Detector]" = OrderedDict()
+_MODELS_LOCK = threading.Lock()
+
+
+def get_detector(df, method: str = "isolation_forest", features: Optional[List[str]] = None,
+                 target: Optional[str] = "Class", contamination: Optional[float] = None,
+                 seed: int = 0) -> Detector:
+    """Detector ajustado na amostra, em cache por (fingerprint do dataset, método, colunas,
+    alvo, contamination): o mesmo CSV recarregado reaproveita o modelo."""
+    if method not in METHODS:
+        raise ValueError(f"Método desconhecido: {method}. Use um de {', '.join(METHODS)}.")
+    target = _resolve_target(df, target) if target else None
+    if features is None:
+        numeric = df.numeric_columns() if is_out_of_core(df) else df.select_dtypes(include=["number"]).columns
+        features = [c for c in numeric if c != target]
+    if not features:
+        raise ValueError("Nenhuma coluna numérica para detectar anomalias.")
+    key = (_fingerprint(df), method, tuple(features), target, contamination, seed)
+    with _MODELS_LOCK:
+        det = _MODELS.get(key)
+        if det is not None:
+            _MODELS.move_to_end(key)
+            return det
+    det = _fit(df, method, list(features), target, contamination, seed)
+    det.key = key
+    with _MODELS_LOCK:
+        _MODELS[key] = det
+        while len(_MODELS) > ANOMALY_MODEL_CACHE:
+            _MODELS.popitem(last=False)
+    return det
+
+
+# -----------------------------------------------------------------------------
+# Pontuação em blocos + resumo
+# -----------------------------------------------------------------------------
+
+class _Summary:
+    """Resumo mergeável das pontuações: contagens, histograma (bordas fixadas pela
+    amostra; valores fora da faixa vão para os bins das pontas), top-k com as linhas
+    originais e, com alvo, sinalizadas x classe positiva e histogramas finos para a AUC."""
+
+    def __init__(self, det: Detector, top: int, positive: Any):
+        s = det.sample_scores
+        lo = float(s.min()) if len(s) else 0.0
+        hi = max(float(s.max()) if len(s) else 1.0, det.threshold)
+        self.edges = np.linspace(lo, hi if hi > lo else lo + 1.0, HIST_BINS + 1)
+        self.fine = np.linspace(self.edges[0], self.edges[-1], AUC_BINS + 1)
+        self.counts = np.zeros(HIST_BINS)
+        self.threshold, self.top, self.positive = det.threshold, top, positive
+        self.n = self.flagged = self.pos = self.flagged_pos = 0.0
+        self.pos_hist = np.zeros(AUC_BINS)
+        self.neg_hist = np.zeros(AUC_BINS)
+        self.rows: Optional[pd.DataFrame] = None
+
+    def update(self, frame: pd.DataFrame, scores: np.ndarray, labels: Optional[pd.Series],
+               weights: Optional[np.ndarray] = None):
+        w = np.ones(len(scores)) if weights is None else weights
+        clipped = np.clip(scores, self.edges[0], self.edges[-1])
+        flagged = scores > self.threshold
+        self.n += w.sum()
+        self.flagged += w[flagged].sum()
+        self.counts += np.histogram(clipped, bins=self.edges, weights=w)[0]
+        if labels is not None and self.positive is not None:
+            known = labels.notna().to_numpy()
+            pos = (labels == self.positive).to_numpy() & known
+            self.pos += w[pos].sum()
+            self.flagged_pos += w[pos & flagged].sum()
+            self.pos_hist += np.histogram(clipped[pos], bins=self.fine, weights=w[pos])[0]
+            neg = known & ~pos
+            self.neg_hist += np.histogram(clipped[neg], bins=self.fine, weights=w[neg])[0]
+        k = min(self.top, len(scores))
+        if k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            part = frame.iloc[best].assign(score=scores[best])
+            both = part if self.rows is None else pd.concat([self.rows, part])
+            self.rows = both.nlargest(self.top, "score")
+
+    def agreement(self) -> Optional[Dict[str, float]]:
+        negatives = self.neg_hist.sum()
+        if self.positive is None or self.pos == 0 or negatives == 0:
+            return None
+        # AUC pelos histogramas: P(score_pos > score_neg) + ½ empates no mesmo bin fino
+        below = np.concatenate(([0.0], np.cumsum(self.neg_hist)[:-1]))
+        auc = float((self.pos_hist * (below + 0.5 * self.neg_hist)).sum() / (self.pos * negatives))
+        return {
+            "positive": self.positive,
+            "positives": self.pos,
+            "flagged_positives": self.flagged_pos,
+            "precision": self.flagged_pos / self.flagged if self.flagged else float("nan"),
+            "recall": self.flagged_pos / self.pos,
+            "base_rate": self.pos / (self.pos + negatives),
+            "auc": auc,
+        }
+
+
+class AnomalyReport:
+    """Resultado de detect_anomalies."""
+
+    def __init__(self, det: Detector, summary: _Summary, approximate: bool, sample: Optional[Sample] = None):
+        self.method = det.method
+        self.features = det.features
+        self.threshold = det.threshold
+        self.fit_rows = det.sample_size
+        self.n_rows = int(round(summary.n))
+        self.flagged = int(round(summary.flagged))
+        self.counts, self.edges = summary.counts, summary.edges
+        self.target = det.target
+        self.agreement = summary.agreement()
+        self.approximate = approximate
+        self.sample = sample
+        top = summary.rows if summary.rows is not None else pd.DataFrame(columns=["score"])
+        if det.method != "isolation_forest" and len(top):
+            top = top.assign(coluna=det.explain(top))
+        self.top = top
+
+
+def _blocks(n: int, jobs: int) -> List[Tuple[int, int]]:
+    size = max(1, min(ANOMALY_BLOCK_ROWS, -(-n // max(jobs, 1))))
+    return [(a, min(a + size, n)) for a in range(0, n, size)]
+
+
+def _score_frame(det: Detector, frame: pd.DataFrame, parallel: Parallel, jobs: int) -> np.ndarray:
+    blocks = _blocks(len(frame), jobs)
+    if len(blocks) <= 1:
+        return det.score(frame)
+    parts = parallel(delayed(det.score)(frame.iloc[a:b]) for a, b in blocks)
+    return np.concatenate(parts)
+
+
+def score_dataset(df: pd.DataFrame, det: Detector) -> np.ndarray:
+    """Pontuação de todas as linhas do DataFrame (em cache por dataset e detector)."""
+    cache = dataset_cache(df)
+    key = ("anomaly_scores", det.key)
+    scores = cache.get(key)
+    if scores is None:
+        jobs = effective_n_jobs(ANOMALY_JOBS)
+        with Parallel(n_jobs=jobs, prefer="threads") as parallel:
+            scores = _score_frame(det, df, parallel, jobs).astype(np.float32)
+        cache[key] = scores
+    return scores
+
+
+def detect_anomalies(df, method: str = "isolation_forest", columns: Optional[List[str]] = None,
+                     target: Optional[str] = "Class", top: int = 20, contamination: Optional[float] = None,
+                     approximate: bool = False) -> AnomalyReport:
+    """Ajusta (ou reaproveita) o detector e resume as pontuações do dataset inteiro; com
+    approximate=True, só a amostra estratificada é pontuada (contagens expandidas pelos pesos)."""
+    det = get_detector(df, method, columns, target, contamination)
+    target = det.target
+    summary = _Summary(det, max(int(top), 1), det.positive)
+    if is_out_of_core(df):
+        jobs = effective_n_jobs(ANOMALY_JOBS)
+        with Parallel(n_jobs=jobs, prefer="threads") as parallel:
+            for chunk in df.iter_chunks():  # linhas inteiras: o top-k mostra todas as colunas
+                summary.update(chunk, _score_frame(det, chunk, parallel, jobs), chunk[target] if target else None)
+        return AnomalyReport(det, summary, approximate=False)
+    if approximate:
+        sample = get_sample(df, target=target)
+        summary.update(sample.df, det.score(sample.df), sample.df[target] if target else None, sample.weights)
+        return AnomalyReport(det, summary, approximate=True, sample=sample)
+    summary.update(df, score_dataset(df, det), df[target] if target else None)
+    return AnomalyReport(det, summary, approximate=False)
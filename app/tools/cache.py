@@ -0,0 +1,46 @@
+# cache por dataset (amostras, índices, máscaras) + fingerprint barato
+# As entradas vivem enquanto o DataFrame existir (liberadas via weakref.finalize).
+import hashlib
+import threading
+import weakref
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+_CACHES: Dict[int, Dict[str, Any]] = {}
+_LOCK = threading.Lock()
+
+
+def dataset_cache(df: pd.DataFrame) -> Dict[str, Any]:
+    """Dicionário de artefatos derivados associado a este DataFrame (por identidade)."""
+    key = id(df)
+    with _LOCK:
+        entry = _CACHES.get(key)
+        if entry is None:
+            entry = {}
+            _CACHES[key] = entry
+            weakref.finalize(df, _CACHES.pop, key, None)
+        return entry
+
+
+def dataset_fingerprint(df: pd.DataFrame, probe_rows: int = 1024) -> str:
+    """Assinatura estável do dataset: shape, colunas, dtypes e hash de linhas espaçadas.
+    Não lê o DataFrame inteiro (custo constante em relação ao número de linhas)."""
+    cache = dataset_cache(df)
+    fp = cache.get("__fingerprint__")
+    if fp is not None:
+        return fp
+    n = len(df)
+    idx = np.unique(np.linspace(0, max(n - 1, 0), num=min(n, probe_rows)).astype(np.int64))
+    probe = df.iloc[idx] if n else df
+    h = pd.util.hash_pandas_object(probe, index=False).values
+    sig = "|".join([
+        str(df.shape),
+        ",".join(map(str, df.columns)),
+        ",".join(map(str, df.dtypes)),
+        f"{int(h.sum(dtype=np.uint64)) if len(h) else 0:x}",
+    ])
+    fp = hashlib.sha1(sig.encode("utf-8")).hexdigest()[:16]
+    cache["__fingerprint__"] = fp
+    return fp
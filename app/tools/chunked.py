@@ -0,0 +1,318 @@
+# execução out-of-core: lê o CSV em chunks e combina agregados parciais "mergeáveis"
+# A memória fica limitada pelo tamanho do chunk (e pelo nº de grupos/valores distintos),
+# nunca pelo tamanho do arquivo.
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 200_000
+MAX_DISTINCT = 1_000_000
+# acima disso, medianas por grupo deixam de ser calculadas (um sketch por grupo)
+MAX_SKETCH_GROUPS = 1_000
+
+
+class ChunkedCSV:
+    """Fonte de dados out-of-core: um caminho de CSV lido sob demanda em chunks."""
+
+    def __init__(self, path: str, chunksize: int = DEFAULT_CHUNKSIZE, **read_kwargs):
+        self.path = path
+        self.chunksize = chunksize
+        self.read_kwargs = read_kwargs
+        self._head = pd.read_csv(path, nrows=1000, **read_kwargs)
+        self._n_rows: Optional[int] = None
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._head.columns
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return self._head.dtypes
+
+    def numeric_columns(self) -> List[str]:
+        return self._head.select_dtypes(include=["number"]).columns.tolist()
+
+    def iter_chunks(self, usecols: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        rows = 0
+        reader = pd.read_csv(self.path, chunksize=self.chunksize, usecols=usecols, **self.read_kwargs)
+        for chunk in reader:
+            rows += len(chunk)
+            yield chunk
+        self._n_rows = rows
+
+    @property
+    def n_rows(self) -> int:
+        if self._n_rows is None:
+            first = self.columns[:1].tolist()
+            for _ in self.iter_chunks(usecols=first):
+                pass
+        return self._n_rows
+
+
+def is_out_of_core(df) -> bool:
+    return isinstance(df, ChunkedCSV)
+
+
+# -----------------------------------------------------------------------------
+# Estados parciais
+# -----------------------------------------------------------------------------
+
+class Moments:
+    """n, média, M2, min, max (merge de Chan et al.). Sem valores (coluna toda nula, filtro
+    vazio): média, min, max e std são NaN, como no pandas; a soma é 0."""
+
+    def __init__(self):
+        self.n, self.mean, self.m2 = 0, float("nan"), 0.0
+        self.min, self.max = float("nan"), float("nan")
+
+    def update(self, x: np.ndarray):
+        x = x[~np.isnan(x)]
+        if len(x) == 0:
+            return
+        other = Moments()
+        other.n, other.mean = len(x), float(x.mean())
+        other.m2 = float(((x - other.mean) ** 2).sum())
+        other.min, other.max = float(x.min()), float(x.max())
+        self.merge(other)
+
+    def merge(self, other: "Moments"):
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2, self.min, self.max = other.n, other.mean, other.m2, other.min, other.max
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+    @property
+    def sum(self) -> float:
+        return self.mean * self.n if self.n else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float("nan")
+
+
+class QuantileSketch:
+    """Sketch de quantis estilo KLL: buffers por nível com capacidade k; ao encher, o buffer
+    é ordenado e metade dos itens (offset aleatório) sobe de nível com peso dobrado.
+    Memória O(k log n); erro de rank ~ O(1/k)."""
+
+    def __init__(self, k: int = 4096, seed: int = 0):
+        self.k = k
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, x: np.ndarray):
+        x = x[~np.isnan(x)]
+        if len(x):
+            self.levels[0] = np.concatenate([self.levels[0], x])
+            self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        for lvl, buf in enumerate(other.levels):
+            if lvl == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[lvl] = np.concatenate([self.levels[lvl], buf])
+        self._compress()
+
+    def _compress(self):
+        lvl = 0
+        while lvl < len(self.levels):
+            buf = self.levels[lvl]
+            if len(buf) > self.k:
+                buf = np.sort(buf)
+                promoted = buf[int(self._rng.integers(2))::2]
+                self.levels[lvl] = np.empty(0)
+                if lvl + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[lvl + 1] = np.concatenate([self.levels[lvl + 1], promoted])
+            lvl += 1
+
+    def quantile(self, q: float) -> float:
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return float("nan")
+        weights = np.concatenate([np.full(len(b), 2.0 ** i) for i, b in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cw = np.cumsum(weights[order])
+        return float(np.interp(q * cw[-1], cw - 0.5 * weights[order], values[order]))
+
+
+class ValueCounter:
+    """Contagens mergeáveis; acima de max_distinct mantém só os mais frequentes (aproximado)."""
+
+    def __init__(self, max_distinct: int = MAX_DISTINCT):
+        self.max_distinct = max_distinct
+        self.counts = pd.Series(dtype="int64")
+        self.truncated = False
+
+    def update(self, s: pd.Series):
+        self.merge_counts(s.value_counts(dropna=False))
+
+    def merge_counts(self, vc: pd.Series):
+        self.counts = self.counts.add(vc, fill_value=0).astype("int64") if len(self.counts) else vc.astype("int64")
+        if len(self.counts) > self.max_distinct:
+            self.counts = self.counts.nlargest(self.max_distinct)
+            self.truncated = True
+
+
+# -----------------------------------------------------------------------------
+# Operações out-of-core
+# -----------------------------------------------------------------------------
+
+def _numeric(chunk: pd.DataFrame, column: str) -> np.ndarray:
+    return pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def value_counts(src: ChunkedCSV, column: str) -> ValueCounter:
+    vc = ValueCounter()
+    for chunk in src.iter_chunks(usecols=[column]):
+        vc.update(chunk[column])
+    vc.counts = vc.counts.sort_values(ascending=False)
+    return vc
+
+
+def compute_stat(src: ChunkedCSV, column: str, stat: str) -> float:
+    """mean/std/min/max/count/sum exatos; median aproximada via QuantileSketch."""
+    mom = Moments()
+    sketch = QuantileSketch() if stat == "median" else None
+    for chunk in src.iter_chunks(usecols=[column]):
+        x = _numeric(chunk, column)
+        if sketch is not None:
+            sketch.update(x)
+        else:
+            mom.update(x)
+    if sketch is not None:
+        return sketch.quantile(0.5)
+    if stat == "count":
+        return float(mom.n)
+    return float(getattr(mom, stat))
+
+
+def describe(src: ChunkedCSV) -> pd.DataFrame:
+    """count/nulls/mean/std/min/max de cada coluna numérica em uma única passada."""
+    num_cols = src.numeric_columns()
+    moments = {c: Moments() for c in num_cols}
+    nulls = pd.Series(0, index=src.columns, dtype="int64")
+    for chunk in src.iter_chunks():
+        nulls = nulls.add(chunk.isna().sum(), fill_value=0).astype("int64")
+        for c in num_cols:
+            moments[c].update(_numeric(chunk, c))
+    rows = {
+        c: {"count": m.n, "mean": m.mean, "std": m.std, "min": m.min, "max": m.max}
+        for c, m in moments.items()
+    }
+    out = pd.DataFrame(rows).T
+    out["nulls"] = nulls.reindex(out.index)
+    return out
+
+
+def histogram(src: ChunkedCSV, column: str, bins: int = 30):
+    """Duas passadas: min/max para fixar os bins; depois soma das contagens por chunk."""
+    mom = Moments()
+    for chunk in src.iter_chunks(usecols=[column]):
+        mom.update(_numeric(chunk, column))
+    if mom.n == 0:
+        raise ValueError(f"Coluna '{column}' não tem valores numéricos")
+    edges = np.histogram_bin_edges([mom.min, mom.max], bins=bins)
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for chunk in src.iter_chunks(usecols=[column]):
+        x = _numeric(chunk, column)
+        counts += np.histogram(x[~np.isnan(x)], bins=edges)[0]
+    return counts, edges
+
+
+def corr_matrix(src: ChunkedCSV, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Pearson pairwise-complete a partir de somas e produtos cruzados acumulados por chunk."""
+    cols = columns or src.numeric_columns()
+    k = len(cols)
+    n = np.zeros((k, k))
+    sx = np.zeros((k, k))
+    sxx = np.zeros((k, k))
+    sxy = np.zeros((k, k))
+    for chunk in src.iter_chunks(usecols=cols):
+        x = chunk[cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        m = (~np.isnan(x)).astype(np.float64)
+        x0 = np.nan_to_num(x)
+        n += m.T @ m
+        sx += x0.T @ m            # sx[i, j] = soma de x_i onde x_j também é válido
+        sxx += (x0 * x0).T @ m
+        sxy += x0.T @ x0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_i * var_i.T)
+    return pd.DataFrame(np.clip(corr, -1, 1), index=cols, columns=cols)
+
+
+def groupby_aggregate(src: ChunkedCSV, by: List[str], aggregations: Dict[str, Any]) -> pd.DataFrame:
+    """Somas, contagens, quadrados, min e max parciais por grupo; mean/std/sum/count/min/max
+    exatos. median por grupo via QuantileSketch (até MAX_SKETCH_GROUPS grupos)."""
+    aggs = {c: ([s] if isinstance(s, str) else list(s)) for c, s in aggregations.items()}
+    cols = list(aggs)
+    usecols = list(dict.fromkeys(list(by) + cols))
+    partial: Optional[pd.DataFrame] = None
+    sketches: Dict[str, Dict[Any, QuantileSketch]] = {c: {} for c, s in aggs.items() if "median" in s}
+    for chunk in src.iter_chunks(usecols=usecols):
+        vals = chunk[cols].apply(pd.to_numeric, errors="coerce")
+        frame = pd.concat(
+            [vals.add_suffix("|sum"), (vals * vals).add_suffix("|sq"), vals.notna().add_suffix("|n"),
+             vals.add_suffix("|min"), vals.add_suffix("|max")],
+            axis=1,
+        )
+        g = frame.groupby([chunk[b] for b in by], dropna=False)
+        part = pd.concat([
+            g[[f"{c}|sum" for c in cols] + [f"{c}|sq" for c in cols] + [f"{c}|n" for c in cols]].sum(),
+            g[[f"{c}|min" for c in cols]].min(),
+            g[[f"{c}|max" for c in cols]].max(),
+        ], axis=1)
+        partial = part if partial is None else _merge_group_partials(partial, part, cols)
+        for c, per_group in sketches.items():
+            for key, x in vals[c].groupby([chunk[b] for b in by], dropna=False):
+                key = key[0] if len(by) == 1 and isinstance(key, tuple) else key
+                sk = per_group.get(key)
+                if sk is None:
+                    if len(per_group) >= MAX_SKETCH_GROUPS:
+                        raise ValueError(f"median por grupo limitada a {MAX_SKETCH_GROUPS} grupos no modo out-of-core")
+                    sk = per_group[key] = QuantileSketch(k=1024)
+                sk.update(x.to_numpy(dtype=np.float64))
+    if partial is None:
+        return pd.DataFrame()
+
+    out = {}
+    for c, stats in aggs.items():
+        n = partial[f"{c}|n"]
+        mean = partial[f"{c}|sum"] / n
+        for st in stats:
+            if st == "mean":
+                out[(c, st)] = mean
+            elif st == "sum":
+                out[(c, st)] = partial[f"{c}|sum"]
+            elif st == "count":
+                out[(c, st)] = n
+            elif st == "std":
+                out[(c, st)] = np.sqrt(((partial[f"{c}|sq"] - n * mean ** 2) / (n - 1)).clip(lower=0))
+            elif st in ("min", "max"):
+                out[(c, st)] = partial[f"{c}|{st}"]
+            elif st == "median":
+                out[(c, st)] = pd.Series({k: sk.quantile(0.5) for k, sk in sketches[c].items()}).reindex(partial.index)
+            else:
+                raise ValueError(f"Estatística não suportada: {st}")
+    return pd.DataFrame(out, index=partial.index)
+
+
+def _merge_group_partials(a: pd.DataFrame, b: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    both = pd.concat([a, b])
+    g = both.groupby(level=list(range(both.index.nlevels)), dropna=False)
+    sums = [f"{c}|{k}" for k in ("sum", "sq", "n") for c in cols]
+    return pd.concat([
+        g[sums].sum(),
+        g[[f"{c}|min" for c in cols]].min(),
+        g[[f"{c}|max" for c in cols]].max(),
+    ], axis=1)
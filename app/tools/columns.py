@@ -0,0 +1,159 @@
+# índice de nomes de colunas por dataset (montado uma vez, reaproveitado por todas as ferramentas)
+# Resolve um nome vindo do modelo ou do usuário por etapas: exato, sem caixa/acentos/
+# separadores, por palavra do nome (único candidato) e por similaridade (difflib). Também
+# encontra, numa só passada, todas as colunas citadas num texto (uma regex com todos os nomes).
+import re
+import unicodedata
+from difflib import SequenceMatcher, get_close_matches
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import dataset_cache
+
+FUZZY_MIN_RATIO = 0.85
+# palavras do texto comparadas por similaridade com nomes de coluna de uma palavra
+FUZZY_MIN_TOKEN_LEN = 4
+
+
+def fold(text: Any) -> str:
+    """minúsculas sem acentos (para casar nomes de colunas e palavras-chave)."""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _key(text: Any) -> str:
+    """forma canônica de um nome: fold + separadores (espaço, _, -, .) unificados."""
+    return re.sub(r"[\s_\-.]+", "_", fold(text)).strip("_")
+
+
+def _tokens(text: Any) -> List[str]:
+    # "merchantType" / "merchant_type" / "Merchant Type" -> ["merchant", "type"]
+    spaced = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", str(text))
+    return [t for t in re.split(r"[^0-9a-z]+", fold(spaced)) if t]
+
+
+class ColumnIndex:
+    """Índice dos nomes de colunas de um dataset."""
+
+    def __init__(self, columns: Iterable[Any]):
+        self.columns = list(columns)
+        self._exact: Dict[str, Any] = {}
+        self._folded: Dict[str, Any] = {}
+        self._by_token: Dict[str, List[Any]] = {}
+        for col in self.columns:
+            self._exact.setdefault(str(col), col)
+            self._folded.setdefault(_key(col), col)
+            for tok in set(_tokens(col)):
+                self._by_token.setdefault(tok, []).append(col)
+        self._keys = list(self._folded)
+        self._pattern: Optional["re.Pattern"] = None
+        self._variants: Dict[str, Any] = {}
+        self._single = {k: c for k, c in self._folded.items()
+                        if re.fullmatch(r"\w+", k) and len(str(c)) >= FUZZY_MIN_TOKEN_LEN}
+
+    def __contains__(self, name: Any) -> bool:
+        return self.resolve(name) is not None
+
+    # ------------------------------------------------------------------
+    # nome -> coluna
+    # ------------------------------------------------------------------
+    def resolve(self, name: Any, fuzzy: bool = True) -> Optional[Any]:
+        """Coluna correspondente a `name` ou None (ambíguo ou sem candidato)."""
+        if name is None:
+            return None
+        hit = self._exact.get(str(name))
+        if hit is not None:
+            return hit
+        key = _key(name)
+        hit = self._folded.get(key)
+        if hit is not None:
+            return hit
+        toks = _tokens(name)
+        if len(toks) == 1:
+            cands = self._by_token.get(toks[0], [])
+            if len(cands) == 1:
+                return cands[0]
+        if fuzzy and key:
+            close = get_close_matches(key, self._keys, n=2, cutoff=FUZZY_MIN_RATIO)
+            if len(close) == 1 or (len(close) > 1 and SequenceMatcher(None, key, close[0]).ratio()
+                                   > SequenceMatcher(None, key, close[1]).ratio()):
+                return self._folded[close[0]]
+        return None
+
+    def suggest(self, name: Any, n: int = 3) -> List[Any]:
+        """Colunas parecidas com `name` (para mensagens de erro)."""
+        key = _key(name)
+        close = [self._folded[k] for k in get_close_matches(key, self._keys, n=n, cutoff=0.6)]
+        for tok in _tokens(name):
+            for col in self._by_token.get(tok, []):
+                if col not in close:
+                    close.append(col)
+        return close[:n]
+
+    def not_found(self, name: Any, label: str = "Coluna") -> str:
+        """Mensagem padrão de coluna inexistente, com sugestões."""
+        msg = f"{label} '{name}' não encontrada."
+        hints = self.suggest(name)
+        if hints:
+            msg += " Você quis dizer: " + ", ".join(f"'{c}'" for c in hints) + "?"
+        return msg
+
+    # ------------------------------------------------------------------
+    # texto -> colunas citadas
+    # ------------------------------------------------------------------
+    def _compiled(self) -> "re.Pattern":
+        if self._pattern is None:
+            for col in self.columns:
+                name = fold(col)
+                if not name:
+                    continue
+                for v in (name, name.replace("_", " ")):
+                    self._variants.setdefault(v, col)
+            # nomes mais longos primeiro ("V10" antes de "V1"): a alternância pega o mais longo
+            alts = sorted(self._variants, key=len, reverse=True)
+            body = "|".join(re.escape(v) for v in alts) or r"(?!x)x"
+            self._pattern = re.compile(r"(?<![\w])(?:" + body + r")(?![\w])")
+        return self._pattern
+
+    def scan(self, text: str, fuzzy: bool = True) -> List[Tuple[int, int, Any]]:
+        """Colunas citadas em `text` como (início, fim, coluna), na ordem em que aparecem.
+        Posições referem-se a fold(text). Casa o nome inteiro (sem caixa/acentos, com _ ou
+        espaço); palavras sem casamento exato ainda podem casar por similaridade com nomes
+        de coluna de uma palavra."""
+        folded = fold(text)
+        found: List[Tuple[int, int, Any]] = []
+        taken = [False] * len(folded)
+        for m in self._compiled().finditer(folded):
+            found.append((m.start(), m.end(), self._variants[m.group()]))
+            taken[m.start():m.end()] = [True] * (m.end() - m.start())
+        if fuzzy and self._single:
+            for m in re.finditer(r"\w{%d,}" % FUZZY_MIN_TOKEN_LEN, folded):
+                if any(taken[m.start():m.end()]):
+                    continue
+                close = get_close_matches(m.group(), list(self._single), n=1, cutoff=FUZZY_MIN_RATIO)
+                if close:
+                    found.append((m.start(), m.end(), self._single[close[0]]))
+        return sorted(found, key=lambda f: (f[0], f[1]))
+
+    def mentioned(self, text: str, fuzzy: bool = True) -> List[Any]:
+        """Colunas citadas em `text`, sem repetição, na ordem em que aparecem."""
+        return list(dict.fromkeys(col for _, _, col in self.scan(text, fuzzy=fuzzy)))
+
+
+def column_index(df) -> ColumnIndex:
+    """ColumnIndex do dataset (DataFrame ou ChunkedCSV), em cache enquanto ele existir."""
+    cache = dataset_cache(df)
+    index = cache.get("column_index")
+    if index is None or len(index.columns) != len(df.columns):
+        index = ColumnIndex(df.columns)
+        cache["column_index"] = index
+    return index
+
+
+def resolve_columns(df, names: Iterable[Any]) -> Tuple[List[Any], List[Any]]:
+    """(colunas resolvidas, nomes sem correspondência)."""
+    index = column_index(df)
+    ok, missing = [], []
+    for name in names:
+        col = index.resolve(name)
+        (ok if col is not None else missing).append(col if col is not None else name)
+    return ok, missing
@@ -0,0 +1,176 @@
+# motor de correlação para datasets largos (centenas de colunas)
+# Pearson = produto matricial float32 (BLAS) sobre colunas centradas; Spearman = ranks + o mesmo produto.
+# NaNs são tratados com máscaras (pairwise-complete), sem descartar linhas inteiras.
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+MAX_HEATMAP_COLUMNS = 40
+
+
+def _rank_columns(x: np.ndarray) -> np.ndarray:
+    """Ranks médios (empates) por coluna, vetorizado na matriz inteira; NaN continua NaN."""
+    xt = np.ascontiguousarray(x.T)
+    order = np.argsort(xt, axis=1)
+    s = np.take_along_axis(xt, order, axis=1)
+    n = s.shape[1]
+    # posições e ranks em float64: float32 só representa inteiros exatos até 2^24 linhas
+    pos = np.broadcast_to(np.arange(n, dtype=np.float64), s.shape)
+    new_run = np.ones(s.shape, dtype=bool)
+    new_run[:, 1:] = s[:, 1:] != s[:, :-1]
+    first = np.maximum.accumulate(np.where(new_run, pos, 0), axis=1)
+    end_run = np.ones(s.shape, dtype=bool)
+    end_run[:, :-1] = new_run[:, 1:]
+    last = np.minimum.accumulate(np.where(end_run, pos, n - 1)[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty(s.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    ranks[np.isnan(xt)] = np.nan
+    return ranks.T
+
+
+def _masked_corr(x: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """Correlação de Pearson pairwise-complete de uma matriz (linhas x colunas) com NaNs.
+    Um único produto k x k cobre as colunas completas; só as colunas com NaN (d) pagam
+    os produtos mascarados extras, de custo k x d."""
+    mask = ~np.isnan(x)
+    w = weights.astype(x.dtype)[:, None] if weights is not None else None
+    # centrar antes do produto reduz o cancelamento numérico em float32; com pesos o centro
+    # é a média ponderada (nas linhas válidas de cada coluna), senão x0.T @ (x0 * w) não é
+    # a covariância ponderada
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if w is None:
+            center = np.nanmean(x, axis=0, dtype=np.float64)
+        else:
+            w64 = weights.astype(np.float64)
+            center = (np.where(mask, x, 0).T @ w64) / (mask.T @ w64)
+        x = x - center.astype(x.dtype)
+    x0 = np.where(mask, x, x.dtype.type(0))
+    xw = x0 * w if w is not None else x0
+    cov = x0.T @ xw
+    d = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.outer(d, d)
+
+    partial = np.flatnonzero(~mask.all(axis=0))
+    if len(partial) == 0:
+        return corr
+    m = mask.astype(x.dtype)
+    m_d = m[:, partial] * w if w is not None else m[:, partial]
+    y_d = xw[:, partial]
+    n = m.T @ m_d
+    sx = x0.T @ m_d             # soma de x_i nas linhas em que x_j (j em d) também é válido
+    sxx = (x0 * x0).T @ m_d
+    sy = m.T @ y_d              # soma de x_j nas linhas em que x_i também é válido
+    syy = m.T @ (y_d * x0[:, partial])
+    sxy = x0.T @ y_d
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c_d = (sxy - sx * sy / n) / np.sqrt((sxx - sx * sx / n) * (syy - sy * sy / n))
+    corr[:, partial] = c_d
+    corr[partial, :] = c_d.T
+    return corr
+
+
+class CoMoments:
+    """n, médias e matriz de co-momentos centrados de colunas sem nulos. Mergeável (Chan et al.):
+    quando o dataset ganha linhas, a correlação de Pearson é atualizada só com as novas."""
+
+    def __init__(self, n: int, mean: np.ndarray, cov: np.ndarray):
+        self.n, self.mean, self.cov = n, mean, cov
+
+    @classmethod
+    def of(cls, x: np.ndarray) -> "CoMoments":
+        mean = x.mean(axis=0, dtype=np.float64)
+        x0 = x - mean.astype(np.float32)
+        return cls(len(x), mean, (x0.T @ x0).astype(np.float64))
+
+    def merge(self, other: "CoMoments") -> "CoMoments":
+        n = self.n + other.n
+        if self.n == 0 or other.n == 0:
+            return other if self.n == 0 else self
+        delta = other.mean - self.mean
+        return CoMoments(n, self.mean + delta * other.n / n,
+                         self.cov + other.cov + np.outer(delta, delta) * (self.n * other.n / n))
+
+    def corr(self) -> np.ndarray:
+        d = np.sqrt(np.diag(self.cov))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.cov / np.outer(d, d)
+
+
+def corr_matrix(df: pd.DataFrame, method: str = "pearson", columns: Optional[List[str]] = None,
+                weights: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Matriz de correlação das colunas numéricas (ou de `columns`), em cache por dataset."""
+    key = ("corr", method, tuple(columns) if columns else None, weights is not None)
+    cache = dataset_cache(df)
+    if key in cache:
+        return cache[key]
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Método não suportado: {method}")
+    num_df = df[columns] if columns else df.select_dtypes(include=["number"])
+    x = num_df.to_numpy(dtype=np.float32, na_value=np.nan)
+    if method == "pearson" and weights is None and not np.isnan(x).any():
+        # sem nulos: guarda os co-momentos, que se atualizam quando o dataset cresce
+        state = CoMoments.of(x)
+        cache[("comoments", tuple(num_df.columns))] = state
+        corr = state.corr()
+    else:
+        if method == "spearman":
+            x = _rank_columns(x)
+        corr = _masked_corr(x, weights)
+    np.fill_diagonal(corr, 1.0)
+    out = pd.DataFrame(np.clip(corr, -1, 1).astype(np.float64), index=num_df.columns, columns=num_df.columns)
+    cache[key] = out
+    return out
+
+
+def top_pairs(corr: pd.DataFrame, k: int = 20, min_abs: float = 0.0) -> pd.DataFrame:
+    """Os k pares (i < j) com maior |r|, via seleção parcial (argpartition)."""
+    values = corr.to_numpy()
+    iu, ju = np.triu_indices(len(values), k=1)
+    r = values[iu, ju]
+    ok = ~np.isnan(r) & (np.abs(r) >= min_abs)
+    iu, ju, r = iu[ok], ju[ok], r[ok]
+    if len(r) > k:
+        sel = np.argpartition(-np.abs(r), k)[:k]
+        iu, ju, r = iu[sel], ju[sel], r[sel]
+    order = np.argsort(-np.abs(r), kind="stable")
+    cols = corr.columns
+    return pd.DataFrame({
+        "col_a": cols[iu[order]],
+        "col_b": cols[ju[order]],
+        "r": r[order],
+    })
+
+
+def cluster_order(corr: pd.DataFrame) -> pd.DataFrame:
+    """Reordena linhas/colunas agrupando variáveis correlacionadas (ligação média em 1-|r|).
+    Sem scipy, ordena pelo autovetor principal de |r|."""
+    if len(corr) < 3:
+        return corr
+    a = np.nan_to_num(np.abs(corr.to_numpy()))
+    try:
+        from scipy.cluster.hierarchy import leaves_list, linkage
+        from scipy.spatial.distance import squareform
+        dist = np.clip(1.0 - a, 0.0, None)
+        np.fill_diagonal(dist, 0.0)
+        order = leaves_list(linkage(squareform(dist, checks=False), method="average"))
+    except ImportError:
+        _, vecs = np.linalg.eigh(a)
+        order = np.argsort(vecs[:, -1])
+    cols = corr.columns[order]
+    return corr.loc[cols, cols]
+
+
+def select_for_render(corr: pd.DataFrame, max_columns: int = MAX_HEATMAP_COLUMNS) -> pd.DataFrame:
+    """Limita o heatmap às colunas com as correlações mais fortes (maior |r| fora da diagonal)."""
+    if len(corr) <= max_columns:
+        return corr
+    a = np.abs(corr.to_numpy())
+    np.fill_diagonal(a, 0.0)
+    strength = np.nan_to_num(a).max(axis=0)
+    keep = np.sort(np.argpartition(-strength, max_columns)[:max_columns])
+    cols = corr.columns[keep]
+    return corr.loc[cols, cols]
@@ -0,0 +1,445 @@
+# filtros de linhas ("where") para as ferramentas de EDA
+# O filtro é uma expressão no estilo Python/pandas ("Class == 1 and Amount > 100"),
+# validada pela ast: só colunas, literais, comparações, in/not in, and/or/not e poucas
+# funções (isna, notna, contains, between). Os nomes passam pelo índice de colunas (caixa,
+# acentos, erros de digitação) e cada comparação vira uma máscara vetorizada. Máscaras e o
+# subconjunto filtrado ficam em cache por dataset (LRU limitado por FILTER_CACHE_MB): o
+# filtro é aplicado uma vez e perguntas seguintes sobre o mesmo recorte reaproveitam o
+# subconjunto (e os caches dele: amostra, índices de grupo). Out-of-core, o filtro é
+# aplicado a cada chunk lido; numa fonte SQL, vira a cláusula WHERE das consultas.
+import ast
+import keyword
+import operator
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+from .chunked import ChunkedCSV, is_out_of_core
+from .columns import column_index
+from .sqlsource import is_sql_source
+
+# memória máxima (por dataset) para máscaras e subconjuntos filtrados em cache
+FILTER_CACHE_MB = float(os.getenv("FILTER_CACHE_MB", "256"))
+FILTER_MAX_LENGTH = 2000
+FILTER_MAX_NODES = 200
+
+_OPS = {ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+        ast.In: "in", ast.NotIn: "not in", ast.Is: "==", ast.IsNot: "!="}
+_COMPARE = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+            ">": operator.gt, ">=": operator.ge}
+# literal à esquerda: "100 < Amount" vira "Amount > 100"
+_FLIP = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+_FUNCS = {"isna": "isna", "isnull": "isna", "notna": "notna", "notnull": "notna",
+          "contains": "contains", "between": "between", "isin": "isin"}
+_STRING = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+_KEYWORDS = {"and": "and", "or": "or", "not": "not", "in": "in", "is": "is",
+             "true": "True", "false": "False", "none": "None", "null": "None"}
+_RESERVED = sorted(set(keyword.kwlist) - set(_KEYWORDS.values()))
+
+
+class FilterError(ValueError):
+    """Filtro inválido: sintaxe não suportada, coluna inexistente ou valor incompatível."""
+
+
+# -----------------------------------------------------------------------------
+# Árvore validada
+# -----------------------------------------------------------------------------
+
+class _Node:
+    """Nó do filtro: folha (comparação, isna, contains...) ou and/or/not.
+    key é a forma canônica (colunas resolvidas, operandos de and/or ordenados): filtros
+    equivalentes escritos de formas diferentes compartilham as máscaras em cache."""
+    __slots__ = ("kind", "col", "op", "value", "children", "key")
+
+    def __init__(self, kind: str, key: str, col: Any = None, op: Optional[str] = None,
+                 value: Any = None, children: Sequence["_Node"] = ()):
+        self.kind, self.key, self.col, self.op, self.value = kind, key, col, op, value
+        self.children = list(children)
+
+
+def _fmt(value: Any) -> str:
+    if isinstance(value, pd.Timestamp):
+        return repr(value.isoformat())
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_fmt(v) for v in value) + "]"
+    return repr(value)
+
+
+def _negate(node: _Node) -> _Node:
+    if node.kind == "not":
+        return node.children[0]
+    inner = node.key if node.kind in ("and", "or") else f"({node.key})"
+    return _Node("not", f"not {inner}", children=[node])
+
+
+def _combine(kind: str, children: List[_Node]) -> _Node:
+    flat: Dict[str, _Node] = {}
+    for child in children:
+        for c in (child.children if child.kind == kind else [child]):
+            flat.setdefault(c.key, c)
+    if len(flat) == 1:
+        return next(iter(flat.values()))
+    keys = sorted(flat)
+    return _Node(kind, "(" + f" {kind} ".join(keys) + ")", children=[flat[k] for k in keys])
+
+
+def _normalize(text: str) -> Tuple[str, Dict[str, str]]:
+    """Colunas entre crases viram identificadores; fora de strings, AND/OR/NOT/TRUE/NULL
+    em qualquer caixa, &&, ||, <> e "=" isolado são aceitos."""
+    names: Dict[str, str] = {}
+
+    def quote(m):
+        ident = f"__col{len(names)}__"
+        names[ident] = m.group(m.lastindex or 0)
+        return ident
+
+    parts = _STRING.split(text)
+    for i in range(0, len(parts), 2):  # índices pares: fora de literais de string
+        p = re.sub(r"`([^`]+)`", quote, parts[i])
+        p = p.replace("&&", " and ").replace("||", " or ").replace("<>", "!=")
+        p = re.sub(r"(?<![=!<>])=(?!=)", "==", p)
+        p = re.sub(r"\b(" + "|".join(_KEYWORDS) + r")\b", lambda m: _KEYWORDS[m.group().lower()], p,
+                   flags=re.IGNORECASE)
+        # palavras reservadas do Python como nome de coluna ("class", "from", "if")
+        p = re.sub(r"\b(" + "|".join(_RESERVED) + r")\b", lambda m: quote(m), p)
+        parts[i] = p
+    return "".join(parts), names
+
+
+class _Parser:
+    def __init__(self, df):
+        self.index = column_index(df)
+        self.dtypes = df.dtypes
+        self.columns: List[Any] = []
+        self.names: Dict[str, str] = {}
+
+    # ------------------------------------------------------------------
+    # operandos
+    # ------------------------------------------------------------------
+    def column(self, node: ast.AST) -> Optional[Any]:
+        """Coluna referida por um operando (nome, `nome`, df['nome'], df.nome) ou None."""
+        if isinstance(node, ast.Name):
+            name = self.names.get(node.id, node.id)
+        elif (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name)
+              and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+            name = node.slice.value
+        elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "df":
+            name = node.attr
+        else:
+            return None
+        col = self.index.resolve(name)
+        if col is None:
+            raise FilterError(self.index.not_found(name))
+        if col not in self.columns:
+            self.columns.append(col)
+        return col
+
+    def literal(self, node: ast.AST) -> Any:
+        if isinstance(node, ast.Constant) and (node.value is None or isinstance(node.value, (str, int, float))):
+            return node.value
+        if (isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd))
+                and isinstance(node.operand, ast.Constant) and isinstance(node.operand.value, (int, float))):
+            return -node.operand.value if isinstance(node.op, ast.USub) else node.operand.value
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [self.literal(e) for e in node.elts]
+        raise FilterError(f"valor não suportado: {ast.unparse(node)}")
+
+    def coerce(self, col: Any, value: Any) -> Any:
+        """Converte o literal para o tipo da coluna (ex.: '1' numa coluna numérica)."""
+        if value is None:
+            return None
+        dtype = self.dtypes[col]
+        kind = dtype.kind
+        if kind == "b":
+            folded = str(value).strip().lower()
+            if folded in ("true", "1", "1.0", "sim"):
+                return True
+            if folded in ("false", "0", "0.0", "nao", "não"):
+                return False
+            raise FilterError(f"'{col}' é booleana; {value!r} não é verdadeiro/falso.")
+        if kind in "iuf":
+            try:
+                number = float(str(value).replace(",", ".")) if isinstance(value, str) else float(value)
+            except ValueError:
+                raise FilterError(f"'{col}' é numérica; {value!r} não é um número.") from None
+            return int(number) if number.is_integer() and abs(number) < 2 ** 53 else number
+        if kind == "M":
+            try:
+                ts = pd.Timestamp(value)
+            except (ValueError, TypeError):
+                raise FilterError(f"'{col}' é data; {value!r} não é uma data.") from None
+            tz = getattr(dtype, "tz", None)
+            if tz is not None and ts.tzinfo is None:
+                ts = ts.tz_localize(tz)
+            return ts
+        return value
+
+    # ------------------------------------------------------------------
+    # expressões
+    # ------------------------------------------------------------------
+    def build(self, node: ast.AST) -> _Node:
+        if isinstance(node, ast.BoolOp):
+            kind = "and" if isinstance(node.op, ast.And) else "or"
+            return _combine(kind, [self.build(v) for v in node.values])
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            kind = "and" if isinstance(node.op, ast.BitAnd) else "or"  # estilo pandas: (a) & (b)
+            return _combine(kind, [self.build(node.left), self.build(node.right)])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.Invert)):
+            return _negate(self.build(node.operand))
+        if isinstance(node, ast.Compare):
+            atoms, left = [], node.left
+            for op, right in zip(node.ops, node.comparators):  # 10 <= Amount < 50 -> dois termos
+                atoms.append(self.compare(left, _OPS[type(op)], right))
+                left = right
+            return _combine("and", atoms)
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        col = self.column(node)
+        if col is not None:
+            if self.dtypes[col].kind not in "biuf":
+                raise FilterError(f"'{col}' sozinha não é condição; compare com um valor (ex.: {col} == ...).")
+            return _Node("truthy", f"`{col}`", col=col)
+        raise FilterError(f"expressão não suportada: {ast.unparse(node)}")
+
+    def compare(self, left: ast.AST, op: str, right: ast.AST) -> _Node:
+        lcol, rcol = self.column(left), self.column(right)
+        if lcol is not None and rcol is not None:
+            if op in ("in", "not in"):
+                raise FilterError("'in' espera uma lista de valores.")
+            return _Node("colcmp", f"`{lcol}` {op} `{rcol}`", col=lcol, op=op, value=rcol)
+        if lcol is None and rcol is None:
+            raise FilterError(f"comparação sem coluna: {ast.unparse(left)} {op} {ast.unparse(right)}")
+        if lcol is None:
+            if op in ("in", "not in"):
+                raise FilterError(f"use '{rcol} in [...]' para comparar com uma lista.")
+            lcol, op, right = rcol, _FLIP[op], left
+        value = self.literal(right)
+        if op in ("in", "not in"):
+            if not isinstance(value, list):
+                raise FilterError(f"'{op}' espera uma lista de valores.")
+            values = sorted({self.coerce(lcol, v) for v in value if v is not None}, key=_fmt)
+            node = _Node("isin", f"`{lcol}` in {_fmt(values)}", col=lcol, value=values)
+            if any(v is None for v in value):
+                node = _combine("or", [node, _Node("isna", f"isna(`{lcol}`)", col=lcol)])
+            return _negate(node) if op == "not in" else node
+        if isinstance(value, list):
+            raise FilterError(f"lista só é aceita com 'in'/'not in' ({lcol}).")
+        if value is None:
+            if op not in ("==", "!="):
+                raise FilterError(f"nulo só pode ser comparado com == ou != ({lcol}).")
+            return _Node("isna" if op == "==" else "notna",
+                         f"{'isna' if op == '==' else 'notna'}(`{lcol}`)", col=lcol)
+        value = self.coerce(lcol, value)
+        return _Node("cmp", f"`{lcol}` {op} {_fmt(value)}", col=lcol, op=op, value=value)
+
+    def call(self, node: ast.Call) -> _Node:
+        """isna(col), notna(col), contains(col, 'txt'), between(col, a, b) e as formas de
+        método do pandas: col.isna(), col.isin([...]), col.str.contains('txt'), col.between(a, b)."""
+        func, args = node.func, list(node.args)
+        if node.keywords:
+            raise FilterError(f"argumentos nomeados não suportados: {ast.unparse(node)}")
+        if isinstance(func, ast.Name) and func.id in _FUNCS:
+            name = _FUNCS[func.id]
+        elif isinstance(func, ast.Attribute) and func.attr in _FUNCS:
+            name = _FUNCS[func.attr]
+            target = func.value
+            if isinstance(target, ast.Attribute) and target.attr == "str":
+                target = target.value
+            args = [target] + args
+        else:
+            raise FilterError(f"função não suportada: {ast.unparse(func)}")
+        arity = {"isna": 1, "notna": 1, "contains": 2, "isin": 2, "between": 3}[name]
+        if len(args) != arity:
+            raise FilterError(f"{name} espera {arity} argumento(s).")
+        col = self.column(args[0])
+        if col is None:
+            raise FilterError(f"{name}: o primeiro argumento deve ser uma coluna.")
+        if name in ("isna", "notna"):
+            return _Node(name, f"{name}(`{col}`)", col=col)
+        if name == "isin":
+            return self.compare(args[0], "in", args[1])
+        if name == "between":
+            return _combine("and", [self.compare(args[0], ">=", args[1]), self.compare(args[0], "<=", args[2])])
+        text = self.literal(args[1])
+        if not isinstance(text, str):
+            raise FilterError("contains espera um texto.")
+        return _Node("contains", f"contains(`{col}`, {_fmt(text.casefold())})", col=col, value=text.casefold())
+
+
+class Predicate:
+    """Filtro validado. text: forma canônica (chave de cache e texto exibido ao usuário);
+    columns: colunas lidas pelo filtro."""
+
+    def __init__(self, root: _Node, columns: List[Any]):
+        self.root = root
+        self.text = root.key[1:-1] if root.kind in ("and", "or") else root.key
+        self.columns = columns
+
+    def __repr__(self) -> str:
+        return f"Predicate({self.text!r})"
+
+    def mask(self, frame: pd.DataFrame, cache: Optional["_MaskCache"] = None) -> np.ndarray:
+        """Máscara booleana (np.ndarray) das linhas de `frame` que satisfazem o filtro;
+        com `cache`, cada comparação é calculada uma vez por dataset."""
+        return _eval(self.root, frame, cache)
+
+
+def parse_where(df, where: str) -> Predicate:
+    """Valida `where` contra as colunas do dataset (DataFrame ou ChunkedCSV)."""
+    if not isinstance(where, str) or not where.strip():
+        raise FilterError("filtro vazio.")
+    if len(where) > FILTER_MAX_LENGTH:
+        raise FilterError(f"filtro longo demais (máx. {FILTER_MAX_LENGTH} caracteres).")
+    source, names = _normalize(where.strip())
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError:
+        raise FilterError(f"sintaxe inválida: {where!r}. Ex.: Class == 1 and Amount > 100") from None
+    if sum(1 for _ in ast.walk(tree)) > FILTER_MAX_NODES:
+        raise FilterError("filtro complexo demais.")
+    parser = _Parser(df)
+    parser.names = names
+    root = parser.build(tree.body)
+    return Predicate(root, parser.columns)
+
+
+# -----------------------------------------------------------------------------
+# Máscaras
+# -----------------------------------------------------------------------------
+
+class _MaskCache:
+    """LRU de máscaras e subconjuntos filtrados de um dataset, limitado em bytes."""
+
+    def __init__(self, max_bytes: float):
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self._items: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: Any) -> Any:
+        with self.lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: Any, value: Any, size: int) -> Any:
+        with self.lock:
+            if size > self.max_bytes:
+                return value
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, freed) = self._items.popitem(last=False)
+                self._bytes -= freed
+        return value
+
+
+def _mask_cache(df) -> _MaskCache:
+    return dataset_cache(df).setdefault("filters", _MaskCache(FILTER_CACHE_MB * 1024 * 1024))
+
+
+def _leaf_mask(node: _Node, frame: pd.DataFrame) -> np.ndarray:
+    s = frame[node.col]
+    try:
+        if node.kind == "cmp":
+            m = _COMPARE[node.op](s, node.value)
+        elif node.kind == "colcmp":
+            m = _COMPARE[node.op](s, frame[node.value])
+        elif node.kind == "isin":
+            m = s.isin(node.value)
+        elif node.kind == "isna":
+            m = s.isna()
+        elif node.kind == "notna":
+            m = s.notna()
+        elif node.kind == "contains":
+            m = s.astype("string").str.casefold().str.contains(node.value, regex=False, na=False)
+        else:  # truthy
+            m = s.notna() & (s != 0)
+    except TypeError as e:
+        raise FilterError(f"comparação inválida em '{node.col}': {e}") from None
+    return m.to_numpy(dtype=bool, na_value=False)
+
+
+def _eval(node: _Node, frame: pd.DataFrame, cache: Optional[_MaskCache]) -> np.ndarray:
+    if cache is not None:
+        hit = cache.get(("mask", node.key))
+        if hit is not None:
+            return hit
+    if node.kind == "not":
+        m = ~_eval(node.children[0], frame, cache)
+    elif node.kind in ("and", "or"):
+        reduce = np.logical_and.reduce if node.kind == "and" else np.logical_or.reduce
+        m = reduce([_eval(c, frame, cache) for c in node.children])
+    else:
+        m = _leaf_mask(node, frame)
+    if cache is not None:
+        cache.put(("mask", node.key), m, m.nbytes)
+    return m
+
+
+# -----------------------------------------------------------------------------
+# Aplicação
+# -----------------------------------------------------------------------------
+
+class FilteredCSV(ChunkedCSV):
+    """ChunkedCSV restrito às linhas que satisfazem o filtro: cada chunk é filtrado ao ser
+    lido, então as agregações out-of-core funcionam sem mudança."""
+
+    def __init__(self, src: ChunkedCSV, predicate: Predicate):
+        # não guarda `src`: o objeto fica no cache de `src` e não deve mantê-lo vivo
+        self.path, self.chunksize, self.read_kwargs = src.path, src.chunksize, src.read_kwargs
+        self._head = src._head
+        self._n_rows = None
+        self.predicate = predicate
+
+    def iter_chunks(self, usecols: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        extra = [] if usecols is None else [c for c in self.predicate.columns if c not in usecols]
+        cols = None if usecols is None else list(usecols) + extra
+        rows = 0
+        for chunk in super().iter_chunks(usecols=cols):
+            chunk = chunk[self.predicate.mask(chunk)]
+            if extra:
+                chunk = chunk.drop(columns=extra)
+            rows += len(chunk)
+            yield chunk
+        self._n_rows = rows
+
+
+def row_mask(df: pd.DataFrame, where) -> np.ndarray:
+    """Máscara das linhas de `df` que satisfazem `where` (texto ou Predicate), em cache."""
+    predicate = where if isinstance(where, Predicate) else parse_where(df, where)
+    return predicate.mask(df, _mask_cache(df))
+
+
+def apply_filter(df, where) -> Tuple[Any, Predicate]:
+    """(dataset filtrado, Predicate). DataFrame: subconjunto em cache pelo filtro canônico
+    (o mesmo objeto para todas as ferramentas e perguntas seguintes); o próprio `df` quando
+    nenhuma linha é excluída. ChunkedCSV: FilteredCSV (filtra chunk a chunk). SQLSource: a
+    mesma fonte com o filtro traduzido para WHERE."""
+    predicate = where if isinstance(where, Predicate) else parse_where(df, where)
+    cache = _mask_cache(df)
+    key = ("subset", predicate.text)
+    with cache.lock:  # ferramentas em paralelo com o mesmo filtro: filtra uma vez só
+        subset = cache.get(key)
+        if subset is not None:
+            return subset, predicate
+        if is_out_of_core(df):
+            return cache.put(key, FilteredCSV(df, predicate), 0), predicate
+        if is_sql_source(df):  # vira WHERE: nada é lido até a agregação
+            return cache.put(key, df.filtered(predicate), 0), predicate
+        mask = predicate.mask(df, cache)
+        if mask.all():
+            return df, predicate
+        subset = df[mask]
+        return cache.put(key, subset, int(subset.memory_usage(index=True, deep=False).sum())), predicate
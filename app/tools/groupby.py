@@ -0,0 +1,262 @@
+# motor de groupby para chaves de alta cardinalidade
+# Os códigos de grupo (factorize das chaves) ficam em cache por dataset e conjunto de
+# chaves; as agregações saem de bincount/ufunc.at sobre esses códigos, várias estatísticas
+# por coluna reaproveitando as mesmas somas (também em cache para perguntas seguintes), e
+# sort+limit usa seleção parcial (argpartition): só as linhas exibidas viram DataFrame.
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+# estatísticas calculadas sobre os códigos; as demais caem no groupby do pandas
+FAST_STATS = {"count", "sum", "mean", "std", "var", "min", "max", "median"}
+
+
+class GroupIndex:
+    """Códigos de grupo de um conjunto de chaves (grupos em ordem crescente das chaves,
+    como no groupby do pandas; linhas com chave nula ficam de fora: código -1)."""
+
+    def __init__(self, df: pd.DataFrame, by: List[str]):
+        self.by = list(by)
+        codes, uniques, sizes = [], [], []
+        for b in self.by:
+            c, u = pd.factorize(df[b], sort=True, use_na_sentinel=True)
+            codes.append(c.astype(np.int64))
+            uniques.append(u)
+            sizes.append(max(len(u), 1))
+        if len(codes) == 1:
+            self.codes = codes[0]  # factorize ordenado já dá os códigos de grupo
+            self.n_groups = len(uniques[0])
+            self._key_codes = [np.arange(self.n_groups)]
+        else:
+            valid = np.logical_and.reduce([c >= 0 for c in codes])
+            sub = [c[valid] for c in codes]
+            # código misto (ordem lexicográfica das chaves preservada); refatoriza no meio
+            # do caminho se o produto das cardinalidades não couber em int64
+            combined = sub[0]
+            for c, size in zip(sub[1:], sizes[1:]):
+                if (int(combined.max(initial=0)) + 1) * size >= 2 ** 62:
+                    combined = pd.factorize(combined, sort=True)[0].astype(np.int64)
+                combined = combined * size + c
+            group_codes = pd.factorize(combined, sort=True)[0].astype(np.int64)
+            self.codes = np.full(len(df), -1, dtype=np.int64)
+            self.codes[valid] = group_codes
+            self.n_groups = int(group_codes.max(initial=-1)) + 1
+            # código de cada chave por grupo (para montar o índice só das linhas exibidas)
+            first = np.zeros(self.n_groups, dtype=np.int64)
+            first[group_codes[::-1]] = np.arange(len(group_codes))[::-1]  # 1ª linha de cada grupo
+            self._key_codes = [c[first] for c in sub]
+        self._uniques = uniques
+        self.valid = self.codes >= 0
+        self.sizes = np.bincount(self.codes[self.valid], minlength=self.n_groups)
+        self._stats: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def keys(self, groups: Optional[np.ndarray] = None) -> pd.Index:
+        """Índice (ou MultiIndex) com as chaves dos grupos pedidos (todos, por padrão)."""
+        sel = slice(None) if groups is None else groups
+        levels = [u.take(kc[sel]) for u, kc in zip(self._uniques, self._key_codes)]
+        if len(levels) == 1:
+            return pd.Index(levels[0], name=self.by[0])
+        return pd.MultiIndex.from_arrays(levels, names=self.by)
+
+
+# estatísticas que se combinam grupo a grupo quando o dataset ganha linhas (na ordem de cálculo)
+MERGEABLE_STATS = ("count", "sum", "mean", "var", "std", "min", "max")
+
+
+def extend_group_index(gi: GroupIndex, tail: pd.DataFrame) -> GroupIndex:
+    """GroupIndex de df + tail a partir do de df: só as linhas novas são fatoradas, os códigos
+    antigos são remapeados para a nova ordem dos grupos e as estatísticas em cache são
+    combinadas por grupo (somas, contagens, min/max e variâncias pela fórmula de Chan).
+    median e as que caem no pandas são descartadas e recalculadas sob demanda."""
+    part = GroupIndex(tail, gi.by)
+    old_keys, tail_keys = gi.keys(), part.keys()
+    keys = old_keys.append(tail_keys).unique().sort_values()
+    old_pos = keys.get_indexer(old_keys)
+    tail_pos = keys.get_indexer(tail_keys)
+    n = len(keys)
+
+    out = GroupIndex.__new__(GroupIndex)
+    out.by = list(gi.by)
+    out.codes = np.concatenate([
+        np.where(gi.valid, old_pos[np.maximum(gi.codes, 0)], -1),
+        np.where(part.valid, tail_pos[np.maximum(part.codes, 0)], -1),
+    ]).astype(np.int64)
+    out.n_groups = n
+    if isinstance(keys, pd.MultiIndex):
+        out._uniques = list(keys.levels)
+        out._key_codes = [np.asarray(c, dtype=np.int64) for c in keys.codes]
+    else:
+        out._uniques = [keys]
+        out._key_codes = [np.arange(n)]
+    out.valid = out.codes >= 0
+    out.sizes = np.zeros(n, dtype=np.int64)
+    out.sizes[old_pos] += gi.sizes
+    out.sizes[tail_pos] += part.sizes
+    out._stats = {}
+
+    def spread(values: np.ndarray, pos: np.ndarray, fill) -> np.ndarray:
+        full = np.full(n, fill, dtype=values.dtype if fill == 0 else np.float64)
+        full[pos] = values
+        return full
+
+    for col in dict.fromkeys(c for c, _ in gi._stats):
+        if col not in tail.columns or _numeric(tail[col]) is None:
+            continue
+        cached = {st: v for (c, st), v in gi._stats.items() if c == col}
+        for st in MERGEABLE_STATS:
+            if st not in cached:
+                continue
+            new = _column_stat(part, tail, col, st)
+            if st in ("count", "sum"):
+                merged = spread(cached[st], old_pos, 0) + spread(new, tail_pos, 0)
+            elif st == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    merged = out._stats[(col, "sum")] / out._stats[(col, "count")]
+            elif st == "var":
+                na = spread(cached["count"], old_pos, 0).astype(np.float64)
+                nb = spread(_column_stat(part, tail, col, "count"), tail_pos, 0).astype(np.float64)
+                ma, mb = spread(cached["mean"], old_pos, np.nan), spread(_column_stat(part, tail, col, "mean"), tail_pos, np.nan)
+                m2a = np.nan_to_num(spread(cached["var"], old_pos, np.nan) * (na - 1))
+                m2b = np.nan_to_num(spread(new, tail_pos, np.nan) * (nb - 1))
+                total = na + nb
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    m2 = m2a + m2b + np.where((na > 0) & (nb > 0), (mb - ma) ** 2 * na * nb / total, 0.0)
+                    merged = np.where(total > 1, m2 / (total - 1), np.nan)
+            elif st == "std":
+                merged = np.sqrt(out._stats[(col, "var")])
+            else:
+                fn = np.fmin if st == "min" else np.fmax
+                merged = fn(spread(cached[st], old_pos, np.nan), spread(new, tail_pos, np.nan))
+            out._stats[(col, st)] = merged
+    return out
+
+
+def group_index(df: pd.DataFrame, by: List[str]) -> GroupIndex:
+    """GroupIndex em cache por dataset e conjunto de chaves (ordem importa)."""
+    key = ("group_index", tuple(by))
+    cache = dataset_cache(df)
+    if key not in cache:
+        cache[key] = GroupIndex(df, by)
+    return cache[key]
+
+
+def _numeric(values: pd.Series) -> Optional[np.ndarray]:
+    if values.dtype.kind not in "biuf":
+        return None
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _column_stat(gi: GroupIndex, df: pd.DataFrame, col: str, stat: str) -> np.ndarray:
+    """Uma estatística por grupo; somas e contagens são compartilhadas entre estatísticas."""
+    key = (col, stat)
+    if key in gi._stats:
+        return gi._stats[key]
+    x = _numeric(df[col])
+    if x is None or stat not in FAST_STATS:
+        values = df[col].groupby(gi.codes).agg(stat)
+        values = values[values.index >= 0].reindex(range(gi.n_groups)).to_numpy()
+    else:
+        ok = gi.valid & ~np.isnan(x)
+        codes, xv = gi.codes[ok], x[ok]
+        n = gi.n_groups
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if stat == "count":
+                values = np.bincount(codes, minlength=n).astype(np.int64)
+            elif stat == "sum":
+                values = np.bincount(codes, weights=xv, minlength=n)
+                if df[col].dtype.kind in "biu":
+                    values = values.astype(np.int64)
+            elif stat == "mean":
+                values = _column_stat(gi, df, col, "sum") / _column_stat(gi, df, col, "count")
+            elif stat in ("var", "std"):
+                # duas passadas (média, depois desvios) para não perder precisão
+                mean = _column_stat(gi, df, col, "mean")
+                m2 = np.bincount(codes, weights=(xv - mean[codes]) ** 2, minlength=n)
+                cnt = _column_stat(gi, df, col, "count")
+                var = np.where(cnt > 1, m2 / (cnt - 1), np.nan)
+                gi._stats[(col, "var")] = var
+                values = var if stat == "var" else np.sqrt(var)
+            elif stat in ("min", "max"):
+                ufunc = np.minimum if stat == "min" else np.maximum
+                values = np.full(n, np.inf if stat == "min" else -np.inf)
+                ufunc.at(values, codes, xv)
+                values = np.where(_column_stat(gi, df, col, "count") > 0, values, np.nan)
+            else:  # median: ordena por (grupo, posto do valor) e pega o(s) elemento(s) do meio
+                rank = np.empty(len(xv), dtype=np.int64)
+                rank[np.argsort(xv)] = np.arange(len(xv))
+                sorted_x = xv[np.argsort(codes * max(len(xv), 1) + rank)]
+                cnt = _column_stat(gi, df, col, "count")
+                starts = np.concatenate(([0], np.cumsum(cnt)[:-1]))
+                lo = starts + np.maximum(cnt - 1, 0) // 2
+                hi = starts + cnt // 2
+                values = np.full(n, np.nan)
+                has = cnt > 0
+                values[has] = (sorted_x[lo[has]] + sorted_x[hi[has]]) / 2
+    gi._stats[key] = values
+    return values
+
+
+def _resolve_sort(columns: List[Tuple[str, str]], sort_by: Any) -> Optional[int]:
+    """Posição da coluna de ordenação: aceita 'Amount', ('Amount', 'mean'), 'Amount_mean' ou 'mean'."""
+    if sort_by is None:
+        return None
+    if isinstance(sort_by, (list, tuple)) and len(sort_by) == 2:
+        sort_by = tuple(sort_by)
+        return columns.index(sort_by) if sort_by in columns else None
+    target = str(sort_by).lower()
+    for matches in (
+        lambda c, s: c.lower() == target,
+        lambda c, s: f"{c}_{s}".lower() == target,
+        lambda c, s: s.lower() == target,
+    ):
+        for i, (c, s) in enumerate(columns):
+            if matches(str(c), s):
+                return i
+    return None
+
+
+def _top_k(values: np.ndarray, k: int, ascending: bool) -> np.ndarray:
+    """Índices dos k primeiros na ordem pedida (nulos por último, empates pela posição),
+    com seleção parcial: O(n) + O(k log k) em vez de ordenar tudo."""
+    v = values.astype(np.float64)
+    key = v if ascending else -v
+    key = np.where(np.isnan(key), np.inf, key)
+    n = len(key)
+    if k < n:
+        cand = np.argpartition(key, k - 1)[:k]
+        # empates na fronteira: inclui todos com o valor do k-ésimo e desempata pela posição
+        kth = key[cand].max()
+        cand = np.union1d(cand, np.flatnonzero(key == kth))
+    else:
+        cand = np.arange(n)
+    return cand[np.lexsort((cand, key[cand]))][:k]
+
+
+def groupby_aggregate(df: pd.DataFrame, by: List[str], aggregations: Dict[str, Any],
+                      sort_by: Any = None, ascending: bool = True,
+                      limit: Optional[int] = None) -> Tuple[pd.DataFrame, int]:
+    """Equivalente a df.groupby(by).agg(aggregations).sort_values(sort_by).head(limit),
+    devolvendo (tabela, número total de grupos). Colunas como no pandas: nome da coluna
+    quando a estatística é uma string; (coluna, estatística) quando alguma é lista."""
+    gi = group_index(df, by)
+    columns: List[Tuple[str, str]] = []
+    flat = all(isinstance(s, str) for s in aggregations.values())
+    for col, stats in aggregations.items():
+        if col not in df.columns:
+            raise KeyError(f"Coluna '{col}' não encontrada.")
+        for st in ([stats] if isinstance(stats, str) else list(stats)):
+            columns.append((col, st))
+    data = [_column_stat(gi, df, col, st) for col, st in columns]
+
+    pos = _resolve_sort(columns, sort_by)
+    k = int(limit) if isinstance(limit, int) and limit > 0 else gi.n_groups
+    if pos is not None:
+        groups = _top_k(data[pos], k, ascending)
+    else:
+        groups = np.arange(min(k, gi.n_groups))
+    out = pd.DataFrame({i: d[groups] for i, d in enumerate(data)}, index=gi.keys(groups))
+    out.columns = [c for c, _ in columns] if flat else pd.MultiIndex.from_tuples(columns)
+    return out, gi.n_groups
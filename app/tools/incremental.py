@@ -0,0 +1,218 @@
+# datasets que crescem por linhas acrescentadas (o extrato diário do mesmo CSV)
+# Reenviar o arquivo com linhas novas no fim não deve custar uma leitura completa:
+#   - o CSV anterior é identificado por tamanho + hash SHA-1 do arquivo inteiro; o novo arquivo
+#     só é tratado como extensão se os seus primeiros bytes tiverem exatamente esse hash (uma
+#     leitura sequencial, sem parsing); aí só o trecho acrescentado é lido e o estado do hash
+#     continua a partir do anterior, sem reler o prefixo;
+#   - os agregados em cache do dataset antigo são estados mergeáveis (momentos, contagens,
+#     histogramas, co-momentos da correlação, estatísticas por grupo) e são combinados com os
+#     do trecho novo, em vez de recalculados sobre o arquivo inteiro.
+# O que não é mergeável (amostras do modo aproximado, máscaras de filtro, medianas, scores de
+# anomalia) simplesmente não é copiado e volta a ser calculado sob demanda.
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+from .chunked import Moments
+from .correlation import CoMoments
+from .groupby import extend_group_index
+
+# tamanho das leituras sequenciais ao calcular o hash do arquivo
+HASH_READ_KB = int(os.getenv("HASH_READ_KB", "1024"))
+# value counts completos só ficam em cache (e são atualizados) até este número de valores distintos
+INCREMENTAL_MAX_DISTINCT = int(os.getenv("INCREMENTAL_MAX_DISTINCT", "100000"))
+
+
+# -----------------------------------------------------------------------------
+# Agregados mergeáveis em cache (usados pelas ferramentas no modo em memória)
+# -----------------------------------------------------------------------------
+
+def _values(s: pd.Series) -> np.ndarray:
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def column_moments(df: pd.DataFrame, column: str) -> Moments:
+    """n, média, M2, min e max da coluna (mean/std/min/max/count exatos), em cache."""
+    key = ("moments", column)
+    cache = dataset_cache(df)
+    mom = cache.get(key)
+    if mom is None:
+        mom = Moments()
+        mom.update(_values(df[column]))
+        cache[key] = mom
+    return mom
+
+
+def value_counts(df: pd.DataFrame, column: str) -> pd.Series:
+    """value_counts(dropna=False) completo da coluna; em cache se a cardinalidade permitir.
+    O cache guarda as contagens na ordem da primeira ocorrência (a que o value_counts usa para
+    desempatar), para que continuem mergeáveis; a ordenação é feita na leitura."""
+    key = ("value_counts", column)
+    cache = dataset_cache(df)
+    counts = cache.get(key)
+    if counts is None:
+        counts = df[column].value_counts(dropna=False, sort=False)
+        if len(counts) <= INCREMENTAL_MAX_DISTINCT:
+            cache[key] = counts
+    return counts.sort_values(ascending=False, kind="stable")
+
+
+def histogram(df: pd.DataFrame, column: str, bins: int = 30) -> Tuple[np.ndarray, np.ndarray]:
+    """Contagens e bordas (bins uniformes entre min e max), em cache por coluna e bins."""
+    key = ("histogram", column, int(bins))
+    cache = dataset_cache(df)
+    hist = cache.get(key)
+    if hist is None:
+        x = _values(df[column])
+        hist = cache[key] = np.histogram(x[~np.isnan(x)], bins=int(bins))
+    return hist
+
+
+# -----------------------------------------------------------------------------
+# Atualização dos artefatos em cache com as linhas novas
+# -----------------------------------------------------------------------------
+
+def _merge_counts(old: pd.Series, new: pd.Series) -> pd.Series:
+    # ordem da primeira ocorrência: os valores já vistos mantêm a posição, os novos vão ao fim
+    index = old.index.append(new.index.difference(old.index, sort=False))
+    merged = old.reindex(index, fill_value=0) + new.reindex(index, fill_value=0)
+    return merged.astype("int64")
+
+
+def _extend_entry(key: Any, value: Any, tail: pd.DataFrame) -> Optional[Any]:
+    """Versão atualizada de uma entrada do cache (None = descartar e recalcular sob demanda)."""
+    kind = key[0] if isinstance(key, tuple) else key
+    if kind == "column_index":  # mesmas colunas
+        return value
+    if kind == "moments":
+        mom = Moments()
+        mom.merge(value)
+        mom.update(_values(tail[key[1]]))
+        return mom
+    if kind == "value_counts":
+        merged = _merge_counts(value, tail[key[1]].value_counts(dropna=False, sort=False))
+        return merged if len(merged) <= INCREMENTAL_MAX_DISTINCT else None
+    if kind == "histogram":
+        counts, edges = value
+        x = _values(tail[key[1]])
+        x = x[~np.isnan(x)]
+        if len(x) and (x.min() < edges[0] or x.max() > edges[-1]):
+            return None  # min/max mudaram: as bordas dos bins mudam
+        return counts + np.histogram(x, bins=edges)[0], edges
+    if kind == "comoments":
+        x = tail[list(key[1])].to_numpy(dtype=np.float32, na_value=np.nan)
+        if np.isnan(x).any():
+            return None
+        return value.merge(CoMoments.of(x))
+    if kind == "group_index":
+        return extend_group_index(value, tail)
+    return None
+
+
+def extend_dataset(df: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """df com as linhas de tail acrescentadas; o cache do novo DataFrame já nasce com os
+    agregados de df atualizados só com tail (custo proporcional ao trecho novo)."""
+    out = pd.concat([df, tail], ignore_index=True)
+    old, new = dataset_cache(df), dataset_cache(out)
+    if not out.dtypes.equals(df.dtypes):  # tipos mudaram: nada do cache antigo vale
+        return out
+    entries = list(old.items())
+    for key, value in entries:
+        try:
+            updated = _extend_entry(key, value, tail)
+        except Exception:  # uma entrada que não se deixa atualizar é só recalculada depois
+            updated = None
+        if updated is not None:
+            new[key] = updated
+    # correlação de Pearson a partir dos co-momentos atualizados
+    for key, value in entries:
+        if isinstance(key, tuple) and key[0] == "corr" and key[1] == "pearson" and not key[3]:
+            state = new.get(("comoments", tuple(value.columns)))
+            if state is not None:
+                corr = np.clip(state.corr(), -1, 1)
+                np.fill_diagonal(corr, 1.0)
+                new[key] = pd.DataFrame(corr, index=value.index, columns=value.columns)
+    return out
+
+
+# -----------------------------------------------------------------------------
+# CSV que cresceu: reconhecer o anterior no início e ler só o trecho novo
+# -----------------------------------------------------------------------------
+
+@dataclass
+class CsvSource:
+    """Assinatura de um CSV carregado: tamanho, hash de todo o conteúdo e tipos das colunas."""
+    size: int
+    digest: str
+    ends_with_newline: bool
+    dtypes: pd.Series
+    # estado do SHA-1 após `size` bytes: o hash do arquivo estendido continua daqui
+    hasher: Any = field(default=None, repr=False, compare=False)
+
+
+def _hash_range(f, h, start: int, end: int):
+    """Atualiza h com os bytes [start, end) de f, em leituras sequenciais."""
+    block = HASH_READ_KB * 1024
+    f.seek(start)
+    pos = start
+    while pos < end:
+        data = f.read(min(block, end - pos))
+        if not data:
+            break
+        h.update(data)
+        pos += len(data)
+    f.seek(0)
+    return h
+
+
+def _ends_with_newline(f, size: int) -> bool:
+    f.seek(max(size - 1, 0))
+    newline = size > 0 and f.read(1) == b"\n"
+    f.seek(0)
+    return newline
+
+
+def csv_source(f, size: int, df: pd.DataFrame, previous: Optional["CsvSource"] = None) -> CsvSource:
+    """Assinatura do arquivo carregado. Com `previous` (o arquivo é uma extensão dele), só os
+    bytes acrescentados são lidos para o hash."""
+    if previous is not None and previous.hasher is not None:
+        h = _hash_range(f, previous.hasher.copy(), previous.size, size)
+    else:
+        h = _hash_range(f, hashlib.sha1(), 0, size)
+    return CsvSource(size, h.hexdigest(), _ends_with_newline(f, size), df.dtypes, h)
+
+
+def is_extension(f, size: int, previous: Optional[CsvSource]) -> bool:
+    """O arquivo (size bytes) começa com o CSV anterior e só acrescenta linhas completas?
+    Compara o hash de todos os primeiros previous.size bytes: qualquer linha alterada conta."""
+    if previous is None or not previous.ends_with_newline or size <= previous.size:
+        return False
+    return _hash_range(f, hashlib.sha1(), 0, previous.size).hexdigest() == previous.digest
+
+
+def read_tail(f, previous: CsvSource) -> Optional[pd.DataFrame]:
+    """Linhas acrescentadas depois de previous.size bytes, com os tipos do dataset anterior.
+    None quando o trecho novo não casa com o schema (o chamador relê o arquivo inteiro)."""
+    columns: List[str] = list(previous.dtypes.index)
+    # colunas de texto continuam texto mesmo que o trecho novo só tenha números
+    text: Dict[str, Any] = {c: t for c, t in previous.dtypes.items()
+                            if not (pd.api.types.is_numeric_dtype(t) or pd.api.types.is_bool_dtype(t))}
+    f.seek(previous.size)
+    try:
+        tail = pd.read_csv(f, header=None, names=columns, dtype=text or None)
+    except Exception:
+        return None
+    finally:
+        f.seek(0)
+    for c, t in previous.dtypes.items():
+        # inteiros num trecho de coluna float: a leitura completa também daria float
+        if t.kind == "f" and tail[c].dtype.kind in "iu":
+            tail[c] = tail[c].astype(t)
+    if not tail.dtypes.equals(previous.dtypes):
+        return None
+    return tail
@@ -1,31 +1,155 @@
 # wrappers matplotlib (1 gráfico por figura; sem paletas fixas)
-import matplotlib.pyplot as plt
+# Desenho orientado a objetos (Figure própria por gráfico) via runtime.render; cada gráfico
+# também tem uma versão "spec" (Vega-Lite com os dados já agregados) renderizada no cliente.
+from typing import Any, Dict
+
 import numpy as np
 import pandas as pd
-from .runtime import fig_to_base64_png
+from .runtime import render
+from .correlation import MAX_HEATMAP_COLUMNS, corr_matrix, cluster_order, select_for_render
 
 
-def plot_histogram(df: pd.DataFrame, column: str, bins: int = 30, log_scale: bool = False) -> str:
+def bin_column(df: pd.DataFrame, column: str, bins: int = 30, weights=None):
+    """Contagens e bordas do histograma (pesos de expansão no modo aproximado)."""
     if column not in df.columns:
         raise ValueError(f"Coluna '{column}' não encontrada no dataset")
-    series = pd.to_numeric(df[column], errors="coerce").dropna()
-    plt.figure()
-    plt.hist(series, bins=bins)
-    plt.title(f"Histograma – {column}")
-    plt.xlabel(column)
-    plt.ylabel("Frequência")
+    x = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnan(x)
+    w = None if weights is None else np.asarray(weights)[ok]
+    return np.histogram(x[ok], bins=bins, weights=w)
+
+
+def _draw_histogram(fig, counts, edges, column: str, log_scale: bool):
+    ax = fig.add_subplot()
+    ax.stairs(counts, edges, fill=True)
+    ax.set_title(f"Histograma – {column}")
+    ax.set_xlabel(column)
+    ax.set_ylabel("Frequência")
     if log_scale:
-        plt.yscale("log")
-    return fig_to_base64_png()
-
-
-def plot_corr_heatmap(df: pd.DataFrame, method: str = "pearson") -> str:
-    num_df = df.select_dtypes(include=["number"]).copy()
-    corr = num_df.corr(method=method)
-    plt.figure()
-    plt.imshow(corr.values, aspect="auto")
-    plt.xticks(range(len(corr.columns)), corr.columns, rotation=90)
-    plt.yticks(range(len(corr.index)), corr.index)
-    plt.title(f"Matriz de correlação ({method})")
-    plt.colorbar()
-    return fig_to_base64_png()
\ No newline at end of file
+        ax.set_yscale("log")
+
+
+def plot_histogram(df: pd.DataFrame, column: str, bins: int = 30, log_scale: bool = False, weights=None,
+                   dpi=None, figsize=None) -> bytes:
+    counts, edges = bin_column(df, column, bins=bins, weights=weights)
+    return plot_binned_histogram(counts, edges, column, log_scale=log_scale, dpi=dpi, figsize=figsize)
+
+
+def plot_binned_histogram(counts, edges, column: str, log_scale: bool = False, dpi=None, figsize=None) -> bytes:
+    """Histograma a partir de contagens já agregadas."""
+    return render(_draw_histogram, counts, edges, column, log_scale, dpi=dpi, figsize=figsize)
+
+
+def histogram_spec(counts, edges, column: str, log_scale: bool = False) -> Dict[str, Any]:
+    """Spec Vega-Lite com os bins já calculados (renderização no cliente)."""
+    values = [
+        {"inicio": float(a), "fim": float(b), "frequencia": float(c)}
+        for a, b, c in zip(edges[:-1], edges[1:], counts)
+    ]
+    return {
+        "title": f"Histograma – {column}",
+        "data": {"values": values},
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "inicio", "type": "quantitative", "bin": {"binned": True}, "title": column},
+            "x2": {"field": "fim"},
+            "y": {"field": "frequencia", "type": "quantitative", "title": "Frequência",
+                  "scale": {"type": "symlog" if log_scale else "linear"}},
+        },
+    }
+
+
+def _draw_timeseries(fig, series: pd.Series, title: str, ylabel: str):
+    ax = fig.add_subplot()
+    ax.plot(series.index, series.to_numpy(dtype=np.float64), linewidth=0.9)
+    ax.set_title(title)
+    ax.set_xlabel(series.index.name or "")
+    ax.set_ylabel(ylabel)
+    if isinstance(series.index, pd.DatetimeIndex):
+        fig.autofmt_xdate()
+
+
+def plot_timeseries(series: pd.Series, title: str, ylabel: str = "", dpi=None, figsize=None) -> bytes:
+    """Linha de uma série já agregada (e decimada: poucos milhares de pontos)."""
+    return render(_draw_timeseries, series, title, ylabel, dpi=dpi, figsize=figsize)
+
+
+def timeseries_spec(series: pd.Series, title: str, ylabel: str = "") -> Dict[str, Any]:
+    """Spec Vega-Lite da série já agregada e decimada (renderização no cliente)."""
+    temporal = isinstance(series.index, pd.DatetimeIndex)
+    x = series.index.strftime("%Y-%m-%dT%H:%M:%S") if temporal else series.index.to_numpy(dtype=np.float64)
+    values = [
+        {"t": t if temporal else float(t), "valor": None if np.isnan(v) else float(v)}
+        for t, v in zip(x, series.to_numpy(dtype=np.float64))
+    ]
+    return {
+        "title": title,
+        "data": {"values": values},
+        "mark": "line",
+        "encoding": {
+            "x": {"field": "t", "type": "temporal" if temporal else "quantitative",
+                  "title": series.index.name or ""},
+            "y": {"field": "valor", "type": "quantitative", "title": ylabel},
+        },
+    }
+
+
+def plot_corr_heatmap(df: pd.DataFrame, method: str = "pearson", weights=None,
+                      max_columns: int = MAX_HEATMAP_COLUMNS) -> bytes:
+    corr = corr_matrix(df, method=method, weights=weights)
+    return plot_corr_matrix(corr, method=method, max_columns=max_columns)
+
+
+def _heatmap_view(corr: pd.DataFrame, max_columns: int, cluster: bool):
+    shown = select_for_render(corr, max_columns=max_columns)
+    if cluster:
+        shown = cluster_order(shown)
+    title = "Matriz de correlação"
+    if len(shown) < len(corr):
+        title += f" – {len(shown)} de {len(corr)} colunas (maiores |r|)"
+    return shown, title
+
+
+def _draw_heatmap(fig, shown: pd.DataFrame, title: str):
+    k = len(shown)
+    ax = fig.add_subplot()
+    im = ax.imshow(shown.values, aspect="auto", vmin=-1, vmax=1)
+    fontsize = 8 if k <= 25 else 6
+    ax.set_xticks(range(k), shown.columns, rotation=90, fontsize=fontsize)
+    ax.set_yticks(range(k), shown.index, fontsize=fontsize)
+    ax.set_title(title)
+    fig.colorbar(im, ax=ax)
+
+
+def plot_corr_matrix(corr: pd.DataFrame, method: str = "pearson", max_columns: int = MAX_HEATMAP_COLUMNS,
+                     cluster: bool = True, dpi=None) -> bytes:
+    """Heatmap de uma matriz de correlação já calculada.
+    Em datasets largos mostra só as colunas com correlações mais fortes, em ordem agrupada."""
+    shown, title = _heatmap_view(corr, max_columns, cluster)
+    size = min(4 + 0.25 * len(shown), 14)
+    return render(_draw_heatmap, shown, title.replace("correlação", f"correlação ({method})", 1),
+                  figsize=(size, size * 0.85), dpi=dpi)
+
+
+def corr_heatmap_spec(corr: pd.DataFrame, method: str = "pearson", max_columns: int = MAX_HEATMAP_COLUMNS,
+                      cluster: bool = True) -> Dict[str, Any]:
+    """Spec Vega-Lite do heatmap (mesmo recorte/ordem da versão PNG)."""
+    shown, title = _heatmap_view(corr, max_columns, cluster)
+    order = [str(c) for c in shown.columns]
+    k = len(order)
+    long = pd.DataFrame({
+        "linha": np.repeat(order, k),
+        "coluna": np.tile(order, k),
+        "r": [None if np.isnan(v) else round(float(v), 4) for v in shown.to_numpy().ravel()],
+    })
+    return {
+        "title": title.replace("correlação", f"correlação ({method})", 1),
+        "data": {"values": long.to_dict(orient="records")},
+        "mark": "rect",
+        "encoding": {
+            "x": {"field": "coluna", "type": "nominal", "sort": order, "title": None},
+            "y": {"field": "linha", "type": "nominal", "sort": order, "title": None},
+            "color": {"field": "r", "type": "quantitative", "scale": {"domain": [-1, 1]}},
+            "tooltip": [{"field": "linha"}, {"field": "coluna"}, {"field": "r"}],
+        },
+    }
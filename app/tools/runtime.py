@@ -1,20 +1,62 @@
 # executor sandbox (sem internet), timeout, captura stdout/figuras
 import io
-import base64
+import os
 import contextlib
 import sys
-import matplotlib
-matplotlib.use("Agg")  # backend não interativo
-import matplotlib.pyplot as plt
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-def fig_to_base64_png() -> str:
+# matplotlib é importado só no primeiro gráfico (import caro; muitas perguntas não desenham nada)
+
+# Renderização orientada a objetos (sem o estado global do pyplot): cada gráfico ganha
+# sua própria Figure, desenhada num pool pequeno e dedicado de threads.
+RENDER_DPI = int(os.getenv("RENDER_DPI", "100"))
+RENDER_FIGSIZE = tuple(float(v) for v in os.getenv("RENDER_FIGSIZE", "6.4x4.8").split("x"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+# zlib 1 = PNG bem mais rápido de codificar, arquivos um pouco maiores
+RENDER_PNG_COMPRESSION = int(os.getenv("RENDER_PNG_COMPRESSION", "1"))
+
+_render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+
+# Execução concorrente das ferramentas (pool separado do de renderização: uma ferramenta
+# que espera um gráfico nunca bloqueia o próprio pool). No máximo TOOL_WORKERS ferramentas
+# rodam ao mesmo tempo (vagas); uma ferramenta abandonada por timeout continua na thread dela,
+# mas devolve a vaga. As threads extras limitam quantas abandonadas convivem com as ativas.
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+TOOL_MAX_ABANDONED = int(os.getenv("TOOL_MAX_ABANDONED", "4"))
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS + TOOL_MAX_ABANDONED, thread_name_prefix="tool")
+_tool_slots = threading.Semaphore(TOOL_WORKERS)
+# intervalo de verificação enquanto há jobs com limite próprio que ainda não começaram
+_START_POLL_S = 0.05
+
+
+def new_figure(figsize=None, dpi=None) -> "Figure":
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize or RENDER_FIGSIZE, dpi=dpi or RENDER_DPI, layout="constrained")
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def figure_to_png(fig: "Figure") -> bytes:
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    plt.close()
-    buf.seek(0)
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    fig.savefig(buf, format="png", pil_kwargs={"compress_level": RENDER_PNG_COMPRESSION})
+    return buf.getvalue()
+
+
+def render(draw, *args, figsize=None, dpi=None, **kwargs) -> bytes:
+    """Executa draw(fig, *args, **kwargs) numa Figure nova, no pool de renderização,
+    e devolve o PNG (bytes; sem ida e volta por base64)."""
+    def job():
+        fig = new_figure(figsize=figsize, dpi=dpi)
+        draw(fig, *args, **kwargs)
+        return figure_to_png(fig)
+    return _render_pool.submit(job).result()
 
 
 def capture_stdout(fn, *args, **kwargs):
@@ -22,4 +64,97 @@ def capture_stdout(fn, *args, **kwargs):
     stream = io.StringIO()
     with contextlib.redirect_stdout(stream):
         result = fn(*args, **kwargs)
-    return result, stream.getvalue()
\ No newline at end of file
+    return result, stream.getvalue()
+
+
+class _Run:
+    """Um job no pool de ferramentas: ocupa uma vaga enquanto roda, registra quando começou
+    de fato (o timeout dele conta a partir daí) e devolve a vaga uma única vez, ao terminar
+    ou ao ser abandonado."""
+
+    def __init__(self, job: Callable[[], Any]):
+        self.job = job
+        self.started: Optional[float] = None
+        self._lock = threading.Lock()
+        self._held = False
+        self._abandoned = False
+
+    def __call__(self):
+        _tool_slots.acquire()
+        with self._lock:
+            if self._abandoned:  # expirou esperando vaga: nem começa
+                _tool_slots.release()
+                return None
+            self._held = True
+            self.started = time.monotonic()
+        try:
+            return self.job()
+        finally:
+            self._free()
+
+    def _free(self):
+        with self._lock:
+            if self._held:
+                self._held = False
+                _tool_slots.release()
+
+    def abandon(self):
+        with self._lock:
+            self._abandoned = True
+        self._free()
+
+
+def iter_with_deadlines(jobs: Sequence[Callable[[], Any]], timeouts: Sequence[Optional[float]],
+                        deadline: Optional[float] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Roda os jobs em paralelo no pool de ferramentas e produz (índice, desfecho) À MEDIDA
+    QUE TERMINAM: {"ok": True, "value": ...}, {"ok": False, "timeout": True} ou
+    {"ok": False, "error": exc}.
+
+    timeouts: limite (s) de cada job, contado a partir de quando ele começa a rodar (esperar
+    vaga não conta); deadline: limite total (s), contado a partir da chamada.
+    Threads não podem ser interrompidas: jobs que ainda não começaram são cancelados, e os
+    que já estão rodando são abandonados (a vaga é liberada e o resultado tardio, descartado).
+    """
+    start = time.monotonic()
+    runs = [_Run(job) for job in jobs]
+    futures = {_tool_pool.submit(run): i for i, run in enumerate(runs)}
+    total_end = None if deadline is None else start + deadline
+
+    def end_of(i: int) -> Optional[float]:
+        ends = [total_end] if total_end is not None else []
+        if timeouts[i] is not None and runs[i].started is not None:
+            ends.append(runs[i].started + timeouts[i])
+        return min(ends) if ends else None
+
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for fut in list(pending):
+            i = futures[fut]
+            end = end_of(i)
+            if end is not None and end <= now and not fut.done():
+                fut.cancel()
+                runs[i].abandon()
+                pending.discard(fut)
+                yield i, {"ok": False, "timeout": True}
+        if not pending:
+            break
+        waits = [end - now for end in (end_of(futures[f]) for f in pending) if end is not None]
+        if any(runs[futures[f]].started is None and timeouts[futures[f]] is not None for f in pending):
+            waits.append(_START_POLL_S)  # o limite de um job só existe quando ele começa
+        done, _ = wait(pending, timeout=max(min(waits), 0.0) if waits else None, return_when=FIRST_COMPLETED)
+        for fut in done:
+            pending.discard(fut)
+            try:
+                yield futures[fut], {"ok": True, "value": fut.result()}
+            except Exception as e:
+                yield futures[fut], {"ok": False, "error": e}
+
+
+def run_with_deadlines(jobs: Sequence[Callable[[], Any]], timeouts: Sequence[Optional[float]],
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Como iter_with_deadlines, mas devolve os desfechos NA ORDEM DOS JOBS."""
+    out: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+    for i, outcome in iter_with_deadlines(jobs, timeouts, deadline):
+        out[i] = outcome
+    return out
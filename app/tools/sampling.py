@@ -0,0 +1,261 @@
+# modo aproximado: amostra estratificada em cache + estimadores com intervalo de confiança
+# Estratifica pela coluna alvo (ex.: Class) para não perder classes raras; cada linha
+# da amostra carrega um peso N_h/n_h, de modo que as estimativas continuam não viesadas.
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+Z95 = 1.959963984540054
+
+DEFAULT_FRACTION = 0.01
+MIN_SAMPLE_ROWS = 20_000
+MAX_SAMPLE_ROWS = 500_000
+MIN_ROWS_PER_STRATUM = 2_000
+# abaixo disso a versão exata já é barata: o modo aproximado é ignorado
+APPROX_MIN_ROWS = 200_000
+MAX_STRATA = 50
+
+
+class Sample:
+    """Amostra de um DataFrame com pesos de expansão (N_h/n_h por estrato)."""
+
+    def __init__(self, df: pd.DataFrame, weights: np.ndarray, population: int, target: Optional[str]):
+        self.df = df
+        self.weights = weights
+        self.population = population
+        self.target = target
+
+    @property
+    def size(self) -> int:
+        return len(self.df)
+
+    def describe(self) -> str:
+        strat = f", estratificada por '{self.target}'" if self.target else ""
+        size, pop = f"{self.size:,}".replace(",", "."), f"{self.population:,}".replace(",", ".")
+        return f"amostra de {size} de {pop} linhas{strat}"
+
+
+def _resolve_target(df: pd.DataFrame, target: Optional[str]) -> Optional[str]:
+    if not target:
+        return None
+    if target in df.columns:
+        return target
+    lowered = {str(c).lower(): c for c in df.columns}
+    return lowered.get(target.lower())
+
+
+def _sample_size(n: int, fraction: float) -> int:
+    return int(min(n, max(MIN_SAMPLE_ROWS, min(MAX_SAMPLE_ROWS, round(n * fraction)))))
+
+
+def get_sample(df: pd.DataFrame, target: Optional[str] = "Class", fraction: float = DEFAULT_FRACTION,
+               seed: int = 0) -> Sample:
+    """Amostra estratificada (ou uniforme, sem alvo) em cache por dataset/alvo/fração/semente."""
+    key = ("sample", target, fraction, seed)
+    cache = dataset_cache(df)
+    if key in cache:
+        return cache[key]
+
+    n = len(df)
+    rng = np.random.default_rng(seed)
+    m = _sample_size(n, fraction)
+    col = _resolve_target(df, target)
+
+    strata = None
+    if col is not None:
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        if len(uniques) <= MAX_STRATA:
+            strata = codes
+        else:
+            col = None
+
+    if strata is None:
+        idx = np.sort(rng.choice(n, size=m, replace=False)) if m < n else np.arange(n)
+        weights = np.full(len(idx), n / max(len(idx), 1), dtype=np.float64)
+    else:
+        sizes = np.bincount(strata)
+        # alocação proporcional com piso por estrato (classes raras entram inteiras)
+        alloc = np.minimum(sizes, np.maximum(np.round(sizes * m / n).astype(np.int64), MIN_ROWS_PER_STRATUM))
+        parts, wparts = [], []
+        order = np.argsort(strata, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        for h, (nh, mh) in enumerate(zip(sizes, alloc)):
+            members = order[bounds[h]:bounds[h + 1]]
+            chosen = members if mh >= nh else rng.choice(members, size=mh, replace=False)
+            parts.append(chosen)
+            wparts.append(np.full(len(chosen), nh / max(len(chosen), 1), dtype=np.float64))
+        idx = np.concatenate(parts)
+        weights = np.concatenate(wparts)
+        order = np.argsort(idx)
+        idx, weights = idx[order], weights[order]
+
+    sample = Sample(df.iloc[idx], weights, n, col)
+    cache[key] = sample
+    return sample
+
+
+def should_approximate(df: pd.DataFrame, approximate: Optional[bool]) -> bool:
+    return bool(approximate) and isinstance(df, pd.DataFrame) and len(df) >= APPROX_MIN_ROWS
+
+
+# -----------------------------------------------------------------------------
+# Estimadores ponderados
+# -----------------------------------------------------------------------------
+
+def _weighted_quantile(x: np.ndarray, w: np.ndarray, qs) -> np.ndarray:
+    order = np.argsort(x, kind="stable")
+    x, w = x[order], w[order]
+    cw = np.cumsum(w)
+    return np.interp(np.asarray(qs) * cw[-1], cw - 0.5 * w, x)
+
+
+def _group_quantiles(codes: np.ndarray, x: np.ndarray, w: np.ndarray, n_groups: int):
+    """Quantis ponderados por grupo com a interpolação de _weighted_quantile, sem laço por grupo:
+    devolve at(q), q com um quantil por grupo -> valor por grupo (NaN em grupo sem valores)."""
+    ok = ~np.isnan(x)
+    codes, x, w = codes[ok], x[ok], w[ok]
+    if not len(x):
+        return lambda q: np.full(n_groups, np.nan)
+    order = np.lexsort((x, codes))
+    codes, x, w = codes[order], x[order], w[order]
+    total = np.bincount(codes, weights=w, minlength=n_groups)
+    before = np.concatenate([[0.0], np.cumsum(total)[:-1]])  # peso dos grupos anteriores
+    # posição de cada valor no próprio grupo, em (0, 1); somada ao código, cresce no array todo
+    pos = (np.cumsum(w) - before[codes] - 0.5 * w) / total[codes]
+    start = np.searchsorted(codes, np.arange(n_groups), side="left")
+    end = np.searchsorted(codes, np.arange(n_groups), side="right") - 1
+    has = end >= start
+    # quantis fora do primeiro/último valor do grupo ficam nele (como o np.interp de um grupo só)
+    lo, hi = pos[np.minimum(start, len(pos) - 1)], pos[np.maximum(end, 0)]
+
+    def at(q: np.ndarray) -> np.ndarray:
+        out = np.interp(np.arange(n_groups) + np.clip(q, lo, hi), codes + pos, x)
+        out[~has] = np.nan
+        return out
+
+    return at
+
+
+def estimate_stat(values: pd.Series, weights: np.ndarray, stat: str, population: int) -> Dict[str, Any]:
+    """Estimativa + IC95% de uma estatística a partir de uma amostra ponderada.
+    mean/sum/count: erro padrão com n efetivo de Kish; std: método delta;
+    median: IC por estatística de ordem; min/max: valor amostral, sem IC (extremos não são estimáveis)."""
+    x = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnan(x)
+    w_all = weights
+    x, w = x[ok], weights[ok]
+    out: Dict[str, Any] = {"value": float("nan"), "ci": None, "n": int(len(x))}
+    if len(x) == 0:
+        return out
+    sw, sw2 = w.sum(), (w * w).sum()
+    n_eff = sw * sw / sw2
+    mean = float((w * x).sum() / sw)
+    var = float((w * (x - mean) ** 2).sum() / sw)
+    se_mean = np.sqrt(var / max(n_eff - 1, 1))
+
+    if stat == "mean":
+        out["value"], out["ci"] = mean, (mean - Z95 * se_mean, mean + Z95 * se_mean)
+    elif stat == "sum":
+        total = float((w * x).sum())
+        se = sw * se_mean
+        out["value"], out["ci"] = total, (total - Z95 * se, total + Z95 * se)
+    elif stat == "count":
+        # proporção de não nulos na população x N
+        tw = w_all.sum()
+        p = sw / tw
+        se = population * np.sqrt(p * (1 - p) / (tw * tw / (w_all * w_all).sum()))
+        val = population * p
+        out["value"], out["ci"] = float(val), (max(val - Z95 * se, 0.0), min(val + Z95 * se, float(population)))
+    elif stat == "std":
+        sd = float(np.sqrt(var * n_eff / max(n_eff - 1, 1)))
+        m4 = float((w * (x - mean) ** 4).sum() / sw)
+        se = np.sqrt(max(m4 - var * var, 0.0) / n_eff) / (2 * sd) if sd > 0 else 0.0
+        out["value"], out["ci"] = sd, (max(sd - Z95 * se, 0.0), sd + Z95 * se)
+    elif stat == "median":
+        half = Z95 * np.sqrt(0.25 / n_eff)
+        lo, med, hi = _weighted_quantile(x, w, [max(0.5 - half, 0.0), 0.5, min(0.5 + half, 1.0)])
+        out["value"], out["ci"] = float(med), (float(lo), float(hi))
+    elif stat in ("min", "max"):
+        out["value"] = float(getattr(np, stat)(x))
+    else:
+        raise ValueError(f"Estatística não suportada: {stat}")
+    return out
+
+
+def format_estimate(label: str, est: Dict[str, Any], sample: Sample) -> str:
+    txt = f"{label} ≈ {est['value']:.6g}"
+    if est.get("ci") is not None:
+        lo, hi = est["ci"]
+        txt += f" (IC95%: {lo:.6g} – {hi:.6g})"
+    else:
+        txt += " (sem IC: extremo observado apenas na amostra)"
+    return txt + f" — {sample.describe()}."
+
+
+def approx_groupby(sample: Sample, by: List[str], aggregations: Dict[str, Any]) -> pd.DataFrame:
+    """Agregação por grupo na amostra ponderada. Para cada (coluna, estatística) devolve
+    a estimativa e, quando aplicável, as colunas *_ic_low/*_ic_high; inclui n_amostra por grupo.
+    median: quantil ponderado por grupo, com IC por estatística de ordem; min/max não são
+    estimáveis e saem como "min (amostra)"/"max (amostra)", o extremo observado na amostra."""
+    df = sample.df
+    w = pd.Series(sample.weights, index=df.index)
+    keys = [df[b] for b in by]
+    frames = {}
+    grouped = df.groupby(keys, dropna=False)
+    grouped_n = grouped.size()
+    codes = grouped.ngroup().to_numpy()
+    for col, stats in aggregations.items():
+        stats = [stats] if isinstance(stats, str) else list(stats)
+        x = pd.to_numeric(df[col], errors="coerce")
+        ok = x.notna()
+        wx = w.where(ok, 0.0)
+        xv = x.fillna(0.0)
+        parts = pd.DataFrame({
+            "sw": wx, "sw2": wx * wx, "swx": wx * xv, "swx2": wx * xv * xv,
+        }).groupby(keys, dropna=False).sum()
+        sw, sw2 = parts["sw"], parts["sw2"]
+        mean = parts["swx"] / sw
+        var = (parts["swx2"] / sw - mean ** 2).clip(lower=0)
+        n_eff = (sw ** 2 / sw2).clip(lower=1)
+        se_mean = np.sqrt(var / (n_eff - 1).clip(lower=1))
+        for st in stats:
+            if st == "mean":
+                val, se = mean, se_mean
+            elif st == "sum":
+                val, se = parts["swx"], sw * se_mean
+            elif st == "count":
+                # variância de Horvitz-Thompson sob amostragem de Poisson (0 para estratos completos)
+                val, se = sw, np.sqrt((sw * sw / n_eff - sw).clip(lower=0))
+            elif st == "std":
+                val = np.sqrt(var * n_eff / (n_eff - 1).clip(lower=1))
+                se = val / np.sqrt(2 * (n_eff - 1).clip(lower=1))
+            elif st == "median":
+                at = _group_quantiles(codes, x.to_numpy(dtype=np.float64, na_value=np.nan), sample.weights,
+                                      len(grouped_n))
+                half = (Z95 * np.sqrt(0.25 / n_eff)).reindex(grouped_n.index).to_numpy()
+                frames[(col, st)] = pd.Series(at(np.full(len(half), 0.5)), index=grouped_n.index)
+                frames[(col, f"{st}_ic_low")] = pd.Series(at(np.maximum(0.5 - half, 0.0)), index=grouped_n.index)
+                frames[(col, f"{st}_ic_high")] = pd.Series(at(np.minimum(0.5 + half, 1.0)), index=grouped_n.index)
+                continue
+            elif st in ("min", "max"):
+                frames[(col, f"{st} (amostra)")] = x.groupby(keys, dropna=False).agg(st)
+                continue
+            else:
+                raise ValueError(f"Estatística não suportada: {st}")
+            frames[(col, st)] = val
+            frames[(col, f"{st}_ic_low")] = val - Z95 * se
+            frames[(col, f"{st}_ic_high")] = val + Z95 * se
+    out = pd.DataFrame(frames)
+    out[("", "n_amostra")] = grouped_n
+    return out
+
+
+def corr_ci_halfwidth(sample: Sample, r: float = 0.0) -> Tuple[float, float]:
+    """IC95% (transformação z de Fisher) para um coeficiente r estimado na amostra."""
+    w = sample.weights
+    n_eff = w.sum() ** 2 / (w * w).sum()
+    z, dz = np.arctanh(np.clip(r, -0.999999, 0.999999)), Z95 / np.sqrt(max(n_eff - 3, 1))
+    return float(np.tanh(z - dz)), float(np.tanh(z + dz))
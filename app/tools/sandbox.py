@@ -0,0 +1,349 @@
+# executor sandbox (sem internet), com limites de CPU/memória/tempo e captura de stdout/figuras
+# O código roda em processos worker "quentes" (pool), nunca no processo do Streamlit, cada um
+# isolado pelo sistema operacional (namespaces, raiz somente leitura, uid sem privilégios,
+# seccomp; ver sandbox_worker.py) e com o ambiente limpo. Sem esse isolamento (fora do Linux,
+# ou SANDBOX_ISOLATION=off) run_python não é oferecido.
+# O DataFrame da sessão é publicado UMA vez num memfd selado (colunas numéricas como arrays
+# crus; demais colunas num único pickle) e o worker monta visões somente leitura sobre ele,
+# sem pickle por chamada. Na volta, o worker (que rodou código não confiável) só manda dados:
+# JSON, PNG e CSV, lidos aqui sem desserializar objetos (nunca pickle).
+import fcntl
+import io
+import json
+import mmap
+import os
+import pickle
+import queue
+import site
+import socket
+import subprocess
+import sys
+import threading
+import uuid
+import weakref
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import send_handle
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache, dataset_fingerprint
+
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+SANDBOX_CPU_S = int(os.getenv("SANDBOX_CPU_S", "20"))
+SANDBOX_WALL_S = float(os.getenv("SANDBOX_WALL_S", "30"))
+# espera máxima por um worker livre; depois disso a chamada desiste (e o código nunca roda)
+SANDBOX_QUEUE_S = float(os.getenv("SANDBOX_QUEUE_S", "5"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "2048"))
+# "namespaces" (padrão; Linux) ou "off": sem isolamento do sistema operacional, run_python fica desligado
+SANDBOX_ISOLATION = os.getenv("SANDBOX_ISOLATION", "namespaces")
+# usuário/grupo sem privilégios do worker (quando o app roda como root)
+SANDBOX_UID = int(os.getenv("SANDBOX_UID", "65534"))
+SANDBOX_GID = int(os.getenv("SANDBOX_GID", "65534"))
+SANDBOX_TMP_MB = int(os.getenv("SANDBOX_TMP_MB", "64"))
+# caminhos cobertos por um diretório vazio (ou /dev/null) dentro da sandbox; "." = diretório do app
+SANDBOX_HIDE = os.getenv("SANDBOX_HIDE", "~,/root,/home,/run/secrets,.")
+SANDBOX_START_S = float(os.getenv("SANDBOX_START_S", "60"))
+# maior mensagem aceita do worker (cabeçalho, cada PNG, a tabela em CSV)
+SANDBOX_MAX_MESSAGE_MB = int(os.getenv("SANDBOX_MAX_MESSAGE_MB", "64"))
+MAX_IMAGES = 20
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+class SandboxUnavailable(RuntimeError):
+    """Não há isolamento do sistema operacional para rodar código (run_python desligado)."""
+
+
+# -----------------------------------------------------------------------------
+# DataFrame em memória compartilhada
+# -----------------------------------------------------------------------------
+
+class SharedFrame:
+    """Cópia única do DataFrame num memfd selado (o worker só consegue mapeá-lo para leitura)
+    + metadados pequenos (picklable)."""
+
+    def __init__(self, df: pd.DataFrame):
+        raw_cols, obj_cols, layout, offset = [], [], [], 0
+        for i, (name, dtype) in enumerate(df.dtypes.items()):
+            if dtype.kind in "biufcmM" and isinstance(dtype, np.dtype):
+                arr = np.ascontiguousarray(df.iloc[:, i].to_numpy())
+                offset = -(-offset // 64) * 64  # alinhamento
+                layout.append(("raw", name, arr.dtype.str, offset))
+                raw_cols.append((offset, arr))
+                offset += arr.nbytes
+            else:
+                layout.append(("obj", name, None, len(obj_cols)))
+                obj_cols.append(df.iloc[:, i].array)
+        index = None if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1 else df.index
+        blob = pickle.dumps((obj_cols, index), protocol=pickle.HIGHEST_PROTOCOL)
+        blob_offset = -(-offset // 64) * 64
+        size = max(blob_offset + len(blob), 1)
+        self.fd = os.memfd_create("sandbox-df", os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+        os.ftruncate(self.fd, size)
+        with mmap.mmap(self.fd, size) as buf:
+            for off, arr in raw_cols:
+                buf[off:off + arr.nbytes] = arr.view(np.uint8).reshape(-1)
+            buf[blob_offset:blob_offset + len(blob)] = blob
+        fcntl.fcntl(self.fd, fcntl.F_ADD_SEALS,
+                    fcntl.F_SEAL_WRITE | fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW | fcntl.F_SEAL_SEAL)
+        self.meta = {
+            "name": uuid.uuid4().hex,
+            "rows": len(df),
+            "size": size,
+            "layout": layout,
+            "blob": (blob_offset, len(blob)),
+        }
+
+    def release(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+_publish_lock = threading.Lock()
+
+
+def _publish(df: pd.DataFrame) -> SharedFrame:
+    # chamadas simultâneas com o mesmo df publicam uma cópia só
+    with _publish_lock:
+        cache = dataset_cache(df)
+        shared = cache.get("sandbox_shm")
+        if shared is None:
+            shared = SharedFrame(df)
+            cache["sandbox_shm"] = shared
+            weakref.finalize(df, shared.release)
+    return shared
+
+
+# -----------------------------------------------------------------------------
+# Processo worker (app/tools/sandbox_worker.py)
+# -----------------------------------------------------------------------------
+
+def _recv_json(conn: Connection) -> Dict[str, Any]:
+    msg = json.loads(conn.recv_bytes(SANDBOX_MAX_MESSAGE_MB << 20))
+    if not isinstance(msg, dict):
+        raise OSError("mensagem inválida do worker")
+    return msg
+
+
+def _recv_output(conn: Connection) -> Dict[str, Any]:
+    """Saída de uma execução: só texto, PNGs e uma tabela lida de CSV (nenhum objeto Python
+    criado no worker é reconstruído aqui)."""
+    limit = SANDBOX_MAX_MESSAGE_MB << 20
+    head = _recv_json(conn)
+    n_images, table = head.get("images"), head.get("table")
+    if not isinstance(n_images, int) or not 0 <= n_images <= MAX_IMAGES:
+        raise OSError("mensagem inválida do worker")
+    images = [conn.recv_bytes(limit) for _ in range(n_images)]
+    out: Dict[str, Any] = {
+        "stdout": head.get("stdout") if isinstance(head.get("stdout"), str) else "",
+        "error": head.get("error") if isinstance(head.get("error"), str) else None,
+        "images": [png for png in images if png.startswith(_PNG_SIGNATURE)],
+        "table": None,
+    }
+    if isinstance(table, dict):
+        payload = conn.recv_bytes(limit)
+        levels = table.get("index_levels")
+        levels = levels if isinstance(levels, int) and 0 <= levels <= 32 else 0
+        out["table"] = pd.read_csv(io.BytesIO(payload), index_col=list(range(levels)) or None)
+    return out
+
+
+def _worker_env() -> Dict[str, str]:
+    # nada do ambiente do app (chaves de API, tokens) chega ao worker
+    return {
+        "PATH": "/usr/local/bin:/usr/bin:/bin",
+        "HOME": os.path.expanduser("~"),  # cache de fontes do matplotlib, lido antes de ocultar o home
+        "LANG": "C.UTF-8",
+        "MPLBACKEND": "Agg",
+        "OPENBLAS_NUM_THREADS": "1",
+        "OMP_NUM_THREADS": "1",
+        "MKL_NUM_THREADS": "1",
+    }
+
+
+def _worker_config(fd: int, memory_mb: int) -> Dict[str, Any]:
+    hide = []
+    for p in SANDBOX_HIDE.split(","):
+        p = os.path.realpath(os.path.expanduser(p.strip())) if p.strip() else ""
+        if p and p != "/" and os.path.exists(p):
+            hide.append(p)
+    # interpretador e bibliotecas continuam visíveis mesmo dentro de um diretório oculto
+    keep = {sys.prefix, sys.base_prefix, sys.exec_prefix, *site.getsitepackages()}
+    if site.ENABLE_USER_SITE:
+        keep.add(site.getusersitepackages())
+    keep = sorted(os.path.realpath(p) for p in keep if os.path.isdir(p))
+    return {"fd": fd, "memory_mb": memory_mb, "uid": SANDBOX_UID, "gid": SANDBOX_GID, "tmp_mb": SANDBOX_TMP_MB,
+            "hide": hide, "keep": keep}
+
+
+class _Worker:
+    def __init__(self, memory_mb: int):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.proc = subprocess.Popen(
+                [sys.executable, "-E", _WORKER_SCRIPT, json.dumps(_worker_config(child.fileno(), memory_mb))],
+                env=_worker_env(), pass_fds=(child.fileno(),), stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL, start_new_session=True)
+        finally:
+            child.close()
+        self.conn = Connection(parent.detach())
+        self.frame: Optional[str] = None  # dataset já entregue a este worker
+        self.ready = False
+
+    def wait_ready(self, timeout: float):
+        try:
+            if not self.conn.poll(timeout):
+                raise SandboxUnavailable("o worker da sandbox não respondeu.")
+            msg = _recv_json(self.conn)
+        except (EOFError, OSError, ValueError):
+            raise SandboxUnavailable("o worker da sandbox encerrou ao iniciar.")
+        if not msg.get("ready"):
+            raise SandboxUnavailable(f"isolamento indisponível ({msg.get('error')}).")
+        self.ready = True
+
+    def send_frame(self, shared: SharedFrame):
+        if self.frame != shared.meta["name"]:
+            self.conn.send({"frame": shared.meta})
+            send_handle(self.conn, shared.fd, self.proc.pid)
+            self.frame = shared.meta["name"]
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait(timeout=1)
+        self.conn.close()
+
+
+class SandboxPool:
+    """Pool de workers quentes: evita pagar o startup (e o isolamento) a cada chamada.
+    Um worker que estoura tempo/CPU/memória é descartado e substituído."""
+
+    def __init__(self, size: int = SANDBOX_WORKERS, memory_mb: int = SANDBOX_MEMORY_MB):
+        if SANDBOX_ISOLATION != "namespaces" or not sys.platform.startswith("linux"):
+            raise SandboxUnavailable(f"SANDBOX_ISOLATION={SANDBOX_ISOLATION} em {sys.platform}.")
+        self._memory_mb = memory_mb
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        workers = [_Worker(memory_mb) for _ in range(size)]
+        try:
+            for worker in workers:  # o primeiro handshake confirma que o isolamento funciona aqui
+                worker.wait_ready(SANDBOX_START_S)
+        except SandboxUnavailable:
+            for worker in workers:
+                worker.kill()
+            raise
+        for worker in workers:
+            self._idle.put(worker)
+
+    def run(self, df: pd.DataFrame, code: str, cpu_s: int = SANDBOX_CPU_S,
+            wall_s: float = SANDBOX_WALL_S, queue_s: float = SANDBOX_QUEUE_S) -> Dict[str, Any]:
+        """Roda `code` num worker livre: espera até queue_s por ele e até wall_s pela execução."""
+        shared = _publish(df)
+        try:
+            worker = self._idle.get(timeout=queue_s)
+        except queue.Empty:  # todos ocupados: a chamada expira sem deixar código na fila
+            return {"error": f"Nenhum worker da sandbox livre em {queue_s:g}s.", "timeout": True}
+        healthy = False
+        try:
+            if not worker.ready:
+                worker.wait_ready(SANDBOX_START_S)  # substituto iniciado depois de uma falha
+            worker.send_frame(shared)
+            worker.conn.send({"code": code, "cpu_s": cpu_s})
+            if not worker.conn.poll(wall_s):
+                return {"error": f"Tempo limite de {wall_s:.0f}s excedido.", "timeout": True}
+            out = _recv_output(worker.conn)
+            healthy = True
+            return out
+        except SandboxUnavailable as e:
+            return {"error": f"Sandbox indisponível: {e}"}
+        except (EOFError, OSError):
+            return {"error": "Worker encerrado (limite de CPU ou memória excedido)."}
+        except ValueError:  # JSON/CSV malformado: o worker não é mais confiável
+            return {"error": "Saída inválida do worker da sandbox."}
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                worker.kill()
+                self._idle.put(_Worker(self._memory_mb))
+
+
+_pool: Optional[SandboxPool] = None
+_pool_error: Optional[str] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """Pool compartilhado; SandboxUnavailable (lembrada) se o isolamento não puder ser montado."""
+    global _pool, _pool_error
+    with _pool_lock:
+        if _pool is None:
+            if _pool_error is not None:
+                raise SandboxUnavailable(_pool_error)
+            try:
+                _pool = SandboxPool()
+            except (SandboxUnavailable, OSError) as e:
+                _pool_error = str(e)
+                raise SandboxUnavailable(_pool_error) from e
+        return _pool
+
+
+_supported: Optional[bool] = None
+_warming: Optional[threading.Thread] = None
+
+
+def _kernel_supports_isolation() -> bool:
+    """Checagem barata (sem subir processos) de que o isolamento de sandbox_worker.py é possível."""
+    if SANDBOX_ISOLATION != "namespaces" or not sys.platform.startswith("linux") or not hasattr(os, "memfd_create"):
+        return False
+    if not all(os.path.exists(f"/proc/self/ns/{ns}") for ns in ("mnt", "net", "pid", "ipc", "uts")):
+        return False
+    if os.geteuid() == 0:
+        return True
+    try:  # sem root, o worker depende de namespaces de usuário
+        with open("/proc/sys/user/max_user_namespaces") as f:
+            return int(f.read()) > 0
+    except (OSError, ValueError):
+        return False
+
+
+def _warm_up():
+    """Sobe o pool numa thread, para a primeira chamada de run_python não pagar o startup."""
+    global _warming
+    with _pool_lock:
+        if _pool is not None or _warming is not None:
+            return
+
+        def job():
+            try:
+                get_pool()
+            except SandboxUnavailable:  # lembrado em _pool_error: run_python deixa de ser oferecido
+                pass
+
+        _warming = threading.Thread(target=job, name="sandbox-warmup", daemon=True)
+        _warming.start()
+
+
+def sandbox_available() -> bool:
+    """run_python só é oferecido ao modelo quando o kernel permite o isolamento e o pool não
+    falhou ao subir. Não bloqueia: o pool é iniciado em segundo plano na primeira consulta."""
+    global _supported
+    if _supported is None:
+        _supported = _kernel_supports_isolation()
+    if not _supported or _pool_error is not None:
+        return False
+    _warm_up()
+    return True
+
+
+def run_code(df: pd.DataFrame, code: str) -> Dict[str, Any]:
+    """Executa `code` na sandbox com `df` (somente leitura), `pd`, `np` e `plt` disponíveis."""
+    try:
+        out = get_pool().run(df, code)
+    except SandboxUnavailable as e:
+        return {"error": f"Execução de código desligada: {e}"}
+    out["dataset"] = dataset_fingerprint(df)
+    return out
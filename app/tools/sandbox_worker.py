@@ -0,0 +1,328 @@
+# processo worker da sandbox de run_python (Linux), iniciado por sandbox.py como script
+# independente: não importa nada do app (o diretório do app fica oculto) e recebe um ambiente
+# limpo (sem OPENAI_API_KEY nem outras variáveis do processo pai). Antes de aceitar código:
+#   - namespaces novos de montagem, rede (sem interfaces além de lo, desligada), PID, IPC e UTS
+#     (e de usuário, quando o app não roda como root);
+#   - raiz somente leitura, /tmp num tmpfs pequeno, diretórios sensíveis (home, app) cobertos
+#     por tmpfs vazios, só o interpretador e os site-packages remontados por cima;
+#   - /proc novo (os processos do app não aparecem), uid sem privilégios (ou, num namespace de
+#     usuário, nenhuma capability), no_new_privs e um filtro seccomp: sockets só AF_UNIX e
+#     nada de mount/ptrace/unshare/setns/bpf/módulos do kernel.
+# Protocolo (multiprocessing.connection sobre o socket herdado): o worker responde
+# {"ready": True} ou {"error": ...}; depois recebe {"frame": meta} + o fd do memfd selado com o
+# DataFrame (send_handle) e {"code": ..., "cpu_s": ...}, e devolve a saída de cada execução.
+# Na volta, nada é pickle (o pai não desserializa objetos criados pelo código do usuário): um
+# cabeçalho JSON, os PNGs crus e a tabela em CSV, cada um numa mensagem send_bytes.
+import ctypes
+import io
+import json
+import mmap
+import os
+import pickle
+import platform
+import resource
+import signal
+import struct
+import sys
+import traceback
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle
+
+MAX_RESULT_ROWS = 10_000
+MAX_STDOUT_CHARS = 20_000
+
+_CLONE_NEWNS = 0x00020000
+_CLONE_NEWUTS = 0x04000000
+_CLONE_NEWIPC = 0x08000000
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWPID = 0x20000000
+_CLONE_NEWNET = 0x40000000
+_CLONE_NEWCGROUP = 0x02000000
+_CLONE_NEW_ANY = (_CLONE_NEWNS | _CLONE_NEWUTS | _CLONE_NEWIPC | _CLONE_NEWUSER | _CLONE_NEWPID
+                  | _CLONE_NEWNET | _CLONE_NEWCGROUP)
+
+_MS_RDONLY, _MS_NOSUID, _MS_NODEV, _MS_NOEXEC = 1, 2, 4, 8
+_MS_BIND, _MS_REC, _MS_PRIVATE = 4096, 16384, 1 << 18
+_MOUNT_ATTR_RDONLY, _MOUNT_ATTR_NOSUID, _MOUNT_ATTR_NODEV = 1, 2, 4
+_AT_FDCWD, _AT_RECURSIVE = -100, 0x8000
+_SYS_MOUNT_SETATTR = 442  # mesmo número em x86_64 e aarch64
+
+_PR_SET_PDEATHSIG, _PR_SET_SECCOMP, _PR_CAPBSET_DROP, _PR_SET_NO_NEW_PRIVS = 1, 22, 24, 38
+_SECCOMP_MODE_FILTER = 2
+_RET_ALLOW, _RET_KILL = 0x7FFF0000, 0x80000000
+_EPERM, _ENOSYS, _EAFNOSUPPORT = 1, 38, 97
+_AF_UNIX = 1
+
+# (arquitetura do seccomp_data, syscalls negadas, socket, clone, clone3, capset)
+_ARCHES = {
+    "x86_64": (0xC000003E, {
+        "ptrace": 101, "mount": 165, "umount2": 166, "pivot_root": 155, "chroot": 161, "unshare": 272,
+        "setns": 308, "bpf": 321, "perf_event_open": 298, "add_key": 248, "request_key": 249,
+        "keyctl": 250, "kexec_load": 246, "init_module": 175, "delete_module": 176, "finit_module": 313,
+        "process_vm_readv": 310, "process_vm_writev": 311, "userfaultfd": 323, "io_uring_setup": 425,
+        "open_tree": 428, "move_mount": 429, "fsopen": 430, "fsmount": 432, "mount_setattr": 442,
+    }, 41, 56, 435, 126),
+    "aarch64": (0xC00000B7, {
+        "ptrace": 117, "mount": 40, "umount2": 39, "pivot_root": 41, "chroot": 51, "unshare": 97,
+        "setns": 268, "bpf": 280, "perf_event_open": 241, "add_key": 217, "request_key": 218,
+        "keyctl": 219, "kexec_load": 104, "init_module": 105, "delete_module": 106, "finit_module": 273,
+        "process_vm_readv": 270, "process_vm_writev": 271, "userfaultfd": 282, "io_uring_setup": 425,
+        "open_tree": 428, "move_mount": 429, "fsopen": 430, "fsmount": 432, "mount_setattr": 442,
+    }, 198, 220, 435, 91),
+}
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.syscall.restype = ctypes.c_long
+
+
+def _check(ret: int, what: str):
+    if ret != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f"{what}: {os.strerror(err)}")
+
+
+def _mount(source, target: str, fstype, flags: int, data=None):
+    enc = (lambda v: None if v is None else v.encode())
+    _check(_libc.mount(enc(source), enc(target), enc(fstype), ctypes.c_ulong(flags), enc(data)),
+           f"mount {target}")
+
+
+def _prctl(option: int, arg: int = 0):
+    return _libc.prctl(option, ctypes.c_ulong(arg), ctypes.c_ulong(0), ctypes.c_ulong(0), ctypes.c_ulong(0))
+
+
+# -----------------------------------------------------------------------------
+# Isolamento
+# -----------------------------------------------------------------------------
+
+def _enter_namespaces(userns: bool):
+    """unshare + fork: o filho é o PID 1 do namespace novo e segue; o pai só espera por ele."""
+    uid, gid = os.getuid(), os.getgid()
+    flags = _CLONE_NEWNS | _CLONE_NEWNET | _CLONE_NEWIPC | _CLONE_NEWUTS | _CLONE_NEWPID
+    _check(_libc.unshare(flags | (_CLONE_NEWUSER if userns else 0)), "unshare")
+    if userns:  # o usuário do app vira root do namespace (só para montar; as capabilities caem depois)
+        with open("/proc/self/setgroups", "w") as f:
+            f.write("deny")
+        with open("/proc/self/uid_map", "w") as f:
+            f.write(f"0 {uid} 1")
+        with open("/proc/self/gid_map", "w") as f:
+            f.write(f"0 {gid} 1")
+    pid = os.fork()
+    if pid:
+        os.closerange(3, 1 << 16)  # só o filho fala com o app: EOF assim que ele terminar
+        _, status = os.waitpid(pid, 0)
+        os._exit(os.waitstatus_to_exitcode(status) & 0xFF)
+
+
+def _under(path: str, parent: str) -> bool:
+    return path == parent or path.startswith(parent.rstrip("/") + "/")
+
+
+def _lock_filesystem(hide, keep, tmp_mb: int):
+    _mount(None, "/", None, _MS_REC | _MS_PRIVATE)  # nada propaga para o namespace do app
+    # o que fica visível dentro dos diretórios ocultos (interpretador, site-packages): fds O_PATH
+    # abertos antes de cobri-los, remontados depois por /proc/self/fd
+    keep_fds = {p: os.open(p, os.O_PATH | os.O_DIRECTORY) for p in keep if any(_under(p, h) for h in hide)}
+    hidden = []
+    for path in sorted(hide, key=len):
+        if any(_under(path, h) for h in hidden):
+            continue
+        if os.path.isdir(path):
+            _mount("tmpfs", path, "tmpfs", _MS_NOSUID | _MS_NODEV | _MS_NOEXEC, "size=1m,mode=755")
+        else:
+            _mount("/dev/null", path, None, _MS_BIND)
+        hidden.append(path)
+    for path, fd in keep_fds.items():
+        os.makedirs(path, exist_ok=True)
+        _mount(f"/proc/self/fd/{fd}", path, None, _MS_BIND | _MS_REC)
+        os.close(fd)
+    # raiz inteira (e submontagens) somente leitura
+    attr = struct.pack("QQQQ", _MOUNT_ATTR_RDONLY | _MOUNT_ATTR_NOSUID | _MOUNT_ATTR_NODEV, 0, 0, 0)
+    buf = ctypes.create_string_buffer(attr, len(attr))
+    _check(_libc.syscall(_SYS_MOUNT_SETATTR, _AT_FDCWD, b"/", _AT_RECURSIVE, buf, len(attr)), "mount_setattr /")
+    _mount("tmpfs", "/tmp", "tmpfs", _MS_NOSUID | _MS_NODEV, f"size={tmp_mb}m,mode=1777")
+    try:
+        _mount("proc", "/proc", "proc", _MS_NOSUID | _MS_NODEV | _MS_NOEXEC)
+    except OSError:  # /proc mascarado (alguns containers): ao menos os processos do app somem
+        _mount("tmpfs", "/proc", "tmpfs", _MS_NOSUID | _MS_NODEV | _MS_NOEXEC | _MS_RDONLY, "size=1k")
+
+
+def _drop_privileges(userns: bool, uid: int, gid: int, capset_nr: int):
+    cap = 0
+    while _prctl(_PR_CAPBSET_DROP, cap) == 0:
+        cap += 1
+    if userns:
+        # root do namespace sem nenhuma capability (header v3 + dois blocos zerados)
+        header = (ctypes.c_uint32 * 2)(0x20080522, 0)
+        data = (ctypes.c_uint32 * 6)()
+        _check(_libc.syscall(capset_nr, header, data), "capset")
+    else:
+        os.setgroups([])
+        os.setresgid(gid, gid, gid)
+        os.setresuid(uid, uid, uid)
+    _prctl(_PR_SET_PDEATHSIG, signal.SIGKILL)  # zerado pela troca de uid: vale a partir daqui
+    _check(_prctl(_PR_SET_NO_NEW_PRIVS, 1), "no_new_privs")
+
+
+def _seccomp(arch: str):
+    audit_arch, denied, sys_socket, sys_clone, sys_clone3, _ = _ARCHES[arch]
+
+    def ins(code, k, jt=0, jf=0):
+        return struct.pack("HBBI", code, jt, jf, k & 0xFFFFFFFF)
+
+    ld, jeq, jset, jge, ret = 0x20, 0x15, 0x45, 0x35, 0x06
+    prog = [ins(ld, 4), ins(jeq, audit_arch, 1, 0), ins(ret, _RET_KILL), ins(ld, 0)]
+    if arch == "x86_64":  # ABI x32
+        prog += [ins(jge, 0x40000000, 0, 1), ins(ret, 0x50000 | _EPERM)]
+    for nr in sorted(set(denied.values())):
+        prog += [ins(jeq, nr, 0, 1), ins(ret, 0x50000 | _EPERM)]
+    prog += [ins(jeq, sys_clone3, 0, 1), ins(ret, 0x50000 | _ENOSYS)]  # a libc recai em clone
+    prog += [ins(jeq, sys_clone, 0, 3), ins(ld, 16), ins(jset, _CLONE_NEW_ANY, 0, 1), ins(ret, 0x50000 | _EPERM),
+             ins(ld, 0)]
+    prog += [ins(jeq, sys_socket, 0, 3), ins(ld, 16), ins(jeq, _AF_UNIX, 1, 0),
+             ins(ret, 0x50000 | _EAFNOSUPPORT)]
+    prog += [ins(ret, _RET_ALLOW)]
+    code = b"".join(prog)
+    filt = ctypes.create_string_buffer(code, len(code))
+    fprog = struct.pack("HxxxxxxQ", len(prog), ctypes.addressof(filt))
+    fbuf = ctypes.create_string_buffer(fprog, len(fprog))
+    _check(_libc.prctl(_PR_SET_SECCOMP, ctypes.c_ulong(_SECCOMP_MODE_FILTER), fbuf, ctypes.c_ulong(0),
+                       ctypes.c_ulong(0)), "seccomp")
+
+
+def _isolate(config):
+    arch = platform.machine()
+    if arch not in _ARCHES:
+        raise OSError(f"arquitetura sem filtro seccomp: {arch}")
+    userns = os.geteuid() != 0
+    _enter_namespaces(userns)
+    # bibliotecas carregadas antes de ocultar os diretórios (cache de fontes do matplotlib no home)
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    _lock_filesystem(config["hide"], config["keep"], config["tmp_mb"])
+    _drop_privileges(userns, config["uid"], config["gid"], _ARCHES[arch][5])
+    _seccomp(arch)
+    os.chdir("/tmp")
+    os.environ.update(HOME="/tmp", TMPDIR="/tmp", MPLCONFIGDIR="/tmp")
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (config["tmp_mb"] << 20, config["tmp_mb"] << 20))
+    limit = config["memory_mb"] << 20  # heap (o DataFrame é um mapeamento compartilhado: não entra aqui)
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+# -----------------------------------------------------------------------------
+# Execução
+# -----------------------------------------------------------------------------
+
+def _attach_frame(meta, fd: int):
+    """DataFrame como visões somente leitura sobre o memfd selado do processo pai."""
+    import numpy as np
+    import pandas as pd
+    buf = mmap.mmap(fd, meta["size"], prot=mmap.PROT_READ)
+    os.close(fd)
+    off, size = meta["blob"]
+    obj_cols, index = pickle.loads(buf[off:off + size])
+    cols = {}
+    for kind, name, dtype, where in meta["layout"]:
+        if kind == "raw":
+            cols[name] = np.ndarray((meta["rows"],), dtype=np.dtype(dtype), buffer=buf, offset=where)
+        else:
+            cols[name] = obj_cols[where]
+    df = pd.DataFrame(cols, copy=False)
+    if index is not None:
+        df.index = index
+    return df
+
+
+def _run(df, code: str, cpu_s: int):
+    import contextlib
+
+    import numpy as np
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    # CPU: limite relativo ao que o processo já consumiu (worker reaproveitado)
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(used.ru_utime + used.ru_stime) + cpu_s
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 1))
+
+    env = {"df": df, "pd": pd, "np": np, "plt": plt}
+    out = {"stdout": "", "images": [], "table": None, "error": None}
+    stream = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stream):
+            exec(compile(code, "<sandbox>", "exec"), env)
+    except MemoryError:
+        out["error"] = "Limite de memória da sandbox excedido."
+    except BaseException:
+        out["error"] = traceback.format_exc(limit=-3)
+    out["stdout"] = stream.getvalue()
+    for num in plt.get_fignums():
+        buf = io.BytesIO()
+        plt.figure(num).savefig(buf, format="png", bbox_inches="tight")
+        out["images"].append(buf.getvalue())
+    plt.close("all")
+    res = env.get("result")
+    if isinstance(res, pd.Series):
+        res = res.to_frame()
+    if isinstance(res, pd.DataFrame):
+        out["table"] = res.head(MAX_RESULT_ROWS)
+    elif res is not None:
+        out["stdout"] += f"\nresult = {res!r}"
+    out["stdout"] = out["stdout"][-MAX_STDOUT_CHARS:]
+    return out
+
+
+def _send_json(conn, msg):
+    conn.send_bytes(json.dumps(msg).encode("utf-8"))
+
+
+def _send_output(conn, out):
+    """Cabeçalho JSON + um send_bytes por PNG + a tabela como CSV (índice nas primeiras colunas)."""
+    import pandas as pd
+    head = {"stdout": out["stdout"], "error": out["error"], "images": len(out["images"]), "table": None}
+    table, payload = out["table"], None
+    if table is not None:
+        try:
+            levels = 0 if isinstance(table.index, pd.RangeIndex) else table.index.nlevels
+            if isinstance(table.columns, pd.MultiIndex):
+                table = table.set_axis([" / ".join(map(str, c)) for c in table.columns], axis=1)
+            payload = table.to_csv(index=bool(levels)).encode("utf-8")
+            head["table"] = {"index_levels": levels}
+        except Exception:
+            head["error"] = (head["error"] or "") + "\n`result` não pôde ser convertido em tabela."
+    _send_json(conn, head)
+    for png in out["images"]:
+        conn.send_bytes(png)
+    if payload is not None:
+        conn.send_bytes(payload)
+
+
+def main():
+    config = json.loads(sys.argv[1])
+    sys.dont_write_bytecode = True
+    conn = Connection(config["fd"])
+    try:
+        _isolate(config)
+    except BaseException as e:
+        _send_json(conn, {"error": f"{type(e).__name__}: {e}"})
+        return 1
+    _send_json(conn, {"ready": True})
+    df = None
+    while True:
+        try:
+            req = conn.recv()
+        except EOFError:
+            return 0
+        if "frame" in req:  # dataset novo: o anterior é liberado quando as visões somem
+            df = None
+            df = _attach_frame(req["frame"], recv_handle(conn))
+            continue
+        _send_output(conn, _run(df, req["code"], req["cpu_s"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
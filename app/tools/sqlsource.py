@@ -0,0 +1,449 @@
+# fonte de dados SQL para as ferramentas de EDA (ex.: as notas fiscais de invoices.db)
+# Uma tabela SQLite vista como dataset: cada coluna é uma expressão SQL (campos de JSON via
+# json_extract, normalizações de CNPJ/data/valor) e tem o dtype pandas equivalente, para o
+# índice de colunas e os filtros funcionarem como num DataFrame. Filtros ("where"), contagens,
+# estatísticas, histogramas e groupby viram consultas no banco, que usam os índices de
+# expressão da tabela; só o resultado agregado é materializado em pandas.
+import math
+import os
+import re
+import sqlite3
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries import offsets
+
+from .groupby import _resolve_sort
+
+# máximo de linhas de resultado (grupos/valores distintos) trazidas para o pandas
+SQL_FETCH_LIMIT = int(os.getenv("SQL_FETCH_LIMIT", "100000"))
+# linhas lidas por bloco quando uma consulta precisa percorrer valores (mediana por grupo)
+SQL_STREAM_ROWS = int(os.getenv("SQL_STREAM_ROWS", "10000"))
+
+_SQL_OPS = {"==": "=", "!=": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+_STATS = ("mean", "median", "std", "var", "sum", "count", "min", "max")
+
+
+@dataclass(frozen=True)
+class SQLColumn:
+    """Coluna exposta: nome, expressão SQL, dtype pandas equivalente e tipo do valor.
+    kind: "value"; "digits" (literais dos filtros ficam só com dígitos); "date" (texto
+    AAAA-MM-DD); "datetime" (texto ISO 8601); "list" (array JSON: value_counts conta cada
+    item, via `each`, uma expressão json_each)."""
+    name: str
+    expr: str
+    dtype: str
+    kind: str = "value"
+    each: Optional[str] = None
+
+
+def is_sql_source(df) -> bool:
+    return isinstance(df, SQLSource)
+
+
+def _nullable(col: SQLColumn) -> bool:
+    # dtypes com pd.NA (ex.: "string"): x != v também é NA para nulos, e a linha fica de fora
+    return getattr(pd.api.types.pandas_dtype(col.dtype), "na_value", None) is pd.NA
+
+
+def _period_sql(expr: str, offset) -> str:
+    """Início (texto ISO) do período de `offset` que contém o instante `expr`: frequências fixas
+    alinhadas à época (como resample(origin="epoch")); semanas a partir de segunda; meses,
+    trimestres e anos a partir do primeiro dia."""
+    if isinstance(offset, offsets.Tick):
+        seconds, rest = divmod(offset.nanos, 1_000_000_000)
+        if seconds < 1 or rest:
+            raise ValueError(f"frequência não suportada na consulta SQL: {offset.freqstr}.")
+        epoch = f"CAST(strftime('%s', {expr}) AS INTEGER)"
+        return f"datetime({epoch} - {epoch} % {seconds}, 'unixepoch')"
+    if offset.n == 1:
+        if isinstance(offset, offsets.Week) and offset.weekday == 0:
+            return f"date({expr}, 'weekday 0', '-6 days')"
+        if isinstance(offset, offsets.MonthBegin):
+            return f"strftime('%Y-%m-01', {expr})"
+        if isinstance(offset, offsets.QuarterBegin) and offset.startingMonth == 1:
+            return (f"printf('%s-%02d-01', strftime('%Y', {expr}), "
+                    f"(CAST(strftime('%m', {expr}) AS INTEGER) - 1) / 3 * 3 + 1)")
+        if isinstance(offset, offsets.YearBegin):
+            return f"strftime('%Y-01-01', {expr})"
+    raise ValueError(f"frequência não suportada na consulta SQL: {offset.freqstr}.")
+
+
+def _timestamp(value: Any) -> pd.Timestamp:
+    ts = pd.to_datetime(value, format="ISO8601")
+    return ts.tz_convert(None) if ts.tzinfo is not None else ts
+
+
+def _casefold(value: Any) -> Optional[str]:
+    return None if value is None else str(value).casefold()
+
+
+class SQLSource:
+    """Dataset apoiado numa tabela SQLite (somente leitura). `filtered` devolve a mesma fonte
+    restrita por um filtro validado (app/tools/filters.py), traduzido para WHERE."""
+
+    def __init__(self, path: str, table: str, columns: Sequence[SQLColumn], label: str = "",
+                 where: str = "", params: Sequence[Any] = (), filter_text: str = ""):
+        self.path = path
+        self.table = table
+        self.label = label or table
+        self._cols: Dict[str, SQLColumn] = {c.name: c for c in columns}
+        self.where = where
+        self.params = list(params)
+        self.filter_text = filter_text
+        self._n_rows: Optional[int] = None
+
+    # ------------------------------------------------------------------
+    # metadados (mesma interface usada pelas ferramentas em DataFrame/ChunkedCSV)
+    # ------------------------------------------------------------------
+    @property
+    def columns(self) -> pd.Index:
+        return pd.Index(list(self._cols))
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return pd.Series({name: pd.api.types.pandas_dtype(c.dtype) for name, c in self._cols.items()},
+                         dtype=object)
+
+    def numeric_columns(self) -> List[str]:
+        return [n for n, c in self._cols.items() if pd.api.types.pandas_dtype(c.dtype).kind in "iuf"]
+
+    def time_columns(self) -> List[str]:
+        return [n for n, c in self._cols.items() if c.kind in ("date", "datetime")]
+
+    @property
+    def n_rows(self) -> int:
+        if self._n_rows is None:
+            self._n_rows = int(self._query(f"SELECT COUNT(*) FROM {self.table}{self._where()}", self.params)[0][0])
+        return self._n_rows
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def describe(self) -> str:
+        rows = f"{self.n_rows:,}".replace(",", ".")
+        return f"{self.label} (SQLite, {rows} linhas, {len(self._cols)} colunas)"
+
+    # ------------------------------------------------------------------
+    # consultas
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        # uma conexão por consulta: as ferramentas rodam em threads paralelas
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        conn.create_function("casefold", 1, _casefold, deterministic=True)
+        return conn
+
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, list(params)).fetchall()
+        finally:
+            conn.close()
+
+    def _where(self, *extra: str) -> str:
+        parts = [p for p in (self.where, *extra) if p]
+        return " WHERE " + " AND ".join(f"({p})" for p in parts) if parts else ""
+
+    def _col(self, name: str) -> SQLColumn:
+        col = self._cols.get(name)
+        if col is None:
+            raise KeyError(f"Coluna '{name}' não encontrada.")
+        return col
+
+    def _numeric(self, name: str) -> SQLColumn:
+        col = self._col(name)
+        if pd.api.types.pandas_dtype(col.dtype).kind not in "iufb":
+            raise ValueError(f"Coluna '{name}' não é numérica.")
+        return col
+
+    def _keys(self, col: SQLColumn, values: Sequence[Any]) -> pd.Index:
+        index = pd.Index(values, name=col.name)
+        if col.kind in ("date", "datetime"):
+            index = pd.DatetimeIndex(pd.to_datetime(index, errors="coerce", format="ISO8601"), name=col.name)
+        return index
+
+    # ------------------------------------------------------------------
+    # filtros
+    # ------------------------------------------------------------------
+    def _param(self, col: SQLColumn, value: Any) -> Any:
+        if isinstance(value, (bool, np.bool_)):
+            return int(value)
+        if isinstance(value, pd.Timestamp):
+            value = value.tz_convert(None) if value.tzinfo is not None else value
+            if col.kind == "date" and value == value.normalize():
+                return value.strftime("%Y-%m-%d")
+            return value.isoformat()
+        if col.kind == "digits" and isinstance(value, str):
+            return re.sub(r"\D", "", value)
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def _node_sql(self, node, params: List[Any], negate: bool = False) -> str:
+        """WHERE equivalente à máscara do pandas: nulo nunca satisfaz uma comparação, mas
+        satisfaz a negação dela (~(x > 1) é True para NaN). As negações descem até as folhas
+        (De Morgan); uma folha negada vira "(cond) IS NOT 1", verdadeiro também para NULL.
+        x != v é ~(x == v) em colunas NumPy (NaN != v) e <> simples nas de pd.NA."""
+        if node.kind == "not":
+            return self._node_sql(node.children[0], params, not negate)
+        if node.kind in ("and", "or"):
+            joiner = {"and": " AND ", "or": " OR "}[node.kind if not negate else ("or" if node.kind == "and" else "and")]
+            return "(" + joiner.join(self._node_sql(c, params, negate) for c in node.children) + ")"
+        col = self._col(node.col)
+        e = col.expr
+        if node.kind == "isna":
+            return f"{e} IS NOT NULL" if negate else f"{e} IS NULL"
+        if node.kind == "notna":
+            return f"{e} IS NULL" if negate else f"{e} IS NOT NULL"
+        if node.kind == "cmp" or node.kind == "colcmp":
+            nullable = _nullable(col) or (node.kind == "colcmp" and _nullable(self._col(node.value)))
+            if node.op == "!=" and not nullable:  # x != v equivale a ~(x == v)
+                op, negate = "=", not negate
+            else:
+                op = _SQL_OPS[node.op]
+            if node.kind == "colcmp":
+                sql = f"{e} {op} {self._col(node.value).expr}"
+            else:
+                params.append(self._param(col, node.value))
+                sql = f"{e} {op} ?"
+        elif node.kind == "isin":
+            if not node.value:
+                sql = "0"
+            else:
+                params.extend(self._param(col, v) for v in node.value)
+                sql = f"{e} IN ({', '.join('?' * len(node.value))})"
+        elif node.kind == "contains":
+            params.append(node.value)
+            sql = f"instr(casefold({e}), ?) > 0"
+        else:  # truthy
+            sql = f"{e} <> 0"
+        return f"({sql}) IS NOT 1" if negate else sql
+
+    def filtered(self, predicate) -> "SQLSource":
+        """Mesma fonte restrita ao filtro (Predicate); filtros sucessivos se acumulam."""
+        params: List[Any] = []
+        sql = self._node_sql(predicate.root, params)
+        where = f"({self.where}) AND ({sql})" if self.where else sql
+        text = f"{self.filter_text} and {predicate.text}" if self.filter_text else predicate.text
+        return SQLSource(self.path, self.table, list(self._cols.values()), self.label,
+                         where, self.params + params, text)
+
+    # ------------------------------------------------------------------
+    # agregações
+    # ------------------------------------------------------------------
+    def value_counts(self, column: str, top: Optional[int] = None) -> Tuple[pd.Series, int]:
+        """(contagens em ordem decrescente, número de valores distintos); nulos contam como valor.
+        Colunas "list" contam cada item do array JSON."""
+        col = self._col(column)
+        limit = min(int(top), SQL_FETCH_LIMIT) if top else SQL_FETCH_LIMIT
+        if col.kind == "list" and col.each:
+            source, value = f"{self.table}, {col.each} AS item", "item.value"
+        else:
+            source, value = self.table, col.expr
+        rows = self._query(
+            f"SELECT {value} AS v, COUNT(*) AS n, COUNT(*) OVER () FROM {source}{self._where()} "
+            f"GROUP BY v ORDER BY n DESC, v LIMIT ?", self.params + [limit])
+        if not rows:
+            return pd.Series(dtype="int64", name="count"), 0
+        counts = pd.Series([r[1] for r in rows], index=self._keys(col, [r[0] for r in rows]),
+                           dtype="int64", name="count")
+        return counts, int(rows[0][2])
+
+    def _present(self, e: str) -> str:
+        # o mesmo que "IS NOT NULL" para números, mas numa forma (intervalo) que o planejador
+        # resolve pelo índice de expressão da coluna, sem reabrir o JSON de cada linha
+        return f"{e} >= -9e999"
+
+    def _moments(self, column: str, with_var: bool = True) -> Dict[str, float]:
+        """count, mean, sum, min, max e (duas passadas, sem cancelamento) var da coluna."""
+        e = self._numeric(column).expr
+        where = self._where(self._present(e))
+        n, mean, total, lo, hi = self._query(
+            f"SELECT COUNT({e}), AVG({e}), TOTAL({e}), MIN({e}), MAX({e}) FROM {self.table}{where}", self.params)[0]
+        out = {"count": float(n), "mean": mean, "sum": total, "min": lo, "max": hi, "var": None}
+        if with_var and n and n > 1:
+            ss = self._query(f"SELECT TOTAL(({e} - ?) * ({e} - ?)) FROM {self.table}{where}",
+                             [mean, mean] + self.params)[0][0]
+            out["var"] = ss / (n - 1)
+        return {k: float("nan") if v is None else float(v) for k, v in out.items()}
+
+    def compute_stat(self, column: str, stat: str) -> float:
+        if stat not in _STATS:
+            raise ValueError(f"Estatística não suportada: {stat}")
+        e = self._numeric(column).expr
+        if stat == "median":  # posição do meio pela ordem do índice da expressão
+            where = self._where(self._present(e))
+            n = int(self._query(f"SELECT COUNT(*) FROM {self.table}{where}", self.params)[0][0])
+            if n == 0:
+                return float("nan")
+            rows = self._query(f"SELECT {e} FROM {self.table}{where} ORDER BY {e} LIMIT ? OFFSET ?",
+                               self.params + [2 - n % 2, (n - 1) // 2])
+            return float(np.mean([r[0] for r in rows]))
+        mom = self._moments(column, with_var=stat in ("std", "var"))
+        if stat == "std":
+            return math.sqrt(mom["var"])
+        return mom[stat]
+
+    def summary(self) -> pd.DataFrame:
+        """count/mean/std/min/max das colunas numéricas (como describe()), coluna a coluna pelos índices."""
+        rows = {}
+        for name in self.numeric_columns():
+            mom = self._moments(name)
+            rows[name] = {"count": mom["count"], "mean": mom["mean"], "std": math.sqrt(mom["var"]),
+                          "min": mom["min"], "max": mom["max"]}
+        return pd.DataFrame(rows, index=["count", "mean", "std", "min", "max"]).T.astype("float64")
+
+    def histogram(self, column: str, bins: int = 30) -> Tuple[np.ndarray, np.ndarray]:
+        """Bins uniformes entre min e max; a contagem por bin é um GROUP BY no banco."""
+        e = self._numeric(column).expr
+        where = self._where(self._present(e))
+        lo, hi, n = self._query(f"SELECT MIN({e}), MAX({e}), COUNT({e}) FROM {self.table}{where}", self.params)[0]
+        if not n:
+            raise ValueError(f"Coluna '{column}' não tem valores numéricos")
+        edges = np.histogram_bin_edges([float(lo), float(hi)], bins=int(bins))
+        width = (edges[-1] - edges[0]) / (len(edges) - 1)
+        # bin estimado pela divisão e corrigido contra as bordas (início + i * largura, as
+        # mesmas contas do linspace do numpy), como no np.histogram: valores sobre uma borda
+        # caem no mesmo bin. Subconsulta em ordem de valor: lida pelo índice, sem reabrir o
+        # JSON de cada linha
+        first, last = float(edges[0]), len(edges) - 2
+        rows = self._query(
+            f"SELECT b - (v < ? + b * ?) + (b < ? AND v >= ? + (b + 1) * ?) AS bin, COUNT(*) "
+            f"FROM (SELECT {e} AS v, MIN(CAST(({e} - ?) / ? AS INTEGER), ?) AS b FROM {self.table}{where} "
+            f"ORDER BY {e}) GROUP BY bin",
+            [first, width, last, first, width, first, width or 1.0, last] + self.params)
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for b, c in rows:
+            counts[int(b)] += c
+        return counts, edges
+
+    def groupby_aggregate(self, by: List[str], aggregations: Dict[str, Any], sort_by: Any = None,
+                          ascending: bool = True, limit: Optional[int] = None) -> Tuple[pd.DataFrame, int]:
+        """Como groupby.groupby_aggregate (mesmas colunas de saída, chaves nulas fora), num único
+        GROUP BY; ordenação e limite também no banco. median por grupo: _group_median."""
+        keys = [self._col(b) for b in by]
+        columns: List[Tuple[str, str]] = []
+        flat = all(isinstance(s, str) for s in aggregations.values())
+        for name, stats in aggregations.items():
+            for st in ([stats] if isinstance(stats, str) else list(stats)):
+                if st not in _STATS:
+                    raise ValueError(f"Estatística não suportada: {st}")
+                columns.append((name, st))
+        key_sql = [k.expr for k in keys]
+        where = self._where(*(f"{k} IS NOT NULL" for k in key_sql))
+
+        # deslocamento pela média da coluna: variâncias por grupo sem cancelamento numérico
+        shifts: Dict[str, float] = {}
+        for name in dict.fromkeys(c for c, st in columns if st in ("std", "var")):
+            mean = self._moments(name, with_var=False)["mean"]
+            shifts[name] = 0.0 if math.isnan(mean) else mean
+
+        select, params = [], []
+        for name, st in columns:
+            e = self._numeric(name).expr if st != "count" else self._col(name).expr
+            if st in ("std", "var"):
+                # (soma dos quadrados - soma²/n) / (n - 1), com valores deslocados
+                select.append(f"(TOTAL(({e} - ?) * ({e} - ?)) - TOTAL({e} - ?) * TOTAL({e} - ?) / COUNT({e}))"
+                              f" / NULLIF(COUNT({e}) - 1, 0)")
+                params += [shifts[name]] * 4
+            elif st == "median":
+                select.append("NULL")  # preenchida abaixo
+            else:
+                select.append({"mean": "AVG", "sum": "SUM", "count": "COUNT", "min": "MIN", "max": "MAX"}[st] + f"({e})")
+
+        pos = _resolve_sort(columns, sort_by)
+        has_median = any(st == "median" for _, st in columns)
+        key_refs = ", ".join(str(i + 1) for i in range(len(keys)))
+        order = key_refs
+        if pos is not None and not has_median:
+            order = f"{len(keys) + pos + 1} {'ASC' if ascending else 'DESC'} NULLS LAST, {key_refs}"
+        k = int(limit) if isinstance(limit, int) and limit > 0 and not (has_median and pos is not None) else SQL_FETCH_LIMIT
+        rows = self._query(
+            f"SELECT {', '.join(key_sql)}, {', '.join(select)}, COUNT(*) OVER () FROM {self.table}{where} "
+            f"GROUP BY {key_refs} ORDER BY {order} LIMIT ?",
+            params + self.params + [min(k, SQL_FETCH_LIMIT)])
+        n_groups = int(rows[0][-1]) if rows else 0
+        nk = len(keys)
+        index = (self._keys(keys[0], [r[0] for r in rows]) if nk == 1 else
+                 pd.MultiIndex.from_arrays([self._keys(kc, [r[i] for r in rows]) for i, kc in enumerate(keys)],
+                                           names=by))
+        data = {}
+        for j, (name, st) in enumerate(columns):
+            values = pd.Series([r[nk + j] for r in rows], index=index, dtype="float64" if st != "count" else "int64")
+            if st == "std":
+                values = np.sqrt(values.clip(lower=0))
+            elif st == "var":
+                values = values.clip(lower=0)
+            elif st == "median":
+                values = self._group_median(keys, name, where).reindex(index)
+            data[j] = values
+        out = pd.DataFrame(data, index=index)
+        out.columns = [c for c, _ in columns] if flat else pd.MultiIndex.from_tuples(columns)
+        if has_median and pos is not None:
+            out = out.sort_values(by=out.columns[pos], ascending=ascending, na_position="last", kind="stable")
+            if isinstance(limit, int) and limit > 0:
+                out = out.head(limit)
+        return out, n_groups
+
+    def time_range(self, column: str) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        e = self._col(column).expr
+        lo, hi = self._query(f"SELECT MIN({e}), MAX({e}) FROM {self.table}{self._where()}", self.params)[0]
+        if lo is None:
+            raise ValueError(f"A coluna '{column}' não tem instantes válidos.")
+        return _timestamp(lo), _timestamp(hi)
+
+    def period_aggregate(self, time_column: str, offset, aggregations: Dict[str, Any]) -> Tuple[pd.DataFrame, int]:
+        """groupby_aggregate pelo período (offset do pandas) de uma coluna de datas, em ordem
+        cronológica: (agregados indexados pelo início de cada período, nº de períodos)."""
+        t = self._col(time_column)
+        if t.kind not in ("date", "datetime"):
+            raise ValueError(f"Coluna '{time_column}' não é de datas.")
+        # sem índice para o período, cada linha é lida da tabela: as expressões (JSON) são
+        # avaliadas uma vez numa subconsulta (LIMIT -1 impede que o SQLite a desfaça e repita
+        # a expressão em cada agregado) e o GROUP BY trabalha sobre os valores prontos
+        used = [self._col(name) for name in dict.fromkeys([time_column, *aggregations])]
+        inner = ", ".join(f'{c.expr} AS "{c.name}"' for c in used)
+        table = f"(SELECT {inner} FROM {self.table}{self._where()} LIMIT -1)"
+        cols = [replace(c, expr=f'"{c.name}"', each=None) for c in used]
+        period = SQLColumn("__periodo", _period_sql(f'"{t.name}"', offset), "datetime64[us]", "datetime")
+        source = SQLSource(self.path, table, cols + [period], self.label, "", self.params, self.filter_text)
+        out, n_periods = source.groupby_aggregate([period.name], aggregations)
+        return out.rename_axis(None), n_periods
+
+    def _group_median(self, keys: List[SQLColumn], name: str, where: str) -> pd.Series:
+        """Mediana por grupo sem materializar a coluna: as contagens por grupo dão a posição do
+        meio de cada um na sequência ordenada por (chaves, valor), que é percorrida uma vez em
+        blocos (pelo índice chave + valor, quando existe)."""
+        e = self._numeric(name).expr
+        part = ", ".join(k.expr for k in keys)
+        where = f"{where} AND ({self._present(e)})" if where else f" WHERE {self._present(e)}"
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")  # as duas consultas veem o mesmo estado da tabela
+            groups = conn.execute(f"SELECT {part}, COUNT(*) FROM {self.table}{where} GROUP BY {part} ORDER BY {part}",
+                                  self.params).fetchall()
+            n = np.array([g[-1] for g in groups], dtype=np.int64)
+            start = np.cumsum(n) - n
+            lo, hi = start + (n - 1) // 2, start + n // 2
+            wanted = np.unique(np.concatenate([lo, hi]))
+            found: Dict[int, float] = {}
+            cursor = conn.execute(f"SELECT {e} FROM {self.table}{where} ORDER BY {part}, {e}", self.params)
+            pos, i = 0, 0
+            while i < len(wanted):
+                block = cursor.fetchmany(SQL_STREAM_ROWS)
+                if not block:
+                    break
+                while i < len(wanted) and wanted[i] < pos + len(block):
+                    found[int(wanted[i])] = block[wanted[i] - pos][0]
+                    i += 1
+                pos += len(block)
+        finally:
+            conn.close()
+        nk = len(keys)
+        index = (self._keys(keys[0], [g[0] for g in groups]) if nk == 1 else
+                 pd.MultiIndex.from_arrays([self._keys(kc, [g[i] for g in groups]) for i, kc in enumerate(keys)],
+                                           names=[k.name for k in keys]))
+        return pd.Series([(found[a] + found[b]) / 2 for a, b in zip(lo.tolist(), hi.tolist())],
+                         index=index, dtype="float64")
@@ -1,5 +1,9 @@
 # funções utilitárias para HTML de DataFrame
 # Conversores de DataFrame para HTML com estilos simples.
+import warnings
+from typing import Any, Dict, Optional
+
+import numpy as np
 import pandas as pd
 
 
@@ -32,4 +36,59 @@ def stylize(df: pd.DataFrame, max_rows: int = 200):
         df.style
           .format(precision=4)
           .background_gradient(axis=None)
-    )
\ No newline at end of file
+    )
+
+class TableResult:
+    """Resultado tabular compacto: arrays por coluna + metadados de resumo.
+    Nada de Styler no caminho da ferramenta: paginação e estilo são aplicados só às
+    linhas exibidas (styled_page), e o resultado completo continua disponível (to_csv_bytes)."""
+
+    def __init__(self, df: pd.DataFrame, title: str = ""):
+        self.title = title
+        self.index = df.index
+        self.columns = df.columns
+        self.arrays = [df.iloc[:, i].to_numpy() for i in range(df.shape[1])]
+        self.n_rows = len(df)
+        numeric = [a for a in self.arrays if a.dtype.kind in "ifu" and len(a)]
+        # escala global do gradiente: cores consistentes entre páginas
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.vmin = float(np.nanmin([np.nanmin(a) for a in numeric])) if numeric else None
+            self.vmax = float(np.nanmax([np.nanmax(a) for a in numeric])) if numeric else None
+
+    @property
+    def shape(self):
+        return self.n_rows, len(self.columns)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"title": self.title, "rows": self.n_rows, "columns": [str(c) for c in self.columns],
+                "min": self.vmin, "max": self.vmax}
+
+    def n_pages(self, page_size: int) -> int:
+        return max(1, -(-self.n_rows // page_size))
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        sl = slice(start, stop)
+        out = pd.DataFrame({i: a[sl] for i, a in enumerate(self.arrays)}, index=self.index[sl])
+        out.columns = self.columns
+        return out
+
+    def page(self, page: int, page_size: int = 50) -> pd.DataFrame:
+        start = page * page_size
+        return self.to_frame(start, start + page_size)
+
+    def styled_page(self, page: int, page_size: int = 50):
+        """Styler apenas das linhas da página (mesmo visual de stylize)."""
+        styler = self.page(page, page_size).style.format(precision=4)
+        if self.vmin is not None and np.isfinite(self.vmin) and np.isfinite(self.vmax):
+            styler = styler.background_gradient(axis=None, vmin=self.vmin, vmax=self.vmax)
+        return styler
+
+    def to_csv_bytes(self) -> bytes:
+        return self.to_frame().to_csv().encode("utf-8")
+
+
+def to_table(df: pd.DataFrame, title: str = "") -> TableResult:
+    if df is None:
+        df = pd.DataFrame({"info": ["Sem dados"]})
+    return TableResult(df, title=title)
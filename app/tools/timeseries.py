@@ -0,0 +1,517 @@
+# séries temporais: agregação por período, janelas móveis e acumuladas
+# A coluna de tempo é detectada (datas, texto com datas ou segundos decorridos, como o Time do
+# dataset de fraudes) e convertida uma vez por dataset: a ordem cronológica das linhas e o
+# índice de instantes ordenado ficam em cache (dataset_cache) para as perguntas seguintes.
+# Cada período vira um estado mergeável (n, média, M2, min, max): reamostragem, janelas móveis
+# e acumuladas saem desses estados com operações vetorizadas, do mesmo jeito em memória,
+# out-of-core (estados combinados chunk a chunk) e na fonte SQL (um GROUP BY por período).
+# A série devolvida para o gráfico é decimada (min/max por faixa) para no máximo
+# TIMESERIES_MAX_POINTS pontos: anos de dados por segundo não viram milhões de pontos no PNG.
+import os
+import re
+import warnings
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries import offsets
+from pandas.tseries.frequencies import to_offset
+
+from .cache import dataset_cache
+from .chunked import ChunkedCSV, is_out_of_core
+from .columns import fold
+from .sqlsource import SQL_FETCH_LIMIT, is_sql_source
+
+# pontos máximos da série enviada ao gráfico (a tabela traz a série completa)
+TIMESERIES_MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", "2000"))
+# períodos visados quando a frequência não é informada
+TIMESERIES_TARGET_PERIODS = int(os.getenv("TIMESERIES_TARGET_PERIODS", "400"))
+# acima disso a frequência pedida é fina demais para o intervalo dos dados: a série sai na
+# frequência mais fina (de _AUTO_FREQS) que cabe, e o resultado informa a troca
+TIMESERIES_MAX_PERIODS = int(os.getenv("TIMESERIES_MAX_PERIODS", "1000000"))
+# fração mínima de valores convertidos para uma coluna de texto ser tratada como tempo
+TIME_PARSE_MIN_RATE = 0.9
+_PROBE_ROWS = 1000
+
+STATS = ("count", "sum", "mean", "median", "std", "min", "max")
+MODES = ("resample", "rolling", "expanding")
+DEFAULT_WINDOW = 7
+
+# origem dos "segundos decorridos": os instantes viram datas a partir de 1970-01-01
+_EPOCH = pd.Timestamp(0)
+_TIME_WORDS = {"time", "timestamp", "date", "datetime", "data", "dt", "hora", "horario", "instante",
+               "created", "updated", "emissao", "periodo", "dia"}
+_FREQ_ALIASES = {
+    "s": "s", "seg": "s", "segundo": "s", "segundos": "s",
+    "t": "min", "min": "min", "minuto": "min", "minutos": "min",
+    "h": "h", "hora": "h", "horas": "h",
+    "d": "D", "dia": "D", "dias": "D",
+    "w": "W-MON", "semana": "W-MON", "semanas": "W-MON",
+    "m": "MS", "me": "MS", "ms": "MS", "mes": "MS", "meses": "MS",
+    "q": "QS", "qe": "QS", "qs": "QS", "trimestre": "QS",
+    "y": "YS", "a": "YS", "ye": "YS", "ys": "YS", "ano": "YS", "anos": "YS",
+}
+# (frequência, duração aproximada, só para datas de calendário)
+_AUTO_FREQS = [
+    ("s", pd.Timedelta(seconds=1), False), ("min", pd.Timedelta(minutes=1), False),
+    ("5min", pd.Timedelta(minutes=5), False), ("15min", pd.Timedelta(minutes=15), False),
+    ("h", pd.Timedelta(hours=1), False), ("6h", pd.Timedelta(hours=6), False),
+    ("D", pd.Timedelta(days=1), False), ("W-MON", pd.Timedelta(days=7), True),
+    ("7D", pd.Timedelta(days=7), False), ("MS", pd.Timedelta(days=30.44), True),
+    ("QS", pd.Timedelta(days=91.3), True), ("YS", pd.Timedelta(days=365.25), True),
+]
+
+
+# -----------------------------------------------------------------------------
+# Coluna de tempo
+# -----------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class TimeFormat:
+    """Como converter a coluna: "datetime" (já é data), "text" (pd.to_datetime com `options`)
+    ou "elapsed" (número de segundos desde o início)."""
+    kind: str
+    options: Tuple[Tuple[str, Any], ...] = ()
+
+    def convert(self, s: pd.Series) -> pd.DatetimeIndex:
+        """Instantes como DatetimeIndex sem fuso (UTC); NaT onde não converte."""
+        if self.kind == "elapsed":
+            seconds = pd.to_numeric(s, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            return pd.DatetimeIndex(_EPOCH + pd.to_timedelta(seconds, unit="s"))
+        if self.kind == "datetime":
+            values = pd.DatetimeIndex(s)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                values = pd.DatetimeIndex(pd.to_datetime(s, errors="coerce", **dict(self.options)))
+        return values.tz_convert(None) if values.tz is not None else values
+
+
+def _name_hint(name: Any) -> bool:
+    return bool(_TIME_WORDS & set(re.split(r"[^a-z0-9]+", fold(name))))
+
+
+def _text_format(sample: pd.Series) -> Optional[TimeFormat]:
+    """Formato que converte ao menos TIME_PARSE_MIN_RATE dos valores não nulos da amostra."""
+    sample = sample.dropna().astype(str).head(_PROBE_ROWS)
+    if sample.empty or not sample.str.contains(r"\d", regex=True).all():
+        return None
+    for options in ((("format", "ISO8601"),), (("dayfirst", True),)):
+        fmt = TimeFormat("text", options)
+        if fmt.convert(sample).notna().mean() >= TIME_PARSE_MIN_RATE:
+            return fmt
+    return None
+
+
+def _detect(frame: pd.DataFrame, column: Optional[str] = None) -> Tuple[str, TimeFormat]:
+    """(coluna, formato). Sem `column`: a primeira coluna de datas; senão a primeira com nome de
+    tempo (time, data, created_at...) que converta; senão a primeira coluna de texto com datas."""
+    candidates = [column] if column is not None else list(frame.columns)
+    for c in candidates:
+        if pd.api.types.is_datetime64_any_dtype(frame[c].dtype):
+            return c, TimeFormat("datetime")
+    if column is None:
+        candidates = [c for c in candidates if _name_hint(c)] + [c for c in candidates if not _name_hint(c)]
+    for c in candidates:
+        dtype = frame[c].dtype
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            if column is not None or _name_hint(c):  # números só com nome de tempo (ou pedidos)
+                return c, TimeFormat("elapsed")
+        elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            fmt = _text_format(frame[c])
+            if fmt is not None:
+                return c, fmt
+    if column is not None:
+        raise ValueError(f"A coluna '{column}' não parece conter datas ou instantes.")
+    raise ValueError("Nenhuma coluna de tempo encontrada; informe time_column.")
+
+
+def time_format(df, column: Optional[str] = None) -> Tuple[str, TimeFormat]:
+    """Coluna de tempo do dataset (detectada uma vez) e como convertê-la."""
+    cache = dataset_cache(df)
+    key = ("time_format", column)
+    found = cache.get(key)
+    if found is None:
+        frame = df._head if is_out_of_core(df) else df  # out-of-core: o primeiro bloco lido
+        found = cache[key] = _detect(frame, column)
+    return found
+
+
+@dataclass
+class TimeIndex:
+    """Instantes válidos em ordem cronológica (order = posições das linhas correspondentes)."""
+    column: str
+    format: TimeFormat
+    order: np.ndarray
+    index: pd.DatetimeIndex
+
+    @property
+    def elapsed(self) -> bool:
+        return self.format.kind == "elapsed"
+
+
+def time_index(df: pd.DataFrame, column: Optional[str] = None) -> TimeIndex:
+    """TimeIndex em cache: a coluna é convertida e ordenada uma única vez por dataset."""
+    column, fmt = time_format(df, column)
+    cache = dataset_cache(df)
+    key = ("time_index", column)
+    ti = cache.get(key)
+    if ti is None:
+        values = fmt.convert(df[column])
+        ns = values.asi8
+        valid = np.flatnonzero(~values.isna())
+        order = valid[np.argsort(ns[valid], kind="stable")]
+        ti = cache[key] = TimeIndex(column, fmt, order, values[order])
+    return ti
+
+
+# -----------------------------------------------------------------------------
+# Frequência e janela
+# -----------------------------------------------------------------------------
+
+def _offset(alias: str) -> offsets.BaseOffset:
+    # dias viram horas: Day não é uma duração fixa no pandas (e o resample ignora origin="epoch"
+    # com ele), então "7D" seria ancorado no primeiro dia de cada chunk
+    offset = to_offset(alias)
+    return offsets.Hour(24 * offset.n) if isinstance(offset, offsets.Day) else offset
+
+
+def freq_label(offset) -> str:
+    """Apelido da frequência para exibição ("D", "7D", "15min", "W-MON", "MS"...)."""
+    if isinstance(offset, offsets.Hour) and offset.n % 24 == 0:
+        days = offset.n // 24
+        return "D" if days == 1 else f"{days}D"
+    return offset.freqstr
+
+
+def _is_calendar(offset) -> bool:
+    return not isinstance(offset, offsets.Tick)
+
+
+def parse_freq(freq: str) -> offsets.BaseOffset:
+    """'h', '15min', 'D', 'W', 'M'/'MS', 'Q', 'Y' (e 'hora', 'dia', 'semana', 'mes', 'ano') ->
+    offset do pandas. Semanas começam na segunda; meses, trimestres e anos no primeiro dia."""
+    m = re.fullmatch(r"\s*(\d*)\s*([a-z]+)\s*", fold(freq or ""))
+    alias = _FREQ_ALIASES.get(m.group(2)) if m else None
+    if alias is None:
+        raise ValueError(f"frequência inválida: {freq!r} (ex.: 's', '15min', 'h', 'D', 'W', 'MS', 'YS').")
+    n = int(m.group(1) or 1)
+    if n < 1:
+        raise ValueError(f"frequência inválida: {freq!r}.")
+    return _offset(f"{n}{alias}")
+
+
+def _resample_options(offset) -> Dict[str, Any]:
+    # períodos rotulados pelo início; frequências fixas alinhadas à época (iguais em todo chunk)
+    if isinstance(offset, offsets.Week):
+        return {"label": "left", "closed": "left"}
+    return {"origin": "epoch"} if not _is_calendar(offset) else {}
+
+
+def _duration(offset) -> pd.Timedelta:
+    if not _is_calendar(offset):
+        return pd.Timedelta(offset.nanos, unit="ns")
+    for alias, duration, _ in _AUTO_FREQS:
+        if type(_offset(alias)) is type(offset):
+            return duration * offset.n
+    return pd.Timedelta(days=offset.n)
+
+
+def _auto_freq(start: pd.Timestamp, end: pd.Timestamp, elapsed: bool) -> offsets.BaseOffset:
+    span = max(end - start, pd.Timedelta(seconds=1))
+    choices = [(a, d) for a, d, calendar in _AUTO_FREQS if not (elapsed and calendar)]
+    for alias, duration in choices:
+        if span / duration <= TIMESERIES_TARGET_PERIODS:
+            return _offset(alias)
+    return _offset(choices[-1][0])
+
+
+def _fit_freq(offset, start: pd.Timestamp, end: pd.Timestamp, elapsed: bool,
+              max_periods: int = TIMESERIES_MAX_PERIODS) -> offsets.BaseOffset:
+    """offset, ou — se der mais de max_periods períodos no intervalo dos dados — a frequência
+    mais fina de _AUTO_FREQS, não mais fina que a pedida, que cabe."""
+    if elapsed and _is_calendar(offset):
+        raise ValueError("a coluna de tempo é de segundos decorridos: use frequências fixas (s, min, h, D).")
+    span = end - start
+    if span / _duration(offset) <= max_periods:
+        return offset
+    choices = [(a, d) for a, d, calendar in _AUTO_FREQS if not (elapsed and calendar) and d >= _duration(offset)]
+    for alias, duration in choices:
+        if span / duration <= max_periods:
+            return _offset(alias)
+    return _offset(choices[-1][0]) if choices else offset
+
+
+def _window(window: Any):
+    """Nº de períodos (inteiro) ou duração ('7D', '12h')."""
+    if window is None or window == "":
+        return DEFAULT_WINDOW
+    if isinstance(window, (int, np.integer)) or str(window).strip().isdigit():
+        if int(window) < 1:
+            raise ValueError("a janela deve ter ao menos 1 período.")
+        return int(window)
+    try:
+        return pd.Timedelta(str(window))
+    except ValueError:
+        raise ValueError(f"janela inválida: {window!r} (ex.: 7 períodos ou '7D').") from None
+
+
+# -----------------------------------------------------------------------------
+# Estados por período: n, média, M2 (soma dos quadrados dos desvios), min, max
+# -----------------------------------------------------------------------------
+
+_PARTIALS = ["n", "mean", "m2", "min", "max"]
+
+
+def _partials(times: pd.DatetimeIndex, values: Optional[np.ndarray], offset) -> pd.DataFrame:
+    """Estados por período (vetorizado: um resample por estatística). Sem `values`, só n
+    (linhas por período)."""
+    options = _resample_options(offset)
+    if values is None:
+        n = pd.Series(np.ones(len(times)), index=times).resample(offset, **options).size()
+        return pd.DataFrame({"n": n.astype("float64")}).reindex(columns=_PARTIALS)
+    r = pd.Series(values, index=times).resample(offset, **options)
+    n = r.count().astype("float64")
+    return pd.DataFrame({"n": n, "mean": r.mean(), "m2": r.var(ddof=0) * n, "min": r.min(), "max": r.max()})
+
+
+def _merge_partials(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Combina estados de dois blocos, período a período (fórmula de Chan)."""
+    index = a.index.union(b.index)
+    a, b = a.reindex(index), b.reindex(index)
+    na, nb = a["n"].fillna(0), b["n"].fillna(0)
+    n = na + nb
+    ma, mb = a["mean"].fillna(0), b["mean"].fillna(0)
+    delta = mb - ma
+    safe = n.where(n > 0, 1)
+    out = pd.DataFrame({
+        "n": n,
+        "mean": (ma + delta * nb / safe).where(n > 0),
+        "m2": a["m2"].fillna(0) + b["m2"].fillna(0) + delta ** 2 * na * nb / safe,
+        "min": np.fmin(a["min"], b["min"]),
+        "max": np.fmax(a["max"], b["max"]),
+    })
+    if a["mean"].isna().all() and b["mean"].isna().all():  # só contagens
+        out[["mean", "m2"]] = np.nan
+    return out
+
+
+def _complete(partials: pd.DataFrame, offset) -> pd.DataFrame:
+    """Todos os períodos entre o primeiro e o último (vazios com n = 0), como no resample."""
+    if partials.empty:
+        return partials
+    full = pd.date_range(partials.index.min(), partials.index.max(), freq=offset)
+    out = partials.reindex(full)
+    out["n"] = out["n"].fillna(0)
+    if out["m2"].notna().any():
+        out["m2"] = out["m2"].fillna(0)
+    return out
+
+
+def _combine(partials: pd.DataFrame, mode: str, window) -> pd.DataFrame:
+    """Estados das janelas (móvel ou acumulada) terminando em cada período."""
+    def roll(s: pd.Series):
+        return s.rolling(window, min_periods=1) if mode == "rolling" else s.expanding()
+
+    n = partials["n"].fillna(0)
+    total = n.sum()
+    # deslocamento pela média global: somas de quadrados sem cancelamento numérico
+    shift = float((n * partials["mean"].fillna(0)).sum() / total) if total else 0.0
+    d = partials["mean"].fillna(shift) - shift
+    nw = roll(n).sum()
+    s1 = roll(n * d).sum()
+    s2 = roll(partials["m2"].fillna(0) + n * d ** 2).sum()
+    safe = nw.where(nw > 0, 1)
+    return pd.DataFrame({
+        "n": nw,
+        "mean": (shift + s1 / safe).where(nw > 0),
+        "m2": (s2 - s1 ** 2 / safe).clip(lower=0),
+        "min": roll(partials["min"]).min(),
+        "max": roll(partials["max"]).max(),
+    })
+
+
+def _stat(state: pd.DataFrame, stat: str) -> pd.Series:
+    n = state["n"]
+    if stat == "count":
+        return n.astype("int64")
+    if stat == "sum":
+        return (state["mean"] * n).fillna(0.0)
+    if stat == "mean":
+        return state["mean"]
+    if stat == "std":
+        return np.sqrt(state["m2"] / (n - 1).where(n > 1))
+    return state[stat]
+
+
+# -----------------------------------------------------------------------------
+# Série temporal
+# -----------------------------------------------------------------------------
+
+@dataclass
+class TimeSeries:
+    """Resultado completo (um valor por período, rotulado pelo início dele)."""
+    series: pd.Series
+    time_column: str
+    column: Optional[str]
+    stat: str
+    mode: str
+    freq: str
+    window: Any
+    elapsed: bool
+    auto_freq: bool
+    requested_freq: Optional[str] = None  # pedida, quando fina demais e trocada por `freq`
+
+    def table(self) -> pd.DataFrame:
+        s = self.series
+        if self.elapsed:  # segundos decorridos: rótulos como durações desde o início
+            s = s.set_axis(pd.TimedeltaIndex(s.index - _EPOCH, name="tempo decorrido"))
+        else:
+            s = s.rename_axis(self.time_column)
+        return s.to_frame(name=self.label)
+
+    @property
+    def label(self) -> str:
+        what = "linhas" if self.column is None else f"{self.stat}({self.column})"
+        if self.mode == "rolling":
+            window = f"{self.window} períodos" if isinstance(self.window, int) else str(self.window)
+            return f"{what}, janela móvel de {window}"
+        if self.mode == "expanding":
+            return f"{what}, acumulado"
+        return what
+
+    def plot_series(self, max_points: int = TIMESERIES_MAX_POINTS) -> pd.Series:
+        """Série decimada para o gráfico; segundos decorridos viram horas desde o início."""
+        s = decimate(self.series, max_points)
+        if self.elapsed:
+            s = s.set_axis(pd.Index((s.index - _EPOCH) / pd.Timedelta(hours=1), name="horas desde o início"))
+        return s
+
+
+def decimate(series: pd.Series, max_points: int = TIMESERIES_MAX_POINTS) -> pd.Series:
+    """No máximo max_points pontos: em cada faixa de posições, o menor e o maior valor (picos
+    e vales preservados, na ordem original)."""
+    s = series.dropna()
+    if len(s) <= max_points:
+        return s
+    buckets = max(max_points // 2, 1)
+    bucket = np.arange(len(s)) * buckets // len(s)
+    values = pd.Series(s.to_numpy(dtype=np.float64))
+    g = values.groupby(bucket)
+    keep = np.unique(np.concatenate([g.idxmin().to_numpy(), g.idxmax().to_numpy()]))
+    return s.iloc[keep]
+
+
+def _validate(column: Optional[str], stat: Optional[str], mode: str) -> str:
+    if mode not in MODES:
+        raise ValueError(f"mode deve ser um de {', '.join(MODES)}.")
+    stat = stat or ("count" if column is None else "mean")
+    if stat not in STATS:
+        raise ValueError(f"estatística não suportada: {stat}")
+    if column is None and stat != "count":
+        raise ValueError(f"informe a coluna para calcular {stat} por período.")
+    if stat == "median" and mode != "resample":
+        raise ValueError("a mediana não se combina entre períodos; use mode='resample'.")
+    return stat
+
+
+def _frame_states(df: pd.DataFrame, column, time_column, freq, stat) -> Tuple[pd.DataFrame, Optional[pd.Series], Any, bool]:
+    ti = time_index(df, time_column)
+    if len(ti.index) == 0:
+        raise ValueError(f"A coluna '{ti.column}' não tem instantes válidos.")
+    start, end = ti.index[0], ti.index[-1]
+    offset = _fit_freq(parse_freq(freq) if freq else _auto_freq(start, end, ti.elapsed), start, end, ti.elapsed)
+    values = None
+    if column is not None:
+        values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)[ti.order]
+    states = _partials(ti.index, values, offset)
+    median = None
+    if stat == "median":
+        median = pd.Series(values, index=ti.index).resample(offset, **_resample_options(offset)).median()
+    return states, median, (ti.column, offset), ti.elapsed
+
+
+def _chunked_states(src: ChunkedCSV, column, time_column, freq, stat) -> Tuple[pd.DataFrame, None, Any, bool]:
+    if stat == "median":
+        raise ValueError("a mediana por período não está disponível no modo out-of-core.")
+    time_column, fmt = time_format(src, time_column)
+    elapsed = fmt.kind == "elapsed"
+    usecols = [time_column] + ([column] if column is not None and column != time_column else [])
+    offset = parse_freq(freq) if freq else None
+    if elapsed and offset is not None and _is_calendar(offset):
+        raise ValueError("a coluna de tempo é de segundos decorridos: use frequências fixas (s, min, h, D).")
+    # intervalo dos dados (lê só a coluna de tempo): escolhe a frequência ou confere se a pedida cabe
+    start = end = None
+    for chunk in src.iter_chunks(usecols=[time_column]):
+        t = fmt.convert(chunk[time_column]).dropna()
+        if len(t):
+            start = t.min() if start is None else min(start, t.min())
+            end = t.max() if end is None else max(end, t.max())
+    if start is None:
+        raise ValueError(f"A coluna '{time_column}' não tem instantes válidos.")
+    offset = _fit_freq(offset or _auto_freq(start, end, elapsed), start, end, elapsed)
+    states: Optional[pd.DataFrame] = None
+    for chunk in src.iter_chunks(usecols=usecols):
+        times = fmt.convert(chunk[time_column])
+        ok = ~times.isna()
+        values = None
+        if column is not None:
+            values = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=np.float64)[ok]
+        part = _partials(times[ok], values, offset)
+        part = part[part["n"] > 0]  # períodos vazios do bloco; o conjunto é completado no fim
+        states = part if states is None else _merge_partials(states, part)
+    if states is None or states.empty:
+        raise ValueError(f"A coluna '{time_column}' não tem instantes válidos.")
+    return _complete(states.sort_index(), offset), None, (time_column, offset), elapsed
+
+
+def _sql_states(src, column, time_column, freq, stat) -> Tuple[pd.DataFrame, Optional[pd.Series], Any, bool]:
+    if time_column is None:
+        names = src.time_columns()
+        if not names:
+            raise ValueError("Nenhuma coluna de tempo encontrada; informe time_column.")
+        time_column = names[0]
+    # cada período é uma linha do GROUP BY: o limite também é o de linhas trazidas do banco
+    start, end = src.time_range(time_column)
+    offset = _fit_freq(parse_freq(freq) if freq else _auto_freq(start, end, False), start, end, False,
+                       min(TIMESERIES_MAX_PERIODS, SQL_FETCH_LIMIT))
+    if column is None:
+        out, n_periods = src.period_aggregate(time_column, offset, {time_column: "count"})
+        states = pd.DataFrame({"n": out[time_column].astype("float64")}).reindex(columns=_PARTIALS)
+    else:
+        # a variância custa uma passada a mais (a média que a desloca): só quando pedida
+        stats = ["count", "mean", "min", "max"] + (["var"] if stat == "std" else []) + \
+            (["median"] if stat == "median" else [])
+        out, n_periods = src.period_aggregate(time_column, offset, {column: stats})
+        out.columns = stats
+        n = out["count"].astype("float64")
+        m2 = (out["var"] * (n - 1)).where(n > 1, 0.0) if stat == "std" else 0.0
+        states = pd.DataFrame({"n": n, "mean": out["mean"], "m2": m2, "min": out["min"], "max": out["max"]})
+    if n_periods > len(states):
+        raise ValueError("frequência fina demais para o intervalo dos dados; use uma frequência maior.")
+    states = _complete(states, offset)
+    median = out["median"].reindex(states.index) if stat == "median" else None
+    return states, median, (time_column, offset), False
+
+
+def time_series(df, column: Optional[str] = None, time_column: Optional[str] = None, freq: Optional[str] = None,
+                stat: Optional[str] = None, mode: str = "resample", window: Any = None) -> TimeSeries:
+    """Série de `stat` de `column` (ou da contagem de linhas) por período de `freq` (escolhida
+    pelo intervalo dos dados se omitida); mode "rolling" (janela de `window` períodos ou uma
+    duração) ou "expanding" (acumulado desde o início) combinam os estados dos períodos."""
+    stat = _validate(column, stat, mode)
+    win = _window(window) if mode == "rolling" else None
+    if is_sql_source(df):
+        states, median, (time_column, offset), elapsed = _sql_states(df, column, time_column, freq, stat)
+    elif is_out_of_core(df):
+        states, median, (time_column, offset), elapsed = _chunked_states(df, column, time_column, freq, stat)
+    else:
+        states, median, (time_column, offset), elapsed = _frame_states(df, column, time_column, freq, stat)
+    if mode != "resample":
+        states = _combine(states, mode, win)
+    series = median if stat == "median" else _stat(states, stat)
+    label = freq_label(offset)
+    requested = freq_label(parse_freq(freq)) if freq else None
+    return TimeSeries(series.rename(column or "linhas"), time_column, column, stat, mode, label, win, elapsed,
+                      auto_freq=not freq, requested_freq=requested if requested not in (None, label) else None)
@@ -0,0 +1,289 @@
+# benchmark das ferramentas de EDA (router._tool_*), dos gráficos (plots) e das tabelas (tables)
+# sobre datasets sintéticos: de 10 mil a 50 milhões de linhas, de 5 a 1000 colunas, com tipos
+# mistos, nulos e um alvo raro (Class). Roda offline (nenhuma chamada à OpenAI), mede tempo
+# (frio = cache do dataset limpo; quente = repetição com cache) e pico de memória (tracemalloc),
+# grava JSON e compara com uma execução anterior, apontando regressões acima de um limiar.
+#
+#   python benchmarks/eda.py run --preset default --out bench.json
+#   python benchmarks/eda.py run --preset smoke --compare bench.json --threshold 0.2
+#   python benchmarks/eda.py compare base.json novo.json
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+os.environ.pop("OPENAI_API_KEY", None)  # garante que nada fala com a API
+
+import numpy as np
+import pandas as pd
+
+from app.agent.registry import output_size
+
+# (linhas, colunas) por preset; casos acima de --max-memory-gb são pulados
+PRESETS: Dict[str, List[Tuple[int, int]]] = {
+    "smoke": [(10_000, 5), (100_000, 30)],
+    "default": [(10_000, 5), (100_000, 30), (1_000_000, 30), (100_000, 200), (10_000, 1000)],
+    "large": [(1_000_000, 30), (10_000_000, 30), (50_000_000, 5), (1_000_000, 200), (200_000, 1000)],
+}
+FRAUD_RATE = 0.0017
+NULL_RATE = 0.01
+CATEGORIES = ["online", "varejo", "posto", "restaurante", "viagem", "saude", "educacao", "outros"]
+
+
+# -----------------------------------------------------------------------------
+# Dados sintéticos
+# -----------------------------------------------------------------------------
+
+def estimate_bytes(rows: int, cols: int) -> int:
+    # float64 na maioria das colunas + folga para cópias temporárias das ferramentas
+    return int(rows * cols * 8 * 2.5)
+
+
+def make_dataset(rows: int, cols: int, seed: int = 0, null_rate: float = NULL_RATE,
+                 fraud_rate: float = FRAUD_RATE) -> pd.DataFrame:
+    """Dataset no formato do creditcard.csv (Time, V1..Vk, Amount, Class) com tipos mistos:
+    a partir de 5 colunas há uma categórica (merchant_type) e uma inteira (n_items); ~1/3 das
+    colunas V têm nulos. Class é rara (fraud_rate) e desloca algumas colunas V."""
+    rng = np.random.default_rng(seed)
+    cls = (rng.random(rows) < fraud_rate).astype(np.int64)
+    data: Dict[str, Any] = {"Time": np.sort(rng.integers(0, 172_800, rows)).astype(np.float64)}
+    n_extra = 2 if cols >= 5 else 0
+    n_v = max(cols - 3 - n_extra, 0)
+    for i in range(1, n_v + 1):
+        x = rng.standard_normal(rows)
+        if i % 7 == 0:  # algumas colunas separam as classes
+            x += 3.0 * cls
+        if i % 3 == 0 and null_rate > 0:
+            x[rng.random(rows) < null_rate] = np.nan
+        data[f"V{i}"] = x
+    data["Amount"] = np.round(rng.lognormal(3.0, 1.5, rows), 2)
+    if n_extra:
+        data["merchant_type"] = pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), rows), CATEGORIES)
+        data["n_items"] = rng.poisson(2.0, rows).astype(np.int64)
+    data["Class"] = cls
+    return pd.DataFrame(data)
+
+
+# -----------------------------------------------------------------------------
+# Casos
+# -----------------------------------------------------------------------------
+
+def _cases() -> List[Tuple[str, Callable[[pd.DataFrame], Any]]]:
+    from app.agent import router as r
+    from app.tools import plots, tables
+    from app.tools.correlation import corr_matrix
+
+    def numeric_corr(df):
+        return corr_matrix(df)
+
+    return [
+        ("tool.describe_data", lambda df: r._tool_describe_data(df)),
+        ("tool.schema_info", lambda df: r._tool_schema_info(df, show_examples=True)),
+        ("tool.value_counts", lambda df: r._tool_value_counts(df, column="Class")),
+        ("tool.class_balance", lambda df: r._tool_class_balance(df, target="Class")),
+        ("tool.histogram", lambda df: r._tool_histogram(df, column="Amount", log_scale=True)),
+        ("tool.histogram.approx", lambda df: r._tool_histogram(df, column="Amount", approximate=True)),
+        ("tool.histogram.spec", lambda df: r._tool_histogram(df, column="Amount", client_chart=True)),
+        ("tool.compute_stat.median", lambda df: r._tool_compute_stat(df, column="Amount", stat="median")),
+        ("tool.compute_stat.approx", lambda df: r._tool_compute_stat(df, column="Amount", stat="mean",
+                                                                     approximate=True)),
+        ("tool.corr_matrix", lambda df: r._tool_corr_matrix(df, top_pairs=10)),
+        ("tool.corr_matrix.spearman", lambda df: r._tool_corr_matrix(df, method="spearman", top_pairs=10)),
+        ("tool.groupby_aggregate", lambda df: r._tool_groupby_aggregate(
+            df, by=["Class"], aggregations={"Amount": ["mean", "std", "max"]})),
+        ("tool.groupby_aggregate.approx", lambda df: r._tool_groupby_aggregate(
+            df, by=["Class"], aggregations={"Amount": ["mean", "std"]}, approximate=True)),
+        ("plot.histogram", lambda df: plots.plot_histogram(df, "Amount")),
+        ("plot.corr_matrix", lambda df: plots.plot_corr_matrix(numeric_corr(df))),
+        ("spec.corr_heatmap", lambda df: plots.corr_heatmap_spec(numeric_corr(df))),
+        ("table.to_table+page", lambda df: tables.to_table(df.describe()).styled_page(0, 50)),
+        ("table.page.large", lambda df: tables.to_table(df.head(100_000)).styled_page(10, 50)),
+        ("table.csv_bytes", lambda df: tables.to_table(df.head(100_000)).to_csv_bytes()),
+        ("table.df_to_html", lambda df: tables.df_to_html(df)),
+    ]
+
+
+def _clear_caches(df: pd.DataFrame):
+    from app.tools.cache import dataset_cache
+    dataset_cache(df).clear()
+
+
+def run_case(fn: Callable, df: pd.DataFrame, repeat: int) -> Dict[str, Any]:
+    cold = []
+    out = None
+    for _ in range(repeat):
+        _clear_caches(df)
+        gc.collect()
+        t0 = time.perf_counter()
+        out = fn(df)
+        cold.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    fn(df)
+    warm = time.perf_counter() - t0
+    # pico de memória numa execução separada (tracemalloc deixa o código mais lento)
+    _clear_caches(df)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(df)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    error = out.get("text") if isinstance(out, dict) and str(out.get("text", "")).startswith("Erro") else None
+    return {
+        "cold_s": statistics.median(cold),
+        "cold_min_s": min(cold),
+        "warm_s": warm,
+        "peak_mb": peak / 2 ** 20,
+        "output_bytes": output_size(out),
+        "error": error,
+    }
+
+
+def _meta() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(grid: List[Tuple[int, int]], repeat: int = 3, only: Optional[List[str]] = None,
+        max_memory_gb: float = 8.0, seed: int = 0) -> Dict[str, Any]:
+    cases = [(n, f) for n, f in _cases() if not only or any(n.startswith(o) for o in only)]
+    report: Dict[str, Any] = {"meta": _meta(), "results": []}
+    for rows, cols in grid:
+        label = f"{rows}x{cols}"
+        if estimate_bytes(rows, cols) > max_memory_gb * 2 ** 30:
+            print(f"[{label}] pulado (estimativa acima de {max_memory_gb:g} GB; use --max-memory-gb)")
+            report["results"].append({"dataset": label, "rows": rows, "cols": cols, "skipped": True})
+            continue
+        t0 = time.perf_counter()
+        df = make_dataset(rows, cols, seed=seed)
+        print(f"[{label}] gerado em {time.perf_counter() - t0:.1f}s "
+              f"({df.memory_usage(deep=True).sum() / 2 ** 20:.0f} MB)")
+        for name, fn in cases:
+            try:
+                res = run_case(fn, df, repeat)
+            except Exception as e:  # o benchmark continua; o erro fica no relatório
+                res = {"error": f"{type(e).__name__}: {e}"}
+            res.update({"dataset": label, "rows": rows, "cols": cols, "case": name})
+            report["results"].append(res)
+            if "cold_s" in res:
+                print(f"  {name:32s} {res['cold_s'] * 1000:10.1f} ms  quente {res['warm_s'] * 1000:9.1f} ms  "
+                      f"pico {res['peak_mb']:8.1f} MB" + (f"  ERRO {res['error']}" if res["error"] else ""))
+            else:
+                print(f"  {name:32s} ERRO {res['error']}")
+        del df
+        gc.collect()
+    return report
+
+
+# -----------------------------------------------------------------------------
+# Comparação
+# -----------------------------------------------------------------------------
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.2,
+            min_delta_s: float = 0.005) -> List[Dict[str, Any]]:
+    """Casos (dataset, caso) mais lentos ou com mais memória que a base além de `threshold`
+    (fração). Diferenças de tempo abaixo de min_delta_s são ruído e não contam."""
+    def index(report):
+        return {(r["dataset"], r["case"]): r for r in report["results"] if "case" in r and "cold_s" in r}
+
+    old, cur = index(base), index(new)
+    flagged = []
+    for key in sorted(old.keys() & cur.keys()):
+        a, b = old[key], cur[key]
+        for metric, floor in (("cold_s", min_delta_s), ("peak_mb", 1.0)):
+            if a[metric] <= 0:
+                continue
+            ratio = b[metric] / a[metric]
+            if ratio > 1 + threshold and b[metric] - a[metric] > floor:
+                flagged.append({"dataset": key[0], "case": key[1], "metric": metric,
+                                "base": a[metric], "new": b[metric], "ratio": ratio})
+    return flagged
+
+
+def print_comparison(flagged: List[Dict[str, Any]], threshold: float):
+    if not flagged:
+        print(f"\nSem regressões acima de {threshold:.0%}.")
+        return
+    print(f"\n{len(flagged)} regressão(ões) acima de {threshold:.0%}:")
+    for f in flagged:
+        unit = "ms" if f["metric"] == "cold_s" else "MB"
+        scale = 1000 if unit == "ms" else 1
+        print(f"  [{f['dataset']}] {f['case']:32s} {f['metric']:8s} "
+              f"{f['base'] * scale:10.1f} -> {f['new'] * scale:10.1f} {unit}  (x{f['ratio']:.2f})")
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _parse_grid(spec: str) -> List[Tuple[int, int]]:
+    """'100000x30,1000000x5' -> [(100000, 30), (1000000, 5)]"""
+    out = []
+    for item in spec.split(","):
+        rows, cols = item.lower().split("x")
+        out.append((int(float(rows)), int(cols)))
+    return out
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline das ferramentas de EDA.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="gera datasets, mede e grava o JSON")
+    p_run.add_argument("--preset", choices=sorted(PRESETS), default="default")
+    p_run.add_argument("--grid", help="linhasxcolunas separados por vírgula (substitui o preset)")
+    p_run.add_argument("--only", nargs="*", help="prefixos de casos (ex.: tool.corr plot.)")
+    p_run.add_argument("--repeat", type=int, default=3)
+    p_run.add_argument("--max-memory-gb", type=float, default=8.0)
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--out", default="bench_eda.json")
+    p_run.add_argument("--compare", help="JSON de base para detectar regressões")
+    p_run.add_argument("--threshold", type=float, default=0.2)
+    p_cmp = sub.add_parser("compare", help="compara dois JSONs já gravados")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "compare":
+        flagged = compare(_load(args.base), _load(args.new), args.threshold)
+        print_comparison(flagged, args.threshold)
+        return 1 if flagged else 0
+
+    grid = _parse_grid(args.grid) if args.grid else PRESETS[args.preset]
+    report = run(grid, repeat=args.repeat, only=args.only, max_memory_gb=args.max_memory_gb, seed=args.seed)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados em {args.out}")
+    if args.compare:
+        flagged = compare(_load(args.compare), report, args.threshold)
+        print_comparison(flagged, args.threshold)
+        return 1 if flagged else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
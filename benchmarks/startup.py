@@ -0,0 +1,131 @@
+# benchmark de cold start: tempo de import (estilo `python -X importtime`), tempo até a
+# primeira renderização de cada app Streamlit (e custo de um rerun) e subida do worker da sandbox.
+# Cada medida roda num subprocesso novo (sem módulos em cache) e sem OPENAI_API_KEY.
+#
+#   python benchmarks/startup.py [--top 15] [--json saida.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["app.agent.router", "app.agent.docs_agent", "app.tools.sandbox"]
+APPS = ["streamlit_app.py", "streamlit_docs.py"]
+# módulos que não deveriam ser carregados só por importar os agentes
+HEAVY = ["matplotlib", "openai", "PIL", "pdf2image", "pytesseract", "sklearn", "scipy"]
+
+
+def _env() -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def _python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=ROOT, env=_env(),
+                          capture_output=True, text=True)
+
+
+def import_report(module: str, top: int = 15) -> Dict[str, Any]:
+    """Tempo de import de `module` e os maiores contribuintes (tempo acumulado, em ms)."""
+    probe = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = _python(probe, "-X", "importtime")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                     "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000})
+    total = next((r["cumulative_ms"] for r in rows if r["module"] == module), None)
+    children = sorted((r for r in rows if r["depth"] == 1), key=lambda r: -r["cumulative_ms"])
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "total_ms": total,
+        "heavy_loaded": [m for m in proc.stdout.strip().split(",") if m],
+        "top": [{k: r[k] for k in ("module", "self_ms", "cumulative_ms")} for r in children[:top]],
+    }
+
+
+def first_render(app: str) -> Dict[str, Any]:
+    """Tempo até a primeira renderização completa do script (AppTest, processo novo) e de um rerun."""
+    code = (
+        "import time; t0 = time.perf_counter()\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({app!r}, default_timeout=120)\n"
+        "t1 = time.perf_counter(); at.run(); t2 = time.perf_counter(); at.run(); t3 = time.perf_counter()\n"
+        "import json; print(json.dumps({'first_render_ms': (t2 - t1) * 1000, 'rerun_ms': (t3 - t2) * 1000,\n"
+        "                               'exceptions': [e.value for e in at.exception]}))"
+    )
+    proc = _python(code)
+    if proc.returncode != 0:
+        return {"app": app, "ok": False, "error": proc.stderr.strip().splitlines()[-1:]}
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"app": app, "ok": not out["exceptions"], **out}
+
+
+def sandbox_cold_start() -> Dict[str, Any]:
+    """Subida de um worker da sandbox até devolver o primeiro resultado."""
+    code = (
+        "import json, time\n"
+        "import pandas as pd\n"
+        "from app.tools.sandbox import SandboxPool\n"
+        "if __name__ == '__main__':\n"
+        "    df = pd.DataFrame({'x': range(10)})\n"
+        "    t0 = time.perf_counter(); pool = SandboxPool(size=1)\n"
+        "    out = pool.run(df, 'result = df.x.sum()'); t1 = time.perf_counter()\n"
+        "    out2 = pool.run(df, 'result = df.x.max()'); t2 = time.perf_counter()\n"
+        "    print(json.dumps({'first_run_ms': (t1 - t0) * 1000, 'warm_run_ms': (t2 - t1) * 1000,\n"
+        "                      'error': out.get('error') or out2.get('error')}))"
+    )
+    proc = _python(code)
+    if proc.returncode != 0:
+        return {"ok": False, "error": proc.stderr.strip().splitlines()[-1:]}
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"ok": out.pop("error") is None, **out}
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark de cold start (imports, 1ª renderização, sandbox).")
+    parser.add_argument("--top", type=int, default=15, help="maiores imports listados por módulo")
+    parser.add_argument("--json", help="grava o relatório completo neste arquivo")
+    parser.add_argument("--skip-apps", action="store_true", help="não mede os apps Streamlit")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    report: Dict[str, Any] = {"python": sys.version.split()[0], "imports": [], "apps": []}
+    for module in MODULES:
+        r = import_report(module, top=args.top)
+        report["imports"].append(r)
+        status = "ok" if r["ok"] else f"FALHOU ({r['error']})"
+        print(f"\nimport {module}: {r['total_ms'] or 0:.0f} ms [{status}]")
+        if r["heavy_loaded"]:
+            print(f"  pesados carregados no import: {', '.join(r['heavy_loaded'])}")
+        for row in r["top"]:
+            print(f"  {row['cumulative_ms']:9.1f} ms  {row['module']}")
+    if not args.skip_apps:
+        for app in APPS:
+            r = first_render(app)
+            report["apps"].append(r)
+            if r["ok"]:
+                print(f"\n{app}: primeira renderização {r['first_render_ms']:.0f} ms, rerun {r['rerun_ms']:.0f} ms")
+            else:
+                print(f"\n{app}: FALHOU {r.get('error') or r.get('exceptions')}")
+    report["sandbox"] = sandbox_cold_start()
+    if report["sandbox"]["ok"]:
+        print(f"\nsandbox: primeiro resultado {report['sandbox']['first_run_ms']:.0f} ms "
+              f"(worker quente: {report['sandbox']['warm_run_ms']:.0f} ms)")
+    report["elapsed_s"] = time.perf_counter() - t0
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
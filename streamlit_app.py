@@ -1,7 +1,13 @@
 # app/streamlit_app.py
 import os
 import io
+import re
 import base64
+import hashlib
+import shutil
+import tempfile
+import uuid
+import weakref
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
@@ -9,70 +15,362 @@ from dotenv import load_dotenv
 # Carrega variáveis do .env (OPENAI_API_KEY, OPENAI_MODEL, etc.)
 load_dotenv()
 
-from app.agent.router import ask_agent
-from app.memory.memory_store import Memory
+from app.agent.conversation import Conversation
+from app.memory.memory_store import SQLiteMemory
+from app.tools.cache import dataset_fingerprint
+from app.tools.chunked import ChunkedCSV
+from app.tools.columns import column_index
+from app.tools.incremental import csv_source, extend_dataset, is_extension, read_tail
+from app.tools.sqlsource import SQLSource
+from app.tools.tables import TableResult
+
+# uploads acima disso não viram DataFrame: vão para disco e são lidos em chunks
+OOC_THRESHOLD_MB = float(os.getenv("OOC_THRESHOLD_MB", "500"))
+# CSVs locais do servidor só podem ser abertos a partir deste diretório
+DATA_DIR = os.getenv("DATA_DIR", "data")
+TABLE_PAGE_SIZE = 50
+MEMORY_DISPLAY_LIMIT = 50
 
 st.set_page_config(page_title="EDA Agent", layout="wide")
+
+
+# O Streamlit reexecuta este script a cada interação: o agente (ferramentas, pools, cliente
+# OpenAI) é carregado uma única vez por processo e só na primeira pergunta.
+@st.cache_resource(show_spinner=False)
+def _agent():
+    from app.agent import router
+    return router
+
+
+@st.cache_resource(show_spinner=False)
+def _llm():
+    from app.agent.llm_client import get_llm
+    return get_llm()
+
 st.title("EDA Agent – CSV qualquer")
 
 concise = st.sidebar.toggle("Modo conciso (ocultar narrativa)", value=False)
+approximate = st.sidebar.toggle(
+    "Modo aproximado (amostra estratificada, datasets grandes)", value=False,
+    help="Histograma, correlação, groupby e estatísticas usam uma amostra em cache e reportam IC95%.",
+)
+client_charts = st.sidebar.toggle(
+    "Gráficos no navegador", value=False,
+    help="Histogramas e heatmaps chegam como dados agregados e são desenhados no cliente (sem PNG no servidor).",
+)
+
+
+def _server_csvs():
+    """CSVs disponíveis em DATA_DIR (caminhos relativos); nada fora dele é oferecido."""
+    root = os.path.realpath(DATA_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.relpath(os.path.join(d, f), root)
+                  for d, _, files in os.walk(root) for f in files if f.lower().endswith(".csv"))
+
+
+def _server_csv_path(name: str) -> str:
+    root = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:  # links simbólicos para fora de DATA_DIR
+        raise ValueError(f"{name} não está em {DATA_DIR}")
+    return path
+
+
+# uma fonte ativa por vez: só ela é lida, e trocar de fonte troca o dataset
+SOURCES = {"upload": "Upload de CSV", "path": f"CSV do servidor ({DATA_DIR}/, out-of-core)",
+           "sql": "Notas fiscais (invoices.db)"}
+server_csvs = _server_csvs()
+source_kind = st.sidebar.radio(
+    "Fonte dos dados", [k for k in SOURCES if k != "path" or server_csvs], format_func=SOURCES.get,
+    help="Upload: CSV enviado pelo navegador. Servidor: CSV de DATA_DIR lido em chunks, sem carregar o arquivo "
+         "inteiro na memória. Notas fiscais: consultas direto no SQLite (filtros e agregações no banco).",
+)
+ooc_name = st.sidebar.selectbox("CSV do servidor", server_csvs) if source_kind == "path" else None
 
 # ---------------------------------------------------------------------
 # Estado da sessão
 # ---------------------------------------------------------------------
 session_state = st.session_state
+if "session_id" not in session_state:
+    # a sessão (conclusões e contabilidade de tokens) fica na URL: recarregar a página a mantém
+    sid = st.query_params.get("sessao", "")
+    session_state.session_id = sid if re.fullmatch(r"[0-9a-f]{32}", sid) else uuid.uuid4().hex
+if st.query_params.get("sessao") != session_state.session_id:
+    st.query_params["sessao"] = session_state.session_id
 if "df" not in session_state:
     session_state.df = None
 if "mem" not in session_state:
-    session_state.mem = Memory("mem.jsonl")  # persiste em arquivo, mas vamos limpar a cada upload
-if "upload_sig" not in session_state:
-    session_state.upload_sig = None
+    # conclusões em mem.db, isoladas por sessão e por dataset (o mem.jsonl legado é importado
+    # uma vez e aparece em todas); sessões encerradas ou inativas são removidas pela compactação
+    session_state.mem = SQLiteMemory("mem.db", session=session_state.session_id)
+if "conversation" not in session_state:
+    # perguntas de acompanhamento: schema + resultados anteriores (zera ao trocar de dataset)
+    session_state.conversation = Conversation()
+if "loaded_sig" not in session_state:
+    session_state.loaded_sig = None  # (fonte, assinatura) do dataset em session_state.df
+if "spool" not in session_state:
+    session_state.spool = None  # finalizador do CSV grande copiado para disco (apaga o arquivo)
+if "source" not in session_state:
+    session_state.source = None  # assinatura do último CSV lido em memória (detecta linhas acrescentadas)
+if "last_prompt" not in session_state:
+    session_state.last_prompt = None
+if "last_approx" not in session_state:
+    session_state.last_approx = []
+if "last_calls" not in session_state:
+    session_state.last_calls = []  # chamadas de ferramenta da última resposta (reexecutar exato)
+if "last_result" not in session_state:
+    session_state.last_result = None
 
 # ---------------------------------------------------------------------
-# Upload de CSV (limpa memória quando o arquivo muda)
+# Upload de CSV (troca o namespace da memória quando o arquivo muda)
 # ---------------------------------------------------------------------
-uploaded = st.file_uploader("Faça upload de um CSV", type=["csv"])
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _spool_to_disk(uploaded):
+    """Upload grande vira arquivo temporário lido em chunks. O arquivo é apagado quando o dataset
+    é trocado (_set_dataset) ou quando a sessão termina e o ChunkedCSV é coletado."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as f:
+        shutil.copyfileobj(uploaded, f, length=16 * 1024 * 1024)
+    try:
+        df = ChunkedCSV(f.name)
+    except Exception:
+        _unlink_quietly(f.name)
+        raise
+    return df, weakref.finalize(df, _unlink_quietly, f.name)
+
+
+def _set_dataset(df, sig, source=None, spool=None):
+    """Troca o dataset da sessão; o arquivo temporário do anterior (se houver) é apagado."""
+    if session_state.spool is not None:
+        session_state.spool()
+    session_state.spool = spool
+    session_state.df = df
+    session_state.conversation.reset()  # resultados guardados eram do dataset anterior
+    session_state.loaded_sig = sig
+    session_state.source = source
+    session_state.last_approx = []
+    session_state.last_result = None
+
+
+def _use_dataset_memory(df, sig) -> str:
+    """Namespace de memória do dataset: fingerprint do conteúdo (ou da origem, out-of-core/SQL)."""
+    if isinstance(df, pd.DataFrame):
+        namespace = dataset_fingerprint(df)
+    else:
+        namespace = "ooc:" + hashlib.sha1(repr(sig).encode("utf-8")).hexdigest()[:16]
+    session_state.mem.use(namespace)
+    column_index(df)  # índice de colunas montado uma vez, no carregamento
+    n = session_state.mem.count()
+    return f" {n} conclusões anteriores deste dataset." if n else " Memória do dataset vazia."
+
+
+def _read_appended(uploaded):
+    """Mesmo CSV com linhas novas no fim: lê só o trecho novo e atualiza os agregados em cache.
+    Devolve o número de linhas novas (None = não é uma extensão do anterior)."""
+    if not isinstance(session_state.df, pd.DataFrame) or not is_extension(uploaded, uploaded.size, session_state.source):
+        return None
+    tail = read_tail(uploaded, session_state.source)
+    if tail is None:
+        return None
+    session_state.df = extend_dataset(session_state.df, tail)
+    session_state.conversation.reset()
+    session_state.source = csv_source(uploaded, uploaded.size, session_state.df, previous=session_state.source)
+    return len(tail)
+
+
+def _loaded_message(df) -> str:
+    if isinstance(df, SQLSource):
+        return f"Base aberta: {df.describe()}; consultas feitas direto no banco."
+    if isinstance(df, ChunkedCSV):
+        return f"CSV aberto em modo out-of-core: {len(df.columns)} colunas, lido em chunks de {df.chunksize} linhas."
+    return f"CSV carregado: {df.shape[0]} linhas, {df.shape[1]} colunas."
+
+
+uploaded = st.file_uploader(
+    "Faça upload de um CSV", type=["csv"],
+    help=f"Reenviar o mesmo CSV com linhas novas no fim lê só as linhas novas. Acima de {OOC_THRESHOLD_MB:g} MB "
+         "o arquivo é lido em modo out-of-core e sempre relido por inteiro.",
+) if source_kind == "upload" else None
+
+if source_kind == "path" and ooc_name and session_state.loaded_sig != ("path", ooc_name):
+    try:
+        df = ChunkedCSV(_server_csv_path(ooc_name))
+        _set_dataset(df, ("path", ooc_name))
+        st.success(_loaded_message(df) + _use_dataset_memory(df, session_state.loaded_sig))
+    except Exception as e:
+        st.error(f"Erro ao abrir CSV: {e}")
+
+if source_kind == "sql":
+    from app.agent.invoice_source import INVOICES_DB, invoice_source
+    if session_state.loaded_sig != ("sql", INVOICES_DB):
+        try:
+            df = invoice_source(INVOICES_DB)
+            _set_dataset(df, ("sql", INVOICES_DB))
+            st.success(_loaded_message(df) + _use_dataset_memory(df, session_state.loaded_sig))
+        except Exception as e:
+            st.error(f"Erro ao abrir {INVOICES_DB}: {e}")
 
 if uploaded is not None:
     # assinatura simples (nome + tamanho) para detectar troca de arquivo
-    sig = (uploaded.name, uploaded.size)
-    if session_state.upload_sig != sig:
-        session_state.upload_sig = sig
+    sig = ("upload", uploaded.name, uploaded.size)
+    if session_state.loaded_sig != sig:
         # reposiciona o ponteiro antes de ler
         uploaded.seek(0)
         try:
-            session_state.df = pd.read_csv(uploaded)
-            # limpa a memória ao trocar de CSV
-            session_state.mem.clear()
-            st.success(
-                f"CSV carregado: {session_state.df.shape[0]} linhas, "
-                f"{session_state.df.shape[1]} colunas. Memória da sessão foi reiniciada."
-            )
+            large = uploaded.size > OOC_THRESHOLD_MB * 1024 * 1024
+            appended = None if large else _read_appended(uploaded)
+            if appended is not None:
+                # mesmo dataset, maior: conclusões (namespace da memória) continuam valendo
+                session_state.loaded_sig = sig
+                session_state.last_approx = []
+                session_state.last_result = None
+                st.success(f"CSV atualizado: {appended} linhas novas lidas; "
+                           f"{len(session_state.df)} linhas no total. Conclusões mantidas.")
+            else:
+                if large:
+                    # out-of-core não tem leitura incremental: o arquivo novo substitui o anterior
+                    df, spool = _spool_to_disk(uploaded)
+                    _set_dataset(df, sig, spool=spool)
+                else:
+                    df = pd.read_csv(uploaded)
+                    _set_dataset(df, sig, csv_source(uploaded, uploaded.size, df))
+                # cada dataset tem suas próprias conclusões
+                mem_msg = _use_dataset_memory(session_state.df, sig)
+                st.success(_loaded_message(session_state.df) + mem_msg)
         except Exception as e:
+            _set_dataset(None, sig)  # não relê o mesmo arquivo inválido a cada interação
             st.error(f"Erro ao ler CSV: {e}")
 
+if session_state.loaded_sig is not None and session_state.loaded_sig[0] != source_kind:
+    # a fonte ativa mudou e ainda não tem dataset: não pergunte sobre os dados da fonte anterior
+    _set_dataset(None, None)
+
 # ---------------------------------------------------------------------
 # Caixa de pergunta e execução do agente
 # ---------------------------------------------------------------------
+def _render_table(tbl, key: str):
+    """Tabelas compactas: estilo só na página exibida + download do resultado completo."""
+    if not isinstance(tbl, TableResult):
+        st.dataframe(tbl, use_container_width=True, height=400)
+        return
+    n_pages = tbl.n_pages(TABLE_PAGE_SIZE)
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+    st.dataframe(tbl.styled_page(page - 1, TABLE_PAGE_SIZE), use_container_width=True, height=400)
+    rows, cols = tbl.shape
+    st.caption(f"{rows} linhas x {cols} colunas")
+    st.download_button("Baixar CSV completo", data=tbl.to_csv_bytes, file_name=f"{tbl.title or key}.csv",
+                       mime="text/csv", key=f"{key}_csv", on_click="ignore")
+
+
+def _render_result(result):
+    # Texto (insights/resultados factuais)
+    if result.get("text"):
+        st.markdown(result["text"])
+    # Tabelas (TableResult paginada; DataFrame/Styler legado)
+    for i, tbl in enumerate(result.get("tables", [])):
+        _render_table(tbl, key=f"tabela_{i}")
+    # Imagens (PNG em bytes; base64 legado)
+    for img in result.get("images", []):
+        st.image(io.BytesIO(img if isinstance(img, bytes) else base64.b64decode(img)))
+    # Gráficos renderizados no cliente (spec Vega-Lite com dados pré-agregados)
+    for spec in result.get("charts", []):
+        st.vega_lite_chart(spec, use_container_width=True)
+
+
+def _stream_result(events):
+    """Mostra cada resultado assim que a ferramenta termina e a narrativa conforme chega.
+    A área ao vivo é descartada no fim: o resultado final é desenhado por _render_result."""
+    live = st.empty()
+    result = {}
+    with live.container():
+        status = st.status("Analisando com o agente...")
+        slots, narrative_box, narrative = {}, None, ""
+        for ev in events:
+            kind = ev["type"]
+            if kind == "tool_started":
+                status.write(f"🔧 {ev['tool']}")
+                slots[ev["index"]] = st.container()
+                continue
+            if kind == "narrative_token":
+                if narrative_box is None:
+                    status.update(label="Escrevendo a análise...")
+                    narrative_box = st.empty()
+                narrative += ev["text"]
+                narrative_box.markdown(narrative)
+                continue
+            if kind == "done":
+                result = ev["result"]
+                continue
+            slot = slots.get(ev.get("index"), st)
+            if kind == "text":
+                slot.markdown(ev["text"])
+            elif kind == "table":
+                tbl = ev["table"]
+                slot.dataframe(tbl.styled_page(0, TABLE_PAGE_SIZE) if isinstance(tbl, TableResult) else tbl,
+                               use_container_width=True, height=400)
+            elif kind == "image":
+                img = ev["image"]
+                slot.image(io.BytesIO(img if isinstance(img, bytes) else base64.b64decode(img)))
+            elif kind == "chart":
+                slot.vega_lite_chart(ev["chart"], use_container_width=True)
+            elif kind == "tool_done":
+                status.write(f"{'⏱️' if ev['timeout'] else '✅'} {ev['tool']}")
+    live.empty()
+    return result
+
+
 prompt = st.text_input("Pergunte algo sobre os dados")
 if st.button("Enviar", disabled=session_state.df is None or not prompt):
-    with st.spinner("Analisando com o agente..."):
-        result = ask_agent(prompt, df=session_state.df, mem=session_state.mem, concise=concise)
-        # Texto (insights/resultados factuais)
-        if result.get("text"):
-            st.markdown(result["text"])
-        # Tabelas (DataFrame ou Styler)
-        for tbl in result.get("tables", []):
-            st.dataframe(tbl, use_container_width=True, height=400)
-        # Imagens (PNG base64)
-        for img_b64 in result.get("images", []):
-            st.image(io.BytesIO(base64.b64decode(img_b64)))
+    result = _stream_result(_agent().ask_agent_stream(prompt, df=session_state.df, mem=session_state.mem,
+                                                      concise=concise, approximate=approximate,
+                                                      client_charts=client_charts, session=session_state.session_id,
+                                                      conversation=session_state.conversation))
+    session_state.last_prompt = prompt
+    session_state.last_approx = result.get("approximate", [])
+    session_state.last_calls = result.get("calls", [])
+    session_state.last_result = result
+
+# Resultado aproximado: reexecuta as mesmas chamadas de ferramenta de forma exata (sem passar de
+# novo pelo roteador/LLM, que poderiam escolher outras ferramentas)
+if session_state.last_approx and session_state.last_calls:
+    sizes = ", ".join(f"{a['tool']}: n={a['sample_size']:,}".replace(",", ".") for a in session_state.last_approx)
+    st.caption(f"Resultado aproximado ({sizes}).")
+    if st.button("Reexecutar exato"):
+        result = _stream_result(_agent().ask_agent_stream(session_state.last_prompt, df=session_state.df,
+                                                          mem=session_state.mem, concise=concise, exact=True,
+                                                          client_charts=client_charts,
+                                                          session=session_state.session_id,
+                                                          conversation=session_state.conversation,
+                                                          replay=session_state.last_calls))
+        session_state.last_approx = []
+        session_state.last_result = result
+
+# O último resultado fica na sessão: paginar/baixar uma tabela não perde a resposta
+if session_state.last_result is not None:
+    _render_result(session_state.last_result)
 
 # ---------------------------------------------------------------------
-# Conclusões (memória da sessão)
+# Conclusões (memória da sessão, deste dataset)
 # ---------------------------------------------------------------------
 with st.expander("Conclusões do agente"):
-    st.markdown(session_state.mem.get_all_as_markdown())
+    st.markdown(session_state.mem.get_all_as_markdown(limit=MEMORY_DISPLAY_LIMIT))
+    if st.button("Encerrar sessão", help="Começa uma sessão nova; as conclusões desta são apagadas."):
+        namespace = session_state.mem.namespace
+        session_state.mem.close_session()
+        session_state.mem.close()
+        session_state.session_id = uuid.uuid4().hex
+        session_state.mem = SQLiteMemory("mem.db", namespace=namespace, session=session_state.session_id)
+        session_state.conversation = Conversation()
+        st.query_params["sessao"] = session_state.session_id
+        st.rerun()
 
 # ---------------------------------------------------------------------
 # Rodapé opcional: status da API
@@ -80,4 +378,27 @@ with st.expander("Conclusões do agente"):
 with st.sidebar:
     st.caption("⚙️ Configuração")
     st.write("Modelo:", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
-    st.write("Chave carregada:", "✅" if os.getenv("OPENAI_API_KEY") else "❌")
\ No newline at end of file
+    st.write("Chave carregada:", "✅" if os.getenv("OPENAI_API_KEY") else "❌")
+    if session_state.last_result is not None:
+        routing = _agent().intent_stats()
+        if routing["local"]:
+            line = f"{routing['local']} de {routing['local'] + routing['llm']} perguntas sem LLM"
+            if routing["tool_agreement"] is not None:
+                line += f" (concordância {routing['tool_agreement']:.0%} em {routing['compared']})"
+            st.write("Roteamento local:", line)
+        tool_metrics = _agent().registry.metrics()
+        if tool_metrics:
+            with st.expander("Desempenho das ferramentas"):
+                st.dataframe(pd.DataFrame([
+                    {"ferramenta": name, "chamadas": m["calls"], "erros": m["errors"],
+                     "p50 (ms)": round(m["wall_ms_p50"]), "p95 (ms)": round(m["wall_ms_p95"]),
+                     "CPU p50 (ms)": round(m["cpu_ms_p50"]),
+                     "pico (MB)": None if m["peak_kb_max"] is None else round(m["peak_kb_max"] / 1024, 1),
+                     "saída (KB)": round(m["output_bytes_p50"] / 1024, 1)}
+                    for name, m in sorted(tool_metrics.items(), key=lambda kv: -kv[1]["wall_ms_p95"])
+                ]).set_index("ferramenta"), use_container_width=True)
+        if os.getenv("OPENAI_API_KEY"):
+            usage = _llm().usage(session=session_state.session_id)
+            if usage["calls"]:
+                st.write("Tokens na sessão:", usage["total_tokens"],
+                         f"({usage['calls']} chamadas, {usage['retries']} retentativas)")
@@ -1,13 +1,21 @@
 
 import io
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
 
-from app.agent.docs_agent import ask_docs_agent, file_to_images
-
 load_dotenv()
 
 st.set_page_config(page_title="CRM-IA – Agente de Documentos Fiscais", layout="wide")
+
+
+# carregado uma vez por processo (o script roda de novo a cada interação); PIL/OCR/OpenAI
+# só entram quando há um arquivo para processar
+@st.cache_resource(show_spinner=False)
+def _docs_agent():
+    from app.agent import docs_agent
+    return docs_agent
+
 st.title("CRM-IA – Agente Inteligente para Documentos Fiscais (OCR + GPT-4 + Validação)")
 
 st.markdown(
@@ -24,6 +32,9 @@ st.markdown(
     """
 )
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # contabilidade de tokens por sessão
+
 uploaded = st.file_uploader(
     "Envie um arquivo de documento fiscal (PDF, JPG, JPEG, PNG)",
     type=["pdf", "jpg", "jpeg", "png"],
@@ -40,7 +51,7 @@ if uploaded is not None:
 
     # Pré-visualização simples da primeira página/Imagem
     try:
-        images = file_to_images(file_bytes, file_type)
+        images = _docs_agent().file_to_images(file_bytes, file_type)
         buf = io.BytesIO()
         images[0].save(buf, format="PNG")
         buf.seek(0)
@@ -50,7 +61,8 @@ if uploaded is not None:
 
     if st.button("Executar agente (GPT-4 + tools)"):
         with st.spinner("Rodando agente de documentos fiscais..."):
-            result = ask_docs_agent(file_bytes=file_bytes, file_type=file_type, user_message=user_message)
+            result = _docs_agent().ask_docs_agent(file_bytes=file_bytes, file_type=file_type,
+                                                  user_message=user_message, session=st.session_state.session_id)
 
         st.markdown("## Resposta do agente")
         st.write(result.get("assistant_message", ""))
@@ -70,5 +82,9 @@ if uploaded is not None:
         if result.get("save_result"):
             st.markdown("### Resultado da persistência")
             st.json(result["save_result"])
+
+        if result.get("usage"):
+            u = result["usage"]
+            st.caption(f"Tokens neste documento: {u['total_tokens']} ({u['calls']} chamadas, {u['retries']} retentativas)")
 else:
     st.info("Envie um arquivo para começar.")
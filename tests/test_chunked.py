@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tools.chunked import ChunkedCSV, compute_stat, describe
+from app.tools.filters import apply_filter
+
+STATS = ("count", "sum", "mean", "std", "min", "max")
+
+
+@pytest.fixture
+def csv(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"valor": rng.normal(100, 15, size=5000), "vazia": np.nan})
+    path = tmp_path / "dados.csv"
+    df.to_csv(path, index=False)
+    return ChunkedCSV(str(path), chunksize=700), df
+
+
+def test_compute_stat_matches_pandas(csv):
+    src, df = csv
+    for stat in STATS:
+        np.testing.assert_allclose(compute_stat(src, "valor", stat), getattr(df["valor"], stat)(), err_msg=stat)
+
+
+def test_no_values_gives_nan_like_pandas(csv):
+    src, df = csv
+    empty, _ = apply_filter(src, "valor > 1000")
+    for source, column in ((src, "vazia"), (empty, "valor")):
+        for stat in STATS:
+            expected = getattr(df[column].iloc[:0] if source is empty else df[column], stat)()
+            np.testing.assert_equal(compute_stat(source, column, stat), expected, err_msg=f"{column} {stat}")
+    row = describe(src).loc["vazia"]
+    assert row["count"] == 0 and row[["mean", "std", "min", "max"]].isna().all()
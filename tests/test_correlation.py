@@ -0,0 +1,46 @@
+import numpy as np
+
+from app.tools.correlation import _masked_corr, _rank_columns
+
+
+def _stratified(seed: int = 0):
+    """População de 300k linhas com Class rara (0,5%) e amostra estratificada com pesos."""
+    rng = np.random.default_rng(seed)
+    n = 300_000
+    cls = (rng.random(n) < 0.005).astype(np.float64)
+    a = 3.0 * cls + rng.normal(size=n) + 10.0
+    b = rng.normal(size=n) - 0.5 * a
+    pop = np.column_stack([a, b, cls])
+    pos = np.flatnonzero(cls == 1)
+    neg = np.flatnonzero(cls == 0)
+    keep = rng.choice(neg, size=len(neg) // 20, replace=False)
+    idx = np.concatenate([pos, keep])
+    w = np.concatenate([np.ones(len(pos)), np.full(len(keep), len(neg) / len(keep))])
+    return pop, pop[idx], w
+
+
+def test_weighted_corr_matches_np_cov_aweights():
+    pop, sample, w = _stratified()
+    got = _masked_corr(sample.astype(np.float32), w)
+    expected = np.corrcoef(pop, rowvar=False)
+    cov = np.cov(sample, rowvar=False, aweights=w)
+    d = np.sqrt(np.diag(cov))
+    np.testing.assert_allclose(got, cov / np.outer(d, d), atol=1e-3)
+    np.testing.assert_allclose(got[0, 2], expected[0, 2], atol=0.02)
+
+
+def test_weighted_corr_with_nans_matches_complete_pairs():
+    _, sample, w = _stratified(1)
+    x = sample.astype(np.float32)
+    x[::7, 1] = np.nan
+    got = _masked_corr(x, w)
+    ok = ~np.isnan(x[:, 1])
+    cov = np.cov(sample[ok][:, [1, 2]], rowvar=False, aweights=w[ok])
+    np.testing.assert_allclose(got[1, 2], cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1]), atol=1e-3)
+    cov = np.cov(sample[:, [0, 2]], rowvar=False, aweights=w)
+    np.testing.assert_allclose(got[0, 2], cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1]), atol=1e-3)
+
+
+def test_rank_columns_average_ties():
+    x = np.array([[3.0], [1.0], [3.0], [np.nan], [2.0]], dtype=np.float32)
+    np.testing.assert_array_equal(_rank_columns(x)[:, 0], [3.5, 1.0, 3.5, np.nan, 2.0])
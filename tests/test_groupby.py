@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tools.groupby import groupby_aggregate
+
+
+def _frame(seed: int = 0, n: int = 20_000) -> pd.DataFrame:
+    """Chaves de alta cardinalidade com nulos, valores com nulos e uma coluna inteira."""
+    rng = np.random.default_rng(seed)
+    x = rng.lognormal(3, 1, size=n)
+    x[rng.random(n) < 0.05] = np.nan
+    key = pd.Series(rng.integers(0, 3000, size=n).astype(str), dtype="str")
+    key[rng.random(n) < 0.02] = None
+    return pd.DataFrame({"cliente": key, "uf": rng.choice(["SP", "RJ", "MG"], size=n),
+                         "valor": x, "itens": rng.integers(1, 10, size=n)})
+
+
+@pytest.mark.parametrize("by", [["cliente"], ["uf", "cliente"]])
+def test_groupby_aggregate_matches_pandas(by):
+    df = _frame()
+    aggs = {"valor": ["count", "sum", "mean", "std", "var", "min", "max", "median"], "itens": "sum"}
+    got, n_groups = groupby_aggregate(df, by, aggs)
+    expected = df.groupby(by).agg(aggs)
+    assert n_groups == len(expected)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_index_type=False)
+
+
+def test_groupby_aggregate_flat_columns_and_nunique_fallback():
+    df = _frame(1)
+    got, _ = groupby_aggregate(df, ["uf"], {"valor": "mean", "cliente": "nunique"})
+    expected = df.groupby(["uf"]).agg({"valor": "mean", "cliente": "nunique"})
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_and_limit_match_pandas(ascending):
+    df = _frame(2)
+    df["valor"] = df["valor"].round(-1)  # muitos empates na ordenação
+    got, n_groups = groupby_aggregate(df, ["cliente"], {"valor": "max"}, sort_by="valor_max",
+                                      ascending=ascending, limit=25)
+    full = df.groupby(["cliente"]).agg({"valor": "max"})
+    expected = full.sort_values("valor", ascending=ascending, kind="stable").head(25)
+    assert n_groups == len(full)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
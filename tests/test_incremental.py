@@ -0,0 +1,135 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from app.tools import incremental
+from app.tools.cache import dataset_cache
+from app.tools.correlation import corr_matrix
+from app.tools.groupby import group_index, groupby_aggregate
+from app.tools.incremental import csv_source, extend_dataset, is_extension, read_tail
+
+
+def _frames(seed: int = 0, n: int = 2000, m: int = 300):
+    """df + tail com chaves repetidas (empates nas contagens), nulos nas chaves e nos valores."""
+    rng = np.random.default_rng(seed)
+
+    def make(rows):
+        k = rng.choice(["a", "b", "c", "d", None], size=rows, p=[0.3, 0.3, 0.2, 0.1, 0.1])
+        x = rng.normal(50, 10, size=rows)
+        x[rng.random(rows) < 0.05] = np.nan
+        return pd.DataFrame({"k": pd.Series(k, dtype="str"), "g": rng.integers(0, 40, size=rows),
+                             "x": x, "y": rng.normal(size=rows)})
+
+    return make(n), make(m)
+
+
+def test_value_counts_after_extend_match_full_recompute():
+    df = pd.DataFrame({"k": ["c", "a", "b", "b", np.nan, "b", "a", "c", "c"]})
+    tail = pd.DataFrame({"k": ["a", np.nan, "d", np.nan]})
+    incremental.value_counts(df, "k")
+    out = extend_dataset(df, tail)
+    assert ("value_counts", "k") in dataset_cache(out)
+    # empate c/a/b/NaN em 3: a ordem é a da primeira ocorrência, como no value_counts
+    expected = pd.concat([df, tail], ignore_index=True)["k"].value_counts(dropna=False)
+    pd.testing.assert_series_equal(incremental.value_counts(out, "k"), expected)
+
+    df, tail = _frames()
+    incremental.value_counts(df, "g")
+    out = extend_dataset(df, tail)
+    expected = pd.concat([df, tail], ignore_index=True)["g"].value_counts(dropna=False)
+    pd.testing.assert_series_equal(incremental.value_counts(out, "g"), expected)
+
+
+def test_moments_and_histogram_after_extend():
+    df, tail = _frames()
+    incremental.column_moments(df, "x")
+    incremental.histogram(df, "y", bins=20)
+    tail["y"] = tail["y"].clip(df["y"].min(), df["y"].max())  # dentro das bordas antigas
+    out = extend_dataset(df, tail)
+    full = pd.concat([df, tail], ignore_index=True)
+    mom = incremental.column_moments(out, "x")
+    assert mom.n == full["x"].count()
+    np.testing.assert_allclose([mom.mean, mom.std, mom.min, mom.max],
+                               [full["x"].mean(), full["x"].std(), full["x"].min(), full["x"].max()])
+    counts, edges = incremental.histogram(out, "y", bins=20)
+    expected_counts, expected_edges = np.histogram(full["y"], bins=20)
+    np.testing.assert_array_equal(counts, expected_counts)
+    np.testing.assert_allclose(edges, expected_edges)
+
+
+def test_histogram_is_dropped_when_the_range_changes():
+    df, tail = _frames()
+    incremental.histogram(df, "y", bins=20)
+    tail.loc[0, "y"] = df["y"].max() + 1.0
+    out = extend_dataset(df, tail)
+    assert ("histogram", "y", 20) not in dataset_cache(out)
+    counts, edges = incremental.histogram(out, "y", bins=20)
+    np.testing.assert_array_equal(counts, np.histogram(pd.concat([df, tail])["y"], bins=20)[0])
+
+
+def test_pearson_corr_from_merged_comoments():
+    df, tail = (d[["g", "y"]].assign(z=d["y"] * 2 + d["g"]) for d in _frames())
+    tail["z"] = tail["g"] * 1.0  # correlação diferente no trecho novo
+    corr_matrix(df)
+    out = extend_dataset(df, tail)
+    key = ("corr", "pearson", None, False)
+    assert key in dataset_cache(out)
+    expected = corr_matrix(pd.concat([df, tail], ignore_index=True))
+    pd.testing.assert_frame_equal(dataset_cache(out)[key], expected, atol=1e-4)
+
+
+def test_group_index_after_extend_matches_full_recompute():
+    df, tail = _frames()
+    tail.loc[:4, "k"] = "e"  # grupo novo, entre os antigos na ordem das chaves
+    aggs = {"x": ["count", "sum", "mean", "std", "min", "max"], "y": "var"}
+    for by in (["k"], ["k", "g"]):
+        groupby_aggregate(df, by, aggs)
+        out = extend_dataset(df, tail)
+        full = pd.concat([df, tail], ignore_index=True)
+        gi, fresh = group_index(out, by), group_index(full, by)
+        np.testing.assert_array_equal(gi.codes, fresh.codes)
+        np.testing.assert_array_equal(gi.sizes, fresh.sizes)
+        pd.testing.assert_index_equal(gi.keys(), fresh.keys())
+        got, n = groupby_aggregate(out, by, aggs)
+        expected, n_full = groupby_aggregate(full, by, aggs)
+        assert n == n_full
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def _csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode()
+
+
+def test_is_extension_and_read_tail():
+    df = pd.DataFrame({"id": [1, 2, 3], "nome": ["a", "b", "c"], "valor": [1.5, 2.0, 3.25]})
+    tail = pd.DataFrame({"id": [4, 5], "nome": ["7", "e"], "valor": [4, 5]})
+    data = _csv(df)
+    prev = csv_source(io.BytesIO(data), len(data), df)
+    grown = data + tail.to_csv(index=False, header=False).encode()
+    f = io.BytesIO(grown)
+    assert is_extension(f, len(grown), prev)
+    got = read_tail(f, prev)
+    # texto continua texto e inteiros viram float nas colunas float, como na leitura completa
+    pd.testing.assert_frame_equal(got, pd.read_csv(io.BytesIO(grown)).iloc[3:].reset_index(drop=True))
+    # o hash continua do estado anterior: o mesmo de um arquivo lido do zero
+    assert csv_source(f, len(grown), df, prev).digest == csv_source(f, len(grown), df).digest
+
+
+def test_edited_prefix_is_not_an_extension():
+    df = pd.DataFrame({"id": [1, 2, 3], "valor": [1.5, 2.0, 3.25]})
+    data = _csv(df)
+    prev = csv_source(io.BytesIO(data), len(data), df)
+    edited = data.replace(b"2.0", b"2.5") + b"4,4.5\n"
+    assert not is_extension(io.BytesIO(edited), len(edited), prev)
+    assert not is_extension(io.BytesIO(data), len(data), prev)  # nada acrescentado
+
+
+def test_read_tail_rejects_a_dtype_change():
+    df = pd.DataFrame({"id": [1, 2, 3], "valor": [1.5, 2.0, 3.25]})
+    data = _csv(df)
+    prev = csv_source(io.BytesIO(data), len(data), df)
+    grown = data + b"4,n/d\n"
+    f = io.BytesIO(grown)
+    assert is_extension(f, len(grown), prev)
+    assert read_tail(f, prev) is None
@@ -0,0 +1,41 @@
+import json
+import random
+import sqlite3
+
+import pytest
+
+from app.agent.invoice_export import _parse_valor
+from app.agent.invoice_source import _VALOR
+
+CASES = ["1.234,56", "1234,56", "1,234.56", "1234.56", "1.234", "R$ 1.234,56", "R$1.234.567", "-12,5",
+         "+7", ".5", "5.", "1,2,3", "1.234.5", "1.2,", ",5", "USD 100", "100 reais", "1-2", "-", "", "abc",
+         "1.234,56.7", "1,2.3,4", 12.5, 7, True, False, None, [1, 2], {"v": 1}]
+
+
+def _sql_valor(conn, value):
+    return conn.execute(f"SELECT {_VALOR} FROM (SELECT ? AS fields_json)",
+                        (json.dumps({"valor_total": value}),)).fetchone()[0]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("value", CASES)
+def test_sql_valor_matches_export(conn, value):
+    assert _sql_valor(conn, value) == _parse_valor(value)
+
+
+def test_text_around_the_number_is_null_not_zero(conn):
+    assert _sql_valor(conn, "USD 100") is None
+    assert _parse_valor("USD 100") is None
+
+
+def test_sql_valor_matches_export_on_random_strings(conn):
+    rng = random.Random(0)
+    for _ in range(5000):
+        value = "".join(rng.choice("0123456789.,-+ R$x") for _ in range(rng.randint(0, 9)))
+        assert _sql_valor(conn, value) == _parse_valor(value), value
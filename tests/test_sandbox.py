@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from app.tools.sandbox import run_code, sandbox_available
+
+pytestmark = pytest.mark.skipif(not sandbox_available(), reason="sem isolamento do sistema operacional")
+
+
+def test_result_objects_are_not_unpickled_in_the_app(tmp_path):
+    marker = tmp_path / "marker"
+    code = (
+        "import os\n"
+        "class X:\n"
+        f"    def __reduce__(self): return (os.system, ('touch {marker}',))\n"
+        "    def __repr__(self): return 'X()'\n"
+        "result = pd.DataFrame({'x': [X()], 'y': [1.5]})\n"
+        "print('ok')\n"
+    )
+    out = run_code(pd.DataFrame({"a": [1, 2, 3]}), code)
+    assert out["error"] is None
+    assert not marker.exists()
+    assert out["stdout"].strip() == "ok"
+    assert out["table"].to_dict("list") == {"x": ["X()"], "y": [1.5]}
+
+
+def test_tables_keep_index_and_figures_come_back_as_png():
+    code = (
+        "result = df.groupby('g')['v'].sum()\n"
+        "plt.plot([1, 2, 3])\n"
+    )
+    out = run_code(pd.DataFrame({"g": ["a", "b", "a"], "v": [1, 2, 3]}), code)
+    assert out["error"] is None
+    assert out["table"]["v"].to_dict() == {"a": 4, "b": 2}
+    assert len(out["images"]) == 1 and out["images"][0].startswith(b"\x89PNG")
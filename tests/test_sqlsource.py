@@ -0,0 +1,93 @@
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agent.invoice_export import _page_frame
+from app.agent.invoice_source import invoice_source, prepare
+from app.tools.filters import parse_where
+
+
+def _valor(rng) -> object:
+    v = float(rng.lognormal(6, 1.5))
+    kind = rng.integers(0, 8)
+    if kind == 0:
+        return f"R$ {v:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+    if kind == 1:
+        return f"{v:,.2f}"
+    if kind == 2:
+        return f"{v:.2f}".replace(".", ",")
+    if kind == 3:
+        return round(v, 2)
+    if kind == 4:
+        return rng.choice([None, "", "USD 100", "n/d", True])
+    return f"{v:.2f}"
+
+
+@pytest.fixture(scope="module")
+def invoices(tmp_path_factory):
+    """Banco com notas em formatos variados + o mesmo conteúdo como a exportação o achata."""
+    rng = np.random.default_rng(0)
+    path = str(tmp_path_factory.mktemp("db") / "invoices.db")
+    prepare(path)
+    rows = []
+    for i in range(3000):
+        fields = {"tipo_documento": str(rng.choice(["NF-e", "NFS-e", "CT-e"])),
+                  "cnpj_emitente": f"{rng.integers(0, 60):02d}.345.678/0001-90",
+                  "data_emissao": f"{rng.integers(1, 29):02d}/{rng.integers(1, 13):02d}/2024",
+                  "valor_total": _valor(rng)}
+        report = {"score_confianca": round(float(rng.random()), 3),
+                  "campos_suspeitos": list(rng.choice(["cnpj", "data", "valor"], size=rng.integers(0, 3),
+                                                      replace=False))}
+        rows.append((i + 1, f"2024-01-01T00:00:{i % 60:02d}", json.dumps(fields), json.dumps(report)))
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO invoices VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return invoice_source(path), _page_frame(rows)
+
+
+def test_moments_and_median_match_pandas(invoices):
+    src, df = invoices
+    for col in ("valor_total", "score_confianca"):
+        x = df[col].astype("float64")
+        for stat in ("count", "sum", "mean", "std", "var", "min", "max", "median"):
+            np.testing.assert_allclose(src.compute_stat(col, stat), getattr(x, stat)(), rtol=1e-9, err_msg=stat)
+
+
+def test_value_counts_match_pandas(invoices):
+    src, df = invoices
+    counts, n_distinct = src.value_counts("tipo_documento")
+    expected = df["tipo_documento"].value_counts(dropna=False)
+    assert n_distinct == len(expected)
+    assert counts.to_dict() == expected.to_dict()
+
+
+def test_groupby_aggregate_matches_pandas(invoices):
+    src, df = invoices
+    aggs = {"valor_total": ["count", "sum", "mean", "std", "min", "max", "median"], "score_confianca": "mean"}
+    got, n_groups = src.groupby_aggregate(["cnpj_emitente"], aggs, sort_by="valor_total_sum",
+                                          ascending=False, limit=10)
+    full = df.astype({"valor_total": "float64", "score_confianca": "float64"}).groupby(["cnpj_emitente"]).agg(aggs)
+    expected = full.sort_values(("valor_total", "sum"), ascending=False).head(10)
+    assert n_groups == len(full)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_index_type=False, rtol=1e-9)
+
+
+def test_filtered_source_matches_pandas_mask(invoices):
+    src, df = invoices
+    sub = src.filtered(parse_where(src, "valor_total > 500 and tipo_documento == 'NF-e'"))
+    expected = df[(df["valor_total"] > 500).fillna(False) & (df["tipo_documento"] == "NF-e").fillna(False)]
+    assert sub.n_rows == len(expected)
+    np.testing.assert_allclose(sub.compute_stat("valor_total", "sum"), expected["valor_total"].sum())
+
+
+def test_histogram_matches_numpy(invoices):
+    src, df = invoices
+    x = df["score_confianca"].dropna().to_numpy(dtype=np.float64)
+    counts, edges = src.histogram("score_confianca", bins=20)
+    expected_counts, expected_edges = np.histogram(x, bins=20)
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_array_equal(counts, expected_counts)